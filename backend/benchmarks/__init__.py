@@ -0,0 +1,11 @@
+"""
+Benchmark Suite
+Reproducible load tests run in-process against a seeded local MongoDB.
+
+- seed_data: deterministic synthetic dataset (users, products, OMSET, Normal DB,
+  reserved members, Member WD) at a configurable scale
+- harness: in-process API client, latency percentiles and RSS sampling
+- scenarios: the scripted request mixes that are measured
+- run_benchmarks: CLI that seeds, runs the scenarios and writes JSON results
+- compare: diff two result files (e.g. before/after a commit)
+"""
@@ -0,0 +1,78 @@
+"""
+Benchmark Result Diff
+Compares two run_benchmarks result files scenario by scenario.
+
+Usage:
+    python -m benchmarks.compare results/base.json results/head.json
+    python -m benchmarks.compare base.json head.json --threshold 15   # fail on >15% p95 regressions
+
+Exit code 1 when a scenario's p95 regressed by more than --threshold percent
+(default 10) or a scenario has new errors.
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+
+METRICS = ['p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb']
+
+
+def _change(base, head):
+    if base is None or head is None:
+        return None
+    if base == 0:
+        return 0.0 if head == 0 else None
+    return round((head - base) / base * 100, 1)
+
+
+def compare(base: dict, head: dict, threshold: float) -> tuple:
+    """
+    Returns:
+        (rows, regressions): one row per scenario/metric and the names of regressed scenarios
+    """
+    rows, regressions = [], []
+    for name in sorted(set(base['scenarios']) | set(head['scenarios'])):
+        before = base['scenarios'].get(name)
+        after = head['scenarios'].get(name)
+        if before is None or after is None:
+            rows.append((name, 'only in ' + ('head' if before is None else 'base'), None, None, None))
+            continue
+        for metric in METRICS:
+            rows.append((name, metric, before.get(metric), after.get(metric), _change(before.get(metric), after.get(metric))))
+        p95_change = _change(before.get('p95_ms'), after.get('p95_ms'))
+        if (p95_change is not None and p95_change > threshold) or after.get('errors', 0) > before.get('errors', 0):
+            regressions.append(name)
+    return rows, regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Diff two benchmark result files')
+    parser.add_argument('base', type=Path)
+    parser.add_argument('head', type=Path)
+    parser.add_argument('--threshold', type=float, default=10.0, help='Allowed p95 regression in percent')
+    args = parser.parse_args()
+
+    base = json.loads(args.base.read_text())
+    head = json.loads(args.head.read_text())
+    print(f"base {base['meta'].get('git_commit')}  ->  head {head['meta'].get('git_commit')}")
+    if base['meta'].get('scale') != head['meta'].get('scale'):
+        print("⚠️  Runs used different scales; numbers are not directly comparable")
+
+    rows, regressions = compare(base, head, args.threshold)
+    print(f"{'scenario':32} {'metric':12} {'base':>10} {'head':>10} {'change':>8}")
+    for name, metric, before, after, change in rows:
+        change_str = f"{change:+.1f}%" if change is not None else ''
+        before_str = '' if before is None else str(before)
+        after_str = '' if after is None else str(after)
+        print(f"{name:32} {metric:12} {before_str:>10} {after_str:>10} {change_str:>8}")
+
+    if regressions:
+        print(f"❌ p95 regressions over {args.threshold}% or new errors: {', '.join(regressions)}")
+        return 1
+    print("✅ No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
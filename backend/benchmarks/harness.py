@@ -0,0 +1,178 @@
+"""
+Benchmark Harness
+Runs the FastAPI app in-process (real startup/shutdown, httpx ASGI transport, no
+network hop) against a local benchmark MongoDB and measures request latency.
+
+- connect_benchmark_db(): Motor client for MONGO_URL / DB_NAME, refusing databases
+  that aren't obviously benchmark databases (seeding drops every collection)
+- InProcessApp: async context manager yielding an httpx client bound to server.app
+- measure(): run a request callable N times at a given concurrency and return
+  p50/p95/p99/mean/max latency, error count and RSS
+"""
+
+import asyncio
+import os
+import resource
+import sys
+import time
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+
+DEFAULT_MONGO_URL = 'mongodb://localhost:27017'
+DEFAULT_DB_NAME = 'crm_bench'
+BENCH_DB_MARKER = 'bench'
+
+
+def _benchmark_env():
+    """MONGO_URL / DB_NAME / JWT_SECRET for the seeder and the in-process app (server.py reads them at import)."""
+    os.environ.setdefault('MONGO_URL', DEFAULT_MONGO_URL)
+    os.environ.setdefault('DB_NAME', DEFAULT_DB_NAME)
+    os.environ.setdefault('JWT_SECRET', 'benchmark-secret')
+    return os.environ['MONGO_URL'], os.environ['DB_NAME']
+
+
+def connect_benchmark_db(allow_any: bool = False):
+    """
+    Connect to the benchmark database.
+
+    Args:
+        allow_any: Skip the check that DB_NAME contains 'bench'
+
+    Returns:
+        (client, db)
+    """
+    mongo_url, db_name = _benchmark_env()
+    if not allow_any and BENCH_DB_MARKER not in db_name.lower():
+        raise SystemExit(
+            f"Refusing to use DB_NAME={db_name!r}: benchmark seeding drops every collection. "
+            f"Use a database whose name contains '{BENCH_DB_MARKER}' or pass --force."
+        )
+    client = AsyncIOMotorClient(mongo_url)
+    return client, client[db_name]
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process right now (Linux /proc), None elsewhere."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(sorted_values: list, q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0-100) of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))  # ceil
+    return sorted_values[int(rank) - 1]
+
+
+class InProcessApp:
+    """The CRM API running in this process; use as `async with InProcessApp() as app:`."""
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self._app = None
+
+    async def __aenter__(self):
+        _benchmark_env()
+        import server  # noqa: E402 - needs the benchmark env set first
+        self._app = server.app
+        # Same startup as uvicorn: indexes, first-deposit index, rollups, profiles, backfills
+        await self._app.router.startup()
+        self.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self._app),
+            base_url='http://benchmark',
+            timeout=600
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        await self._app.router.shutdown()
+
+    def token(self, user_id: str, email: str, role: str) -> dict:
+        """Authorization header for a seeded user."""
+        from routes.deps import create_token
+        return {'Authorization': f'Bearer {create_token(user_id, email, role)}'}
+
+
+async def measure(
+    call: Callable[[int], Awaitable[httpx.Response]],
+    iterations: int,
+    concurrency: int = 1,
+    warmup: int = 1,
+    before_each: Optional[Callable[[int], Awaitable[None]]] = None
+) -> dict:
+    """
+    Time call(i) for i in range(iterations), at most `concurrency` in flight.
+
+    before_each(i) runs before each call and is not timed (setup such as picking
+    record ids or clearing a cache). Responses outside 2xx count as errors.
+
+    Returns:
+        Latency percentiles in ms, error count, first error and RSS figures
+    """
+    for i in range(warmup):
+        if before_each:
+            await before_each(-1 - i)
+        await call(-1 - i)
+
+    rss_before = current_rss_mb()
+    latencies = []
+    errors = 0
+    first_error = None
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i: int):
+        nonlocal errors, first_error
+        async with semaphore:
+            if before_each:
+                await before_each(i)
+            started = time.perf_counter()
+            response = await call(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not 200 <= response.status_code < 300:
+                errors += 1
+                if first_error is None:
+                    first_error = f'{response.status_code}: {response.text[:200]}'
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(i) for i in range(iterations)))
+    wall_seconds = time.perf_counter() - started
+
+    latencies.sort()
+    rss_after = current_rss_mb()
+    return {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': errors,
+        'first_error': first_error,
+        'p50_ms': _round(percentile(latencies, 50)),
+        'p95_ms': _round(percentile(latencies, 95)),
+        'p99_ms': _round(percentile(latencies, 99)),
+        'mean_ms': _round(sum(latencies) / len(latencies)) if latencies else None,
+        'max_ms': _round(latencies[-1]) if latencies else None,
+        'throughput_rps': round(iterations / wall_seconds, 2) if wall_seconds else None,
+        'rss_mb': rss_after,
+        'rss_delta_mb': round(rss_after - rss_before, 1) if rss_after is not None and rss_before is not None else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
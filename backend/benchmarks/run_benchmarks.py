@@ -0,0 +1,125 @@
+"""
+Benchmark Runner
+Seeds the benchmark database, starts the app in-process and runs the scenarios,
+writing one JSON result file per run (diff two of them with benchmarks.compare).
+
+Requires a local mongod; MONGO_URL defaults to mongodb://localhost:27017 and
+DB_NAME to crm_bench. Run from backend/:
+
+Usage:
+    python -m benchmarks.run_benchmarks                          # seed 'full' and run everything
+    python -m benchmarks.run_benchmarks --scale smoke            # quick sanity run
+    python -m benchmarks.run_benchmarks --no-seed --scenarios leaderboard,omset_summary
+    python -m benchmarks.compare results/old.json results/new.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.harness import InProcessApp, connect_benchmark_db, peak_rss_mb
+from benchmarks.scenarios import SCENARIOS
+from benchmarks.seed_data import add_scale_arguments, load_seed_result, scale_from_args, seed
+
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+# Writing scenarios consume seeded records, so they get fewer iterations by default
+WRITE_SCENARIO_ITERATIONS = {
+    'download_requests_create': 20,
+    'memberwd_upload': 3,
+    'memberwd_assign': 10,
+    'memberwd_assign_random': 10,
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def run(args) -> dict:
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}")
+
+    client, db = connect_benchmark_db(allow_any=args.force)
+    try:
+        if args.no_seed:
+            seeded = await load_seed_result(db)
+            if not seeded:
+                raise SystemExit(f"{db.name} has no benchmark dataset; run without --no-seed first")
+            seed_seconds = None
+        else:
+            started = time.perf_counter()
+            seeded = await seed(db, scale_from_args(args), args.seed, args.anchor_date)
+            seed_seconds = round(time.perf_counter() - started, 1)
+            print(f"Seeded {db.name} in {seed_seconds}s: {seeded['counts']}")
+
+        build_info = await db.command('buildInfo')
+
+        async with InProcessApp() as app:
+            results = {}
+            for name in names:
+                iterations = args.iterations or WRITE_SCENARIO_ITERATIONS.get(name, 20)
+                print(f"▶ {name} ({iterations} iterations, concurrency {args.concurrency})")
+                stats = await SCENARIOS[name](app, db, seeded, iterations, args.concurrency)
+                results[name] = stats
+                print(f"  p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms "
+                      f"errors={stats['errors']} peak_rss={stats['peak_rss_mb']}MB")
+                if stats['first_error']:
+                    print(f"  first error: {stats['first_error']}")
+
+        return {
+            'meta': {
+                'git_commit': _git_commit(),
+                'started_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'mongodb': build_info.get('version'),
+                'platform': platform.platform(),
+                'scale': seeded['scale'],
+                'seed': seeded['seed'],
+                'anchor_date': seeded['anchor_date'],
+                'seed_seconds': seed_seconds,
+                'peak_rss_mb': peak_rss_mb(),
+            },
+            'scenarios': results,
+        }
+    finally:
+        client.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Run the CRM API benchmark suite')
+    add_scale_arguments(parser)
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the dataset already in DB_NAME')
+    parser.add_argument('--scenarios', default=None, help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--iterations', type=int, default=None, help='Iterations per scenario (default 20, fewer for writes)')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--output', type=Path, default=None, help='Result file (default results/<utc time>_<commit>.json)')
+    parser.add_argument('--force', action='store_true', help='Allow a DB_NAME without the bench prefix')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = args.output or RESULTS_DIR / (
+        f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}_{report['meta']['git_commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, sort_keys=True))
+    print(f"✅ Results written to {output}")
+    return 1 if any(s['errors'] for s in report['scenarios'].values()) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
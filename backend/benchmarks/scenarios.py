@@ -0,0 +1,213 @@
+"""
+Benchmark Scenarios
+The scripted request mixes measured by run_benchmarks. Each scenario gets the
+running InProcessApp, the direct benchmark db handle and the seed result, and
+returns the measure() stats.
+
+Scenarios that write (download requests, Member WD upload/assign) consume seeded
+records, so results are only comparable between runs on a freshly seeded database.
+"""
+
+import csv
+import io
+import random
+from typing import Awaitable, Callable, Dict
+
+from benchmarks.harness import InProcessApp, measure
+from benchmarks.seed_data import ADMIN_ID, memberwd_rows
+
+
+ScenarioFn = Callable[..., Awaitable[dict]]
+SCENARIOS: Dict[str, ScenarioFn] = {}
+
+DOWNLOAD_REQUEST_SIZE = 50
+MEMBERWD_UPLOAD_ROWS = 5000
+MEMBERWD_ASSIGN_SIZE = 100
+
+
+def scenario(name: str):
+    def register(fn: ScenarioFn) -> ScenarioFn:
+        SCENARIOS[name] = fn
+        return fn
+    return register
+
+
+def _admin(app: InProcessApp) -> dict:
+    return app.token(ADMIN_ID, 'bench-admin@crm.com', 'admin')
+
+
+def _staff(app: InProcessApp, seeded: dict, i: int) -> dict:
+    staff_id = seeded['staff_ids'][i % len(seeded['staff_ids'])]
+    return app.token(staff_id, f'{staff_id}@crm.com', 'staff')
+
+
+@scenario('omset_summary')
+async def omset_summary(app, db, seeded, iterations, concurrency):
+    headers = _admin(app)
+    month_start = seeded['anchor_date'][:8] + '01'
+    return await measure(
+        lambda i: app.client.get('/api/omset/summary', headers=headers,
+                                 params={'start_date': month_start, 'end_date': seeded['anchor_date']}),
+        iterations, concurrency
+    )
+
+
+@scenario('omset_dashboard_stats_cold')
+async def omset_dashboard_stats_cold(app, db, seeded, iterations, concurrency):
+    """Dashboard stats with the response cache cleared before every call (the computation itself)."""
+    from utils.omset_rollup import dashboard_stats_cache
+    headers = _admin(app)
+
+    async def clear_cache(i):
+        dashboard_stats_cache.clear()
+
+    return await measure(
+        lambda i: app.client.get('/api/omset/dashboard-stats', headers=headers),
+        iterations, concurrency, before_each=clear_cache
+    )
+
+
+@scenario('omset_dashboard_stats')
+async def omset_dashboard_stats(app, db, seeded, iterations, concurrency):
+    """Dashboard stats as polled by open dashboards (response cache warm)."""
+    headers = _admin(app)
+    return await measure(
+        lambda i: app.client.get('/api/omset/dashboard-stats', headers=headers),
+        iterations, concurrency
+    )
+
+
+@scenario('leaderboard')
+async def leaderboard(app, db, seeded, iterations, concurrency):
+    return await measure(
+        lambda i: app.client.get('/api/leaderboard', headers=_staff(app, seeded, i), params={'period': 'month'}),
+        iterations, concurrency
+    )
+
+
+@scenario('retention_alerts')
+async def retention_alerts(app, db, seeded, iterations, concurrency):
+    headers = _admin(app)
+    return await measure(
+        lambda i: app.client.get('/api/retention/alerts', headers=headers),
+        iterations, concurrency
+    )
+
+
+@scenario('retention_overview')
+async def retention_overview(app, db, seeded, iterations, concurrency):
+    headers = _admin(app)
+    return await measure(
+        lambda i: app.client.get('/api/retention/overview', headers=headers),
+        iterations, concurrency
+    )
+
+
+@scenario('retention_customers')
+async def retention_customers(app, db, seeded, iterations, concurrency):
+    """Customer list cycling through the filters (ndp/rdp classify every customer, all/loyal only the page)."""
+    headers = _admin(app)
+    filters = ['all', 'ndp', 'rdp', 'loyal']
+    return await measure(
+        lambda i: app.client.get('/api/retention/customers', headers=headers,
+                                 params={'filter_type': filters[i % len(filters)], 'sort_by': 'omset'}),
+        iterations, concurrency
+    )
+
+
+@scenario('download_requests_list')
+async def download_requests_list(app, db, seeded, iterations, concurrency):
+    headers = _admin(app)
+    return await measure(
+        lambda i: app.client.get('/api/download-requests', headers=headers),
+        iterations, concurrency
+    )
+
+
+@scenario('databases_with_stats')
+async def databases_with_stats(app, db, seeded, iterations, concurrency):
+    """Normal DB overview (status and reserved-excluded counts per database), polled by the admin page."""
+    headers = _admin(app)
+    return await measure(
+        lambda i: app.client.get('/api/databases/with-stats', headers=headers),
+        iterations, concurrency
+    )
+
+
+@scenario('download_requests_create')
+async def download_requests_create(app, db, seeded, iterations, concurrency):
+    """Staff draw DOWNLOAD_REQUEST_SIZE random non-reserved records (auto-approved) across the seeded databases."""
+    database_ids = seeded['database_ids']
+    return await measure(
+        lambda i: app.client.post(
+            '/api/download-requests',
+            headers=_staff(app, seeded, i),
+            json={'database_id': database_ids[i % len(database_ids)], 'record_count': DOWNLOAD_REQUEST_SIZE}
+        ),
+        iterations, concurrency
+    )
+
+
+def _memberwd_csv(rows: list) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+@scenario('memberwd_upload')
+async def memberwd_upload(app, db, seeded, iterations, concurrency):
+    """Upload a MEMBERWD_UPLOAD_ROWS-row CSV (foreground import)."""
+    headers = _admin(app)
+
+    def upload(i):
+        offset = 10_000_000 + (i + 1) * MEMBERWD_UPLOAD_ROWS  # distinct usernames per upload
+        return app.client.post(
+            '/api/memberwd/upload',
+            headers=headers,
+            data={'name': f'bench_upload_{i}', 'product_id': seeded['product_ids'][0]},
+            files={'file': (f'bench_upload_{i}.csv', _memberwd_csv(memberwd_rows(MEMBERWD_UPLOAD_ROWS, offset)), 'text/csv')}
+        )
+
+    return await measure(upload, iterations, concurrency)
+
+
+@scenario('memberwd_assign')
+async def memberwd_assign(app, db, seeded, iterations, concurrency):
+    """Assign MEMBERWD_ASSIGN_SIZE picked records (picking them is not timed)."""
+    headers = _admin(app)
+    picked = {}
+    rng = random.Random(seeded['seed'])
+
+    async def pick_records(i):
+        records = await db.memberwd_records.find(
+            {'database_id': seeded['memberwd_database_id'], 'status': 'available'}, {'_id': 0, 'id': 1}
+        ).limit(MEMBERWD_ASSIGN_SIZE).to_list(MEMBERWD_ASSIGN_SIZE)
+        picked[i] = [r['id'] for r in records]
+
+    return await measure(
+        lambda i: app.client.post(
+            '/api/memberwd/assign',
+            headers=headers,
+            json={'record_ids': picked.pop(i), 'staff_id': rng.choice(seeded['staff_ids'])}
+        ),
+        iterations, 1, before_each=pick_records
+    )
+
+
+@scenario('memberwd_assign_random')
+async def memberwd_assign_random(app, db, seeded, iterations, concurrency):
+    headers = _admin(app)
+    return await measure(
+        lambda i: app.client.post(
+            '/api/memberwd/assign-random',
+            headers=headers,
+            json={
+                'database_id': seeded['memberwd_database_id'],
+                'staff_id': seeded['staff_ids'][i % len(seeded['staff_ids'])],
+                'quantity': MEMBERWD_ASSIGN_SIZE
+            }
+        ),
+        iterations, concurrency
+    )
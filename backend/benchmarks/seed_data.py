@@ -0,0 +1,434 @@
+"""
+Benchmark Data Generator
+Deterministic synthetic dataset for the benchmark suite, written straight to MongoDB.
+
+Users and products follow the shapes of scripts/seed_users.py and scripts/seed_products.py;
+OMSET, Normal DB, reserved member and Member WD documents carry the same derived fields
+(customer_id_normalized, customer_name_lower, customer_type, username_normalized,
+row_identifiers, reservation keys) as the API writes them. The derived collections
+(first-deposit index, daily rollups, deposit profiles) are built by the app's own
+startup backfills when the harness starts it.
+
+The same seed, scale and anchor date always produce the same documents.
+
+Usage:
+    python -m benchmarks.seed_data                    # 'full' scale
+    python -m benchmarks.seed_data --scale smoke      # 1/100 of 'full'
+"""
+
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import date, datetime, timedelta
+
+import bcrypt
+
+from utils.helpers import JAKARTA_TZ, normalize_customer_id
+from utils.deposit_lookup import normalize_customer_name
+from utils.reserved_check import build_row_identifiers, extract_username
+from utils.reserved_lookup import with_reservation_keys
+
+
+SCALES = {
+    'full': {
+        'staff': 50,
+        'products': 3,
+        'omset_records': 500_000,
+        'customer_records': 1_000_000,
+        'reserved_members': 20_000,
+        'memberwd_records': 50_000,
+    },
+    'smoke': {
+        'staff': 10,
+        'products': 3,
+        'omset_records': 5_000,
+        'customer_records': 10_000,
+        'reserved_members': 200,
+        'memberwd_records': 1_000,
+    },
+}
+
+INSERT_BATCH_SIZE = 5000
+DATABASE_SIZE = 50_000  # Normal DB records per uploaded database
+OMSET_HISTORY_DAYS = 365
+DEPOSITS_PER_CUSTOMER = (1, 15)
+OTHER_STAFF_DEPOSIT_RATE = 0.1  # deposits recorded by a staff other than the customer's owner
+NORMAL_DB_OMSET_OVERLAP = 0.05  # Normal DB usernames that are also OMSET customers
+ASSIGNED_RATE = 0.2  # Normal DB records already assigned to staff
+
+BENCH_PASSWORD = 'bench123'
+ADMIN_ID = 'bench-admin'
+CREATED_AT = '2025-01-01T00:00:00+00:00'
+SEED_SETTINGS_KEY = 'benchmark_seed'
+
+
+def staff_id(i: int) -> str:
+    return f'bench-staff-{i}'
+
+
+def staff_name(i: int) -> str:
+    return f'Bench Staff {i}'
+
+
+def product_id(i: int) -> str:
+    return f'bench-prod-{i}'
+
+
+def omset_customer(i: int) -> str:
+    return f'CUST{i:07d}'
+
+
+def normal_db_username(i: int) -> str:
+    return f'user{i:07d}'
+
+
+class Generator:
+    """Seeded id/date source so every run writes identical documents."""
+
+    def __init__(self, seed: int, anchor: date):
+        self.rng = random.Random(seed)
+        self.anchor = anchor
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def past_date(self, max_days: int) -> str:
+        return (self.anchor - timedelta(days=self.rng.randrange(max_days))).strftime('%Y-%m-%d')
+
+
+async def _insert_batched(collection, docs):
+    """insert_many in INSERT_BATCH_SIZE chunks from any iterable; returns the inserted count."""
+    batch, total = [], 0
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            await collection.insert_many(batch, ordered=False)
+            total += len(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+        total += len(batch)
+    return total
+
+
+def _users(scale: dict) -> list:
+    # One bcrypt hash shared by every benchmark user (hashing is the slow part of seeding)
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt()).decode()
+    users = [{
+        'id': ADMIN_ID,
+        'email': 'bench-admin@crm.com',
+        'name': 'Bench Admin',
+        'role': 'admin',
+        'password_hash': password_hash,
+        'created_at': CREATED_AT
+    }]
+    for i in range(scale['staff']):
+        users.append({
+            'id': staff_id(i),
+            'email': f'bench-staff-{i}@crm.com',
+            'name': staff_name(i),
+            'role': 'staff',
+            'password_hash': password_hash,
+            'created_at': CREATED_AT
+        })
+    return users
+
+
+def _products(scale: dict) -> list:
+    return [
+        {'id': product_id(i), 'name': f'BENCH{i}', 'created_at': CREATED_AT}
+        for i in range(scale['products'])
+    ]
+
+
+def _omset_records(gen: Generator, scale: dict, owners: dict):
+    """
+    Deposits customer by customer in date order, so customer_type is NDP exactly on
+    the first deposit of each (staff, customer, product). owners collects the owning
+    (staff index, product index) of every generated customer for the reservations.
+    """
+    remaining = scale['omset_records']
+    customer = 0
+    while remaining > 0:
+        cid = omset_customer(customer)
+        owner = gen.rng.randrange(scale['staff'])
+        prod = gen.rng.randrange(scale['products'])
+        owners[cid] = (owner, prod)
+        customer += 1
+
+        count = min(remaining, gen.rng.randint(*DEPOSITS_PER_CUSTOMER))
+        remaining -= count
+        dates = sorted(gen.past_date(OMSET_HISTORY_DAYS) for _ in range(count))
+        seen_staff = set()
+        for record_date in dates:
+            recorder = owner
+            if gen.rng.random() < OTHER_STAFF_DEPOSIT_RATE:
+                recorder = gen.rng.randrange(scale['staff'])
+            customer_type = 'RDP' if recorder in seen_staff else 'NDP'
+            seen_staff.add(recorder)
+
+            nominal = float(gen.rng.choice([50_000, 100_000, 200_000, 500_000, 1_000_000]))
+            customer_name = f'Customer {customer}'
+            yield {
+                'id': gen.uuid(),
+                'product_id': product_id(prod),
+                'product_name': f'BENCH{prod}',
+                'staff_id': staff_id(recorder),
+                'staff_name': staff_name(recorder),
+                'record_date': record_date,
+                'customer_name': customer_name,
+                'customer_id': cid,
+                'nominal': nominal,
+                'depo_kelipatan': 1.0,
+                'depo_total': nominal,
+                'keterangan': None,
+                'approval_status': 'approved',
+                'conflict_info': None,
+                'created_at': f'{record_date}T10:00:00+07:00',
+                'updated_at': None,
+                'customer_id_normalized': normalize_customer_id(cid),
+                'customer_name_lower': normalize_customer_name(customer_name),
+                'customer_type': customer_type,
+            }
+
+
+def _databases(gen: Generator, scale: dict) -> list:
+    databases = []
+    for n in range((scale['customer_records'] + DATABASE_SIZE - 1) // DATABASE_SIZE):
+        prod = n % scale['products']
+        rows = min(DATABASE_SIZE, scale['customer_records'] - n * DATABASE_SIZE)
+        databases.append({
+            'id': gen.uuid(),
+            'filename': f'bench_db_{n}.csv',
+            'file_type': 'csv',
+            'file_size': rows * 64,
+            'description': 'Benchmark database',
+            'product_id': product_id(prod),
+            'product_name': f'BENCH{prod}',
+            'uploaded_by': ADMIN_ID,
+            'uploaded_by_name': 'Bench Admin',
+            'uploaded_at': CREATED_AT,
+            'file_path': '',
+            'preview_data': None,
+            'total_records': rows,
+            'auto_approve': None,
+            'ingest_job_id': None,
+        })
+    return databases
+
+
+def _customer_records(gen: Generator, scale: dict, databases: list, omset_customers: int):
+    row = 0
+    for database in databases:
+        for row_number in range(1, database['total_records'] + 1):
+            if omset_customers and gen.rng.random() < NORMAL_DB_OMSET_OVERLAP:
+                username = omset_customer(gen.rng.randrange(omset_customers))
+            else:
+                username = normal_db_username(row)
+            row += 1
+            row_data = {'Username': username, 'Nama': f'Member {row}', 'No HP': f'08{row:010d}'}
+
+            assigned = gen.rng.random() < ASSIGNED_RATE
+            assignee = gen.rng.randrange(scale['staff']) if assigned else None
+            yield {
+                'id': gen.uuid(),
+                'database_id': database['id'],
+                'database_name': database['filename'],
+                'product_id': database['product_id'],
+                'product_name': database['product_name'],
+                'row_number': row_number,
+                'row_data': row_data,
+                'status': 'assigned' if assigned else 'available',
+                'assigned_to': staff_id(assignee) if assigned else None,
+                'assigned_to_name': staff_name(assignee) if assigned else None,
+                'assigned_at': CREATED_AT if assigned else None,
+                'request_id': None,
+                'created_at': CREATED_AT,
+                'username_normalized': extract_username(row_data),
+                'row_identifiers': build_row_identifiers(row_data),
+            }
+
+
+def _reserved_members(gen: Generator, scale: dict, owners: dict) -> list:
+    """Reservations of OMSET customers by their owning staff (topped up with Normal DB usernames)."""
+    customers = sorted(owners)
+    gen.rng.shuffle(customers)
+    members = []
+    for n in range(scale['reserved_members']):
+        if n < len(customers):
+            cid = customers[n]
+            owner, prod = owners[cid]
+        else:
+            cid = normal_db_username(n)
+            owner, prod = gen.rng.randrange(scale['staff']), gen.rng.randrange(scale['products'])
+        members.append(with_reservation_keys({
+            'id': gen.uuid(),
+            'customer_id': cid,
+            'customer_name': None,
+            'phone_number': None,
+            'product_id': product_id(prod),
+            'product_name': f'BENCH{prod}',
+            'staff_id': staff_id(owner),
+            'staff_name': staff_name(owner),
+            'status': 'approved',
+            'created_by': ADMIN_ID,
+            'created_by_name': 'Bench Admin',
+            'created_at': CREATED_AT,
+            'approved_at': CREATED_AT,
+            'approved_by': ADMIN_ID,
+            'approved_by_name': 'Bench Admin',
+            'last_omset_date': None,
+            'days_since_last_omset': None,
+            'is_permanent': False,
+        }))
+    return members
+
+
+def memberwd_rows(count: int, offset: int = 0) -> list:
+    """row_data of a Member WD file (also used to build the upload scenario's CSV)."""
+    return [
+        {'Username': f'wd{offset + i:07d}', 'Nama': f'WD Member {offset + i}', 'No HP': f'089{offset + i:09d}'}
+        for i in range(count)
+    ]
+
+
+def _memberwd_records(gen: Generator, database: dict, rows: list, reserved: set):
+    for row_number, row_data in enumerate(rows, start=1):
+        is_reserved = row_data['Username'].upper() in reserved
+        yield {
+            'id': gen.uuid(),
+            'database_id': database['id'],
+            'database_name': database['name'],
+            'product_id': database['product_id'],
+            'product_name': database['product_name'],
+            'row_number': row_number,
+            'row_data': row_data,
+            'row_identifiers': build_row_identifiers(row_data),
+            'status': 'reserved' if is_reserved else 'available',
+            'assigned_to': None,
+            'assigned_to_name': None,
+            'assigned_at': None,
+            'assigned_by': None,
+            'assigned_by_name': None,
+            'is_reserved_member': is_reserved,
+            'reserved_by': None,
+            'reserved_by_name': None,
+            'created_at': CREATED_AT,
+        }
+
+
+async def seed(db, scale: dict, seed: int = 42, anchor: date = None) -> dict:
+    """
+    Drop the benchmark collections and write a fresh dataset.
+
+    Args:
+        db: Motor database (must be a dedicated benchmark database)
+        scale: Counts per collection (see SCALES)
+        seed: Random seed
+        anchor: "Today" of the dataset; OMSET dates fall in the year before it
+
+    Returns:
+        Scale, inserted counts and the ids the scenarios need
+    """
+    anchor = anchor or datetime.now(JAKARTA_TZ).date()
+    gen = Generator(seed, anchor)
+
+    for name in await db.list_collection_names():
+        await db.drop_collection(name)
+
+    counts = {}
+    counts['users'] = await _insert_batched(db.users, _users(scale))
+    counts['products'] = await _insert_batched(db.products, _products(scale))
+
+    owners = {}
+    counts['omset_records'] = await _insert_batched(db.omset_records, _omset_records(gen, scale, owners))
+
+    databases = _databases(gen, scale)
+    counts['databases'] = await _insert_batched(db.databases, databases)
+    counts['customer_records'] = await _insert_batched(
+        db.customer_records, _customer_records(gen, scale, databases, len(owners))
+    )
+
+    reserved_members = _reserved_members(gen, scale, owners)
+    counts['reserved_members'] = await _insert_batched(db.reserved_members, reserved_members)
+
+    memberwd_database = {
+        'id': gen.uuid(),
+        'name': 'bench_memberwd',
+        'filename': 'bench_memberwd.csv',
+        'file_type': 'csv',
+        'total_records': scale['memberwd_records'],
+        'product_id': product_id(0),
+        'product_name': 'BENCH0',
+        'uploaded_by': ADMIN_ID,
+        'uploaded_by_name': 'Bench Admin',
+        'uploaded_at': CREATED_AT,
+        'ingest_job_id': None,
+    }
+    await db.memberwd_databases.insert_one(dict(memberwd_database))
+    reserved_keys = {m['customer_id'].upper() for m in reserved_members}
+    counts['memberwd_records'] = await _insert_batched(
+        db.memberwd_records,
+        _memberwd_records(gen, memberwd_database, memberwd_rows(scale['memberwd_records']), reserved_keys)
+    )
+
+    # Download requests are auto-approved so the scenario measures the full claim path
+    await db.system_settings.insert_one({'key': 'auto_approve_requests', 'enabled': True})
+
+    result = {
+        'scale': scale,
+        'counts': counts,
+        'anchor_date': anchor.isoformat(),
+        'seed': seed,
+        'database_ids': [d['id'] for d in databases],
+        'memberwd_database_id': memberwd_database['id'],
+        'staff_ids': [staff_id(i) for i in range(scale['staff'])],
+        'product_ids': [product_id(i) for i in range(scale['products'])],
+    }
+    # Kept so a later run can reuse the dataset without reseeding (load_seed_result)
+    await db.system_settings.insert_one({'key': SEED_SETTINGS_KEY, **result})
+    return result
+
+
+async def load_seed_result(db) -> dict:
+    """The seed() result of the dataset currently in db, or None if it wasn't seeded by seed()."""
+    return await db.system_settings.find_one({'key': SEED_SETTINGS_KEY}, {'_id': 0, 'key': 0})
+
+
+def scale_from_args(args) -> dict:
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        value = getattr(args, key, None)
+        if value is not None:
+            scale[key] = value
+    return scale
+
+
+def add_scale_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--scale', choices=sorted(SCALES), default='full')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor-date', type=date.fromisoformat, default=None,
+                        help="Dataset 'today' (YYYY-MM-DD); defaults to the current Jakarta date")
+    for key in SCALES['full']:
+        parser.add_argument(f'--{key.replace("_", "-")}', dest=key, type=int, default=None)
+
+
+async def main(args) -> int:
+    from benchmarks.harness import connect_benchmark_db
+    client, db = connect_benchmark_db(allow_any=args.force)
+    try:
+        result = await seed(db, scale_from_args(args), args.seed, args.anchor_date)
+        for name, count in result['counts'].items():
+            print(f"  {name}: {count}")
+        print(f"✅ Seeded {db.name} (seed={result['seed']}, anchor={result['anchor_date']})")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed the benchmark database')
+    add_scale_arguments(parser)
+    parser.add_argument('--force', action='store_true', help='Allow a DB_NAME without the bench prefix')
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
@@ -4,10 +4,10 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import FileResponse
 from typing import Optional
 from datetime import datetime, timedelta
-import pandas as pd
-import io
 from .deps import User, get_db, get_admin_user, get_user_from_token_param
 from utils.helpers import get_jakarta_now, normalize_customer_id
+from utils.executors import run_cpu_bound
+from utils.workbooks import write_table_file
 
 router = APIRouter(tags=["Analytics & Export"])
 
@@ -182,9 +182,9 @@ async def get_business_analytics(period: str = 'month', custom_start: Optional[s
     # IMPORTANT: Exclude records with "tambahan" from first_date calculation
     # When filtering by staff_id, still need global first_date to determine NDP/RDP correctly
     # But for the omset totals, we only show the selected staff's records
-    # Build STAFF-SPECIFIC customer first deposit map using MongoDB aggregation
+    # Build STAFF-SPECIFIC customer first deposit map from the first-deposit index
     from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id)
+    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id, records=records)
     
     # Calculate daily stats with unique (staff, customer, product) tuples
     daily_stats = {}
@@ -352,7 +352,7 @@ async def get_staff_ndp_rdp_daily(
         add_approved_filter(omset_query), {'_id': 0}
     ).to_list(100000)
 
-    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id)
+    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id, records=records)
 
     # Group by (date, staff_id) → {ndp, rdp}
     daily_staff = {}
@@ -821,7 +821,7 @@ async def get_product_performance(
         add_approved_filter(omset_query), {'_id': 0}
     ).to_list(100000)
 
-    staff_customer_first_date = await build_staff_first_date_map(db)
+    staff_customer_first_date = await build_staff_first_date_map(db, records=records)
 
     products = await db.products.find({}, {'_id': 0}).to_list(1000)
     product_names = {p['id']: p['name'] for p in products}
@@ -894,7 +894,7 @@ async def get_customer_value_comparison(
         add_approved_filter(omset_query), {'_id': 0}
     ).to_list(100000)
 
-    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id)
+    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id, records=records)
 
     # Aggregate by staff: NDP vs RDP amounts
     staff_value = {}
@@ -1191,7 +1191,7 @@ async def drill_down_product_staff(
         add_approved_filter(omset_query), {'_id': 0}
     ).to_list(100000)
 
-    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id)
+    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id, records=records)
 
     staff_data = {}
     for record in records:
@@ -1250,7 +1250,7 @@ async def drill_down_staff_customers(
         add_approved_filter(omset_query), {'_id': 0}
     ).to_list(100000)
 
-    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id)
+    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id, records=records)
 
     customer_map = {}
     for record in records:
@@ -1361,45 +1361,56 @@ async def export_customer_records(
     if staff_id:
         query['assigned_to'] = staff_id
     
-    records = await db.customer_records.find(query, {'_id': 0}).to_list(100000)
-    
+    # Date filtering on assigned_at (falling back to created_at) is pushed into the query
+    date_bounds = {}
     if start_date:
-        records = [r for r in records if r.get('assigned_at', r.get('created_at', '')) >= start_date]
+        date_bounds['$gte'] = start_date
     if end_date:
-        records = [r for r in records if r.get('assigned_at', r.get('created_at', '')) <= end_date]
+        date_bounds['$lte'] = end_date
+    if date_bounds:
+        query['$or'] = [
+            {'assigned_at': date_bounds},
+            {'assigned_at': {'$exists': False}, 'created_at': date_bounds}
+        ]
     
-    export_data = []
-    for record in records:
-        row = {
-            'ID': record.get('id', ''), 'Database': record.get('database_name', ''),
-            'Product': record.get('product_name', ''), 'Status': record.get('status', ''),
-            'Assigned To': record.get('assigned_to_name', ''), 'Assigned At': record.get('assigned_at', ''),
-            'WhatsApp Status': record.get('whatsapp_status', ''), 'Respond Status': record.get('respond_status', ''),
-        }
-        if record.get('row_data'):
-            for key, value in record['row_data'].items():
-                row[key] = value
-        export_data.append(row)
+    from utils.streaming_export import EXPORT_BATCH_SIZE, streaming_export_response
     
-    df = pd.DataFrame(export_data)
-    filename = f"customer_records_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # Dynamic row_data columns are collected up front so rows can be streamed one by one
+    base_columns = ['ID', 'Database', 'Product', 'Status', 'Assigned To', 'Assigned At', 'WhatsApp Status', 'Respond Status']
+    key_rows = await db.customer_records.aggregate([
+        {'$match': query},
+        {'$project': {'_id': 0, 'k': {'$map': {
+            'input': {'$objectToArray': {'$ifNull': ['$row_data', {}]}},
+            'in': '$$this.k'
+        }}}},
+        {'$unwind': {'path': '$k', 'includeArrayIndex': 'i'}},
+        {'$group': {'_id': '$k', 'i': {'$min': '$i'}}},
+        {'$sort': {'i': 1, '_id': 1}}
+    ], allowDiskUse=True).to_list(None)
+    row_data_columns = [k['_id'] for k in key_rows if k['_id'] not in base_columns]
     
-    if format == 'csv':
-        output = io.BytesIO()
-        df.to_csv(output, index=False, encoding='utf-8')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.csv"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
-        return FileResponse(path=temp_path, media_type='text/csv', filename=f"{filename}.csv")
-    else:
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.xlsx"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
-        return FileResponse(path=temp_path, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', filename=f"{filename}.xlsx")
+    cursor = db.customer_records.find(query, {'_id': 0}).batch_size(EXPORT_BATCH_SIZE)
+    
+    async def export_rows():
+        async for record in cursor:
+            row = {
+                'ID': record.get('id', ''), 'Database': record.get('database_name', ''),
+                'Product': record.get('product_name', ''), 'Status': record.get('status', ''),
+                'Assigned To': record.get('assigned_to_name', ''), 'Assigned At': record.get('assigned_at', ''),
+                'WhatsApp Status': record.get('whatsapp_status', ''), 'Respond Status': record.get('respond_status', ''),
+            }
+            if record.get('row_data'):
+                for key, value in record['row_data'].items():
+                    row[key] = value
+            yield [row.get(column, '') for column in base_columns + row_data_columns]
+    
+    return streaming_export_response(
+        base_columns + row_data_columns,
+        export_rows(),
+        filename=f"customer_records_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        format='csv' if format == 'csv' else 'xlsx',
+        sheet_title='Customer Records'
+    )
 
 @router.get("/export/omset")
 async def export_omset_data(
@@ -1422,41 +1433,36 @@ async def export_omset_data(
     if customer_type:
         query['customer_type'] = customer_type
     
-    records = await db.omset_records.find(query, {'_id': 0}).to_list(100000)
-    
-    if start_date:
-        records = [r for r in records if r.get('date', '') >= start_date]
-    if end_date:
-        records = [r for r in records if r.get('date', '') <= end_date]
+    # OMSET records are dated by record_date; the range is filtered in the query
+    if start_date or end_date:
+        query['record_date'] = {}
+        if start_date:
+            query['record_date']['$gte'] = start_date
+        if end_date:
+            query['record_date']['$lte'] = end_date
     
-    export_data = [{
-        'Date': r.get('date', ''), 'Customer Name': r.get('customer_name', ''),
-        'Customer ID': r.get('customer_id', ''), 'Product': r.get('product_name', ''),
-        'Staff': r.get('staff_name', ''), 'Nominal': r.get('nominal', 0),
-        'Kelipatan': r.get('kelipatan', 1), 'Depo Total': r.get('depo_total', 0),
-        'Customer Type': r.get('customer_type', ''), 'Keterangan': r.get('keterangan', ''),
-        'Created At': r.get('created_at', '')
-    } for r in records]
+    from utils.streaming_export import EXPORT_BATCH_SIZE, streaming_export_response
+    cursor = db.omset_records.find(query, {'_id': 0}).batch_size(EXPORT_BATCH_SIZE)
     
-    df = pd.DataFrame(export_data)
-    filename = f"omset_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    async def export_rows():
+        async for r in cursor:
+            yield [
+                r.get('record_date', ''), r.get('customer_name', ''),
+                r.get('customer_id', ''), r.get('product_name', ''),
+                r.get('staff_name', ''), r.get('nominal', 0),
+                r.get('depo_kelipatan', 1), r.get('depo_total', 0),
+                r.get('customer_type', ''), r.get('keterangan', ''),
+                r.get('created_at', '')
+            ]
     
-    if format == 'csv':
-        output = io.BytesIO()
-        df.to_csv(output, index=False, encoding='utf-8')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.csv"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
-        return FileResponse(path=temp_path, media_type='text/csv', filename=f"{filename}.csv")
-    else:
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.xlsx"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
-        return FileResponse(path=temp_path, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', filename=f"{filename}.xlsx")
+    return streaming_export_response(
+        ['Date', 'Customer Name', 'Customer ID', 'Product', 'Staff', 'Nominal',
+         'Kelipatan', 'Depo Total', 'Customer Type', 'Keterangan', 'Created At'],
+        export_rows(),
+        filename=f"omset_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        format='csv' if format == 'csv' else 'xlsx',
+        sheet_title='OMSET'
+    )
 
 @router.get("/export/staff-report")
 async def export_staff_performance_report(format: str = 'xlsx', period: str = 'month', custom_start: Optional[str] = None, custom_end: Optional[str] = None, token: Optional[str] = None):
@@ -1477,24 +1483,14 @@ async def export_staff_performance_report(format: str = 'xlsx', period: str = 'm
         'Respond Rate (%)': s['respond_rate'], 'Completion Rate (%)': s['completion_rate']
     } for s in analytics['staff_metrics']]
     
-    df = pd.DataFrame(export_data)
     filename = f"staff_performance_{period}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
+    # File is written on the process pool so other requests keep being served
     if format == 'csv':
-        output = io.BytesIO()
-        df.to_csv(output, index=False, encoding='utf-8')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.csv"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
+        temp_path = await run_cpu_bound(write_table_file, export_data, f"/tmp/{filename}.csv", 'csv')
         return FileResponse(path=temp_path, media_type='text/csv', filename=f"{filename}.csv")
     else:
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.xlsx"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
+        temp_path = await run_cpu_bound(write_table_file, export_data, f"/tmp/{filename}.xlsx", 'xlsx')
         return FileResponse(path=temp_path, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', filename=f"{filename}.xlsx")
 
 @router.get("/export/leave-requests")
@@ -1538,24 +1534,14 @@ async def export_leave_requests(
         'Created At': r.get('created_at', '')
     } for r in records]
     
-    df = pd.DataFrame(export_data)
     filename = f"leave_requests_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
+    # File is written on the process pool so other requests keep being served
     if format == 'csv':
-        output = io.BytesIO()
-        df.to_csv(output, index=False, encoding='utf-8')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.csv"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
+        temp_path = await run_cpu_bound(write_table_file, export_data, f"/tmp/{filename}.csv", 'csv')
         return FileResponse(path=temp_path, media_type='text/csv', filename=f"{filename}.csv")
     else:
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.xlsx"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
+        temp_path = await run_cpu_bound(write_table_file, export_data, f"/tmp/{filename}.xlsx", 'xlsx')
         return FileResponse(path=temp_path, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', filename=f"{filename}.xlsx")
 
 @router.get("/export/izin-records")
@@ -1591,22 +1577,12 @@ async def export_izin_records(
         'Created At': r.get('created_at', '')
     } for r in records]
     
-    df = pd.DataFrame(export_data)
     filename = f"izin_records_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
+    # File is written on the process pool so other requests keep being served
     if format == 'csv':
-        output = io.BytesIO()
-        df.to_csv(output, index=False, encoding='utf-8')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.csv"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
+        temp_path = await run_cpu_bound(write_table_file, export_data, f"/tmp/{filename}.csv", 'csv')
         return FileResponse(path=temp_path, media_type='text/csv', filename=f"{filename}.csv")
     else:
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        temp_path = f"/tmp/{filename}.xlsx"
-        with open(temp_path, 'wb') as f:
-            f.write(output.getvalue())
+        temp_path = await run_cpu_bound(write_table_file, export_data, f"/tmp/{filename}.xlsx", 'xlsx')
         return FileResponse(path=temp_path, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', filename=f"{filename}.xlsx")
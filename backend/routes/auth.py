@@ -5,8 +5,11 @@ from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from .deps import (
     User, UserCreate, UserLogin, get_db, get_current_user, get_admin_user, get_master_admin_user,
-    hash_password, verify_password, create_token, get_jakarta_now, can_manage_user, ROLE_HIERARCHY
+    hash_password, verify_password, create_token, get_jakarta_now, can_manage_user, ROLE_HIERARCHY,
+    invalidate_cached_user
 )
+from utils.executors import run_blocking
+from utils.reserved_snapshot import bump_reserved_version
 
 router = APIRouter(tags=["Authentication"])
 
@@ -37,7 +40,7 @@ async def register(user_data: UserCreate, admin: User = Depends(get_admin_user))
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    password_hash = hash_password(user_data.password)
+    password_hash = await run_blocking(hash_password, user_data.password)
     user = User(
         email=user_data.email,
         name=user_data.name,
@@ -65,7 +68,7 @@ async def login(credentials: UserLogin):
             detail="Service temporarily unavailable. Please try again in a moment."
         )
     
-    if not user or not verify_password(credentials.password, user['password_hash']):
+    if not user or not await run_blocking(verify_password, credentials.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Update login timestamp and set user as online
@@ -83,6 +86,9 @@ async def login(credentials: UserLogin):
         # Log but don't fail login if we can't update timestamp
         print(f"Warning: Could not update login timestamp: {e}")
     
+    from utils.activity_registry import activity_registry
+    activity_registry.touch(user['id'], now)
+    
     token = create_token(user['id'], user['email'], user['role'])
     return {
         'token': token,
@@ -127,7 +133,7 @@ async def change_password(request: ChangePasswordRequest, user: User = Depends(g
         raise HTTPException(status_code=404, detail="User not found")
     
     # Verify current password
-    if not verify_password(request.current_password, current_user['password_hash']):
+    if not await run_blocking(verify_password, request.current_password, current_user['password_hash']):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     # Validate new password
@@ -135,11 +141,12 @@ async def change_password(request: ChangePasswordRequest, user: User = Depends(g
         raise HTTPException(status_code=400, detail="New password must be at least 6 characters")
     
     # Update password
-    new_hash = hash_password(request.new_password)
+    new_hash = await run_blocking(hash_password, request.new_password)
     await db.users.update_one(
         {'id': user.id},
         {'$set': {'password_hash': new_hash}}
     )
+    await invalidate_cached_user(user.id)
     
     return {'message': 'Password changed successfully'}
 
@@ -164,6 +171,7 @@ async def update_profile(request: UpdateProfileRequest, user: User = Depends(get
         raise HTTPException(status_code=400, detail="No fields to update")
     
     await db.users.update_one({'id': user.id}, {'$set': update_data})
+    await invalidate_cached_user(user.id)
     
     # Return updated user
     updated_user = await db.users.find_one({'id': user.id}, {'_id': 0, 'password_hash': 0})
@@ -209,16 +217,10 @@ async def heartbeat(user: User = Depends(get_current_user)):
     - Updates ONLY that specific user's last_activity
     - Cannot affect any other user's status
     """
-    db = get_db()
-    now = get_jakarta_now()
+    from utils.activity_registry import activity_registry
     
-    # Update ONLY this user's activity - filter by their unique ID
-    await db.users.update_one(
-        {'id': user.id},
-        {'$set': {
-            'last_activity': now.isoformat()
-        }}
-    )
+    # Update ONLY this user's activity - buffered and flushed to users.last_activity in bulk
+    now = activity_registry.touch(user.id)
     
     return {
         'status': 'ok',
@@ -243,6 +245,7 @@ async def get_user_activity(admin: User = Depends(get_admin_user)):
     # Import datetime utilities
     from datetime import datetime
     import pytz
+    from utils.activity_registry import activity_registry, parse_activity_time
     JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
     now = datetime.now(JAKARTA_TZ)
     
@@ -251,8 +254,11 @@ async def get_user_activity(admin: User = Depends(get_admin_user)):
     IDLE_THRESHOLD = 30       # 5-30 minutes = Idle
     OFFLINE_THRESHOLD = 60    # 60+ minutes = Offline
     
-    # Fetch all users (excluding password)
-    users = await db.users.find({}, {'_id': 0, 'password_hash': 0}).to_list(1000)
+    # Fetch all users (only the fields shown here)
+    users = await db.users.find(
+        {},
+        {'_id': 0, 'id': 1, 'name': 1, 'email': 1, 'role': 1, 'last_activity': 1, 'last_logout': 1}
+    ).to_list(1000)
     
     activity_list = []
     online_count = 0
@@ -260,7 +266,8 @@ async def get_user_activity(admin: User = Depends(get_admin_user)):
     offline_count = 0
     
     for user_doc in users:
-        last_activity_str = user_doc.get('last_activity')
+        # Heartbeats not yet flushed to the database are in the activity registry
+        last_activity_str = activity_registry.last_activity_iso(user_doc.get('id'), user_doc.get('last_activity'))
         last_logout_str = user_doc.get('last_logout')
         user_role = user_doc.get('role', 'staff')
         
@@ -272,9 +279,7 @@ async def get_user_activity(admin: User = Depends(get_admin_user)):
         if last_activity_str:
             try:
                 # Parse last_activity timestamp
-                last_activity = datetime.fromisoformat(last_activity_str.replace('Z', '+00:00'))
-                if last_activity.tzinfo is None:
-                    last_activity = JAKARTA_TZ.localize(last_activity)
+                last_activity = parse_activity_time(last_activity_str)
                 
                 minutes_since_activity = (now - last_activity).total_seconds() / 60
                 
@@ -377,11 +382,12 @@ async def emergency_reset_password(data: EmergencyPasswordReset):
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
     
     # Update password
-    new_hash = hash_password(data.new_password)
+    new_hash = await run_blocking(hash_password, data.new_password)
     await db.users.update_one(
         {'email': data.email},
         {'$set': {'password_hash': new_hash}}
     )
+    await invalidate_cached_user(user['id'])
     
     return {
         'status': 'ok',
@@ -432,6 +438,7 @@ async def update_page_access(
         {'id': user_id},
         {'$set': {'blocked_pages': access_data.blocked_pages}}
     )
+    await invalidate_cached_user(user_id)
     
     return {'message': 'Page access updated successfully', 'blocked_pages': access_data.blocked_pages}
 
@@ -469,6 +476,7 @@ async def update_user_page_access(
         {'id': user_id},
         {'$set': {'blocked_pages': access_data.blocked_pages}}
     )
+    await invalidate_cached_user(user_id)
     
     return {'message': 'Page access updated successfully', 'blocked_pages': access_data.blocked_pages}
 
@@ -516,12 +524,13 @@ async def update_user(user_id: str, user_data: UserUpdate, admin: User = Depends
             raise HTTPException(status_code=400, detail="Email already in use")
         update_data['email'] = user_data.email
     if user_data.password:
-        update_data['password_hash'] = hash_password(user_data.password)
+        update_data['password_hash'] = await run_blocking(hash_password, user_data.password)
     if user_data.role:
         update_data['role'] = user_data.role
     
     if update_data:
         await db.users.update_one({'id': user_id}, {'$set': update_data})
+        await invalidate_cached_user(user_id)
     
     updated_user = await db.users.find_one({'id': user_id}, {'_id': 0, 'password_hash': 0})
     return updated_user
@@ -560,6 +569,8 @@ async def delete_user(user_id: str, admin: User = Depends(get_admin_user)):
     # Delete reserved members owned by this user
     result = await db.reserved_members.delete_many({'staff_id': user_id})
     cleanup_results['reserved_members'] = result.deleted_count
+    if result.deleted_count:
+        await bump_reserved_version(db)
     
     # Delete bonus check submissions by this user
     result = await db.bonus_check_submissions.delete_many({'staff_id': user_id})
@@ -590,6 +601,7 @@ async def delete_user(user_id: str, admin: User = Depends(get_admin_user)):
     
     # Finally delete the user
     await db.users.delete_one({'id': user_id})
+    await invalidate_cached_user(user_id)
     
     return {
         'message': 'User deleted successfully',
@@ -667,11 +679,22 @@ async def delete_staff_records(staff_id: str, admin: User = Depends(get_admin_us
     if omset_count == 0 and bonanza_count == 0 and memberwd_count == 0:
         raise HTTPException(status_code=404, detail="No records found for this staff")
     
+    # Customers whose deposit profiles include this staff's OMSET (refreshed after the purge)
+    purged_customer_ids = await db.omset_records.distinct('customer_id_normalized', {'staff_id': staff_id})
+    
     # Delete from all relevant collections
     omset_result = await db.omset_records.delete_many({'staff_id': staff_id})
     bonanza_result = await db.bonanza_records.delete_many({'staff_id': staff_id})
     memberwd_result = await db.memberwd_records.delete_many({'staff_id': staff_id})
     
+    # Keep the NDP/RDP first-deposit index, daily rollups and deposit profiles in sync with the purged OMSET
+    from utils.first_deposit_index import delete_first_deposits_for_staff
+    from utils.omset_rollup import delete_rollups_for_staff
+    await delete_first_deposits_for_staff(db, staff_id)
+    await delete_rollups_for_staff(db, staff_id)
+    from utils.deposit_profile import refresh_deposit_profiles_for_customers
+    await refresh_deposit_profiles_for_customers(db, purged_customer_ids)
+    
     # Also clean up any attendance records
     attendance_result = await db.attendance_records.delete_many({'staff_id': staff_id})
     totp_result = await db.attendance_totp.delete_many({'staff_id': staff_id})
@@ -17,15 +17,18 @@
 #   - customer_name (old field, for backwards compatibility)
 #
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File, Form
 from pydantic import BaseModel
 from typing import Optional, List
+import os
 import uuid
-import random
-import pandas as pd
-import io
-from .deps import User, get_db, get_current_user, get_admin_user, get_jakarta_now
-from utils.reserved_check import build_reserved_set, build_reserved_map, is_record_reserved, find_reservation_owner, ensure_reserved_status_for_database
+from .deps import User, get_db, get_current_user, get_admin_user, get_jakarta_now, PageParams, get_page_params, read_page, submit_job
+from utils.reserved_check import is_record_reserved, find_reservation_owner, ensure_reserved_status_for_database, build_row_identifiers, build_unreserved_filter
+from utils.record_assignment import count_assignable, claim_random_records
+from utils.reserved_snapshot import get_reserved_snapshot
+from utils.pagination import apply_page_headers
+from utils.ingestion import BLANK_TEXT, ChunkReader, IngestionJob, UploadParseError, new_spool_path, spool_upload, import_upload, run_in_background
+from utils.job_queue import JobContext, register_job
 
 router = APIRouter(tags=["DB Bonanza"])
 
@@ -136,7 +139,7 @@ async def sanitize_bonanza_records(database_id: str, user: User = Depends(get_ad
         if needs_fix or row_data != sanitized:
             await db.bonanza_records.update_one(
                 {'id': record['id']},
-                {'$set': {'row_data': sanitized}}
+                {'$set': {'row_data': sanitized, 'row_identifiers': build_row_identifiers(sanitized)}}
             )
             fixed_count += 1
     
@@ -153,9 +156,10 @@ async def upload_bonanza_database(
     file: UploadFile = File(...),
     name: str = Form(...),
     product_id: str = Form(...),
+    background: bool = Form(False),
     user: User = Depends(get_admin_user)
 ):
-    """Upload a new Bonanza database (Admin only)"""
+    """Upload a new Bonanza database (Admin only), imported in chunks (background=true returns a job_id to poll)"""
     db = get_db()
     if not file.filename.endswith(('.csv', '.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
@@ -164,23 +168,21 @@ async def upload_bonanza_database(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    contents = await file.read()
+    file_type = 'csv' if file.filename.endswith('.csv') else file.filename.rsplit('.', 1)[-1].lower()
+    spool_path = new_spool_path('bonanza', file_type)
+    await spool_upload(file, spool_path)
     
+    reader = ChunkReader(spool_path, file_type, BLANK_TEXT)
     try:
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        else:
-            df = pd.read_excel(io.BytesIO(contents))
+        first_chunk = await reader.next_chunk()
     except Exception as e:
+        os.remove(spool_path)
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
     
     # CRITICAL: Get ACTIVE reserved members to flag during upload
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'}, 
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'staff_id': 1, 'staff_name': 1}
-    ).to_list(100000)
+    reserved_map = (await get_reserved_snapshot(db)).reserved_map
     
-    reserved_map = build_reserved_map(reserved_members)
+    job = await IngestionJob.create(db, 'bonanza', file.filename, user)
     
     database_id = str(uuid.uuid4())
     database_doc = {
@@ -188,90 +190,102 @@ async def upload_bonanza_database(
         'name': name,
         'filename': file.filename,
         'file_type': 'csv' if file.filename.endswith('.csv') else 'excel',
-        'total_records': len(df),
+        'total_records': reader.rows_read,
         'product_id': product_id,
         'product_name': product['name'],
         'uploaded_by': user.id,
         'uploaded_by_name': user.name,
-        'uploaded_at': get_jakarta_now().isoformat()
+        'uploaded_at': get_jakarta_now().isoformat(),
+        'ingest_job_id': job.id
     }
     
     await db.bonanza_databases.insert_one(database_doc)
+    await job.update(database_id=database_id)
     
-    records = []
     reserved_count = 0
     
-    for idx, row in df.iterrows():
-        # Sanitize row data to handle NaN, NaT, and other special values
-        row_data = {}
-        for col, value in row.items():
-            if pd.isna(value):
-                row_data[str(col)] = ''
-            elif isinstance(value, (int, float)):
-                if pd.isna(value) or value != value:  # Check for NaN
-                    row_data[str(col)] = ''
-                else:
-                    row_data[str(col)] = str(value) if not float(value).is_integer() else str(int(value))
-            else:
-                # Convert to string and handle any encoding issues
-                try:
-                    row_data[str(col)] = str(value) if value is not None else ''
-                except Exception:
-                    row_data[str(col)] = ''
-        
-        # Check if this record is a reserved member
-        # Check ALL row_data values against reserved members (field-name independent)
-        is_reserved = False
-        reserved_by = None
-        reserved_by_name = None
-        
-        for key, value in row_data.items():
-            if value:
-                normalized = str(value).strip().upper()
-                if normalized in reserved_map:
-                    is_reserved = True
-                    reserved_by = reserved_map[normalized]['staff_id']
-                    reserved_by_name = reserved_map[normalized]['staff_name']
-                    reserved_count += 1
-                    break
-        
-        record = {
-            'id': str(uuid.uuid4()),
-            'database_id': database_id,
-            'database_name': name,
+    def build_docs(rows: List[dict], first_row_number: int) -> List[dict]:
+        nonlocal reserved_count
+        records = []
+        for idx, row_data in enumerate(rows, start=first_row_number):
+            # Check if this record is a reserved member
+            # Check ALL row_data values against reserved members (field-name independent)
+            is_reserved = False
+            reserved_by = None
+            reserved_by_name = None
+            
+            for key, value in row_data.items():
+                if value and str(value).strip():
+                    normalized = str(value).strip().upper()
+                    if normalized in reserved_map:
+                        is_reserved = True
+                        reserved_by = reserved_map[normalized]['staff_id']
+                        reserved_by_name = reserved_map[normalized]['staff_name']
+                        reserved_count += 1
+                        break
+            
+            records.append({
+                'id': str(uuid.uuid4()),
+                'database_id': database_id,
+                'database_name': name,
+                'product_id': product_id,
+                'product_name': product['name'],
+                'row_number': idx,
+                'row_data': row_data,
+                'row_identifiers': build_row_identifiers(row_data),
+                'status': 'reserved' if is_reserved else 'available',
+                'assigned_to': None,
+                'assigned_to_name': None,
+                'assigned_at': None,
+                'assigned_by': None,
+                'assigned_by_name': None,
+                'is_reserved_member': is_reserved,
+                'reserved_by': reserved_by,
+                'reserved_by_name': reserved_by_name,
+                'created_at': get_jakarta_now().isoformat()
+            })
+        return records
+    
+    async def finalize(total_records: int) -> dict:
+        await db.bonanza_databases.update_one({'id': database_id}, {'$set': {'total_records': total_records}})
+        result = {
+            'id': database_id,
+            'name': name,
             'product_id': product_id,
             'product_name': product['name'],
-            'row_number': idx + 1,
-            'row_data': row_data,
-            'status': 'reserved' if is_reserved else 'available',
-            'assigned_to': None,
-            'assigned_to_name': None,
-            'assigned_at': None,
-            'assigned_by': None,
-            'assigned_by_name': None,
-            'is_reserved_member': is_reserved,
-            'reserved_by': reserved_by,
-            'reserved_by_name': reserved_by_name,
-            'created_at': get_jakarta_now().isoformat()
+            'total_records': total_records,
+            'columns': reader.columns
+        }
+        if reserved_count > 0:
+            result['warning'] = f'{reserved_count} records are reserved members and will be excluded from random assignment'
+            result['reserved_count'] = reserved_count
+        return result
+    
+    async def run_import():
+        try:
+            return await import_upload(
+                job, reader, first_chunk, db.bonanza_records, build_docs, finalize, db.bonanza_databases, database_id
+            )
+        finally:
+            os.remove(spool_path)
+    
+    if background:
+        run_in_background(run_import())
+        return {
+            'id': database_id,
+            'name': name,
+            'product_id': product_id,
+            'product_name': product['name'],
+            'columns': reader.columns,
+            'job_id': job.id,
+            'status': 'running'
         }
-        records.append(record)
-    
-    if records:
-        await db.bonanza_records.insert_many(records)
-    
-    response = {
-        'id': database_id,
-        'name': name,
-        'product_id': product_id,
-        'product_name': product['name'],
-        'total_records': len(df),
-        'columns': list(df.columns)
-    }
-    
-    if reserved_count > 0:
-        response['warning'] = f'{reserved_count} records are reserved members and will be excluded from random assignment'
-        response['reserved_count'] = reserved_count
     
+    try:
+        response = await run_import()
+    except UploadParseError as e:
+        raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
+    response['job_id'] = job.id
     return response
 
 @router.get("/bonanza/databases")
@@ -330,12 +344,7 @@ async def assign_bonanza_records(assignment: BonanzaAssignment, user: User = Dep
         raise HTTPException(status_code=404, detail="Staff not found")
     
     # CRITICAL: Check for reserved members BEFORE assigning
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'}, 
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'staff_id': 1, 'staff_name': 1}
-    ).to_list(100000)
-    
-    reserved_map_local = build_reserved_map(reserved_members)
+    reserved_map_local = (await get_reserved_snapshot(db)).reserved_map
     
     # Get the records to be assigned
     records = await db.bonanza_records.find(
@@ -401,38 +410,25 @@ async def assign_random_bonanza_records(assignment: RandomBonanzaAssignment, use
     
     # Get ACTIVE reserved members only (approved status)
     # Deleted reserved members should NOT be excluded - their customers are available again
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'}, 
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1}
-    ).to_list(100000)
+    reserved_ids = (await get_reserved_snapshot(db)).reserved_set
     
-    reserved_ids = build_reserved_set(reserved_members)
-    
-    available_records = await db.bonanza_records.find(
-        {'database_id': assignment.database_id, 'status': 'available'},
-        {'_id': 0}
-    ).to_list(100000)
+    # Reserved records are excluded with an indexed predicate on row_identifiers
+    available_query = {'database_id': assignment.database_id, 'status': 'available'}
+    unreserved_query = build_unreserved_filter(reserved_ids)
+    counts = await count_assignable(db.bonanza_records, available_query, unreserved_query)
+    skipped_count = counts['reserved']
     
-    eligible_records = []
-    skipped_count = 0
-    for record in available_records:
-        if is_record_reserved(record, reserved_ids):
-            skipped_count += 1
-            continue
-        eligible_records.append(record)
-    
-    if len(eligible_records) == 0:
+    if counts['eligible'] == 0:
         raise HTTPException(status_code=400, detail="No eligible records available")
     
-    if assignment.quantity > len(eligible_records):
-        raise HTTPException(status_code=400, detail=f"Only {len(eligible_records)} eligible records available")
+    if assignment.quantity > counts['eligible']:
+        raise HTTPException(status_code=400, detail=f"Only {counts['eligible']} eligible records available")
     
-    random.shuffle(eligible_records)
-    selected_records = eligible_records[:assignment.quantity]
-    selected_ids = [r['id'] for r in selected_records]
-    
-    result = await db.bonanza_records.update_many(
-        {'id': {'$in': selected_ids}},
+    # Draw and claim the records server-side ($sample + conditional update)
+    selected_ids = await claim_random_records(
+        db.bonanza_records,
+        {**available_query, **unreserved_query},
+        assignment.quantity,
         {'$set': {
             'status': 'assigned',
             'assigned_to': staff['id'],
@@ -444,10 +440,10 @@ async def assign_random_bonanza_records(assignment: RandomBonanzaAssignment, use
     )
     
     return {
-        'message': f'{result.modified_count} records assigned to {staff["name"]}',
-        'assigned_count': result.modified_count,
+        'message': f'{len(selected_ids)} records assigned to {staff["name"]}',
+        'assigned_count': len(selected_ids),
         'total_reserved_in_db': skipped_count,
-        'remaining_eligible': len(eligible_records) - assignment.quantity
+        'remaining_eligible': counts['eligible'] - len(selected_ids)
     }
 
 @router.delete("/bonanza/databases/{database_id}")
@@ -459,8 +455,13 @@ async def delete_bonanza_database(database_id: str, user: User = Depends(get_adm
     return {'message': 'Database deleted successfully'}
 
 @router.get("/bonanza/staff/records")
-async def get_staff_bonanza_records(product_id: Optional[str] = None, user: User = Depends(get_current_user)):
-    """Get Bonanza records assigned to the current staff"""
+async def get_staff_bonanza_records(
+    response: Response,
+    product_id: Optional[str] = None,
+    page: PageParams = Depends(get_page_params),
+    user: User = Depends(get_current_user)
+):
+    """Get Bonanza records assigned to the current staff (keyset-paginated, next page cursor in X-Next-Cursor)"""
     db = get_db()
     if user.role != 'staff':
         raise HTTPException(status_code=403, detail="Only staff can access this endpoint")
@@ -469,7 +470,9 @@ async def get_staff_bonanza_records(product_id: Optional[str] = None, user: User
     if product_id:
         query['product_id'] = product_id
     
-    records = await db.bonanza_records.find(query, {'_id': 0}).sort('assigned_at', -1).to_list(10000)
+    result = await read_page(db.bonanza_records, query, [('assigned_at', -1), ('id', -1)], page, default_limit=10000)
+    apply_page_headers(response, result)
+    records = result.items
     
     for record in records:
         if 'product_id' not in record:
@@ -582,8 +585,7 @@ async def validate_bonanza_records(data: RecordValidation, user: User = Depends(
             replacement_details = []
             
             # Get reserved members
-            reserved_members = await db.reserved_members.find({'status': 'approved'}, {'_id': 0, 'customer_id': 1, 'customer_name': 1}).to_list(100000)
-            reserved_ids = build_reserved_set(reserved_members)
+            reserved_ids = (await get_reserved_snapshot(db)).reserved_set
             
             for database_id, group in invalid_by_db.items():
                 invalid_records = group['records']
@@ -871,12 +873,7 @@ async def process_invalid_and_replace(staff_id: str, data: ProcessInvalidRequest
         raise HTTPException(status_code=404, detail="Staff not found")
     
     # Get reserved members for filtering
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'},
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1}
-    ).to_list(100000)
-    
-    reserved_ids = build_reserved_set(reserved_members)
+    reserved_ids = (await get_reserved_snapshot(db)).reserved_set
     
     # Group invalid records by database_id
     invalid_by_database = {}
@@ -1076,16 +1073,30 @@ async def get_staff_list(user: User = Depends(get_admin_user)):
     return staff
 
 
-@router.post("/bonanza/admin/repair-data")
-async def repair_bonanza_data(user: User = Depends(get_admin_user)):
+@register_job('bonanza_repair', concurrency=1, lease_seconds=300)
+async def run_bonanza_repair(ctx: JobContext):
     """
-    Repair and synchronize bonanza record data.
-    Uses shared repair utilities for consistency across modules.
+    Job: repair bonanza record data with the shared repair utilities.
+    Progress is checkpointed after every database so a resumed job skips the repaired ones.
     """
     from utils.repair_helpers import run_full_repair
     
     db = get_db()
-    return await run_full_repair(db, module='bonanza')
+    await ctx.progress(0, 'Repairing records')
+    return await run_full_repair(
+        db, module='bonanza', checkpoint=ctx.checkpoint,
+        on_progress=lambda percent, message, state: ctx.progress(percent, message, checkpoint=state)
+    )
+
+
+@router.post("/bonanza/admin/repair-data")
+async def repair_bonanza_data(wait: bool = True, user: User = Depends(get_admin_user)):
+    """
+    Repair and synchronize bonanza record data.
+    Uses shared repair utilities for consistency across modules.
+    Runs as a background job (see GET /jobs/{job_id}).
+    """
+    return await submit_job('bonanza_repair', {}, user, wait)
 
 
 @router.post("/bonanza/admin/repair-product-mismatch")
@@ -1164,16 +1175,12 @@ async def diagnose_invalid_records(staff_id: str, user: User = Depends(get_admin
     }, {'_id': 0}).to_list(10000)
     
     # Get reserved members
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'},
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1}
-    ).to_list(100000)
-    
-    reserved_ids = build_reserved_set(reserved_members)
+    snapshot = await get_reserved_snapshot(db)
+    reserved_ids = snapshot.reserved_set
     
     diagnosis = {
         'total_invalid_records': len(invalid_records),
-        'reserved_members_count': len(reserved_members),
+        'reserved_members_count': len(snapshot.members),
         'invalid_records_by_database': {},
         'issues': []
     }
@@ -3,11 +3,11 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import Optional, List
-import io
-import pandas as pd
 
 from .deps import get_db, get_admin_user, get_user_from_token_param, User
 from utils.helpers import normalize_customer_id, get_jakarta_now
+from utils.executors import run_cpu_bound
+from utils.workbooks import write_sheets_xlsx
 
 router = APIRouter(tags=["Bonus Calculation"])
 
@@ -165,9 +165,9 @@ async def get_bonus_calculation_data(
         keterangan = record.get('keterangan', '') or ''
         return 'tambahan' in keterangan.lower()
     
-    # Build STAFF-SPECIFIC customer first deposit map using MongoDB aggregation
+    # Build STAFF-SPECIFIC customer first deposit map from the first-deposit index
     from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db)
+    staff_customer_first_date = await build_staff_first_date_map(db, records=records)
     
     staff_data = {}
     for record in records:
@@ -328,48 +328,43 @@ async def export_bonus_calculation(
     
     bonus_data = await get_bonus_calculation_data(year, month, None, user)
     
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        summary_data = []
-        for staff in bonus_data['staff_bonuses']:
-            summary_data.append({
-                'Staff': staff['staff_name'],
-                'Total Nominal (Rp)': staff['total_nominal'],
-                'Main Bonus ($)': staff['main_bonus'],
-                'NDP Bonus ($)': staff['ndp_bonus_total'],
-                'RDP Bonus ($)': staff['rdp_bonus_total'],
-                'Total Bonus ($)': staff['total_bonus'],
-                'Days Worked': staff['days_worked']
-            })
-        
+    summary_data = []
+    for staff in bonus_data['staff_bonuses']:
         summary_data.append({
-            'Staff': 'GRAND TOTAL',
-            'Total Nominal (Rp)': bonus_data['grand_total']['total_nominal'],
-            'Main Bonus ($)': bonus_data['grand_total']['main_bonus'],
-            'NDP Bonus ($)': bonus_data['grand_total']['ndp_bonus_total'],
-            'RDP Bonus ($)': bonus_data['grand_total']['rdp_bonus_total'],
-            'Total Bonus ($)': bonus_data['grand_total']['total_bonus'],
-            'Days Worked': '-'
+            'Staff': staff['staff_name'],
+            'Total Nominal (Rp)': staff['total_nominal'],
+            'Main Bonus ($)': staff['main_bonus'],
+            'NDP Bonus ($)': staff['ndp_bonus_total'],
+            'RDP Bonus ($)': staff['rdp_bonus_total'],
+            'Total Bonus ($)': staff['total_bonus'],
+            'Days Worked': staff['days_worked']
         })
-        
-        summary_df = pd.DataFrame(summary_data)
-        summary_df.to_excel(writer, sheet_name='Bonus Summary', index=False)
-        
-        for staff in bonus_data['staff_bonuses']:
-            if staff['daily_breakdown']:
-                daily_df = pd.DataFrame(staff['daily_breakdown'])
-                daily_df.columns = ['Date', 'NDP', 'RDP', 'NDP Bonus ($)', 'RDP Bonus ($)']
-                sheet_name = staff['staff_name'][:31]
-                daily_df.to_excel(writer, sheet_name=sheet_name, index=False)
     
-    output.seek(0)
+    summary_data.append({
+        'Staff': 'GRAND TOTAL',
+        'Total Nominal (Rp)': bonus_data['grand_total']['total_nominal'],
+        'Main Bonus ($)': bonus_data['grand_total']['main_bonus'],
+        'NDP Bonus ($)': bonus_data['grand_total']['ndp_bonus_total'],
+        'RDP Bonus ($)': bonus_data['grand_total']['rdp_bonus_total'],
+        'Total Bonus ($)': bonus_data['grand_total']['total_bonus'],
+        'Days Worked': '-'
+    })
+    
+    sheets = [('Bonus Summary', summary_data, None)]
+    for staff in bonus_data['staff_bonuses']:
+        if staff['daily_breakdown']:
+            sheets.append((
+                staff['staff_name'][:31],
+                [list(day.values()) for day in staff['daily_breakdown']],
+                ['Date', 'NDP', 'RDP', 'NDP Bonus ($)', 'RDP Bonus ($)']
+            ))
     
     month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
     filename = f"Bonus_Calculation_{month_names[month-1]}_{year}.xlsx"
     
+    # Workbook is built on the process pool so other requests keep being served
     temp_path = f"/tmp/{filename}"
-    with open(temp_path, 'wb') as f:
-        f.write(output.getvalue())
+    await run_cpu_bound(write_sheets_xlsx, sheets, temp_path)
     
     return FileResponse(
         path=temp_path,
@@ -410,9 +405,9 @@ async def get_my_bonus_data(
         keterangan = record.get('keterangan', '') or ''
         return 'tambahan' in keterangan.lower()
     
-    # Build STAFF-SPECIFIC customer first deposit map using MongoDB aggregation
+    # Build STAFF-SPECIFIC customer first deposit map from the first-deposit index
     from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db)
+    staff_customer_first_date = await build_staff_first_date_map(db, records=records)
     
     # Calculate staff's bonus data
     total_nominal = 0
@@ -7,7 +7,11 @@ from typing import Optional, List
 import uuid
 import io
 import csv
-from .deps import User, get_db, get_current_user, get_admin_user, get_jakarta_now
+from .deps import User, get_db, get_current_user, get_admin_user, get_jakarta_now, PageParams, get_page_params, read_page
+from utils.executors import run_cpu_bound
+from utils.workbooks import styled_table_xlsx_bytes
+from utils.deposit_lookup import find_last_deposit_date
+from utils.reserved_lookup import find_reservation
 from datetime import datetime, timedelta
 
 router = APIRouter(tags=["Bonus Check"])
@@ -48,15 +52,9 @@ async def submit_bonus_check(data: BonusCheckSubmission, user: User = Depends(ge
     # Check if customer is in staff's reserved member list
     # Check both customer_id and customer_name fields for backwards compatibility
     # Use staff_id field (not reserved_by)
-    reserved = await db.reserved_members.find_one({
-        '$or': [
-            {'customer_id': {'$regex': f'^{customer_id_normalized}$', '$options': 'i'}},
-            {'customer_name': {'$regex': f'^{customer_id_normalized}$', '$options': 'i'}}
-        ],
-        'staff_id': user.id,
-        'product_id': data.product_id,
-        'status': 'approved'
-    }, {'_id': 0})
+    reserved = await find_reservation(
+        db, customer_id_normalized, status='approved', product_id=data.product_id, staff_id=user.id
+    )
     
     if not reserved:
         return BonusCheckResponse(
@@ -79,20 +77,12 @@ async def submit_bonus_check(data: BonusCheckSubmission, user: User = Depends(ge
     
     # Get LAST DEPOSIT DATE from omset_records (using record_date field)
     # This is the CORRECT date to use for grace period calculation
-    last_omset = await db.omset_records.find_one(
-        {
-            'customer_id': {'$regex': f'^{customer_id_normalized}$', '$options': 'i'},
-            'staff_id': user.id
-        },
-        {'_id': 0, 'record_date': 1},
-        sort=[('record_date', -1)]  # Get the most recent by actual deposit date
-    )
+    last_omset_date = await find_last_deposit_date(db, customer_id_normalized, staff_id=user.id)
     
-    if last_omset and last_omset.get('record_date'):
+    if last_omset_date:
         # Use last deposit date for expiration calculation
         try:
-            record_date_str = last_omset['record_date']
-            last_deposit_date = datetime.strptime(record_date_str, '%Y-%m-%d')
+            last_deposit_date = datetime.strptime(last_omset_date, '%Y-%m-%d')
         except Exception:
             # Fall back to approved_at if parsing fails
             approved_at = reserved.get('approved_at') or reserved.get('created_at')
@@ -213,9 +203,10 @@ async def get_all_bonus_submissions(
     month: Optional[str] = None,
     staff_id: Optional[str] = None,
     product_id: Optional[str] = None,
+    page: PageParams = Depends(get_page_params),
     user: User = Depends(get_admin_user)
 ):
-    """Admin: Get all bonus check submissions"""
+    """Admin: Get all bonus check submissions (keyset-paginated; pass next_cursor back as cursor)"""
     db = get_db()
     
     query = {}
@@ -233,11 +224,12 @@ async def get_all_bonus_submissions(
     if product_id:
         query['product_id'] = product_id
     
-    submissions = await db.bonus_check_submissions.find(
-        query, {'_id': 0}
-    ).sort('submitted_at', -1).to_list(10000)
+    result = await read_page(
+        db.bonus_check_submissions, query, [('submitted_at', -1), ('id', -1)], page, default_limit=10000
+    )
+    submissions = result.items
     
-    # Group by staff for summary
+    # Group by staff for summary (of this page)
     staff_summary = {}
     for sub in submissions:
         sid = sub['staff_id']
@@ -251,9 +243,11 @@ async def get_all_bonus_submissions(
     
     return {
         'submissions': submissions,
-        'total': len(submissions),
+        'total': result.total if result.total is not None else len(submissions),
         'month': query['month'],
-        'by_staff': list(staff_summary.values())
+        'by_staff': list(staff_summary.values()),
+        'next_cursor': result.next_cursor,
+        'has_more': result.has_more
     }
 
 
@@ -316,54 +310,31 @@ async def export_bonus_submissions(
         )
     
     else:
-        # Excel format using openpyxl
+        # Excel format using openpyxl, built on the process pool
         try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, PatternFill
-            
-            wb = Workbook()
-            ws = wb.active
-            ws.title = f"Bonus Check {query['month']}"
-            
-            # Header style
-            header_font = Font(bold=True, color="FFFFFF")
-            header_fill = PatternFill(start_color="4F46E5", end_color="4F46E5", fill_type="solid")
-            
-            # Headers
-            headers = ['No', 'Customer ID', 'Product', 'Staff Name', 'Submitted At', 'Month', 'Status']
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col, value=header)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = Alignment(horizontal='center')
-            
-            # Data rows
-            for idx, sub in enumerate(submissions, 1):
-                ws.cell(row=idx+1, column=1, value=idx)
-                ws.cell(row=idx+1, column=2, value=sub.get('customer_id', ''))
-                ws.cell(row=idx+1, column=3, value=sub.get('product_name', ''))
-                ws.cell(row=idx+1, column=4, value=sub.get('staff_name', ''))
-                ws.cell(row=idx+1, column=5, value=sub.get('submitted_at', ''))
-                ws.cell(row=idx+1, column=6, value=sub.get('month', ''))
-                ws.cell(row=idx+1, column=7, value=sub.get('status', 'pending'))
-            
-            # Adjust column widths
-            ws.column_dimensions['A'].width = 5
-            ws.column_dimensions['B'].width = 20
-            ws.column_dimensions['C'].width = 15
-            ws.column_dimensions['D'].width = 20
-            ws.column_dimensions['E'].width = 25
-            ws.column_dimensions['F'].width = 12
-            ws.column_dimensions['G'].width = 12
-            
-            # Save to bytes
-            output = io.BytesIO()
-            wb.save(output)
-            output.seek(0)
+            content = await run_cpu_bound(
+                styled_table_xlsx_bytes,
+                f"Bonus Check {query['month']}",
+                ['No', 'Customer ID', 'Product', 'Staff Name', 'Submitted At', 'Month', 'Status'],
+                [
+                    [
+                        idx,
+                        sub.get('customer_id', ''),
+                        sub.get('product_name', ''),
+                        sub.get('staff_name', ''),
+                        sub.get('submitted_at', ''),
+                        sub.get('month', ''),
+                        sub.get('status', 'pending')
+                    ]
+                    for idx, sub in enumerate(submissions, 1)
+                ],
+                '4F46E5',
+                {'A': 5, 'B': 20, 'C': 15, 'D': 20, 'E': 25, 'F': 12, 'G': 12}
+            )
             
             filename = f"bonus_check_{query['month']}.xlsx"
             return StreamingResponse(
-                iter([output.getvalue()]),
+                iter([content]),
                 media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 headers={"Content-Disposition": f"attachment; filename={filename}"}
             )
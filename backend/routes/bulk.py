@@ -4,7 +4,6 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 import uuid
-import random
 from .deps import User, get_db, get_current_user, get_admin_user, get_jakarta_now
 
 router = APIRouter(tags=["Bulk Operations"])
@@ -44,29 +43,47 @@ async def bulk_request_action(bulk: BulkRequestAction, user: User = Depends(get_
                 errors.append(f"Database not found for request {request_id}")
                 continue
             
-            available_records = await db.customer_records.find({
-                'database_id': request['database_id'],
-                'status': 'available'
-            }, {'_id': 0}).to_list(request['record_count'])
-            
-            if len(available_records) < request['record_count']:
-                errors.append(f"Not enough records for request {request_id}")
-                continue
-            
-            random.shuffle(available_records)
-            selected = available_records[:request['record_count']]
-            selected_ids = [r['id'] for r in selected]
+            assign_update = {'$set': {
+                'status': 'assigned',
+                'assigned_to': request['requested_by'],
+                'assigned_to_name': request['requested_by_name'],
+                'assigned_at': get_jakarta_now().isoformat(),
+                'request_id': request_id
+            }}
             
+            # Records claimed for this request when it was created are assigned first
             await db.customer_records.update_many(
-                {'id': {'$in': selected_ids}},
-                {'$set': {
-                    'status': 'assigned',
-                    'assigned_to': request['requested_by'],
-                    'assigned_to_name': request['requested_by_name'],
-                    'assigned_at': get_jakarta_now().isoformat(),
-                    'request_id': request_id
-                }}
+                {'request_id': request_id, 'status': 'requested'}, assign_update
             )
+            own_ids = [r['id'] for r in await db.customer_records.find(
+                {'request_id': request_id, 'status': 'assigned', 'assigned_to': request['requested_by']},
+                {'_id': 0, 'id': 1}
+            ).to_list(None)]
+            
+            # Top up from the pool (server-side random draw, reserved usernames excluded)
+            topped_up_ids = []
+            missing = request['record_count'] - len(own_ids)
+            if missing > 0:
+                from utils.reserved_check import get_download_reserved_ids, build_unreserved_username_filter
+                from utils.record_assignment import claim_random_records
+                reserved_ids = await get_download_reserved_ids(db, database.get('product_id'))
+                topped_up_ids = await claim_random_records(
+                    db.customer_records,
+                    {'database_id': request['database_id'], 'status': 'available',
+                     **build_unreserved_username_filter(reserved_ids)},
+                    missing,
+                    assign_update
+                )
+            
+            selected_ids = own_ids + topped_up_ids
+            if len(selected_ids) < request['record_count']:
+                # Roll back: the request stays pending with its own records still requested
+                from utils.db_operations import update_many_by_ids
+                unassign = {'assigned_to': None, 'assigned_to_name': None, 'assigned_at': None}
+                await update_many_by_ids(db.customer_records, own_ids, {'$set': {'status': 'requested', **unassign}})
+                await update_many_by_ids(db.customer_records, topped_up_ids, {'$set': {'status': 'available', 'request_id': None, **unassign}})
+                errors.append(f"Not enough records for request {request_id}")
+                continue
             
             await db.download_requests.update_one(
                 {'id': request_id},
@@ -90,6 +107,12 @@ async def bulk_request_action(bulk: BulkRequestAction, user: User = Depends(get_
                 'created_at': get_jakarta_now().isoformat()
             })
         else:
+            # Release the records claimed for this request back to the pool
+            await db.customer_records.update_many(
+                {'request_id': request_id, 'status': 'requested'},
+                {'$set': {'status': 'available'}}
+            )
+            
             await db.download_requests.update_one(
                 {'id': request_id},
                 {'$set': {
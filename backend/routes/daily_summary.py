@@ -5,8 +5,9 @@ from typing import Optional, List
 from datetime import datetime, timedelta
 import asyncio
 
-from .deps import get_db, get_current_user, get_admin_user, User
+from .deps import get_db, get_current_user, get_admin_user, User, submit_job
 from utils.helpers import normalize_customer_id, get_jakarta_now
+from utils.job_queue import JobContext, register_job
 
 router = APIRouter(tags=["Daily Summary"])
 
@@ -38,9 +39,9 @@ async def generate_daily_summary(date_str: str = None):
         return None
     
     # Get all records for NDP/RDP calculation
-    # Use MongoDB aggregation to compute first_date efficiently (instead of loading 500K records)
+    # Only the keys touched by this day's records are read from the first-deposit index
     from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db)
+    staff_customer_first_date = await build_staff_first_date_map(db, records=records)
     
     # Calculate totals
     total_omset = 0
@@ -259,9 +260,9 @@ async def generate_daily_summary_filtered(date_str: str, filter_product_id: str)
         return None
     
     # Get all records for NDP/RDP calculation (for this product only)
-    # Use MongoDB aggregation for efficiency
+    # Only the keys touched by this day's records are read from the first-deposit index
     from utils.db_operations import build_staff_first_date_map
-    full_first_date_map = await build_staff_first_date_map(db, product_id=filter_product_id)
+    full_first_date_map = await build_staff_first_date_map(db, product_id=filter_product_id, records=records)
     
     # Re-key to (staff_id, customer_id) since product is fixed
     staff_customer_first_date = {}
@@ -643,19 +644,16 @@ async def trigger_daily_summary_generation(
     
     return {'message': f'No data found for {date}', 'summary': None}
 
-@router.post("/daily-summary/generate-range")
-async def generate_summary_range(
-    start_date: str,
-    end_date: str,
-    user: User = Depends(get_admin_user)
-):
-    """Generate daily summaries for a date range (Admin only)"""
-    
-    start = datetime.strptime(start_date, '%Y-%m-%d')
-    end = datetime.strptime(end_date, '%Y-%m-%d')
-    
-    generated = []
-    current = start
+@register_job('daily_summary_range', concurrency=1)
+async def run_summary_range(ctx: JobContext):
+    """Job: generate daily summaries day by day, checkpointing the next date to generate"""
+    start = datetime.strptime(ctx.params['start_date'], '%Y-%m-%d')
+    end = datetime.strptime(ctx.params['end_date'], '%Y-%m-%d')
+    total_days = max((end - start).days + 1, 1)
+    
+    # Resume after the last finished day if a previous worker was interrupted
+    generated = list(ctx.checkpoint.get('generated', []))
+    current = datetime.strptime(ctx.checkpoint['next_date'], '%Y-%m-%d') if ctx.checkpoint.get('next_date') else start
     while current <= end:
         date_str = current.strftime('%Y-%m-%d')
         summary = await generate_daily_summary(date_str)
@@ -663,9 +661,30 @@ async def generate_summary_range(
             await save_daily_summary(summary)
             generated.append(date_str)
         current += timedelta(days=1)
+        await ctx.progress(
+            ((current - start).days * 100) / total_days,
+            f'Generated up to {date_str}',
+            checkpoint={'next_date': current.strftime('%Y-%m-%d'), 'generated': generated}
+        )
     
     return {'message': f'Generated {len(generated)} summaries', 'dates': generated}
 
+@router.post("/daily-summary/generate-range")
+async def generate_summary_range(
+    start_date: str,
+    end_date: str,
+    wait: bool = True,
+    user: User = Depends(get_admin_user)
+):
+    """Generate daily summaries for a date range as a background job (Admin only)"""
+    try:
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    
+    return await submit_job('daily_summary_range', {'start_date': start_date, 'end_date': end_date}, user, wait)
+
 @router.get("/daily-summary/my-performance")
 async def get_my_performance_trend(
     days: int = 30,
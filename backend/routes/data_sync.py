@@ -4,7 +4,11 @@ from typing import Optional, List
 from datetime import datetime, timedelta
 import pytz
 
-from .deps import get_db, get_admin_user, User, get_jakarta_now
+from .deps import get_db, get_admin_user, User, get_jakarta_now, submit_job
+from utils.deposit_lookup import find_last_deposit_date
+from utils.job_queue import JobContext, register_job
+from utils.reserved_lookup import find_reservation
+from utils.reserved_snapshot import bump_reserved_version
 
 router = APIRouter(tags=["Data Sync"])
 
@@ -195,27 +199,44 @@ async def run_health_check(user: User = Depends(get_admin_user)):
     }
 
 
-@router.post("/data-sync/repair")
-async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
+REPAIR_STEPS = [
+    'orphaned_reserved_members',
+    'orphaned_bonus_submissions',
+    'bonus_without_reservation',
+    'attendance_leave_conflict',
+    'sync_last_omset_date',
+    'fix_cross_product_invalidations',
+]
+
+
+@register_job('data_sync_repair', concurrency=1)
+async def run_repair(ctx: JobContext):
     """
-    Auto-repair detected data issues.
-    
-    repair_type options:
-    - orphaned_reserved_members: Delete reserved members for deleted staff
-    - orphaned_bonus_submissions: Delete bonus submissions for deleted staff
-    - bonus_without_reservation: Delete bonus submissions without valid reservation
-    - attendance_leave_conflict: Fix attendance records that should have leave flag
-    - all: Run all repairs
+    Job: run the requested repairs one step at a time.
+    Finished steps are checkpointed with their results and skipped on resume.
     """
     db = get_db()
     jakarta_now = get_jakarta_now()
-    results = {}
+    repair_type = ctx.params['repair_type']
+    results = dict(ctx.checkpoint.get('results', {}))
+    steps = [step for step in REPAIR_STEPS if repair_type in [step, 'all']]
+    
+    def wants(step: str) -> bool:
+        return step in steps and step not in results
+    
+    async def start_step(step: str):
+        await ctx.progress(
+            len(results) * 100 / len(steps),
+            f'Running {step}',
+            checkpoint={'results': results}
+        )
     
     # Get all valid staff IDs
     staff_users = await db.users.find({'role': 'staff'}, {'id': 1}).to_list(10000)
     all_staff_ids = {s['id'] for s in staff_users}
     
-    if repair_type in ['orphaned_reserved_members', 'all']:
+    if wants('orphaned_reserved_members'):
+        await start_step('orphaned_reserved_members')
         # Delete reserved members for non-existent staff
         orphaned = await db.reserved_members.find(
             {'staff_id': {'$nin': list(all_staff_ids)}},
@@ -226,6 +247,7 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
             result = await db.reserved_members.delete_many(
                 {'staff_id': {'$nin': list(all_staff_ids)}}
             )
+            await bump_reserved_version(db)
             results['orphaned_reserved_members'] = {
                 'deleted': result.deleted_count,
                 'message': f'Deleted {result.deleted_count} orphaned reserved members'
@@ -233,7 +255,8 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
         else:
             results['orphaned_reserved_members'] = {'deleted': 0, 'message': 'No orphaned records found'}
     
-    if repair_type in ['orphaned_bonus_submissions', 'all']:
+    if wants('orphaned_bonus_submissions'):
+        await start_step('orphaned_bonus_submissions')
         # Delete bonus submissions for non-existent staff
         result = await db.bonus_check_submissions.delete_many(
             {'staff_id': {'$nin': list(all_staff_ids)}}
@@ -243,7 +266,8 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
             'message': f'Deleted {result.deleted_count} orphaned bonus submissions'
         }
     
-    if repair_type in ['bonus_without_reservation', 'all']:
+    if wants('bonus_without_reservation'):
+        await start_step('bonus_without_reservation')
         # Get all reserved members
         reserved_members = await db.reserved_members.find({}, {'customer_id': 1, 'staff_id': 1}).to_list(10000)
         reserved_set = set()
@@ -270,7 +294,8 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
         else:
             results['bonus_without_reservation'] = {'deleted': 0, 'message': 'No orphaned submissions found'}
     
-    if repair_type in ['attendance_leave_conflict', 'all']:
+    if wants('attendance_leave_conflict'):
+        await start_step('attendance_leave_conflict')
         # Get ALL approved leave records
         leave_records = await db.leave_requests.find(
             {'status': 'approved'},
@@ -313,7 +338,8 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
             'message': f'Synced {fixed_count} attendance records with leave data'
         }
     
-    if repair_type in ['sync_last_omset_date', 'all']:
+    if wants('sync_last_omset_date'):
+        await start_step('sync_last_omset_date')
         # Populate last_omset_date for reserved members from omset_records
         # Support both old field (customer_name) and new field (customer_id)
         reserved_members = await db.reserved_members.find(
@@ -342,29 +368,15 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
                 continue
             
             # Try to find omset record - first with exact staff match, then any staff
-            last_omset = await db.omset_records.find_one(
-                {
-                    'customer_id': {'$regex': f'^{customer_id.strip()}$', '$options': 'i'},
-                    'staff_id': staff_id
-                },
-                {'_id': 0, 'record_date': 1},
-                sort=[('record_date', -1)]
-            )
+            record_date_str = await find_last_deposit_date(db, customer_id, staff_id=staff_id)
             
             # If not found with staff_id, try without staff filter (for migrated customers)
-            if not last_omset:
-                last_omset = await db.omset_records.find_one(
-                    {
-                        'customer_id': {'$regex': f'^{customer_id.strip()}$', '$options': 'i'}
-                    },
-                    {'_id': 0, 'record_date': 1},
-                    sort=[('record_date', -1)]
-                )
+            if not record_date_str:
+                record_date_str = await find_last_deposit_date(db, customer_id)
             
-            if last_omset and last_omset.get('record_date'):
+            if record_date_str:
                 from datetime import datetime
                 try:
-                    record_date_str = last_omset['record_date']
                     last_date = datetime.strptime(record_date_str, '%Y-%m-%d')
                     last_date = JAKARTA_TZ.localize(last_date)
                     
@@ -390,7 +402,8 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
             'message': f'Updated {updated_count} reserved members. {already_has_date} already had date. {no_omset_found} have no omset records.'
         }
     
-    if repair_type in ['fix_cross_product_invalidations', 'all']:
+    if wants('fix_cross_product_invalidations'):
+        await start_step('fix_cross_product_invalidations')
         # Fix records that were wrongly invalidated due to cross-product reservation conflicts
         # These are records that were marked invalid because the customer was reserved by another staff,
         # but for a DIFFERENT product - which should NOT have caused invalidation
@@ -422,15 +435,10 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
                     continue
                 
                 # Check if there's actually a reservation for this customer + product by this staff
-                reservation = await db.reserved_members.find_one({
-                    '$or': [
-                        {'customer_id': {'$regex': f'^{customer_id}$', '$options': 'i'}},
-                        {'customer_name': {'$regex': f'^{customer_id}$', '$options': 'i'}}
-                    ],
-                    'product_id': record_product_id,
-                    'staff_id': reserved_by_staff_id,
-                    'status': 'approved'
-                })
+                reservation = await find_reservation(
+                    db, customer_id, status='approved', product_id=record_product_id,
+                    staff_id=reserved_by_staff_id, projection={'_id': 0, 'id': 1}
+                )
                 
                 # If no matching reservation exists for this product, this was wrongly invalidated
                 if not reservation:
@@ -460,8 +468,8 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
         'type': 'data_repair',
         'repair_type': repair_type,
         'results': results,
-        'performed_by': user.id,
-        'performed_by_name': user.name,
+        'performed_by': ctx.user_id,
+        'performed_by_name': ctx.user_name,
         'performed_at': jakarta_now.isoformat()
     })
     
@@ -473,6 +481,21 @@ async def repair_data(repair_type: str, user: User = Depends(get_admin_user)):
     }
 
 
+@router.post("/data-sync/repair")
+async def repair_data(repair_type: str, wait: bool = True, user: User = Depends(get_admin_user)):
+    """
+    Auto-repair detected data issues (runs as a background job, see GET /jobs/{job_id}).
+    
+    repair_type options:
+    - orphaned_reserved_members: Delete reserved members for deleted staff
+    - orphaned_bonus_submissions: Delete bonus submissions for deleted staff
+    - bonus_without_reservation: Delete bonus submissions without valid reservation
+    - attendance_leave_conflict: Fix attendance records that should have leave flag
+    - all: Run all repairs
+    """
+    return await submit_job('data_sync_repair', {'repair_type': repair_type}, user, wait)
+
+
 @router.get("/data-sync/activity-log")
 async def get_activity_log(
     limit: int = 50,
@@ -567,12 +590,8 @@ async def get_sync_status(user: User = Depends(get_admin_user)):
     for r in reserved:
         if not r.get('last_omset_date'):
             cid = r.get('customer_id') or r.get('customer_name')
-            if cid:
-                has_omset = await db.omset_records.count_documents({
-                    'customer_id': {'$regex': f'^{cid.strip()}$', '$options': 'i'}
-                })
-                if has_omset > 0:
-                    can_sync += 1
+            if cid and await find_last_deposit_date(db, cid):
+                can_sync += 1
     
     if total_reserved > 0:
         status = 'synced' if has_omset_date == total_reserved else 'partial'
@@ -1,6 +1,6 @@
 # Shared dependencies and utilities for all route modules
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
@@ -19,6 +19,9 @@ from utils.helpers import (
     get_jakarta_datetime_string,
     normalize_customer_id,
 )
+from utils.ttl_cache import TTLCache
+from utils.pagination import MAX_PAGE_SIZE, InvalidCursorError, Page, build_projection, fetch_page
+from utils.job_queue import JOB_COMPLETED, JOB_FAILED, enqueue_job, wait_for_job
 
 # Database connection - will be initialized from server.py
 db = None
@@ -74,6 +77,33 @@ class ProductCreate(BaseModel):
 
 # ==================== AUTH DEPENDENCIES ====================
 
+# Resolved users by id. Entries are dropped on every worker when a user's profile, role,
+# password or page access changes (invalidations travel over the realtime pub/sub); the TTL
+# bounds staleness when the pub/sub is in-process only (REALTIME_PUBSUB_BACKEND=memory).
+USER_CACHE_TTL_SECONDS = 30
+USER_CACHE_MAX_SIZE = 1024
+user_cache = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+async def invalidate_cached_user(user_id: str):
+    """Drop a user from the auth cache of every worker (call after updating or deleting the user)"""
+    user_cache.invalidate(user_id)
+    from .websocket import publish_user_invalidated
+    await publish_user_invalidated(user_id)
+
+async def load_user(user_id: str) -> User:
+    """Resolve a user by id through the auth cache"""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    
+    user_data = await db.users.find_one({'id': user_id}, {'_id': 0, 'password_hash': 0})
+    if not user_data:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    user = User(**user_data)
+    user_cache.set(user_id, user)
+    return user
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Validate JWT token and return current user"""
     try:
@@ -83,11 +113,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user_data = await db.users.find_one({'id': user_id}, {'_id': 0})
-        if not user_data:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return User(**user_data)
+        return await load_user(user_id)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
@@ -106,10 +132,7 @@ async def get_user_from_token_param(token: str) -> User:
         user_id = payload.get('user_id')
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user_data = await db.users.find_one({'id': user_id}, {'_id': 0})
-        if not user_data:
-            raise HTTPException(status_code=401, detail="User not found")
-        return User(**user_data)
+        return await load_user(user_id)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
@@ -127,6 +150,59 @@ async def get_staff_user(user: User = Depends(get_current_user)) -> User:
         raise HTTPException(status_code=403, detail="Staff access required")
     return user
 
+# ==================== PAGINATION ====================
+
+class PageParams(BaseModel):
+    """Keyset paging options shared by list endpoints (limit=None keeps the endpoint's default page size)"""
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+    fields: Optional[str] = None
+    include_total: bool = False
+
+def get_page_params(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False
+) -> PageParams:
+    return PageParams(limit=limit, cursor=cursor, fields=fields, include_total=include_total)
+
+async def read_page(collection, query: dict, sort, params: PageParams, default_limit: int, required_fields=()) -> Page:
+    """Read one page of a listing, turning a bad cursor into a 400"""
+    try:
+        return await fetch_page(
+            collection,
+            query,
+            sort,
+            limit=params.limit or default_limit,
+            cursor=params.cursor,
+            projection=build_projection(params.fields, required_fields),
+            include_total=params.include_total
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def submit_job(job_type: str, params: dict, user: User, wait: bool = True) -> dict:
+    """
+    Queue a background job for an admin operation.
+    Returns the job's result (plus job_id) if it finishes within the inline wait,
+    otherwise the job id and status to poll with GET /jobs/{job_id}.
+    """
+    job = await enqueue_job(db, job_type, params, user)
+    if wait:
+        job = await wait_for_job(db, job['id']) or job
+    if job['status'] == JOB_FAILED:
+        raise HTTPException(status_code=500, detail=job.get('error') or 'Job failed')
+    if job['status'] == JOB_COMPLETED:
+        return {**(job.get('result') or {}), 'job_id': job['id'], 'job_status': JOB_COMPLETED}
+    return {
+        'success': True,
+        'job_id': job['id'],
+        'job_status': job['status'],
+        'progress': job.get('progress', 0),
+        'message': f"Still running in the background ({job.get('progress', 0)}%). Check GET /api/jobs/{job['id']} for progress."
+    }
+
 # Role hierarchy for permission checking
 ROLE_HIERARCHY = {
     'master_admin': 3,  # Highest - can manage everyone
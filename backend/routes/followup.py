@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 
 from .deps import get_db, get_current_user, User
 from utils.helpers import get_jakarta_now, JAKARTA_TZ
+from utils.deposit_lookup import find_deposit, find_deposits
 
 router = APIRouter(tags=["Follow-ups"])
 
@@ -24,6 +25,25 @@ def get_reminder_level(days_since_response: int) -> dict:
     else:
         return {'level': 0, 'label': 'Today', 'urgency': 'low', 'color': 'green'}
 
+def extract_customer_identity(row_data: dict) -> tuple:
+    """Return (customer_id, customer_name) from row_data, lowercased and stripped (None if missing)"""
+    customer_id = None
+    customer_name = None
+    
+    # Common field names for customer ID
+    for field in ['customer_id', 'id', 'ID', 'Id', 'user_id', 'userid', 'username']:
+        if field in row_data and row_data[field]:
+            customer_id = str(row_data[field]).lower().strip()
+            break
+    
+    # Common field names for customer name
+    for field in ['name', 'Name', 'nama', 'Nama', 'customer_name', 'customer']:
+        if field in row_data and row_data[field]:
+            customer_name = str(row_data[field]).lower().strip()
+            break
+    
+    return customer_id, customer_name
+
 # ==================== FOLLOW-UP ENDPOINTS ====================
 
 @router.get("/followups/filters")
@@ -134,24 +154,14 @@ async def get_followups(
             }
         }
     
-    # Get OMSET records to check who has deposited
-    omset_query = {}
-    if target_staff_id:
-        omset_query['staff_id'] = target_staff_id
-    omset_records = await db.omset_records.find(
-        omset_query,
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'product_id': 1}
-    ).to_list(100000)
-    
-    # Build set of deposited customer IDs (per product)
-    deposited_customers = set()
-    for omset in omset_records:
-        # Key is (customer_id, product_id) to match correctly
-        key = (omset.get('customer_id', '').lower().strip(), omset.get('product_id', ''))
-        deposited_customers.add(key)
-        # Also add by customer name for matching
-        name_key = (omset.get('customer_name', '').lower().strip(), omset.get('product_id', ''))
-        deposited_customers.add(name_key)
+    # Check who has deposited with one batched lookup over the responded customers
+    identities = [extract_customer_identity(r.get('row_data', {})) for r in responded_records]
+    deposits = await find_deposits(
+        db,
+        customer_ids=[cid for cid, _ in identities],
+        customer_names=[name for _, name in identities],
+        staff_id=target_staff_id
+    )
     
     followups = []
     summary = {
@@ -168,29 +178,11 @@ async def get_followups(
         row_data = record.get('row_data', {})
         
         # Try to find customer ID or name from row_data
-        customer_id = None
-        customer_name = None
-        
-        # Common field names for customer ID
-        for field in ['customer_id', 'id', 'ID', 'Id', 'user_id', 'userid', 'username']:
-            if field in row_data and row_data[field]:
-                customer_id = str(row_data[field]).lower().strip()
-                break
+        customer_id, customer_name = extract_customer_identity(row_data)
         
-        # Common field names for customer name
-        for field in ['name', 'Name', 'nama', 'Nama', 'customer_name', 'customer']:
-            if field in row_data and row_data[field]:
-                customer_name = str(row_data[field]).lower().strip()
-                break
-        
-        # Check if this customer has deposited
+        # Check if this customer has deposited (for this record's product)
         product_id_rec = record.get('product_id', '')
-        is_deposited = False
-        
-        if customer_id:
-            is_deposited = (customer_id, product_id_rec) in deposited_customers
-        if not is_deposited and customer_name:
-            is_deposited = (customer_name, product_id_rec) in deposited_customers
+        is_deposited = deposits.has_deposited(customer_id, customer_name, product_id_rec)
         
         if is_deposited:
             summary['deposited'] += 1
@@ -300,6 +292,14 @@ async def get_followup_notifications(user: User = Depends(get_current_user)):
     
     records = await db.customer_records.find(query, {'_id': 0}).to_list(10000)
     
+    # Latest deposit date (any product) of every responded customer, in one batched lookup
+    def record_customer_id(record):
+        return record.get('customer_id_normalized') or record.get('customer_id', '').strip()
+    
+    deposits = await find_deposits(
+        db, customer_ids=[record_customer_id(r) for r in records if r.get('respond_date')]
+    )
+    
     # Calculate summary counts
     critical = 0
     high = 0
@@ -315,12 +315,8 @@ async def get_followup_notifications(user: User = Depends(get_current_user)):
             days_since = (jakarta_now - respond_dt).days
             
             # Check if already deposited after respond
-            is_deposited = await db.omset_records.find_one({
-                'customer_id_normalized': record.get('customer_id_normalized') or record.get('customer_id', '').strip().upper(),
-                'record_date': {'$gte': respond_date}
-            })
-            
-            if is_deposited:
+            last_deposit = deposits.last_deposit_date(customer_id=record_customer_id(record))
+            if last_deposit is not None and last_deposit >= respond_date:
                 continue
             
             if days_since >= 7:
@@ -375,49 +371,17 @@ async def check_if_deposited(record_id: str, user: User = Depends(get_current_us
     product_id = record.get('product_id', '')
     
     # Get customer identifiers
-    customer_id = None
-    customer_name = None
-    
-    for field in ['customer_id', 'id', 'ID', 'Id', 'user_id', 'userid', 'username']:
-        if field in row_data and row_data[field]:
-            customer_id = str(row_data[field]).lower().strip()
-            break
-    
-    for field in ['name', 'Name', 'nama', 'Nama', 'customer_name', 'customer']:
-        if field in row_data and row_data[field]:
-            customer_name = str(row_data[field]).lower().strip()
-            break
-    
-    # Search in OMSET records
-    omset_query = {'product_id': product_id}
-    if user.role == 'staff':
-        omset_query['staff_id'] = user.id
-    
-    omset_records = await db.omset_records.find(omset_query, {'_id': 0}).to_list(100000)
-    
-    is_deposited = False
-    deposit_info = None
-    
-    for omset in omset_records:
-        omset_customer_id = str(omset.get('customer_id', '')).lower().strip()
-        omset_customer_name = str(omset.get('customer_name', '')).lower().strip()
-        
-        if customer_id and omset_customer_id == customer_id:
-            is_deposited = True
-            deposit_info = {
-                'record_date': omset.get('record_date'),
-                'nominal': omset.get('nominal'),
-                'depo_total': omset.get('depo_total')
-            }
-            break
-        elif customer_name and omset_customer_name == customer_name:
-            is_deposited = True
-            deposit_info = {
-                'record_date': omset.get('record_date'),
-                'nominal': omset.get('nominal'),
-                'depo_total': omset.get('depo_total')
-            }
-            break
+    customer_id, customer_name = extract_customer_identity(row_data)
+    
+    # Single indexed lookup in OMSET records (by ID or by name)
+    deposit_info = await find_deposit(
+        db,
+        customer_id=customer_id,
+        customer_name=customer_name,
+        product_id=product_id,
+        staff_id=user.id if user.role == 'staff' else None
+    )
+    is_deposited = deposit_info is not None
     
     return {
         'record_id': record_id,
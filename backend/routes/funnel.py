@@ -4,6 +4,7 @@ from typing import Optional
 from datetime import datetime, timedelta
 
 from .deps import get_db, get_current_user, get_admin_user, get_jakarta_now, User
+from utils.deposit_lookup import find_deposits, count_deposit_records
 
 router = APIRouter(tags=["Conversion Funnel"])
 
@@ -111,28 +112,12 @@ async def get_conversion_funnel(
     # Stage 4: Deposited - get customer_ids that have OMSET records
     # IMPORTANT: Don't filter by date here - we want to check if assigned customers
     # have EVER deposited, not just within the date range
-    omset_query = {}
-    if staff_id:
-        omset_query['staff_id'] = staff_id
-    if product_id:
-        omset_query['product_id'] = product_id
-    
-    omset_records = await db.omset_records.find(
-        omset_query,
-        {'_id': 0, 'customer_id': 1, 'customer_id_normalized': 1, 'product_id': 1}
-    ).to_list(50000)
-    
-    # Create set of deposited customer identifiers (normalized username - ALWAYS uppercase)
-    deposited_customers = set()
-    for omset in omset_records:
-        # Get customer_id and ALWAYS convert to uppercase for case-insensitive matching
-        raw_cust_id = omset.get('customer_id_normalized') or omset.get('customer_id', '')
-        cust_id = str(raw_cust_id).strip().upper() if raw_cust_id else None
-        prod_id = omset.get('product_id')
-        if cust_id:
-            deposited_customers.add((cust_id, prod_id))
-            # Also add without product for looser matching
-            deposited_customers.add((cust_id, None))
+    deposits = await find_deposits(
+        db,
+        customer_ids=[extract_username(r)[0] for r in assigned_records],
+        product_id=product_id,
+        staff_id=staff_id
+    )
     
     # Check how many assigned records have deposited
     # Match by username from row_data
@@ -149,7 +134,7 @@ async def get_conversion_funnel(
         prod_id = record.get('product_id')
         
         # Check if this customer deposited (with or without product match)
-        if (username, prod_id) in deposited_customers or (username, None) in deposited_customers:
+        if deposits.has_deposited(username):
             deposited_from_assigned += 1
             # Add to deposited list with details
             deposited_customer_list.append({
@@ -205,8 +190,8 @@ async def get_conversion_funnel(
             'database_id': database_id
         },
         'debug': {
-            'total_omset_records': len(omset_records),
-            'unique_depositors_in_omset': len(deposited_customers),
+            'total_omset_records': await count_deposit_records(db, product_id, staff_id),
+            'unique_depositors_in_omset': deposits.customer_count(),
             'assigned_records_with_username': sum(1 for r in assigned_records if r.get('row_data') or r.get('customer_id'))
         }
     }
@@ -242,29 +227,13 @@ async def get_funnel_by_product(
          'whatsapp_status': 1, 'respond_status': 1, 'row_data': 1}
     ).to_list(50000)
     
-    # Get ALL OMSET records (no date filter - check if customer ever deposited)
-    omset_query = {}
-    if user.role == 'staff':
-        omset_query['staff_id'] = user.id
-    
-    omset_records = await db.omset_records.find(
-        omset_query,
-        {'_id': 0, 'customer_id': 1, 'customer_id_normalized': 1, 'product_id': 1}
-    ).to_list(50000)
-    
-    # Create set of ALL deposited customers (regardless of product for matching)
-    # ALWAYS convert to uppercase for case-insensitive matching
-    all_deposited = set()
-    deposited_by_product = {}  # product_id -> set of usernames
-    for omset in omset_records:
-        raw_cust_id = omset.get('customer_id_normalized') or omset.get('customer_id', '')
-        cust_id = str(raw_cust_id).strip().upper() if raw_cust_id else None
-        prod_id = omset.get('product_id')
-        if cust_id:
-            all_deposited.add(cust_id)
-            if prod_id not in deposited_by_product:
-                deposited_by_product[prod_id] = set()
-            deposited_by_product[prod_id].add(cust_id)
+    # Deposits of the assigned customers (no date filter - check if customer ever deposited)
+    staff_scope = user.id if user.role == 'staff' else None
+    deposits = await find_deposits(
+        db,
+        customer_ids=[extract_username(r)[0] for r in assigned_records],
+        staff_id=staff_scope
+    )
     
     # Group by product
     products = {}
@@ -295,7 +264,7 @@ async def get_funnel_by_product(
         username, original_username = extract_username(record)
         
         # Match: customer deposited with same product OR deposited at all
-        if username and (username in deposited_by_product.get(prod_id, set()) or username in all_deposited):
+        if username and deposits.has_deposited(username):
             products[prod_id]['deposited'] += 1
             if original_username:
                 products[prod_id]['deposited_customers'].append(original_username)
@@ -333,8 +302,8 @@ async def get_funnel_by_product(
         'date_range': {'start': start_date, 'end': end_date},
         'products': result,
         'debug': {
-            'total_omset_records': len(omset_records),
-            'unique_depositors': len(all_deposited)
+            'total_omset_records': await count_deposit_records(db, staff_id=staff_scope),
+            'unique_depositors': deposits.customer_count()
         }
     }
 
@@ -369,20 +338,8 @@ async def get_funnel_by_staff(
     ).to_list(1000)
     staff_map = {s['id']: s['name'] for s in all_staff}
     
-    # Get ALL OMSET records (no date filter - check if customer ever deposited)
-    omset_records = await db.omset_records.find(
-        {},
-        {'_id': 0, 'customer_id': 1, 'customer_id_normalized': 1, 'product_id': 1, 'staff_id': 1}
-    ).to_list(50000)
-    
-    # Build set of ALL deposited customers (regardless of which staff)
-    # ALWAYS convert to uppercase for case-insensitive matching
-    all_deposited = set()
-    for omset in omset_records:
-        raw_cust_id = omset.get('customer_id_normalized') or omset.get('customer_id', '')
-        cust_id = str(raw_cust_id).strip().upper() if raw_cust_id else None
-        if cust_id:
-            all_deposited.add(cust_id)
+    # Deposits of the assigned customers with ANY staff (no date filter - check if customer ever deposited)
+    deposits = await find_deposits(db, customer_ids=[extract_username(r)[0] for r in assigned_records])
     
     # Group by staff
     staff_data = {}
@@ -416,7 +373,7 @@ async def get_funnel_by_staff(
         username, original_username = extract_username(record)
         
         # Match: customer deposited with ANY staff (not just this staff)
-        if username and username in all_deposited:
+        if username and deposits.has_deposited(username):
             staff_data[staff_id]['deposited'] += 1
             if original_username:
                 staff_data[staff_id]['deposited_customers'].append(original_username)
@@ -454,8 +411,8 @@ async def get_funnel_by_staff(
         'date_range': {'start': start_date, 'end': end_date},
         'staff': result,
         'debug': {
-            'total_omset_records': len(omset_records),
-            'unique_depositors': len(all_deposited)
+            'total_omset_records': await count_deposit_records(db),
+            'unique_depositors': deposits.customer_count()
         }
     }
 
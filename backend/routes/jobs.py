@@ -0,0 +1,44 @@
+# Background Job Status Routes
+from fastapi import APIRouter, Depends, HTTPException, Response
+from typing import Optional
+
+from .deps import get_db, get_admin_user, User, PageParams, get_page_params, read_page
+from utils.job_queue import JOBS_COLLECTION, get_job
+from utils.pagination import apply_page_headers
+
+router = APIRouter(tags=["Background Jobs"])
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, user: User = Depends(get_admin_user)):
+    """
+    Status of a background job: status (queued/running/completed/failed),
+    progress (0-100), progress_message, result once completed, error if failed.
+    """
+    db = get_db()
+    job = await get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs")
+async def list_jobs(
+    response: Response,
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    page: PageParams = Depends(get_page_params),
+    user: User = Depends(get_admin_user)
+):
+    """Recent background jobs, newest first (optionally filtered by type and status)"""
+    db = get_db()
+    query = {}
+    if type:
+        query['type'] = type
+    if status:
+        query['status'] = status
+    result = await read_page(db[JOBS_COLLECTION], query, [('created_at', -1), ('id', -1)], page, default_limit=50)
+    apply_page_headers(response, result)
+    for job in result.items:
+        job.pop('active_key', None)
+    return result.items
@@ -49,32 +49,22 @@ async def get_leaderboard(
     current_month = jakarta_now.month
     today = jakarta_now.strftime('%Y-%m-%d')
     
-    # Build query based on period
+    # Build rollup query based on period
+    from utils.omset_rollup import fetch_rollups
     if period == "month":
         month_str = f"{current_year}-{str(current_month).zfill(2)}"
-        query = {'record_date': {'$regex': f'^{month_str}'}}
+        query = {'date': {'$gte': f'{month_str}-01', '$lte': f'{month_str}-31'}}
     else:  # all time
         query = {}
     
-    def is_tambahan_record(record):
-        """Check if record has 'tambahan' in keterangan field"""
-        keterangan = record.get('keterangan', '') or ''
-        return 'tambahan' in keterangan.lower()
-    
-    # Fetch records for calculating unique customers (only approved)
-    from utils.db_operations import add_approved_filter
-    records = await db.omset_records.find(add_approved_filter(query.copy()), {'_id': 0}).to_list(100000)
-    today_records = await db.omset_records.find(add_approved_filter({'record_date': today}), {'_id': 0}).to_list(10000)
-    
-    # Build customer_first_date for NDP detection
-    # Use MongoDB aggregation for efficiency
-    from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db)
+    # Daily rollup rows already hold per-day DISTINCT (customer, product) NDP/RDP counts,
+    # with "tambahan" records always counted as RDP and only approved records included
+    rollups = await fetch_rollups(db, query)
     
     # Get all staff users
     staff_users = await db.users.find({'role': 'staff'}, {'_id': 0}).to_list(100)
     
-    # Calculate stats for each staff - track (customer, product) pairs for consistency
+    # Calculate stats for each staff
     staff_stats = {}
     for staff in staff_users:
         staff_stats[staff['id']] = {
@@ -85,97 +75,38 @@ async def get_leaderboard(
             'total_rdp': 0,
             'today_ndp': 0,
             'today_rdp': 0,
-            'days_worked': set(),
-            'daily_ndp_pairs': {},  # {date: set((customer_id, product_id))}
-            'daily_rdp_pairs': {}   # {date: set((customer_id, product_id))}
+            'days_worked': set()
         }
     
-    # Process records
-    for record in records:
-        staff_id = record['staff_id']
-        date = record['record_date']
+    # Process rollup rows
+    for row in rollups:
+        staff_id = row['staff_id']
+        date = row['date']
         
         # Initialize staff if not exists (for deleted staff)
         if staff_id not in staff_stats:
             staff_stats[staff_id] = {
                 'staff_id': staff_id,
-                'staff_name': record.get('staff_name', 'Unknown'),
+                'staff_name': row.get('staff_name') or 'Unknown',
                 'total_omset': 0,
                 'total_ndp': 0,
                 'total_rdp': 0,
                 'today_ndp': 0,
                 'today_rdp': 0,
-                'days_worked': set(),
-                'daily_ndp_pairs': {},
-                'daily_rdp_pairs': {}
+                'days_worked': set()
             }
         
-        staff_stats[staff_id]['total_omset'] += record.get('depo_total', 0) or 0
+        staff_stats[staff_id]['total_omset'] += row['depo_total']
+        staff_stats[staff_id]['total_ndp'] += row['ndp_count']
+        staff_stats[staff_id]['total_rdp'] += row['rdp_count']
         staff_stats[staff_id]['days_worked'].add(date)
-        
-        # Initialize daily tracking sets
-        if date not in staff_stats[staff_id]['daily_ndp_pairs']:
-            staff_stats[staff_id]['daily_ndp_pairs'][date] = set()
-            staff_stats[staff_id]['daily_rdp_pairs'][date] = set()
-        
-        # Check NDP/RDP - use STAFF-SPECIFIC first_date
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        product_id_rec = record['product_id']
-        staff_key = (staff_id, cid_normalized, product_id_rec)
-        staff_first_date = staff_customer_first_date.get(staff_key)
-        
-        # Track by (customer, product) pair — each product counted independently
-        customer_product_pair = (cid_normalized, product_id_rec)
-        
-        # "tambahan" records are always RDP
-        if is_tambahan_record(record):
-            if customer_product_pair not in staff_stats[staff_id]['daily_rdp_pairs'][date]:
-                staff_stats[staff_id]['daily_rdp_pairs'][date].add(customer_product_pair)
-                staff_stats[staff_id]['total_rdp'] += 1
-        elif staff_first_date == date:
-            if customer_product_pair not in staff_stats[staff_id]['daily_ndp_pairs'][date]:
-                staff_stats[staff_id]['daily_ndp_pairs'][date].add(customer_product_pair)
-                staff_stats[staff_id]['total_ndp'] += 1
-        else:
-            if customer_product_pair not in staff_stats[staff_id]['daily_rdp_pairs'][date]:
-                staff_stats[staff_id]['daily_rdp_pairs'][date].add(customer_product_pair)
-                staff_stats[staff_id]['total_rdp'] += 1
-    
-    # Calculate today's stats separately
-    today_ndp_pairs = {}  # {staff_id: set((customer_id, product_id))}
-    today_rdp_pairs = {}  # {staff_id: set((customer_id, product_id))}
     
-    for record in today_records:
-        staff_id = record['staff_id']
-        
-        if staff_id not in today_ndp_pairs:
-            today_ndp_pairs[staff_id] = set()
-            today_rdp_pairs[staff_id] = set()
-        
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        product_id_rec = record['product_id']
-        # Use STAFF-SPECIFIC first_date for today's stats too
-        staff_key = (staff_id, cid_normalized, product_id_rec)
-        staff_first_date = staff_customer_first_date.get(staff_key)
-        
-        customer_product_pair = (cid_normalized, product_id_rec)
-        
-        # "tambahan" records are always RDP
-        if is_tambahan_record(record):
-            if customer_product_pair not in today_rdp_pairs[staff_id]:
-                today_rdp_pairs[staff_id].add(customer_product_pair)
-                if staff_id in staff_stats:
-                    staff_stats[staff_id]['today_rdp'] += 1
-        elif staff_first_date == today:
-            if customer_product_pair not in today_ndp_pairs[staff_id]:
-                today_ndp_pairs[staff_id].add(customer_product_pair)
-                if staff_id in staff_stats:
-                    staff_stats[staff_id]['today_ndp'] += 1
-        else:
-            if customer_product_pair not in today_rdp_pairs[staff_id]:
-                today_rdp_pairs[staff_id].add(customer_product_pair)
-                if staff_id in staff_stats:
-                    staff_stats[staff_id]['today_rdp'] += 1
+    # Today's stats - today is always inside both periods, so reuse the fetched rows
+    for row in rollups:
+        if row['date'] != today:
+            continue
+        staff_stats[row['staff_id']]['today_ndp'] += row['ndp_count']
+        staff_stats[row['staff_id']]['today_rdp'] += row['rdp_count']
     
     # Convert to list and calculate averages
     leaderboard = []
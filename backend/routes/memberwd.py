@@ -1,14 +1,17 @@
 # Member WD CRM Routes
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File, Form
 from pydantic import BaseModel
 from typing import Optional, List
+import os
 import uuid
-import random
-import pandas as pd
-import io
-from .deps import User, get_db, get_current_user, get_admin_user, get_jakarta_now
-from utils.reserved_check import build_reserved_set, build_reserved_map, is_record_reserved, find_reservation_owner, sync_all_reserved_statuses, ensure_reserved_status_for_database
+from .deps import User, get_db, get_current_user, get_admin_user, get_jakarta_now, PageParams, get_page_params, read_page, submit_job
+from utils.reserved_check import is_record_reserved, find_reservation_owner, sync_all_reserved_statuses, ensure_reserved_status_for_database, build_row_identifiers, build_unreserved_filter
+from utils.record_assignment import count_assignable, claim_random_records
+from utils.reserved_snapshot import get_reserved_snapshot
+from utils.pagination import apply_page_headers
+from utils.ingestion import BLANK_TEXT, ChunkReader, IngestionJob, UploadParseError, new_spool_path, spool_upload, import_upload, run_in_background
+from utils.job_queue import JobContext, register_job
 
 router = APIRouter(tags=["Member WD CRM"])
 
@@ -82,16 +85,19 @@ async def update_memberwd_settings(data: MemberWDSettings, user: User = Depends(
     }
 
 
-@router.post("/memberwd/admin/migrate-batches")
-async def migrate_existing_records_to_batches(user: User = Depends(get_admin_user)):
+@register_job('memberwd_batch_migration', concurrency=1, lease_seconds=300)
+async def run_batch_migration(ctx: JobContext):
     """
-    Migration endpoint: Auto-create batch cards for existing assigned records that don't have batch_id.
+    Job: auto-create batch cards for existing assigned records that don't have batch_id.
     
     Logic:
     1. Group REGULAR records by staff_id + database_id + EXACT assigned_at timestamp
     2. Create batches for each group
     3. For REPLACEMENT records (auto_replaced=True): Find the correct batch by looking up 
        the assigned_at of the invalid records they replaced
+    
+    Resumable: records linked before an interruption no longer match the query, and
+    each group's batch id is derived from its key so a re-run reuses the same batch.
     """
     db = get_db()
     now = get_jakarta_now()
@@ -154,15 +160,17 @@ async def migrate_existing_records_to_batches(user: User = Depends(get_admin_use
         groups[key]['records'].append(record)
     
     # STEP 2: Create batches for regular records and build timestamp->batch_id mapping
-    batches_created = 0
-    records_updated = 0
+    batches_created = ctx.checkpoint.get('batches_created', 0)
+    records_updated = ctx.checkpoint.get('records_updated', 0)
     timestamp_to_batch = {}  # Maps (staff_id, database_id, assigned_at) -> batch_id
+    total_steps = len(groups) + len(replacement_records)
     
-    for key, group in groups.items():
-        batch_id = str(uuid.uuid4())
+    for position, (key, group) in enumerate(groups.items(), 1):
+        # Same group key -> same batch id, so a resumed job finds the batch it already created
+        batch_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f'memberwd-migration:{key}'))
         
         # Create batch document
-        await db.memberwd_batches.insert_one({
+        upsert = await db.memberwd_batches.update_one({'id': batch_id}, {'$setOnInsert': {
             'id': batch_id,
             'staff_id': group['staff_id'],
             'staff_name': group['staff_name'],
@@ -176,9 +184,10 @@ async def migrate_existing_records_to_batches(user: User = Depends(get_admin_use
             'current_count': len(group['records']),
             'migrated': True,
             'migrated_at': now.isoformat(),
-            'migrated_by': user.name
-        })
-        batches_created += 1
+            'migrated_by': ctx.user_name
+        }}, upsert=True)
+        if upsert.upserted_id is not None:
+            batches_created += 1
         
         # Store mapping for replacement record lookup
         timestamp_to_batch[key] = batch_id
@@ -190,12 +199,26 @@ async def migrate_existing_records_to_batches(user: User = Depends(get_admin_use
             {'$set': {'batch_id': batch_id}}
         )
         records_updated += result.modified_count
+        
+        if position % 50 == 0:
+            await ctx.progress(
+                position * 100 / total_steps,
+                f'Created {batches_created} batches',
+                checkpoint={'batches_created': batches_created, 'records_updated': records_updated}
+            )
     
     # STEP 3: Handle replacement records - find correct batch from invalid records they replaced
     replacement_count = 0
     replacement_failed = 0
     
-    for record in replacement_records:
+    for position, record in enumerate(replacement_records, len(groups) + 1):
+        if position % 200 == 0:
+            await ctx.progress(
+                position * 100 / total_steps,
+                f'Linked {replacement_count} replacement records',
+                checkpoint={'batches_created': batches_created, 'records_updated': records_updated}
+            )
+        
         invalid_ids = record.get('replaced_invalid_ids', [])
         if not invalid_ids:
             replacement_failed += 1
@@ -267,6 +290,15 @@ async def migrate_existing_records_to_batches(user: User = Depends(get_admin_use
     }
 
 
+@router.post("/memberwd/admin/migrate-batches")
+async def migrate_existing_records_to_batches(wait: bool = True, user: User = Depends(get_admin_user)):
+    """
+    Migration endpoint: Auto-create batch cards for existing assigned records that don't have batch_id.
+    Runs as a background job (see GET /jobs/{job_id}).
+    """
+    return await submit_job('memberwd_batch_migration', {}, user, wait)
+
+
 @router.get("/memberwd/admin/check-migration-status")
 async def check_migration_status(user: User = Depends(get_admin_user)):
     """Check how many records still need batch migration"""
@@ -355,9 +387,10 @@ async def upload_memberwd_database(
     file: UploadFile = File(...),
     name: str = Form(...),
     product_id: str = Form(...),
+    background: bool = Form(False),
     user: User = Depends(get_admin_user)
 ):
-    """Upload a new Member WD database (Admin only)"""
+    """Upload a new Member WD database (Admin only), imported in chunks (background=true returns a job_id to poll)"""
     db = get_db()
     if not file.filename.endswith(('.csv', '.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
@@ -366,23 +399,21 @@ async def upload_memberwd_database(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    contents = await file.read()
+    file_type = 'csv' if file.filename.endswith('.csv') else file.filename.rsplit('.', 1)[-1].lower()
+    spool_path = new_spool_path('memberwd', file_type)
+    await spool_upload(file, spool_path)
     
+    reader = ChunkReader(spool_path, file_type, BLANK_TEXT)
     try:
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        else:
-            df = pd.read_excel(io.BytesIO(contents))
+        first_chunk = await reader.next_chunk()
     except Exception as e:
+        os.remove(spool_path)
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
     
     # CRITICAL: Get ACTIVE reserved members to flag during upload
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'}, 
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'staff_id': 1, 'staff_name': 1}
-    ).to_list(100000)
+    reserved_map = (await get_reserved_snapshot(db)).reserved_map
     
-    reserved_map = build_reserved_map(reserved_members)
+    job = await IngestionJob.create(db, 'memberwd', file.filename, user)
     
     database_id = str(uuid.uuid4())
     database_doc = {
@@ -390,89 +421,102 @@ async def upload_memberwd_database(
         'name': name,
         'filename': file.filename,
         'file_type': 'csv' if file.filename.endswith('.csv') else 'excel',
-        'total_records': len(df),
+        'total_records': reader.rows_read,
         'product_id': product_id,
         'product_name': product['name'],
         'uploaded_by': user.id,
         'uploaded_by_name': user.name,
-        'uploaded_at': get_jakarta_now().isoformat()
+        'uploaded_at': get_jakarta_now().isoformat(),
+        'ingest_job_id': job.id
     }
     
     await db.memberwd_databases.insert_one(database_doc)
+    await job.update(database_id=database_id)
     
-    records = []
     reserved_count = 0
     
-    for idx, row in df.iterrows():
-        # Sanitize row data to handle NaN, NaT, and other special values
-        row_data = {}
-        for col, value in row.items():
-            if pd.isna(value):
-                row_data[str(col)] = ''
-            elif isinstance(value, (int, float)):
-                if pd.isna(value) or value != value:  # Check for NaN
-                    row_data[str(col)] = ''
-                else:
-                    row_data[str(col)] = str(value) if not float(value).is_integer() else str(int(value))
-            else:
-                # Convert to string and handle any encoding issues
-                try:
-                    row_data[str(col)] = str(value) if value is not None else ''
-                except Exception:
-                    row_data[str(col)] = ''
-        
-        # Check if this record is a reserved member using centralized utility
-        is_reserved_flag = False
-        reserved_by = None
-        reserved_by_name = None
-        
-        for key, value in row_data.items():
-            if value and str(value).strip():
-                normalized = str(value).strip().upper()
-                if normalized in reserved_map:
-                    is_reserved_flag = True
-                    reserved_by = reserved_map[normalized]['staff_id']
-                    reserved_by_name = reserved_map[normalized]['staff_name']
-                    reserved_count += 1
-                    break
-        
-        record = {
-            'id': str(uuid.uuid4()),
-            'database_id': database_id,
-            'database_name': name,
+    def build_docs(rows: List[dict], first_row_number: int) -> List[dict]:
+        nonlocal reserved_count
+        records = []
+        for idx, row_data in enumerate(rows, start=first_row_number):
+            # Check if this record is a reserved member
+            # Check ALL row_data values against reserved members (field-name independent)
+            is_reserved_flag = False
+            reserved_by = None
+            reserved_by_name = None
+            
+            for key, value in row_data.items():
+                if value and str(value).strip():
+                    normalized = str(value).strip().upper()
+                    if normalized in reserved_map:
+                        is_reserved_flag = True
+                        reserved_by = reserved_map[normalized]['staff_id']
+                        reserved_by_name = reserved_map[normalized]['staff_name']
+                        reserved_count += 1
+                        break
+            
+            records.append({
+                'id': str(uuid.uuid4()),
+                'database_id': database_id,
+                'database_name': name,
+                'product_id': product_id,
+                'product_name': product['name'],
+                'row_number': idx,
+                'row_data': row_data,
+                'row_identifiers': build_row_identifiers(row_data),
+                'status': 'reserved' if is_reserved_flag else 'available',
+                'assigned_to': None,
+                'assigned_to_name': None,
+                'assigned_at': None,
+                'assigned_by': None,
+                'assigned_by_name': None,
+                'is_reserved_member': is_reserved_flag,
+                'reserved_by': reserved_by,
+                'reserved_by_name': reserved_by_name,
+                'created_at': get_jakarta_now().isoformat()
+            })
+        return records
+    
+    async def finalize(total_records: int) -> dict:
+        await db.memberwd_databases.update_one({'id': database_id}, {'$set': {'total_records': total_records}})
+        result = {
+            'id': database_id,
+            'name': name,
             'product_id': product_id,
             'product_name': product['name'],
-            'row_number': idx + 1,
-            'row_data': row_data,
-            'status': 'reserved' if is_reserved_flag else 'available',
-            'assigned_to': None,
-            'assigned_to_name': None,
-            'assigned_at': None,
-            'assigned_by': None,
-            'assigned_by_name': None,
-            'is_reserved_member': is_reserved_flag,
-            'reserved_by': reserved_by,
-            'reserved_by_name': reserved_by_name,
-            'created_at': get_jakarta_now().isoformat()
+            'total_records': total_records,
+            'columns': reader.columns
         }
-        records.append(record)
-    
-    if records:
-        await db.memberwd_records.insert_many(records)
-    
-    response = {
-        'id': database_id,
-        'name': name,
-        'product_id': product_id,
-        'product_name': product['name'],
-        'total_records': len(df),
-        'columns': list(df.columns)
-    }
+        if reserved_count > 0:
+            result['warning'] = f'{reserved_count} records are reserved members and will be excluded from random assignment'
+            result['reserved_count'] = reserved_count
+        return result
+    
+    async def run_import():
+        try:
+            return await import_upload(
+                job, reader, first_chunk, db.memberwd_records, build_docs, finalize, db.memberwd_databases, database_id
+            )
+        finally:
+            os.remove(spool_path)
     
-    if reserved_count > 0:
-        response['warning'] = f'{reserved_count} records are reserved members and will be excluded from random assignment'
-        response['reserved_count'] = reserved_count
+    if background:
+        run_in_background(run_import())
+        return {
+            'id': database_id,
+            'name': name,
+            'product_id': product_id,
+            'product_name': product['name'],
+            'columns': reader.columns,
+            'job_id': job.id,
+            'status': 'running'
+        }
     
+    try:
+        response = await run_import()
+    except UploadParseError as e:
+        raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
+    response['job_id'] = job.id
     return response
 
 @router.get("/memberwd/databases")
@@ -533,12 +577,7 @@ async def assign_memberwd_records(assignment: MemberWDAssignment, user: User = D
     now = get_jakarta_now()
     
     # CRITICAL: Check for reserved members BEFORE assigning
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'}, 
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'staff_id': 1, 'staff_name': 1}
-    ).to_list(100000)
-    
-    reserved_map_local = build_reserved_map(reserved_members)
+    reserved_map_local = (await get_reserved_snapshot(db)).reserved_map
     
     # Get the records to be assigned
     records = await db.memberwd_records.find(
@@ -636,46 +675,46 @@ async def assign_random_memberwd_records(assignment: RandomMemberWDAssignment, u
     now = get_jakarta_now()
     
     # Get ACTIVE reserved members only (approved status)
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'}, 
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1}
-    ).to_list(100000)
-    
-    reserved_ids = build_reserved_set(reserved_members)
-    
-    available_records = await db.memberwd_records.find(
-        {'database_id': assignment.database_id, 'status': 'available'},
-        {'_id': 0}
-    ).to_list(100000)
+    reserved_ids = (await get_reserved_snapshot(db)).reserved_set
     
-    eligible_records = []
-    skipped_count = 0
-    for record in available_records:
-        if is_record_reserved(record, reserved_ids):
-            skipped_count += 1
-            continue
-        eligible_records.append(record)
+    # Reserved records are excluded with an indexed predicate on row_identifiers
+    available_query = {'database_id': assignment.database_id, 'status': 'available'}
+    unreserved_query = build_unreserved_filter(reserved_ids)
+    counts = await count_assignable(db.memberwd_records, available_query, unreserved_query)
+    skipped_count = counts['reserved']
     
-    if len(eligible_records) == 0:
+    if counts['eligible'] == 0:
         raise HTTPException(status_code=400, detail="No eligible records available")
     
-    if assignment.quantity > len(eligible_records):
-        raise HTTPException(status_code=400, detail=f"Only {len(eligible_records)} eligible records available")
+    if assignment.quantity > counts['eligible']:
+        raise HTTPException(status_code=400, detail=f"Only {counts['eligible']} eligible records available")
+    
+    # Create or use existing batch (records are claimed straight into it)
+    batch_id = assignment.batch_id or str(uuid.uuid4())
     
-    random.shuffle(eligible_records)
-    selected_records = eligible_records[:assignment.quantity]
-    selected_ids = [r['id'] for r in selected_records]
+    # Draw and claim the records server-side ($sample + conditional update)
+    selected_ids = await claim_random_records(
+        db.memberwd_records,
+        {**available_query, **unreserved_query},
+        assignment.quantity,
+        {'$set': {
+            'status': 'assigned',
+            'assigned_to': staff['id'],
+            'assigned_to_name': staff['name'],
+            'assigned_at': now.isoformat(),
+            'assigned_by': user.id,
+            'assigned_by_name': user.name,
+            'batch_id': batch_id
+        }}
+    )
     
     # Get database info
     db_info = await db.memberwd_databases.find_one({'id': assignment.database_id}, {'_id': 0})
     database_name = db_info.get('name', 'Unknown') if db_info else 'Unknown'
     product_name = db_info.get('product_name', 'Unknown') if db_info else 'Unknown'
     
-    # Create or use existing batch
-    batch_id = assignment.batch_id
-    if not batch_id:
+    if not assignment.batch_id:
         # Create new batch
-        batch_id = str(uuid.uuid4())
         await db.memberwd_batches.insert_one({
             'id': batch_id,
             'staff_id': staff['id'],
@@ -695,24 +734,11 @@ async def assign_random_memberwd_records(assignment: RandomMemberWDAssignment, u
             {'$inc': {'current_count': len(selected_ids)}}
         )
     
-    result = await db.memberwd_records.update_many(
-        {'id': {'$in': selected_ids}},
-        {'$set': {
-            'status': 'assigned',
-            'assigned_to': staff['id'],
-            'assigned_to_name': staff['name'],
-            'assigned_at': now.isoformat(),
-            'assigned_by': user.id,
-            'assigned_by_name': user.name,
-            'batch_id': batch_id
-        }}
-    )
-    
     return {
-        'message': f'{result.modified_count} records assigned to {staff["name"]}',
-        'assigned_count': result.modified_count,
+        'message': f'{len(selected_ids)} records assigned to {staff["name"]}',
+        'assigned_count': len(selected_ids),
         'total_reserved_in_db': skipped_count,
-        'remaining_eligible': len(eligible_records) - assignment.quantity,
+        'remaining_eligible': counts['eligible'] - len(selected_ids),
         'batch_id': batch_id
     }
 
@@ -786,8 +812,13 @@ async def rename_memberwd_batch(batch_id: str, data: BatchRenameRequest, user: U
 
 
 @router.get("/memberwd/staff/records")
-async def get_staff_memberwd_records(product_id: Optional[str] = None, user: User = Depends(get_current_user)):
-    """Get Member WD records assigned to the current staff"""
+async def get_staff_memberwd_records(
+    response: Response,
+    product_id: Optional[str] = None,
+    page: PageParams = Depends(get_page_params),
+    user: User = Depends(get_current_user)
+):
+    """Get Member WD records assigned to the current staff (keyset-paginated, next page cursor in X-Next-Cursor)"""
     db = get_db()
     if user.role != 'staff':
         raise HTTPException(status_code=403, detail="Only staff can access this endpoint")
@@ -796,7 +827,9 @@ async def get_staff_memberwd_records(product_id: Optional[str] = None, user: Use
     if product_id:
         query['product_id'] = product_id
     
-    records = await db.memberwd_records.find(query, {'_id': 0}).sort('assigned_at', -1).to_list(10000)
+    result = await read_page(db.memberwd_records, query, [('assigned_at', -1), ('id', -1)], page, default_limit=10000)
+    apply_page_headers(response, result)
+    records = result.items
     
     for record in records:
         if 'product_id' not in record:
@@ -1215,12 +1248,7 @@ async def process_invalid_memberwd_and_replace(staff_id: str, data: ProcessInval
     
     if data.auto_assign_quantity > 0:
         # Get reserved members for filtering
-        reserved_members = await db.reserved_members.find(
-            {'status': 'approved'},
-            {'_id': 0, 'customer_id': 1, 'customer_name': 1}
-        ).to_list(100000)
-        
-        reserved_ids = build_reserved_set(reserved_members)
+        reserved_ids = (await get_reserved_snapshot(db)).reserved_set
         
         # Process each batch group separately
         # Key: Each invalid record gets replaced by one record from the SAME database, 
@@ -1477,25 +1505,39 @@ async def get_memberwd_staff_list(user: User = Depends(get_admin_user)):
     return staff
 
 
-@router.post("/memberwd/admin/repair-data")
-async def repair_memberwd_data(user: User = Depends(get_admin_user)):
+@register_job('memberwd_repair', concurrency=1, lease_seconds=300)
+async def run_memberwd_repair(ctx: JobContext):
     """
-    Repair and synchronize memberwd record data.
+    Job: repair and synchronize memberwd record data.
     Uses shared repair utilities + MemberWD-specific batch sync + reserved status sync.
+    Each finished phase is checkpointed so a resumed job skips it.
     """
     from utils.repair_helpers import run_full_repair, sync_batch_counts
     
     db = get_db()
+    done = dict(ctx.checkpoint)
     
     # Run standard repair (fixes unknown statuses, orphaned assignments, etc.)
-    result = await run_full_repair(db, module='memberwd')
+    if 'repair' not in done:
+        await ctx.progress(0, 'Repairing records')
+        done['repair'] = await run_full_repair(
+            db, module='memberwd', checkpoint=done.get('repair_progress'),
+            on_progress=lambda percent, message, state: ctx.progress(
+                percent * 0.4, message, checkpoint={**done, 'repair_progress': state}
+            )
+        )
+    result = done['repair']
     
     # Sync reserved statuses (mark matching available records as 'reserved')
-    reserved_sync = await sync_all_reserved_statuses(db)
+    if 'reserved_sync' not in done:
+        await ctx.progress(40, 'Syncing reserved statuses', checkpoint=done)
+        done['reserved_sync'] = await sync_all_reserved_statuses(db)
+    reserved_sync = done['reserved_sync']
     result['repair_log']['reserved_marked'] = reserved_sync['marked_reserved']
     result['repair_log']['reserved_reverted'] = reserved_sync['marked_available']
     
     # Also sync batch counts (MemberWD specific)
+    await ctx.progress(70, 'Syncing batch counts', checkpoint=done)
     batch_sync = await sync_batch_counts(db)
     
     # Merge batch sync results into repair log
@@ -1518,6 +1560,15 @@ async def repair_memberwd_data(user: User = Depends(get_admin_user)):
     return result
 
 
+@router.post("/memberwd/admin/repair-data")
+async def repair_memberwd_data(wait: bool = True, user: User = Depends(get_admin_user)):
+    """
+    Repair and synchronize memberwd record data.
+    Runs as a background job (see GET /jobs/{job_id}).
+    """
+    return await submit_job('memberwd_repair', {}, user, wait)
+
+
 @router.get("/memberwd/admin/diagnose-product-mismatch")
 async def diagnose_memberwd_product_mismatch(user: User = Depends(get_admin_user)):
     """
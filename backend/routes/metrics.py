@@ -0,0 +1,31 @@
+# Request Metrics Routes (admin JSON view; Prometheus text is served at /metrics by server.py)
+from fastapi import APIRouter, Depends
+from typing import Optional
+
+from .deps import get_admin_user, User
+from utils.request_metrics import background_stats, metrics_registry
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/admin/metrics")
+async def get_request_metrics(
+    sort: str = 'total_time',
+    limit: Optional[int] = 50,
+    user: User = Depends(get_admin_user)
+):
+    """
+    Per-route latency (avg/p50/p95/p99), MongoDB commands and time per request, response
+    sizes and status codes of this worker, plus totals per MongoDB command.
+    sort: total_time (default), p95, count or db_commands.
+    """
+    summary = metrics_registry.summary(sort=sort, limit=limit)
+    summary['background'] = background_stats()
+    return summary
+
+
+@router.post("/admin/metrics/reset")
+async def reset_request_metrics(user: User = Depends(get_admin_user)):
+    """Clear this worker's request and MongoDB command metrics"""
+    metrics_registry.reset()
+    return {'success': True}
@@ -3,6 +3,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
 import uuid
 from .deps import User, get_db, get_current_user, get_admin_user, get_jakarta_now
 
@@ -144,10 +145,9 @@ async def resolve_all_admin_notifications(user: User = Depends(get_admin_user)):
         'resolved_count': result.modified_count
     }
 # Helper function to create notification (can be imported by other modules)
-async def create_notification(user_id: str, type: str, title: str, message: str, data: dict = None):
-    """Create a notification for a user and send it via WebSocket"""
-    db = get_db()
-    notification = {
+def build_notification(user_id: str, type: str, title: str, message: str, data: dict = None) -> dict:
+    """Notification document as stored by create_notification()"""
+    return {
         'id': str(uuid.uuid4()),
         'user_id': user_id,
         'type': type,
@@ -157,16 +157,29 @@ async def create_notification(user_id: str, type: str, title: str, message: str,
         'read': False,
         'created_at': get_jakarta_now().isoformat()
     }
-    await db.notifications.insert_one(notification)
+
+async def create_notification(user_id: str, type: str, title: str, message: str, data: dict = None):
+    """Create a notification for a user and send it via WebSocket"""
+    notification = build_notification(user_id, type, title, message, data)
+    await create_notifications([notification])
+    return notification
+
+async def create_notifications(notifications: List[dict]) -> int:
+    """Insert many built notifications with one insert_many and send each via WebSocket"""
+    if not notifications:
+        return 0
+    db = get_db()
+    # insert_many adds _id to the documents; keep it out of the WebSocket payloads
+    await db.notifications.insert_many([dict(n) for n in notifications], ordered=False)
     
-    # Send real-time notification via WebSocket
+    # Send real-time notifications via WebSocket
     try:
         from .websocket import send_realtime_notification
-        await send_realtime_notification(user_id, notification)
+        await asyncio.gather(*(send_realtime_notification(n['user_id'], n) for n in notifications))
     except Exception as e:
         print(f"Failed to send real-time notification: {e}")
     
-    return notification
+    return len(notifications)
 
 # ==================== USER PREFERENCES ENDPOINTS ====================
 
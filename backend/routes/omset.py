@@ -1,17 +1,21 @@
 # OMSET CRM Routes
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional, List
 from datetime import datetime, timezone, timedelta
+import asyncio
 import uuid
 from uuid import uuid4
-import io
-import csv
 import jwt
 
-from .deps import get_db, get_current_user, get_admin_user, User, JWT_SECRET, JWT_ALGORITHM
+from .deps import get_db, get_current_user, get_admin_user, User, JWT_SECRET, JWT_ALGORITHM, PageParams, get_page_params, read_page, submit_job
 from utils.helpers import normalize_customer_id, get_jakarta_now
+from utils.deposit_lookup import normalize_customer_name
+from utils.reserved_lookup import find_reservation, update_reservations, with_reservation_keys
+from utils.reserved_snapshot import bump_reserved_version
+from utils.omset_rollup import dashboard_stats_cache
+from utils.pagination import apply_page_headers
+from utils.job_queue import JobContext, register_job
 
 router = APIRouter(tags=["OMSET CRM"])
 
@@ -54,6 +58,37 @@ class OmsetRecordUpdate(BaseModel):
 
 # ==================== OMSET ENDPOINTS ====================
 
+async def _count_daily_ndp_rdp(db, dates: List[str]) -> dict:
+    """
+    Count NDP / RDP records per date (records, not customers; "tambahan" records are skipped).
+
+    Only the given days are read from omset_records and each record's first deposit
+    date is looked up against the keys present on those days.
+    """
+    from utils.db_operations import APPROVED_FILTER
+    from utils.first_deposit_index import ndp_classification_stages
+    
+    rows = await db.omset_records.aggregate([
+        {'$match': {'$and': [{'record_date': {'$in': dates}}, APPROVED_FILTER]}},
+        {'$project': {
+            '_id': 0, 'record_date': 1, 'staff_id': 1, 'customer_id': 1,
+            'customer_id_normalized': 1, 'product_id': 1, 'keterangan': 1
+        }},
+        *ndp_classification_stages(),
+        {'$match': {'_tambahan': False}},
+        {'$group': {
+            '_id': '$record_date',
+            'ndp': {'$sum': {'$cond': ['$_is_ndp', 1, 0]}},
+            'rdp': {'$sum': {'$cond': ['$_is_ndp', 0, 1]}},
+        }}
+    ]).to_list(None)
+    
+    counts = {d: {'ndp': 0, 'rdp': 0} for d in dates}
+    for row in rows:
+        counts[row['_id']] = {'ndp': row['ndp'], 'rdp': row['rdp']}
+    return counts
+
+
 @router.get("/omset/dashboard-stats")
 async def get_omset_dashboard_stats(user: User = Depends(get_current_user)):
     """Get dashboard stats with trend indicators comparing today vs yesterday, this month vs last month."""
@@ -65,130 +100,67 @@ async def get_omset_dashboard_stats(user: User = Depends(get_current_user)):
     today = jakarta_now.strftime('%Y-%m-%d')
     yesterday = (jakarta_now - timedelta(days=1)).strftime('%Y-%m-%d')
     
-    # Approved-only filter for all aggregations
-    approved_match = {'$or': [{'approval_status': 'approved'}, {'approval_status': {'$exists': False}}]}
+    cached = dashboard_stats_cache.get(today)
+    if cached is not None:
+        return cached
+    
+    # Totals come from the pre-aggregated daily rollups (a few rows per day)
+    from utils.omset_rollup import facet_sum_rollups
     
-    # Run all aggregations in parallel via gather-style sequential calls (motor doesn't support true parallel)
-    # 1) Year total
     year_start = f"{current_year}-01-01"
     year_end = f"{current_year}-12-31"
-    year_total = await db.omset_records.aggregate([
-        {'$match': {'record_date': {'$gte': year_start, '$lte': year_end}, **approved_match}},
-        {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$depo_total', 0]}}, 'count': {'$sum': 1}}}
-    ]).to_list(1)
     
-    # 2) Last year same period (for YoY comparison)
+    # Last year same period (for YoY comparison)
     last_year = current_year - 1
     ly_start = f"{last_year}-01-01"
     ly_end = (jakarta_now.replace(year=last_year)).strftime('%Y-%m-%d')
-    ly_total = await db.omset_records.aggregate([
-        {'$match': {'record_date': {'$gte': ly_start, '$lte': ly_end}, **approved_match}},
-        {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$depo_total', 0]}}}}
-    ]).to_list(1)
     
-    # 3) Monthly ATH (best day this month)
     month_str = f"{current_year}-{str(current_month).zfill(2)}"
     month_start = f"{month_str}-01"
     month_end = f"{month_str}-31"
-    daily_totals_agg = await db.omset_records.aggregate([
-        {'$match': {'record_date': {'$gte': month_start, '$lte': month_end}, **approved_match}},
-        {'$group': {'_id': '$record_date', 'daily_total': {'$sum': {'$ifNull': ['$depo_total', 0]}}}},
-        {'$sort': {'daily_total': -1}},
-        {'$limit': 1}
-    ]).to_list(1)
-    
-    # 4) Today's stats (omset + NDP/RDP counts)
-    today_stats = await db.omset_records.aggregate([
-        {'$match': {'record_date': today, **approved_match}},
-        {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$depo_total', 0]}}, 'count': {'$sum': 1}}}
-    ]).to_list(1)
-    
-    # 5) Yesterday's stats
-    yesterday_stats = await db.omset_records.aggregate([
-        {'$match': {'record_date': yesterday, **approved_match}},
-        {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$depo_total', 0]}}, 'count': {'$sum': 1}}}
-    ]).to_list(1)
-    
-    # 6) This month total
-    this_month_total = await db.omset_records.aggregate([
-        {'$match': {'record_date': {'$gte': month_start, '$lte': month_end}, **approved_match}},
-        {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$depo_total', 0]}}, 'count': {'$sum': 1}}}
-    ]).to_list(1)
-    
-    # 7) Last month total
+    
     if current_month == 1:
         lm_year, lm_month = current_year - 1, 12
     else:
         lm_year, lm_month = current_year, current_month - 1
     lm_str = f"{lm_year}-{str(lm_month).zfill(2)}"
-    last_month_total = await db.omset_records.aggregate([
-        {'$match': {'record_date': {'$gte': f'{lm_str}-01', '$lte': f'{lm_str}-31'}, **approved_match}},
-        {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$depo_total', 0]}}, 'count': {'$sum': 1}}}
-    ]).to_list(1)
     
-    # 8) Today's NDP count (unique new customers today)
-    from utils.db_operations import build_staff_first_date_map
-    first_date_map = await build_staff_first_date_map(db)
-    
-    today_records = await db.omset_records.find(
-        {'record_date': today, **approved_match},
-        {'_id': 0, 'staff_id': 1, 'customer_id_normalized': 1, 'product_id': 1, 'keterangan': 1}
-    ).to_list(5000)
-    
-    yesterday_records = await db.omset_records.find(
-        {'record_date': yesterday, **approved_match},
-        {'_id': 0, 'staff_id': 1, 'customer_id_normalized': 1, 'product_id': 1, 'keterangan': 1}
-    ).to_list(5000)
-    
-    def count_ndp_rdp(records):
-        ndp, rdp = 0, 0
-        for r in records:
-            keterangan = r.get('keterangan', '') or ''
-            if 'tambahan' in keterangan.lower():
-                continue
-            key = (r.get('staff_id', ''), r.get('customer_id_normalized', ''), r.get('product_id', ''))
-            first = first_date_map.get(key)
-            if first and first == today:
-                ndp += 1
-            elif first and first == yesterday and r.get('staff_id'):
-                ndp += 1
-            else:
-                rdp += 1
-        return ndp, rdp
-    
-    # Simpler approach: count unique customer+product combos for today/yesterday
-    today_ndp = 0
-    today_rdp = 0
-    for r in today_records:
-        keterangan = r.get('keterangan', '') or ''
-        if 'tambahan' in keterangan.lower():
-            continue
-        key = (r.get('staff_id', ''), r.get('customer_id_normalized', ''), r.get('product_id', ''))
-        first = first_date_map.get(key)
-        if first and first == today:
-            today_ndp += 1
-        else:
-            today_rdp += 1
+    # All rollup windows (plus the monthly ATH) in one $facet, in parallel with the
+    # today/yesterday NDP/RDP classification on omset_records
+    rollup_sums, ndp_rdp = await asyncio.gather(
+        facet_sum_rollups(
+            db,
+            {
+                'year': {'date': {'$gte': year_start, '$lte': year_end}},
+                'last_year_ytd': {'date': {'$gte': ly_start, '$lte': ly_end}},
+                'today': {'date': today},
+                'yesterday': {'date': yesterday},
+                'this_month': {'date': {'$gte': month_start, '$lte': month_end}},
+                'last_month': {'date': {'$gte': f'{lm_str}-01', '$lte': f'{lm_str}-31'}},
+            },
+            extra_facets={
+                # Monthly ATH (best day this month)
+                'monthly_ath': [
+                    {'$match': {'date': {'$gte': month_start, '$lte': month_end}}},
+                    {'$group': {'_id': '$date', 'daily_total': {'$sum': '$depo_total'}}},
+                    {'$sort': {'daily_total': -1}},
+                    {'$limit': 1}
+                ]
+            }
+        ),
+        _count_daily_ndp_rdp(db, [today, yesterday])
+    )
     
-    yesterday_ndp = 0
-    yesterday_rdp = 0
-    for r in yesterday_records:
-        keterangan = r.get('keterangan', '') or ''
-        if 'tambahan' in keterangan.lower():
-            continue
-        key = (r.get('staff_id', ''), r.get('customer_id_normalized', ''), r.get('product_id', ''))
-        first = first_date_map.get(key)
-        if first and first == yesterday:
-            yesterday_ndp += 1
-        else:
-            yesterday_rdp += 1
+    today_stats = rollup_sums['today']
+    yesterday_stats = rollup_sums['yesterday']
+    daily_totals_agg = rollup_sums['monthly_ath']
     
     # Build response (keeping ALL existing fields + adding trends)
-    total_omset_year = year_total[0]['total'] if year_total else 0
+    total_omset_year = rollup_sums['year']['depo_total']
     ath_date = daily_totals_agg[0]['_id'] if daily_totals_agg else None
     ath_amount = daily_totals_agg[0]['daily_total'] if daily_totals_agg else 0
     
-    return {
+    result = {
         # Existing fields (unchanged)
         'year': current_year,
         'month': current_month,
@@ -196,19 +168,21 @@ async def get_omset_dashboard_stats(user: User = Depends(get_current_user)):
         'monthly_ath': {'date': ath_date, 'amount': ath_amount},
         # New trend data
         'trends': {
-            'today_omset': today_stats[0]['total'] if today_stats else 0,
-            'yesterday_omset': yesterday_stats[0]['total'] if yesterday_stats else 0,
-            'today_records': today_stats[0]['count'] if today_stats else 0,
-            'yesterday_records': yesterday_stats[0]['count'] if yesterday_stats else 0,
-            'today_ndp': today_ndp,
-            'yesterday_ndp': yesterday_ndp,
-            'today_rdp': today_rdp,
-            'yesterday_rdp': yesterday_rdp,
-            'this_month_omset': this_month_total[0]['total'] if this_month_total else 0,
-            'last_month_omset': last_month_total[0]['total'] if last_month_total else 0,
-            'last_year_ytd': ly_total[0]['total'] if ly_total else 0,
+            'today_omset': today_stats['depo_total'],
+            'yesterday_omset': yesterday_stats['depo_total'],
+            'today_records': today_stats['count'],
+            'yesterday_records': yesterday_stats['count'],
+            'today_ndp': ndp_rdp[today]['ndp'],
+            'yesterday_ndp': ndp_rdp[yesterday]['ndp'],
+            'today_rdp': ndp_rdp[today]['rdp'],
+            'yesterday_rdp': ndp_rdp[yesterday]['rdp'],
+            'this_month_omset': rollup_sums['this_month']['depo_total'],
+            'last_month_omset': rollup_sums['last_month']['depo_total'],
+            'last_year_ytd': rollup_sums['last_year_ytd']['depo_total'],
         }
     }
+    dashboard_stats_cache.set(today, result)
+    return result
 
 @router.post("/omset", response_model=OmsetRecord)
 async def create_omset_record(record_data: OmsetRecordCreate, user: User = Depends(get_current_user)):
@@ -258,14 +232,9 @@ async def create_omset_record(record_data: OmsetRecordCreate, user: User = Depen
     approval_status = 'approved'
     conflict_info = None
     
-    reserved_conflict = await db.reserved_members.find_one({
-        'status': 'approved',
-        'staff_id': {'$ne': user.id},
-        '$or': [
-            {'customer_id': {'$regex': f'^{record_data.customer_id.strip()}$', '$options': 'i'}},
-            {'customer_name': {'$regex': f'^{record_data.customer_id.strip()}$', '$options': 'i'}}
-        ]
-    }, {'_id': 0})
+    reserved_conflict = await find_reservation(
+        db, record_data.customer_id, status='approved', exclude_staff_id=user.id
+    )
     
     if reserved_conflict:
         approval_status = 'pending'
@@ -294,6 +263,7 @@ async def create_omset_record(record_data: OmsetRecordCreate, user: User = Depen
     doc = record.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     doc['customer_id_normalized'] = normalized_cid
+    doc['customer_name_lower'] = normalize_customer_name(doc['customer_name'])
     doc['customer_type'] = customer_type
     doc['approval_status'] = approval_status
     if conflict_info:
@@ -304,8 +274,10 @@ async def create_omset_record(record_data: OmsetRecordCreate, user: User = Depen
     # SYNC: Recalculate NDP/RDP for ALL records of this (staff, customer, product)
     # This handles out-of-order entry (e.g., Feb 9 entered before Feb 7)
     if approval_status == 'approved':
-        from utils.db_operations import recalculate_customer_type
-        await recalculate_customer_type(db, user.id, record_data.customer_id.strip(), record_data.product_id)
+        from utils.omset_rollup import sync_omset_change
+        await sync_omset_change(
+            db, user.id, record_data.customer_id.strip(), record_data.product_id, [record_data.record_date]
+        )
     
     # If pending, notify admin
     if approval_status == 'pending':
@@ -324,17 +296,10 @@ async def create_omset_record(record_data: OmsetRecordCreate, user: User = Depen
     # SYNC: Update reserved_members last_omset_date if this customer is reserved by THIS staff
     # Search BOTH customer_id AND customer_name fields to handle legacy data
     if approval_status == 'approved':
-        customer_id_clean = record_data.customer_id.strip()
-        await db.reserved_members.update_many(
-            {
-                '$or': [
-                    {'customer_id': {'$regex': f'^{customer_id_clean}$', '$options': 'i'}},
-                    {'customer_name': {'$regex': f'^{customer_id_clean}$', '$options': 'i'}}
-                ],
-                'staff_id': user.id,
-                'status': 'approved'
-            },
-            {'$set': {'last_omset_date': record_data.record_date}}
+        await update_reservations(
+            db, record_data.customer_id,
+            {'$set': {'last_omset_date': record_data.record_date}},
+            status='approved', staff_id=user.id
         )
     
     # AUTO-REASSIGNMENT: If this customer had a deleted/expired reservation
@@ -344,24 +309,13 @@ async def create_omset_record(record_data: OmsetRecordCreate, user: User = Depen
         customer_id_clean = record_data.customer_id.strip()
         
         # Check if customer is NOT currently reserved by ANYONE
-        current_reservation = await db.reserved_members.find_one({
-            'status': 'approved',
-            '$or': [
-                {'customer_id': {'$regex': f'^{customer_id_clean}$', '$options': 'i'}},
-                {'customer_name': {'$regex': f'^{customer_id_clean}$', '$options': 'i'}}
-            ]
-        })
+        current_reservation = await find_reservation(db, customer_id_clean, status='approved', projection={'_id': 0, 'id': 1})
         
         if not current_reservation:
             # Check if there's a deleted reservation for this customer + staff + product
-            deleted_reservation = await db.deleted_reserved_members.find_one({
-                'staff_id': user.id,
-                'product_id': record_data.product_id,
-                '$or': [
-                    {'customer_id': {'$regex': f'^{customer_id_clean}$', '$options': 'i'}},
-                    {'customer_name': {'$regex': f'^{customer_id_clean}$', '$options': 'i'}}
-                ]
-            }, {'_id': 0})
+            deleted_reservation = await find_reservation(
+                db, customer_id_clean, product_id=record_data.product_id, staff_id=user.id, archived=True
+            )
             
             if deleted_reservation:
                 # Auto-create a new reservation
@@ -388,7 +342,8 @@ async def create_omset_record(record_data: OmsetRecordCreate, user: User = Depen
                     'auto_reassigned_at': now.isoformat(),
                 }
                 
-                await db.reserved_members.insert_one(new_reservation)
+                await db.reserved_members.insert_one(with_reservation_keys(new_reservation))
+                await bump_reserved_version(db)
                 
                 # Remove from deleted_reserved_members archive
                 await db.deleted_reserved_members.delete_one({
@@ -442,24 +397,16 @@ async def approve_omset(record_id: str, user: User = Depends(get_admin_user)):
     
     # Update reserved_members last_omset_date
     # Search BOTH customer_id AND customer_name fields to handle legacy data
-    customer_id_clean = record['customer_id'].strip() if record.get('customer_id') else ''
-    if customer_id_clean:
-        await db.reserved_members.update_many(
-            {
-                '$or': [
-                    {'customer_id': {'$regex': f'^{customer_id_clean}$', '$options': 'i'}},
-                    {'customer_name': {'$regex': f'^{customer_id_clean}$', '$options': 'i'}}
-                ],
-                'staff_id': record['staff_id'],
-                'status': 'approved'
-            },
-            {'$set': {'last_omset_date': record['record_date']}}
-        )
+    await update_reservations(
+        db, record.get('customer_id'),
+        {'$set': {'last_omset_date': record['record_date']}},
+        status='approved', staff_id=record['staff_id']
+    )
     
     # Recalculate NDP/RDP customer_type now that this record is approved
-    from utils.db_operations import recalculate_customer_type
-    await recalculate_customer_type(
-        db, record['staff_id'], record['customer_id'], record['product_id']
+    from utils.omset_rollup import sync_omset_change
+    await sync_omset_change(
+        db, record['staff_id'], record['customer_id'], record['product_id'], [record['record_date']]
     )
     
     # Notify staff
@@ -490,9 +437,9 @@ async def decline_omset(record_id: str, user: User = Depends(get_admin_user)):
     await db.omset_records.delete_one({'id': record_id})
     
     # Recalculate NDP/RDP customer_type for remaining records of this (staff, customer, product)
-    from utils.db_operations import recalculate_customer_type
-    await recalculate_customer_type(
-        db, record['staff_id'], record['customer_id'], record['product_id']
+    from utils.omset_rollup import sync_omset_change
+    await sync_omset_change(
+        db, record['staff_id'], record['customer_id'], record['product_id'], [record['record_date']]
     )
     
     # Notify staff
@@ -578,13 +525,16 @@ async def get_omset_duplicates(
 
 @router.get("/omset")
 async def get_omset_records(
+    response: Response,
     product_id: Optional[str] = None,
     record_date: Optional[str] = None,
     staff_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    page: PageParams = Depends(get_page_params),
     user: User = Depends(get_current_user)
 ):
+    """OMSET records, newest first, keyset-paginated (next page cursor in X-Next-Cursor)"""
     db = get_db()
     query = {}
     
@@ -605,7 +555,11 @@ async def get_omset_records(
     elif end_date:
         query['record_date'] = {'$lte': end_date}
     
-    records = await db.omset_records.find(query, {'_id': 0}).sort([('record_date', -1), ('created_at', -1)]).to_list(10000)
+    result = await read_page(
+        db.omset_records, query, [('record_date', -1), ('created_at', -1), ('id', -1)], page, default_limit=10000
+    )
+    apply_page_headers(response, result)
+    records = result.items
     
     for record in records:
         if isinstance(record.get('created_at'), str):
@@ -628,8 +582,10 @@ async def update_omset_record(record_id: str, update_data: OmsetRecordUpdate, us
     update_fields = {}
     if update_data.customer_name is not None:
         update_fields['customer_name'] = update_data.customer_name
+        update_fields['customer_name_lower'] = normalize_customer_name(update_data.customer_name)
     if update_data.customer_id is not None:
         update_fields['customer_id'] = update_data.customer_id
+        update_fields['customer_id_normalized'] = normalize_customer_id(update_data.customer_id)
     if update_data.nominal is not None:
         update_fields['nominal'] = update_data.nominal
     if update_data.depo_kelipatan is not None:
@@ -644,6 +600,24 @@ async def update_omset_record(record_id: str, update_data: OmsetRecordUpdate, us
     
     await db.omset_records.update_one({'id': record_id}, {'$set': update_fields})
     
+    # Customer ID and keterangan ("tambahan") both affect NDP/RDP, so resync the
+    # old combo and, if the customer changed, the new one as well.
+    # Nominal changes only move the daily rollup totals.
+    from utils.omset_rollup import sync_omset_change, refresh_daily_rollup
+    if update_data.customer_id is not None or update_data.keterangan is not None:
+        await sync_omset_change(
+            db, record['staff_id'], record['customer_id'], record['product_id'], [record['record_date']]
+        )
+        if update_data.customer_id is not None and \
+                normalize_customer_id(update_data.customer_id) != normalize_customer_id(record['customer_id']):
+            await sync_omset_change(
+                db, record['staff_id'], update_data.customer_id, record['product_id'], [record['record_date']]
+            )
+    else:
+        from utils.deposit_profile import refresh_deposit_profile
+        await refresh_daily_rollup(db, record['record_date'], record['staff_id'], record['product_id'])
+        await refresh_deposit_profile(db, record['customer_id'], record['product_id'])
+    
     return {'message': 'Record updated successfully'}
 
 @router.delete("/omset/{record_id}")
@@ -669,9 +643,9 @@ async def delete_omset_record(record_id: str, user: User = Depends(get_current_u
     await db.omset_records.delete_one({'id': record_id})
     
     # Recalculate NDP/RDP customer_type for remaining records of this (staff, customer, product)
-    from utils.db_operations import recalculate_customer_type
-    await recalculate_customer_type(
-        db, record['staff_id'], record['customer_id'], record['product_id']
+    from utils.omset_rollup import sync_omset_change
+    await sync_omset_change(
+        db, record['staff_id'], record['customer_id'], record['product_id'], [record['record_date']]
     )
     
     return {
@@ -717,24 +691,17 @@ async def restore_omset_record(record_id: str, user: User = Depends(get_current_
     record_date = restored_record.get('record_date', '')
     
     if customer_id and staff_id and record_date:
-        await db.reserved_members.update_many(
-            {
-                'customer_id': {'$regex': f'^{customer_id}$', '$options': 'i'},
-                'staff_id': staff_id,
-                'status': 'approved'
-            },
-            {
-                '$set': {
-                    'last_omset_date': record_date
-                }
-            }
+        await update_reservations(
+            db, customer_id,
+            {'$set': {'last_omset_date': record_date}},
+            status='approved', staff_id=staff_id
         )
     
     # Recalculate NDP/RDP customer_type for this (staff, customer, product) after restore
     product_id = restored_record.get('product_id', '')
     if customer_id and staff_id and product_id:
-        from utils.db_operations import recalculate_customer_type
-        await recalculate_customer_type(db, staff_id, customer_id, product_id)
+        from utils.omset_rollup import sync_omset_change
+        await sync_omset_change(db, staff_id, customer_id, product_id, [record_date])
     
     return {
         'message': 'Record restored successfully',
@@ -825,221 +792,118 @@ async def get_omset_summary(
     # Only count approved records in summary calculations
     query['$or'] = [{'approval_status': 'approved'}, {'approval_status': {'$exists': False}}]
     
-    records = await db.omset_records.find(query, {'_id': 0}).to_list(100000)
-    
-    # Helper function to check if record has "tambahan" in notes
-    def is_tambahan_record(record) -> bool:
-        keterangan = record.get('keterangan', '') or ''
-        return 'tambahan' in keterangan.lower()
-    
-    # Get ALL records for building customer_first_date maps
-    # Use MongoDB aggregation for efficiency (instead of loading 500K records into memory)
-    from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id)
+    # Daily / staff / product totals come from the pre-aggregated daily rollups.
+    # Rollup rows are (date, staff, product) with DISTINCT-customer NDP/RDP counts and
+    # ndp_total/rdp_total counting each customer's depo once, so summing them gives the same
+    # (staff_id, customer_id, product_id, date) tuple counts and totals as before.
+    from utils.omset_rollup import build_rollup_match, fetch_rollups
+    rollups = await fetch_rollups(db, build_rollup_match(
+        staff_id=query.get('staff_id'), product_id=product_id, start_date=start_date, end_date=end_date
+    ))
     
     daily_summary = {}
     staff_summary = {}
     product_summary = {}
     total_nominal = 0
     total_depo = 0
-    total_records = len(records)
+    total_records = 0
     total_ndp = 0
     total_rdp = 0
     
-    # Use (staff_id, customer_id, product_id) tuples for consistent tracking everywhere
-    # This ensures NDP/RDP counts ALWAYS match across daily, staff, and product views
-    staff_ndp_pairs = {}     # staff_id -> set of (customer_id, product_id)
-    staff_rdp_pairs = {}     # staff_id -> set of (customer_id, product_id)
-    product_ndp_pairs = {}   # product_id -> set of (staff_id, customer_id)
-    product_rdp_pairs = {}   # product_id -> set of (staff_id, customer_id)
-    
-    # UNIQUE CUSTOMERS tracking (deduplicated across ALL dates, for the new section)
-    # Per staff: set of (cid_normalized, product_id) -> track original customer_id for display
-    staff_unique_ndp = {}    # staff_id -> {(cid_normalized, product_id): {'customer_id': str, 'product_name': str, 'dates': set, 'total_depo': int}}
-    staff_unique_rdp = {}    # staff_id -> {(cid_normalized, product_id): {'customer_id': str, 'product_name': str, 'dates': set, 'total_depo': int}}
-    
-    for record in records:
-        date = record['record_date']
-        staff_name = record['staff_name']
-        staff_id_rec = record['staff_id']
-        product_name = record['product_name']
-        product_id_rec = record['product_id']
-        nominal = record.get('nominal', 0) or 0
-        depo_total = record.get('depo_total', 0) or 0
-        
-        # Use normalized customer_id
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        
-        # SINGLE NDP/RDP definition: per (staff, customer, product)
-        staff_key = (staff_id_rec, cid_normalized, product_id_rec)
-        staff_first_date = staff_customer_first_date.get(staff_key)
-        
-        is_tambahan = is_tambahan_record(record)
-        
-        if is_tambahan:
-            is_ndp = False
-        else:
-            is_ndp = staff_first_date == date
-        
-        total_nominal += nominal
-        total_depo += depo_total
+    for row in rollups:
+        date = row['date']
+        total_nominal += row['nominal']
+        total_depo += row['depo_total']
+        total_records += row['count']
+        total_ndp += row['ndp_count']
+        total_rdp += row['rdp_count']
         
         # --- Daily Summary ---
         if date not in daily_summary:
             daily_summary[date] = {
-                'date': date, 
-                'total_nominal': 0, 
-                'total_depo': 0, 
+                'date': date,
+                'total_nominal': 0,
+                'total_depo': 0,
                 'count': 0,
-                'ndp_tuples': set(),   # Track (staff_id, customer_id, product_id)
-                'rdp_tuples': set(),   # Track (staff_id, customer_id, product_id)
+                'ndp_count': 0,
+                'rdp_count': 0,
                 'ndp_total': 0,
                 'rdp_total': 0
             }
-        daily_summary[date]['total_nominal'] += nominal
-        daily_summary[date]['total_depo'] += depo_total
-        daily_summary[date]['count'] += 1
-        
-        ndp_tuple = (staff_id_rec, cid_normalized, product_id_rec)
-        if is_ndp:
-            if ndp_tuple not in daily_summary[date]['ndp_tuples']:
-                daily_summary[date]['ndp_tuples'].add(ndp_tuple)
-                daily_summary[date]['ndp_total'] += depo_total
-        else:
-            if ndp_tuple not in daily_summary[date]['rdp_tuples']:
-                daily_summary[date]['rdp_tuples'].add(ndp_tuple)
-                daily_summary[date]['rdp_total'] += depo_total
+        for field in ('ndp_total', 'rdp_total', 'count', 'ndp_count', 'rdp_count'):
+            daily_summary[date][field] += row[field]
+        daily_summary[date]['total_nominal'] += row['nominal']
+        daily_summary[date]['total_depo'] += row['depo_total']
         
         # --- Staff Summary ---
+        staff_id_rec = row['staff_id']
         if staff_id_rec not in staff_summary:
             staff_summary[staff_id_rec] = {
-                'staff_id': staff_id_rec, 
-                'staff_name': staff_name, 
-                'total_nominal': 0, 
-                'total_depo': 0, 
+                'staff_id': staff_id_rec,
+                'staff_name': row.get('staff_name'),
+                'total_nominal': 0,
+                'total_depo': 0,
                 'count': 0,
                 'ndp_count': 0,
                 'rdp_count': 0
             }
-            staff_ndp_pairs[staff_id_rec] = set()
-            staff_rdp_pairs[staff_id_rec] = set()
-        
-        staff_summary[staff_id_rec]['total_nominal'] += nominal
-        staff_summary[staff_id_rec]['total_depo'] += depo_total
-        staff_summary[staff_id_rec]['count'] += 1
-        
-        # Track (customer_id, product_id, date) per staff — include date to match daily totals
-        customer_product_date = (cid_normalized, product_id_rec, date)
-        if is_ndp:
-            if customer_product_date not in staff_ndp_pairs[staff_id_rec]:
-                staff_ndp_pairs[staff_id_rec].add(customer_product_date)
-                staff_summary[staff_id_rec]['ndp_count'] += 1
-        else:
-            if customer_product_date not in staff_rdp_pairs[staff_id_rec]:
-                staff_rdp_pairs[staff_id_rec].add(customer_product_date)
-                staff_summary[staff_id_rec]['rdp_count'] += 1
+        staff_summary[staff_id_rec]['total_nominal'] += row['nominal']
+        staff_summary[staff_id_rec]['total_depo'] += row['depo_total']
+        for field in ('count', 'ndp_count', 'rdp_count'):
+            staff_summary[staff_id_rec][field] += row[field]
         
         # --- Product Summary ---
+        product_id_rec = row['product_id']
         if product_id_rec not in product_summary:
             product_summary[product_id_rec] = {
-                'product_id': product_id_rec, 
-                'product_name': product_name, 
-                'total_nominal': 0, 
-                'total_depo': 0, 
+                'product_id': product_id_rec,
+                'product_name': row.get('product_name'),
+                'total_nominal': 0,
+                'total_depo': 0,
                 'count': 0,
                 'ndp_count': 0,
                 'rdp_count': 0
             }
-            product_ndp_pairs[product_id_rec] = set()
-            product_rdp_pairs[product_id_rec] = set()
-        
-        product_summary[product_id_rec]['total_nominal'] += nominal
-        product_summary[product_id_rec]['total_depo'] += depo_total
-        product_summary[product_id_rec]['count'] += 1
-        
-        # Track (staff_id, customer_id, date) per product — include date to match daily totals
-        staff_customer_date = (staff_id_rec, cid_normalized, date)
-        if is_ndp:
-            if staff_customer_date not in product_ndp_pairs[product_id_rec]:
-                product_ndp_pairs[product_id_rec].add(staff_customer_date)
-                product_summary[product_id_rec]['ndp_count'] += 1
-        else:
-            if staff_customer_date not in product_rdp_pairs[product_id_rec]:
-                product_rdp_pairs[product_id_rec].add(staff_customer_date)
-                product_summary[product_id_rec]['rdp_count'] += 1
-        
-        # --- UNIQUE CUSTOMERS tracking (deduped across ALL dates) ---
-        original_customer_id = record.get('customer_id', cid_normalized)
-        if staff_id_rec not in staff_unique_ndp:
-            staff_unique_ndp[staff_id_rec] = {}
-            staff_unique_rdp[staff_id_rec] = {}
-        
-        unique_key = (cid_normalized, product_id_rec)
-        if is_ndp:
-            if unique_key not in staff_unique_ndp[staff_id_rec]:
-                staff_unique_ndp[staff_id_rec][unique_key] = {
-                    'customer_id': original_customer_id,
-                    'product_id': product_id_rec,
-                    'product_name': product_name,
-                    'dates': set(),
-                    'total_depo': 0,
-                    'deposit_count': 0
-                }
-            staff_unique_ndp[staff_id_rec][unique_key]['dates'].add(date)
-            staff_unique_ndp[staff_id_rec][unique_key]['total_depo'] += depo_total
-            staff_unique_ndp[staff_id_rec][unique_key]['deposit_count'] += 1
-        else:
-            if unique_key not in staff_unique_rdp[staff_id_rec]:
-                staff_unique_rdp[staff_id_rec][unique_key] = {
-                    'customer_id': original_customer_id,
-                    'product_id': product_id_rec,
-                    'product_name': product_name,
-                    'dates': set(),
-                    'total_depo': 0,
-                    'deposit_count': 0
-                }
-            staff_unique_rdp[staff_id_rec][unique_key]['dates'].add(date)
-            staff_unique_rdp[staff_id_rec][unique_key]['total_depo'] += depo_total
-            staff_unique_rdp[staff_id_rec][unique_key]['deposit_count'] += 1
-    
-    daily_list = []
-    for date, data in daily_summary.items():
-        daily_list.append({
-            'date': data['date'],
-            'total_nominal': data['total_nominal'],
-            'total_depo': data['total_depo'],
-            'count': data['count'],
-            'ndp_count': len(data['ndp_tuples']),
-            'rdp_count': len(data['rdp_tuples']),
-            'ndp_total': data['ndp_total'],
-            'rdp_total': data['rdp_total']
+        product_summary[product_id_rec]['total_nominal'] += row['nominal']
+        product_summary[product_id_rec]['total_depo'] += row['depo_total']
+        for field in ('count', 'ndp_count', 'rdp_count'):
+            product_summary[product_id_rec][field] += row[field]
+    
+    # --- UNIQUE CUSTOMERS (deduped across ALL dates) ---
+    # Grouped server-side to one row per (staff, customer, product, NDP/RDP) instead of
+    # shipping every raw record; NDP is classified via the first-deposit index lookup.
+    from utils.first_deposit_index import ndp_classification_stages
+    unique_rows = await db.omset_records.aggregate([
+        {'$match': query},
+        *ndp_classification_stages(),
+        {'$group': {
+            '_id': {'s': '$staff_id', 'c': '$_cid', 'p': '$product_id', 'ndp': '$_is_ndp'},
+            'customer_id': {'$first': '$customer_id'},
+            'product_name': {'$first': '$product_name'},
+            'dates': {'$addToSet': '$record_date'},
+            'total_depo': {'$sum': '$_depo'},
+            'deposit_count': {'$sum': 1}
+        }}
+    ], allowDiskUse=True).to_list(None)
+    
+    staff_unique_ndp = {}    # staff_id -> [customer dict]
+    staff_unique_rdp = {}    # staff_id -> [customer dict]
+    for u in unique_rows:
+        target = staff_unique_ndp if u['_id']['ndp'] else staff_unique_rdp
+        target.setdefault(u['_id']['s'], []).append({
+            'customer_id': u.get('customer_id') or u['_id']['c'],
+            'product_id': u['_id']['p'],
+            'product_name': u.get('product_name'),
+            'deposit_count': u['deposit_count'],
+            'total_depo': u['total_depo'],
+            'dates': sorted(u['dates'])
         })
-        total_ndp += len(data['ndp_tuples'])
-        total_rdp += len(data['rdp_tuples'])
     
     # Build unique customers summary per staff
     unique_customers_by_staff = []
     for sid, sdata in staff_summary.items():
-        ndp_customers = []
-        for key, cdata in staff_unique_ndp.get(sid, {}).items():
-            ndp_customers.append({
-                'customer_id': cdata['customer_id'],
-                'product_id': cdata['product_id'],
-                'product_name': cdata['product_name'],
-                'deposit_count': cdata['deposit_count'],
-                'total_depo': cdata['total_depo'],
-                'dates': sorted(cdata['dates'])
-            })
-        rdp_customers = []
-        for key, cdata in staff_unique_rdp.get(sid, {}).items():
-            rdp_customers.append({
-                'customer_id': cdata['customer_id'],
-                'product_id': cdata['product_id'],
-                'product_name': cdata['product_name'],
-                'deposit_count': cdata['deposit_count'],
-                'total_depo': cdata['total_depo'],
-                'dates': sorted(cdata['dates'])
-            })
+        ndp_customers = staff_unique_ndp.get(sid, [])
+        rdp_customers = staff_unique_rdp.get(sid, [])
         unique_customers_by_staff.append({
             'staff_id': sid,
             'staff_name': sdata['staff_name'],
@@ -1057,7 +921,7 @@ async def get_omset_summary(
             'total_ndp': total_ndp,
             'total_rdp': total_rdp
         },
-        'daily': sorted(daily_list, key=lambda x: x['date'], reverse=True),
+        'daily': sorted(daily_summary.values(), key=lambda x: x['date'], reverse=True),
         'by_staff': sorted(staff_summary.values(), key=lambda x: x['total_depo'], reverse=True),
         'by_product': sorted(product_summary.values(), key=lambda x: x['total_depo'], reverse=True),
         'unique_customers': sorted(unique_customers_by_staff, key=lambda x: x['unique_rdp_count'], reverse=True)
@@ -1091,7 +955,12 @@ async def export_omset_records(
     format: str = "csv",
     token: Optional[str] = None
 ):
-    """Export OMSET records to CSV format"""
+    """
+    Export OMSET records to CSV format.
+    Type is NDP when a record is not "tambahan" and falls on the first record date of its
+    (customer, product) across all staff (across the staff's own records for staff exports),
+    not on the per-staff first deposit used by the summaries.
+    """
     db = get_db()
     
     if token:
@@ -1130,65 +999,61 @@ async def export_omset_records(
     elif end_date:
         query['record_date'] = {'$lte': end_date}
     
-    records = await db.omset_records.find(query, {'_id': 0}).sort([('record_date', -1), ('created_at', -1)]).to_list(100000)
-    
-    all_query = {'product_id': product_id} if product_id else {}
+    # Stream records straight from the cursor; each record's (customer, product) first date
+    # is an indexed $lookup (customer_product_idx) instead of loading every record to build it
+    from utils.helpers import customer_key_expr
+    from utils.streaming_export import EXPORT_BATCH_SIZE, streaming_export_response
+    first_date_match = [
+        {'$eq': ['$customer_id_normalized', '$$c']},
+        {'$eq': ['$product_id', '$$p']},
+    ]
     if user.role == 'staff':
-        all_query['staff_id'] = user.id
-    
-    all_records = await db.omset_records.find(all_query, {'_id': 0}).to_list(100000)
-    
-    customer_first_date = {}
-    for record in sorted(all_records, key=lambda x: x['record_date']):
-        # Use normalized customer_id for comparison
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        key = (cid_normalized, record['product_id'])
-        if key not in customer_first_date:
-            customer_first_date[key] = record['record_date']
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(['Date', 'Product', 'Staff', 'Customer ID', 'Nominal', 'Kelipatan', 'Depo Total', 'Type', 'Keterangan'])
-    
-    for record in records:
-        # Use normalized customer_id for comparison
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        key = (cid_normalized, record['product_id'])
-        first_date = customer_first_date.get(key)
-        
-        # Check if "tambahan" in notes - if so, always RDP
-        keterangan = record.get('keterangan', '') or ''
-        if 'tambahan' in keterangan.lower():
-            record_type = 'RDP'
-        else:
-            record_type = 'NDP' if first_date == record['record_date'] else 'RDP'
-        
-        writer.writerow([
-            record['record_date'],
-            record['product_name'],
-            record['staff_name'],
-            record['customer_id'],
-            record.get('nominal', 0),
-            record.get('depo_kelipatan', 1),
-            record.get('depo_total', 0),
-            record_type,
-            record.get('keterangan', '')
-        ])
-    
-    output.seek(0)
+        first_date_match.append({'$eq': ['$staff_id', user.id]})
+    cursor = db.omset_records.aggregate([
+        {'$match': query},
+        {'$sort': {'record_date': -1, 'created_at': -1}},
+        {'$lookup': {
+            'from': 'omset_records',
+            'let': {'c': customer_key_expr(), 'p': '$product_id'},
+            'pipeline': [
+                {'$match': {'$expr': {'$and': first_date_match}}},
+                {'$group': {'_id': None, 'first_date': {'$min': '$record_date'}}},
+            ],
+            'as': '_first'
+        }},
+        {'$addFields': {'_first_date': {'$arrayElemAt': ['$_first.first_date', 0]}}},
+        {'$project': {'_id': 0, '_first': 0}}
+    ], allowDiskUse=True, batchSize=EXPORT_BATCH_SIZE)
+    
+    async def export_rows():
+        async for record in cursor:
+            # Check if "tambahan" in notes - if so, always RDP
+            keterangan = record.get('keterangan', '') or ''
+            if 'tambahan' in keterangan.lower():
+                record_type = 'RDP'
+            else:
+                record_type = 'NDP' if record.get('_first_date') == record['record_date'] else 'RDP'
+            yield [
+                record['record_date'],
+                record['product_name'],
+                record['staff_name'],
+                record['customer_id'],
+                record.get('nominal', 0),
+                record.get('depo_kelipatan', 1),
+                record.get('depo_total', 0),
+                record_type,
+                record.get('keterangan', '')
+            ]
     
     date_part = record_date if record_date else f"{start_date or 'all'}_to_{end_date or 'now'}"
-    filename = f"omset_export_{date_part}.csv"
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="application/octet-stream",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}",
-            "Content-Type": "application/octet-stream",
-            "Cache-Control": "no-cache"
-        }
+    
+    return streaming_export_response(
+        ['Date', 'Product', 'Staff', 'Customer ID', 'Nominal', 'Kelipatan', 'Depo Total', 'Type', 'Keterangan'],
+        export_rows(),
+        filename=f"omset_export_{date_part}",
+        format='xlsx' if format == 'xlsx' else 'csv',
+        sheet_title='OMSET',
+        media_type="application/octet-stream"
     )
 
 @router.get("/omset/export-summary")
@@ -1233,74 +1098,41 @@ async def export_omset_summary(
     elif end_date:
         query['record_date'] = {'$lte': end_date}
     
-    records = await db.omset_records.find(query, {'_id': 0}).to_list(100000)
-    
-    # Build STAFF-SPECIFIC customer first deposit map using MongoDB aggregation
-    from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db, product_id=product_id)
-    
-    daily_summary = {}
-    for record in records:
-        date = record['record_date']
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        staff_id_rec = record['staff_id']
-        product_id_rec = record['product_id']
-        key = (staff_id_rec, cid_normalized, product_id_rec)
-        first_date = staff_customer_first_date.get(key)
-        
-        # Check if "tambahan" in notes - if so, always RDP
-        keterangan = record.get('keterangan', '') or ''
-        if 'tambahan' in keterangan.lower():
-            is_ndp = False
-        else:
-            is_ndp = first_date == date
-        
-        if date not in daily_summary:
-            daily_summary[date] = {
-                'date': date,
-                'total_depo': 0,
-                'ndp_tuples': set(),
-                'rdp_tuples': set(),
-                'total_form': 0
-            }
-        
-        daily_summary[date]['total_depo'] += record.get('depo_total', 0)
-        daily_summary[date]['total_form'] += record.get('depo_kelipatan', 1)
-        
-        ndp_tuple = (staff_id_rec, cid_normalized, product_id_rec)
-        if is_ndp:
-            daily_summary[date]['ndp_tuples'].add(ndp_tuple)
-        else:
-            daily_summary[date]['rdp_tuples'].add(ndp_tuple)
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(['Date', 'Total Form', 'NDP', 'RDP', 'Total OMSET'])
-    
-    for date in sorted(daily_summary.keys(), reverse=True):
-        data = daily_summary[date]
-        writer.writerow([
-            date,
-            data['total_form'],
-            len(data['ndp_tuples']),
-            len(data['rdp_tuples']),
-            data['total_depo']
-        ])
+    # Aggregate per day server-side: each (staff, customer, product) tuple counts once per
+    # day as NDP and/or RDP, classified against the STAFF-SPECIFIC first-deposit index
+    from utils.first_deposit_index import ndp_classification_stages
+    from utils.streaming_export import EXPORT_BATCH_SIZE, streaming_export_response
+    cursor = db.omset_records.aggregate([
+        {'$match': query},
+        *ndp_classification_stages(),
+        {'$group': {
+            '_id': {'d': '$record_date', 's': '$staff_id', 'c': '$_cid', 'p': '$product_id'},
+            'total_depo': {'$sum': '$_depo'},
+            'total_form': {'$sum': {'$ifNull': ['$depo_kelipatan', 1]}},
+            'has_ndp': {'$max': '$_is_ndp'},
+            'has_rdp': {'$max': {'$not': ['$_is_ndp']}}
+        }},
+        {'$group': {
+            '_id': '$_id.d',
+            'total_depo': {'$sum': '$total_depo'},
+            'total_form': {'$sum': '$total_form'},
+            'ndp': {'$sum': {'$cond': ['$has_ndp', 1, 0]}},
+            'rdp': {'$sum': {'$cond': ['$has_rdp', 1, 0]}}
+        }},
+        {'$sort': {'_id': -1}}
+    ], allowDiskUse=True, batchSize=EXPORT_BATCH_SIZE)
     
-    output.seek(0)
+    async def summary_rows():
+        async for day in cursor:
+            yield [day['_id'], day['total_form'], day['ndp'], day['rdp'], day['total_depo']]
     
     date_part = f"{start_date or 'all'}_to_{end_date or 'now'}"
-    filename = f"omset_summary_{date_part}.csv"
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="application/octet-stream",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}",
-            "Content-Type": "application/octet-stream",
-            "Cache-Control": "no-cache"
-        }
+    
+    return streaming_export_response(
+        ['Date', 'Total Form', 'NDP', 'RDP', 'Total OMSET'],
+        summary_rows(),
+        filename=f"omset_summary_{date_part}",
+        media_type="application/octet-stream"
     )
 
 @router.get("/omset/ndp-rdp")
@@ -1374,16 +1206,16 @@ async def get_omset_record_types(
 ):
     """Get all records with NDP/RDP classification for a specific date"""
     db = get_db()
-    query = {'product_id': product_id}
+    query = {'product_id': product_id, 'record_date': record_date}
     
     if user.role == 'staff':
         query['staff_id'] = user.id
     
-    # Build STAFF-SPECIFIC first deposit map using MongoDB aggregation
-    from utils.db_operations import build_staff_first_date_map
-    full_map = await build_staff_first_date_map(db, product_id=product_id)
+    date_records = await db.omset_records.find(query, {'_id': 0}).to_list(100000)
     
-    all_records = await db.omset_records.find(query, {'_id': 0}).to_list(100000)
+    # Build STAFF-SPECIFIC first deposit map for the keys present on this date
+    from utils.db_operations import build_staff_first_date_map
+    full_map = await build_staff_first_date_map(db, product_id=product_id, records=date_records)
     
     # Re-key to (staff_id, customer_id) since product is fixed
     staff_customer_first_date = {}
@@ -1392,8 +1224,6 @@ async def get_omset_record_types(
         if key not in staff_customer_first_date or first_date < staff_customer_first_date[key]:
             staff_customer_first_date[key] = first_date
     
-    date_records = [r for r in all_records if r['record_date'] == record_date]
-    
     for record in date_records:
         cid = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
         key = (record['staff_id'], cid)
@@ -1410,53 +1240,148 @@ async def get_omset_record_types(
     
     return date_records
 
-@router.post("/omset/migrate-normalize")
-async def migrate_normalize_customer_ids(user: User = Depends(get_admin_user)):
+MIGRATE_NORMALIZE_CHUNK = 2000
+
+@register_job('omset_migrate_normalize', concurrency=1, lease_seconds=300)
+async def run_migrate_normalize(ctx: JobContext):
     """
-    Admin-only endpoint to migrate existing records:
+    Job: migrate existing records:
     1. Add customer_id_normalized field to all records
     2. Recalculate and update customer_type (NDP/RDP) based on normalized customer_id
     Note: Records with "tambahan" in keterangan are always marked as RDP
+    
+    Records are processed in _id order in chunks; the last _id of every chunk is
+    checkpointed, so a resumed job continues after it.
     """
-    db = get_db()
+    from bson import ObjectId
+    from pymongo import UpdateOne
+    from utils.db_operations import build_staff_first_date_map, bulk_write_chunked
+    from utils.first_deposit_index import rebuild_first_deposit_index
     
-    # Get all omset records (only fields needed for type recalculation)
-    all_records = await db.omset_records.find(
-        {},
-        {'id': 1, 'staff_id': 1, 'customer_id': 1, 'customer_id_normalized': 1,
-         'product_id': 1, 'record_date': 1, 'keterangan': 1, 'customer_type': 1}
-    ).to_list(50000)
+    db = get_db()
+    checkpoint = dict(ctx.checkpoint)
     
-    # Build STAFF-SPECIFIC customer first deposit map using MongoDB aggregation
-    from utils.db_operations import build_staff_first_date_map
+    # Rebuild the first-deposit index from scratch, then read the full map from it
+    if not checkpoint.get('index_rebuilt'):
+        await rebuild_first_deposit_index(db)
+        checkpoint['index_rebuilt'] = True
+        await ctx.progress(5, 'First-deposit index rebuilt', checkpoint=checkpoint)
     staff_customer_first_date = await build_staff_first_date_map(db)
     
-    # Update all records
-    updated_count = 0
-    for record in all_records:
-        cid_normalized = normalize_customer_id(record['customer_id'])
-        key = (record['staff_id'], cid_normalized, record['product_id'])
-        first_date = staff_customer_first_date.get(key)
+    total_records = await db.omset_records.count_documents({})
+    updated_count = checkpoint.get('updated_count', 0)
+    
+    while True:
+        query = {'_id': {'$gt': ObjectId(checkpoint['last_id'])}} if checkpoint.get('last_id') else {}
+        # Only the fields needed for type recalculation
+        records = await db.omset_records.find(
+            query,
+            {'_id': 1, 'staff_id': 1, 'customer_id': 1, 'product_id': 1, 'record_date': 1, 'keterangan': 1}
+        ).sort('_id', 1).limit(MIGRATE_NORMALIZE_CHUNK).to_list(MIGRATE_NORMALIZE_CHUNK)
+        if not records:
+            break
         
-        # Check if "tambahan" in notes - if so, always RDP
-        keterangan = record.get('keterangan', '') or ''
-        if 'tambahan' in keterangan.lower():
-            customer_type = 'RDP'
-        else:
-            customer_type = 'NDP' if first_date == record['record_date'] else 'RDP'
+        operations = []
+        for record in records:
+            cid_normalized = normalize_customer_id(record['customer_id'])
+            key = (record['staff_id'], cid_normalized, record['product_id'])
+            first_date = staff_customer_first_date.get(key)
+            
+            # Check if "tambahan" in notes - if so, always RDP
+            keterangan = record.get('keterangan', '') or ''
+            if 'tambahan' in keterangan.lower():
+                customer_type = 'RDP'
+            else:
+                customer_type = 'NDP' if first_date == record['record_date'] else 'RDP'
+            
+            operations.append(UpdateOne(
+                {'_id': record['_id']},
+                {'$set': {
+                    'customer_id_normalized': cid_normalized,
+                    'customer_type': customer_type
+                }}
+            ))
         
-        # Update the record
-        await db.omset_records.update_one(
-            {'_id': record['_id']},
-            {'$set': {
-                'customer_id_normalized': cid_normalized,
-                'customer_type': customer_type
-            }}
+        await bulk_write_chunked(db.omset_records, operations)
+        updated_count += len(records)
+        checkpoint.update(last_id=str(records[-1]['_id']), updated_count=updated_count)
+        await ctx.progress(
+            5 + updated_count * 85 / max(total_records, 1),
+            f'Migrated {updated_count} of {total_records} records',
+            checkpoint=checkpoint
         )
-        updated_count += 1
+    
+    # Normalized IDs changed, so re-derive the daily rollups and deposit profiles from the migrated records
+    from utils.omset_rollup import rebuild_daily_rollups
+    from utils.deposit_profile import rebuild_deposit_profiles
+    await ctx.progress(90, 'Rebuilding daily rollups and deposit profiles')
+    await rebuild_daily_rollups(db)
+    await rebuild_deposit_profiles(db)
     
     return {
         'message': f'Successfully migrated {updated_count} records',
-        'total_records': len(all_records),
+        'total_records': updated_count,
         'updated_count': updated_count
     }
+
+@router.post("/omset/migrate-normalize")
+async def migrate_normalize_customer_ids(wait: bool = True, user: User = Depends(get_admin_user)):
+    """
+    Admin-only endpoint to re-normalize customer IDs and recalculate NDP/RDP on all records.
+    Runs as a background job (see GET /jobs/{job_id}).
+    """
+    return await submit_job('omset_migrate_normalize', {}, user, wait)
+
+
+@router.post("/omset/first-deposit-index/rebuild")
+async def rebuild_omset_first_deposit_index(user: User = Depends(get_admin_user)):
+    """Admin-only: rebuild the customer_first_deposit (NDP/RDP) index from omset_records."""
+    db = get_db()
+    from utils.first_deposit_index import rebuild_first_deposit_index
+    from utils.omset_rollup import rebuild_daily_rollups
+    from utils.rebuild_guard import RebuildInProgressError
+    try:
+        result = await rebuild_first_deposit_index(db)
+        # Rollup NDP/RDP counts are classified against the index, so refresh them too
+        rollup = await rebuild_daily_rollups(db)
+    except RebuildInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        'message': f"First-deposit index rebuilt with {result['entries']} entries",
+        **result,
+        'rollup_rows': rollup['rows']
+    }
+
+
+@router.get("/omset/first-deposit-index/verify")
+async def verify_omset_first_deposit_index(user: User = Depends(get_admin_user)):
+    """
+    Admin-only: compare the customer_first_deposit index with a fresh scan of omset_records.
+    Read-only; repair drift with POST /omset/first-deposit-index/rebuild.
+    """
+    db = get_db()
+    from utils.first_deposit_index import verify_first_deposit_index
+    return await verify_first_deposit_index(db)
+
+
+@router.post("/omset/daily-rollup/rebuild")
+async def rebuild_omset_daily_rollup(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user: User = Depends(get_admin_user)
+):
+    """
+    Admin-only: rebuild the omset_daily_rollup rows (dashboard/summary/leaderboard/Report CRM
+    totals) from omset_records. Without dates the whole history is rebuilt.
+    """
+    db = get_db()
+    from utils.omset_rollup import rebuild_daily_rollups
+    from utils.rebuild_guard import RebuildInProgressError
+    try:
+        result = await rebuild_daily_rollups(db, start_date, end_date)
+    except RebuildInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        'message': f"Daily OMSET rollup rebuilt with {result['rows']} rows",
+        **result
+    }
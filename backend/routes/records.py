@@ -1,17 +1,27 @@
 # Core Database and Records Management Routes
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File, Form
 from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional, List
 from datetime import datetime, timedelta
 from pathlib import Path
 import uuid
 import os
-import random
-import pandas as pd
 
-from .deps import get_db, get_current_user, get_admin_user, get_jakarta_now, User, JAKARTA_TZ
+from .deps import (
+    get_db, get_current_user, get_admin_user, get_jakarta_now, User, JAKARTA_TZ,
+    PageParams, get_page_params, read_page
+)
 from .notifications import create_notification
-from utils.reserved_check import sync_reserved_status_on_add, sync_reserved_status_on_remove
+from utils.reserved_check import sync_reserved_status_on_add, sync_reserved_status_on_remove, extract_username, build_row_identifiers, count_excluded_available
+from utils.db_operations import update_many_by_ids
+from utils.deposit_lookup import find_deposits
+from utils.reserved_lookup import ACTIVE_STATUSES, delete_reservations, find_reservation, with_reservation_keys
+from utils.reserved_snapshot import bump_reserved_version, get_reserved_snapshot
+from utils.pagination import apply_page_headers, required_fields
+from utils.ingestion import (
+    NULLABLE_TEXT, ChunkReader, IngestionJob, UploadParseError, spool_upload, import_upload, run_in_background,
+    get_ingestion_job
+)
 
 router = APIRouter(tags=["Records Management"])
 
@@ -77,6 +87,7 @@ async def invalidate_customer_records_for_other_staff(
             {'_id': 0, 'id': 1, 'row_data': 1, 'assigned_to': 1, 'assigned_to_name': 1, 'database_name': 1, 'product_id': 1}
         ).to_list(100000)
         
+        conflict_ids = []
         for record in assigned_records:
             row_data = record.get('row_data', {})
             
@@ -96,17 +107,7 @@ async def invalidate_customer_records_for_other_staff(
                 
                 # Mark as invalid - keep status as 'assigned' but set is_reservation_conflict
                 # This preserves the assignment for counting purposes while flagging the conflict
-                await collection.update_one(
-                    {'id': record['id']},
-                    {'$set': {
-                        'is_reservation_conflict': True,
-                        'invalid_reason': f'Customer reserved by {reserved_by_staff_name}',
-                        'invalidated_at': now.isoformat(),
-                        'invalidated_by': 'system',
-                        'reserved_by_staff_id': reserved_by_staff_id,
-                        'reserved_by_staff_name': reserved_by_staff_name
-                    }}
-                )
+                conflict_ids.append(record['id'])
                 invalidated_count += 1
                 
                 # Send notification to the affected staff (only once per staff)
@@ -125,6 +126,15 @@ async def invalidate_customer_records_for_other_staff(
                         }
                     )
                     notified_staff.add(other_staff_id)
+        
+        await update_many_by_ids(collection, conflict_ids, {'$set': {
+            'is_reservation_conflict': True,
+            'invalid_reason': f'Customer reserved by {reserved_by_staff_name}',
+            'invalidated_at': now.isoformat(),
+            'invalidated_by': 'system',
+            'reserved_by_staff_id': reserved_by_staff_id,
+            'reserved_by_staff_name': reserved_by_staff_name
+        }})
     
     return invalidated_count, notified_staff
 
@@ -170,6 +180,7 @@ async def restore_invalidated_records_for_reservation(
             {'_id': 0, 'id': 1, 'row_data': 1, 'assigned_to': 1}
         ).to_list(100000)
         
+        restore_ids = []
         for record in conflicted_records:
             row_data = record.get('row_data', {})
             matches = False
@@ -179,24 +190,80 @@ async def restore_invalidated_records_for_reservation(
                     break
             
             if matches:
-                await collection.update_one(
-                    {'id': record['id']},
-                    {
-                        '$set': {
-                            'is_reservation_conflict': False,
-                            'restored_at': now.isoformat(),
-                            'restored_reason': 'reservation_removed'
-                        },
-                        '$unset': {
-                            'invalid_reason': '',
-                            'invalidated_at': '',
-                            'invalidated_by': '',
-                            'reserved_by_staff_id': '',
-                            'reserved_by_staff_name': ''
-                        }
-                    }
-                )
-                restored_count += 1
+                restore_ids.append(record['id'])
+        
+        restored_count += await update_many_by_ids(collection, restore_ids, {
+            '$set': {
+                'is_reservation_conflict': False,
+                'restored_at': now.isoformat(),
+                'restored_reason': 'reservation_removed'
+            },
+            '$unset': {
+                'invalid_reason': '',
+                'invalidated_at': '',
+                'invalidated_by': '',
+                'reserved_by_staff_id': '',
+                'reserved_by_staff_name': ''
+            }
+        })
+    
+    return restored_count
+
+
+async def restore_invalidated_records_for_reservations(db, reservations: list):
+    """
+    Batched restore_invalidated_records_for_reservation() for many removed reservations:
+    one query per collection for the conflicted records of all their staff, matched in memory.
+    
+    Args:
+        reservations: (customer_id, reserved_by_staff_id, product_id) of every removed reservation
+    
+    Returns: count of restored records
+    """
+    # staff_id -> product_id (None = any product) -> normalized customer ids
+    wanted = {}
+    for customer_id, staff_id, product_id in reservations:
+        customer_id_normalized = str(customer_id).strip().upper() if customer_id else ''
+        if customer_id_normalized:
+            wanted.setdefault(staff_id, {}).setdefault(product_id or None, set()).add(customer_id_normalized)
+    if not wanted:
+        return 0
+    
+    restored_count = 0
+    now = get_jakarta_now()
+    
+    for collection_name in ['customer_records', 'bonanza_records', 'memberwd_records']:
+        collection = db[collection_name]
+        conflicted_records = await collection.find(
+            {'is_reservation_conflict': True, 'reserved_by_staff_id': {'$in': list(wanted)}},
+            {'_id': 0, 'id': 1, 'row_data': 1, 'reserved_by_staff_id': 1, 'product_id': 1}
+        ).to_list(None)
+        
+        restore_ids = []
+        for record in conflicted_records:
+            by_product = wanted.get(record.get('reserved_by_staff_id'), {})
+            customers = by_product.get(None, set()) | by_product.get(record.get('product_id'), set())
+            if not customers:
+                continue
+            for value in (record.get('row_data') or {}).values():
+                if value and str(value).strip().upper() in customers:
+                    restore_ids.append(record['id'])
+                    break
+        
+        restored_count += await update_many_by_ids(collection, restore_ids, {
+            '$set': {
+                'is_reservation_conflict': False,
+                'restored_at': now.isoformat(),
+                'restored_reason': 'reservation_removed'
+            },
+            '$unset': {
+                'invalid_reason': '',
+                'invalidated_at': '',
+                'invalidated_by': '',
+                'reserved_by_staff_id': '',
+                'reserved_by_staff_name': ''
+            }
+        })
     
     return restored_count
 
@@ -220,6 +287,7 @@ class Database(BaseModel):
     preview_data: Optional[dict] = None
     total_records: int = 0
     auto_approve: Optional[bool] = None
+    ingest_job_id: Optional[str] = None
 
 class CustomerRecord(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -322,34 +390,6 @@ class BatchPinUpdate(BaseModel):
 
 # ==================== HELPER FUNCTIONS ====================
 
-def parse_file_to_records(file_path: str, file_type: str) -> tuple:
-    try:
-        if file_type == 'csv':
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
-        
-        records = []
-        for idx, row in df.iterrows():
-            row_dict = {}
-            for col in df.columns:
-                val = row[col]
-                if pd.isna(val):
-                    row_dict[str(col)] = None
-                else:
-                    row_dict[str(col)] = str(val)
-            records.append(row_dict)
-        
-        preview = {
-            'columns': df.columns.tolist(),
-            'rows': df.head(5).values.tolist(),
-            'total_rows': len(df)
-        }
-        
-        return records, preview
-    except Exception as e:
-        return [], {'error': str(e)}
-
 # ==================== DATABASE ENDPOINTS ====================
 
 @router.post("/databases", response_model=Database)
@@ -357,8 +397,13 @@ async def upload_database(
     file: UploadFile = File(...),
     description: Optional[str] = Form(None),
     product_id: str = Form(...),
+    background: bool = Form(False),
     user: User = Depends(get_admin_user)
 ):
+    """
+    Upload a Normal DB file. The file is spooled to disk and imported in chunks;
+    with background=true the import continues after the response (poll /upload-jobs/{ingest_job_id}).
+    """
     db = get_db()
     
     if not file.filename.endswith(('.csv', '.xlsx')):
@@ -375,16 +420,22 @@ async def upload_database(
     file_id = str(uuid.uuid4())
     file_path = UPLOAD_DIR / f"{file_id}_{file.filename}"
     
-    content = await file.read()
-    with open(file_path, 'wb') as f:
-        f.write(content)
+    file_size = await spool_upload(file, file_path)
     
-    records_data, preview_data = parse_file_to_records(str(file_path), file_type)
+    reader = ChunkReader(str(file_path), file_type, NULLABLE_TEXT)
+    try:
+        first_chunk = await reader.next_chunk()
+        preview_data = {'columns': reader.columns, 'rows': reader.preview_rows, 'total_rows': reader.rows_read}
+    except Exception as e:
+        first_chunk = None
+        preview_data = {'error': str(e)}
+    
+    job = await IngestionJob.create(db, 'database', file.filename, user)
     
     database = Database(
         filename=file.filename,
         file_type=file_type,
-        file_size=len(content),
+        file_size=file_size,
         description=description,
         product_id=product_id,
         product_name=product['name'],
@@ -392,33 +443,75 @@ async def upload_database(
         uploaded_by_name=user.name,
         file_path=str(file_path),
         preview_data=preview_data,
-        total_records=len(records_data)
+        total_records=reader.rows_read,
+        ingest_job_id=job.id
     )
     
     doc = database.model_dump()
     doc['uploaded_at'] = doc['uploaded_at'].isoformat()
     
     await db.databases.insert_one(doc)
+    await job.update(database_id=database.id)
+    
+    def build_docs(rows: List[dict], first_row_number: int) -> List[dict]:
+        customer_records = []
+        for idx, row_data in enumerate(rows, start=first_row_number):
+            record = CustomerRecord(
+                database_id=database.id,
+                database_name=database.filename,
+                product_id=product_id,
+                product_name=product['name'],
+                row_number=idx,
+                row_data=row_data
+            )
+            rec_doc = record.model_dump()
+            rec_doc['created_at'] = rec_doc['created_at'].isoformat()
+            # Persisted for the indexed reserved-username exclusion of download requests
+            rec_doc['username_normalized'] = extract_username(row_data)
+            # Persisted for the indexed reserved-excluded counts of /databases/with-stats
+            rec_doc['row_identifiers'] = build_row_identifiers(row_data)
+            customer_records.append(rec_doc)
+        return customer_records
+    
+    async def finalize(total_records: int) -> dict:
+        update = {'total_records': total_records}
+        if 'error' not in preview_data:
+            update['preview_data.total_rows'] = total_records
+        await db.databases.update_one({'id': database.id}, {'$set': update})
+        return {'database_id': database.id, 'total_records': total_records}
+    
+    async def run_import():
+        try:
+            return await import_upload(
+                job, reader, first_chunk, db.customer_records, build_docs, finalize, db.databases, database.id
+            )
+        except Exception:
+            # The database was discarded, so its stored file is not needed either
+            file_path.unlink(missing_ok=True)
+            raise
     
-    customer_records = []
-    for idx, row_data in enumerate(records_data, start=1):
-        record = CustomerRecord(
-            database_id=database.id,
-            database_name=database.filename,
-            product_id=product_id,
-            product_name=product['name'],
-            row_number=idx,
-            row_data=row_data
-        )
-        rec_doc = record.model_dump()
-        rec_doc['created_at'] = rec_doc['created_at'].isoformat()
-        customer_records.append(rec_doc)
-    
-    if customer_records:
-        await db.customer_records.insert_many(customer_records)
+    if background:
+        run_in_background(run_import())
+        return database
     
+    try:
+        result = await run_import()
+    except UploadParseError as e:
+        raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
+    database.total_records = result['total_records']
+    if 'error' not in preview_data:
+        database.preview_data['total_rows'] = result['total_records']
     return database
 
+@router.get("/upload-jobs/{job_id}")
+async def get_upload_job(job_id: str, user: User = Depends(get_admin_user)):
+    """Progress of a chunked database upload (Normal DB, DB Bonanza or Member WD)"""
+    db = get_db()
+    job = await get_ingestion_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
 @router.get("/databases/with-stats")
 async def get_databases_with_stats(search: Optional[str] = None, product_id: Optional[str] = None, user: User = Depends(get_current_user)):
     """Get all databases with real-time record status counts including excluded (reserved) records"""
@@ -456,23 +549,9 @@ async def get_databases_with_stats(search: Optional[str] = None, product_id: Opt
             counts_lookup[db_id] = {'available': 0, 'requested': 0, 'assigned': 0}
         counts_lookup[db_id][status] = item['count']
     
-    # Get all approved reserved members to calculate excluded counts
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'},
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'product_id': 1}
-    ).to_list(100000)
-    
-    # Build set of reserved customer identifiers per product for fast lookup
-    reserved_by_product = {}
-    for rm in reserved_members:
-        prod_id = rm.get('product_id', '')
-        if prod_id not in reserved_by_product:
-            reserved_by_product[prod_id] = set()
-        # Add both customer_id and customer_name (normalized to uppercase)
-        if rm.get('customer_id'):
-            reserved_by_product[prod_id].add(rm['customer_id'].strip().upper())
-        if rm.get('customer_name'):
-            reserved_by_product[prod_id].add(rm['customer_name'].strip().upper())
+    # Available records matching approved reservations, counted for all databases in one aggregation
+    reserved_by_product = (await get_reserved_snapshot(db)).reserved_by_product
+    excluded_lookup = await count_excluded_available(db, databases, reserved_by_product)
     
     result = []
     for db_item in databases:
@@ -486,28 +565,8 @@ async def get_databases_with_stats(search: Optional[str] = None, product_id: Opt
         assigned_count = counts.get('assigned', 0)
         total_count = available_count + requested_count + assigned_count
         
-        # Calculate excluded count (available records that match reserved members)
-        excluded_count = 0
-        product_id_for_db = db_item.get('product_id', '')
-        
-        if product_id_for_db and product_id_for_db in reserved_by_product and available_count > 0:
-            # Get available records for this database to check against reserved members
-            available_records = await db.customer_records.find(
-                {'database_id': db_item['id'], 'status': 'available'},
-                {'_id': 0, 'row_data': 1}
-            ).to_list(100000)
-            
-            reserved_set = reserved_by_product[product_id_for_db]
-            for record in available_records:
-                row_data = record.get('row_data', {})
-                is_reserved = record.get('is_reserved_member', False)
-                if not is_reserved:
-                    for key, value in row_data.items():
-                        if value and str(value).strip().upper() in reserved_set:
-                            is_reserved = True
-                            break
-                if is_reserved:
-                    excluded_count += 1
+        # Excluded count (available records that match reserved members)
+        excluded_count = excluded_lookup.get(db_item['id'], 0)
         
         # Adjust available count to show truly available (not excluded)
         truly_available = available_count - excluded_count
@@ -581,9 +640,16 @@ async def delete_database(database_id: str, user: User = Depends(get_admin_user)
     return {'message': 'Database deleted successfully'}
 
 @router.get("/databases/{database_id}/records", response_model=List[CustomerRecord])
-async def get_database_records(database_id: str, status: Optional[str] = None, user: User = Depends(get_current_user)):
+async def get_database_records(
+    database_id: str,
+    response: Response,
+    status: Optional[str] = None,
+    page: PageParams = Depends(get_page_params),
+    user: User = Depends(get_current_user)
+):
+    """Records of a database in row order, keyset-paginated (next page cursor in X-Next-Cursor)"""
     db = get_db()
-    database = await db.databases.find_one({'id': database_id})
+    database = await db.databases.find_one({'id': database_id}, {'_id': 0, 'id': 1})
     if not database:
         raise HTTPException(status_code=404, detail="Database not found")
     
@@ -591,7 +657,12 @@ async def get_database_records(database_id: str, status: Optional[str] = None, u
     if status:
         query['status'] = status
     
-    records = await db.customer_records.find(query, {'_id': 0}).sort('row_number', 1).to_list(10000)
+    result = await read_page(
+        db.customer_records, query, [('row_number', 1), ('id', 1)], page,
+        default_limit=10000, required_fields=required_fields(CustomerRecord)
+    )
+    apply_page_headers(response, result)
+    records = result.items
     
     for record in records:
         if isinstance(record.get('created_at'), str):
@@ -620,75 +691,29 @@ async def create_download_request(request_data: DownloadRequestCreate, user: Use
     # Get all ACTIVE reserved member IDs for this product (case-insensitive)
     # Only check 'approved' status - deleted reserved members should be available again
     # Note: 'pending' can also be excluded as those are awaiting approval
-    product_id = database.get('product_id')
-    reserved_members = await db.reserved_members.find(
-        {'product_id': product_id, 'status': {'$in': ['pending', 'approved']}},
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1}
-    ).to_list(10000)
-    
-    # Create a set of reserved IDs (normalized to uppercase for case-insensitive comparison)
-    # Support both customer_id and customer_name (old field) for backwards compatibility
-    reserved_ids = set()
-    for member in reserved_members:
-        cid = member.get('customer_id') or member.get('customer_name') or ''
-        if cid:
-            reserved_ids.add(str(cid).strip().upper())
-    
-    # Get all available records from the database
-    all_available_records = await db.customer_records.find(
-        {'database_id': request_data.database_id, 'status': 'available'},
-        {'_id': 0}
-    ).to_list(100000)
-    
-    if len(all_available_records) == 0:
+    from utils.reserved_check import get_download_reserved_ids
+    reserved_ids = await get_download_reserved_ids(db, database.get('product_id'))
+    
+    # Reserved usernames are excluded with an indexed predicate on the persisted
+    # username_normalized (first username column of row_data, uppercased)
+    # IMPORTANT: 'name' field is NOT checked - it's the customer's actual name, not username
+    # Username = Customer ID = customer_id in Reserved Member
+    from utils.reserved_check import build_unreserved_username_filter
+    from utils.record_assignment import count_assignable, claim_random_records, release_records
+    available_query = {'database_id': request_data.database_id, 'status': 'available'}
+    eligible_query = build_unreserved_username_filter(reserved_ids)
+    counts = await count_assignable(db.customer_records, available_query, eligible_query)
+    
+    if counts['available'] == 0:
         raise HTTPException(status_code=400, detail="No available records in this database")
     
-    # Filter out records that have usernames matching Reserved Members' customer_id
-    valid_records = []
-    skipped_records = []
-    
-    for record in all_available_records:
-        row_data = record.get('row_data', {})
-        username = None
-        
-        # Check for username field using standardized keys
-        # IMPORTANT: 'name' field is NOT checked - it's the customer's actual name, not username
-        # Username = Customer ID = customer_id in Reserved Member
-        username_keys_lower = ['username', 'user_name', 'user', 'id', 'userid', 'user_id', 'customer_id', 'member', 'account']
-        for key in row_data:
-            if key.lower() in username_keys_lower:
-                username = row_data[key]
-                break
-        
-        # Normalize username for comparison against reserved customer_id
-        if username:
-            normalized_username = str(username).strip().upper()
-            
-            if normalized_username in reserved_ids:
-                # This record's username matches a reserved customer_id, skip it
-                skipped_records.append({
-                    'record_id': record['id'],
-                    'username': username,
-                    'reason': 'Reserved by another staff'
-                })
-                continue
-        
-        valid_records.append(record)
-    
     # Check if we have enough valid records
-    if len(valid_records) < request_data.record_count:
-        available_count = len(valid_records)
-        reserved_count = len(skipped_records)
+    if counts['eligible'] < request_data.record_count:
         raise HTTPException(
             status_code=400, 
-            detail=f"Only {available_count} non-reserved records available ({reserved_count} records skipped due to Reserved Member duplicates). You requested {request_data.record_count}."
+            detail=f"Only {counts['eligible']} non-reserved records available ({counts['reserved']} records skipped due to Reserved Member duplicates). You requested {request_data.record_count}."
         )
     
-    # Randomize and select the requested number of records
-    random.shuffle(valid_records)
-    selected_records = valid_records[:request_data.record_count]
-    record_ids = [record['id'] for record in selected_records]
-    
     # Check if auto-approve is enabled
     # 1. Global toggle must be ON as the master switch
     # 2. Then check per-database setting (True=auto, False=manual)
@@ -707,9 +732,43 @@ async def create_download_request(request_data: DownloadRequestCreate, user: Use
         should_auto_approve = False
     else:
         # Global ON + per-database is Auto (True) or not set (None = follows global = auto)
-        should_auto_approve = max_records is None or len(record_ids) <= max_records
+        should_auto_approve = max_records is None or request_data.record_count <= max_records
+    
+    # Randomly draw and atomically claim the requested number of records server-side.
+    # Concurrent requests can never receive the same record.
+    request_id = str(uuid.uuid4())
+    if should_auto_approve:
+        # Auto-approve: Set records to assigned directly
+        claim_update = {'$set': {
+            'status': 'assigned',
+            'request_id': request_id,
+            'assigned_to': user.id,
+            'assigned_to_name': user.name,
+            'assigned_at': get_jakarta_now().isoformat()
+        }}
+    else:
+        # Manual approval required: Set records to requested
+        claim_update = {'$set': {
+            'status': 'requested',
+            'request_id': request_id
+        }}
+    
+    record_ids = await claim_random_records(
+        db.customer_records, {**available_query, **eligible_query}, request_data.record_count, claim_update
+    )
+    
+    if len(record_ids) < request_data.record_count:
+        # Other requests took the remaining records in the meantime - give ours back
+        await release_records(db.customer_records, record_ids, {
+            '$set': {'status': 'available', 'request_id': None, 'assigned_to': None, 'assigned_to_name': None, 'assigned_at': None}
+        })
+        raise HTTPException(
+            status_code=409,
+            detail=f"Only {len(record_ids)} non-reserved records could be claimed. You requested {request_data.record_count}. Please try again."
+        )
     
     request = DownloadRequest(
+        id=request_id,
         database_id=request_data.database_id,
         database_name=database['filename'],
         product_id=database.get('product_id'),
@@ -724,7 +783,7 @@ async def create_download_request(request_data: DownloadRequestCreate, user: Use
     doc = request.model_dump()
     doc['requested_at'] = doc['requested_at'].isoformat()
     # Store info about skipped records for transparency
-    doc['skipped_reserved_count'] = len(skipped_records)
+    doc['skipped_reserved_count'] = counts['reserved']
     
     if should_auto_approve:
         # Add approval info for auto-approved requests
@@ -736,19 +795,6 @@ async def create_download_request(request_data: DownloadRequestCreate, user: Use
     await db.download_requests.insert_one(doc)
     
     if should_auto_approve:
-        # Auto-approve: Set records to assigned directly
-        for record_id in record_ids:
-            await db.customer_records.update_one(
-                {'id': record_id},
-                {'$set': {
-                    'status': 'assigned',
-                    'request_id': request.id,
-                    'assigned_to': user.id,
-                    'assigned_to_name': user.name,
-                    'assigned_at': get_jakarta_now().isoformat()
-                }}
-            )
-        
         # Notify staff that their request was auto-approved
         await create_notification(
             user_id=user.id,
@@ -758,16 +804,6 @@ async def create_download_request(request_data: DownloadRequestCreate, user: Use
             data={'request_id': request.id, 'record_count': len(record_ids), 'database_name': database['filename']}
         )
     else:
-        # Manual approval required: Set records to requested
-        for record_id in record_ids:
-            await db.customer_records.update_one(
-                {'id': record_id},
-                {'$set': {
-                    'status': 'requested',
-                    'request_id': request.id
-                }}
-            )
-        
         # Notify all admins about the new request
         admins = await db.users.find({'role': {'$in': ['admin', 'master_admin']}}, {'_id': 0, 'id': 1}).to_list(100)
         for admin in admins:
@@ -783,13 +819,16 @@ async def create_download_request(request_data: DownloadRequestCreate, user: Use
 
 @router.get("/download-requests", response_model=List[DownloadRequest])
 async def get_download_requests(
+    response: Response,
     staff_id: Optional[str] = None,
     product_id: Optional[str] = None,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     status: Optional[str] = None,
+    page: PageParams = Depends(get_page_params),
     user: User = Depends(get_current_user)
 ):
+    """Download requests, newest first, keyset-paginated (next page cursor in X-Next-Cursor)"""
     db = get_db()
     query = {}
     
@@ -820,7 +859,12 @@ async def get_download_requests(
         # Add one day to include the end date fully
         query['requested_at']['$lte'] = date_to + 'T23:59:59'
     
-    requests = await db.download_requests.find(query, {'_id': 0}).sort('requested_at', -1).to_list(1000)
+    result = await read_page(
+        db.download_requests, query, [('requested_at', -1), ('id', -1)], page,
+        default_limit=1000, required_fields=required_fields(DownloadRequest)
+    )
+    apply_page_headers(response, result)
+    requests = result.items
     
     for req in requests:
         if isinstance(req['requested_at'], str):
@@ -957,17 +1001,13 @@ async def approve_request(request_id: str, user: User = Depends(get_admin_user))
         }}
     )
     
-    for record_id in request['record_ids']:
-        await db.customer_records.update_one(
-            {'id': record_id},
-            {'$set': {
-                'status': 'assigned',
-                'assigned_to': request['requested_by'],
-                'assigned_to_name': request['requested_by_name'],
-                'assigned_at': get_jakarta_now().isoformat(),
-                'request_id': request_id
-            }}
-        )
+    await update_many_by_ids(db.customer_records, request['record_ids'], {'$set': {
+        'status': 'assigned',
+        'assigned_to': request['requested_by'],
+        'assigned_to_name': request['requested_by_name'],
+        'assigned_at': get_jakarta_now().isoformat(),
+        'request_id': request_id
+    }})
     
     await create_notification(
         user_id=request['requested_by'],
@@ -999,11 +1039,7 @@ async def reject_request(request_id: str, user: User = Depends(get_admin_user)):
         }}
     )
     
-    for record_id in request['record_ids']:
-        await db.customer_records.update_one(
-            {'id': record_id},
-            {'$set': {'status': 'available'}}
-        )
+    await update_many_by_ids(db.customer_records, request['record_ids'], {'$set': {'status': 'available'}})
     
     await create_notification(
         user_id=request['requested_by'],
@@ -1017,6 +1053,16 @@ async def reject_request(request_id: str, user: User = Depends(get_admin_user)):
 
 # ==================== MY RECORDS ENDPOINTS ====================
 
+# $group accumulators counting a batch's records by WhatsApp / respond status
+BATCH_STATUS_COUNTERS = {
+    'count': {'$sum': 1},
+    'ada_count': {'$sum': {'$cond': [{'$eq': ['$whatsapp_status', 'ada']}, 1, 0]}},
+    'ceklis1_count': {'$sum': {'$cond': [{'$eq': ['$whatsapp_status', 'ceklis1']}, 1, 0]}},
+    'tidak_count': {'$sum': {'$cond': [{'$eq': ['$whatsapp_status', 'tidak']}, 1, 0]}},
+    'respond_ya_count': {'$sum': {'$cond': [{'$eq': ['$respond_status', 'ya']}, 1, 0]}},
+    'respond_tidak_count': {'$sum': {'$cond': [{'$eq': ['$respond_status', 'tidak']}, 1, 0]}},
+}
+
 @router.get("/my-request-batches")
 async def get_my_request_batches(user: User = Depends(get_current_user)):
     """Get all approved request batches for the current staff member"""
@@ -1030,21 +1076,25 @@ async def get_my_request_batches(user: User = Depends(get_current_user)):
         {'_id': 0}
     ).sort('reviewed_at', -1).to_list(1000)
     
+    # Per-batch WhatsApp / respond counters in one $group over the staff's assigned records
+    stats_by_request = {}
+    if requests:
+        stats_rows = await db.customer_records.aggregate([
+            {'$match': {'request_id': {'$in': [req['id'] for req in requests]}, 'assigned_to': user.id}},
+            {'$group': {'_id': '$request_id', **BATCH_STATUS_COUNTERS}}
+        ]).to_list(None)
+        stats_by_request = {row['_id']: row for row in stats_rows}
+    
+    database_ids = list({req['database_id'] for req in requests if req.get('database_id')})
+    databases = await db.databases.find(
+        {'id': {'$in': database_ids}}, {'_id': 0, 'id': 1, 'name': 1, 'product_name': 1}
+    ).to_list(None) if database_ids else []
+    database_map = {d['id']: d for d in databases}
+    
     batches = []
     for req in requests:
-        batch_records = await db.customer_records.find({
-            'request_id': req['id'],
-            'assigned_to': user.id
-        }, {'_id': 0, 'whatsapp_status': 1, 'respond_status': 1}).to_list(10000)
-        
-        record_count = len(batch_records)
-        ada_count = sum(1 for r in batch_records if r.get('whatsapp_status') == 'ada')
-        ceklis1_count = sum(1 for r in batch_records if r.get('whatsapp_status') == 'ceklis1')
-        tidak_count = sum(1 for r in batch_records if r.get('whatsapp_status') == 'tidak')
-        respond_ya_count = sum(1 for r in batch_records if r.get('respond_status') == 'ya')
-        respond_tidak_count = sum(1 for r in batch_records if r.get('respond_status') == 'tidak')
-        
-        database = await db.databases.find_one({'id': req['database_id']}, {'_id': 0})
+        stats = stats_by_request.get(req['id'], {})
+        database = database_map.get(req['database_id'])
         
         batches.append({
             'id': req['id'],
@@ -1054,12 +1104,12 @@ async def get_my_request_batches(user: User = Depends(get_current_user)):
             'custom_title': req.get('custom_title'),
             'is_pinned': req.get('is_pinned', False),
             'quantity': req.get('quantity', 0),
-            'record_count': record_count,
-            'ada_count': ada_count,
-            'ceklis1_count': ceklis1_count,
-            'tidak_count': tidak_count,
-            'respond_ya_count': respond_ya_count,
-            'respond_tidak_count': respond_tidak_count,
+            'record_count': stats.get('count', 0),
+            'ada_count': stats.get('ada_count', 0),
+            'ceklis1_count': stats.get('ceklis1_count', 0),
+            'tidak_count': stats.get('tidak_count', 0),
+            'respond_ya_count': stats.get('respond_ya_count', 0),
+            'respond_tidak_count': stats.get('respond_tidak_count', 0),
             'requested_at': req.get('requested_at'),
             'approved_at': req.get('reviewed_at')
         })
@@ -1071,62 +1121,42 @@ async def get_my_request_batches(user: User = Depends(get_current_user)):
         legacy_titles[doc['batch_id']] = doc.get('title')
         legacy_pins[doc['batch_id']] = doc.get('is_pinned', False)
     
-    legacy_records_all = await db.customer_records.find(
-        {
+    # Legacy records (assigned before request batches existed) grouped per database
+    legacy_rows = await db.customer_records.aggregate([
+        {'$match': {
             'assigned_to': user.id,
             'status': 'assigned',
             '$or': [{'request_id': {'$exists': False}}, {'request_id': None}]
-        },
-        {'_id': 0, 'database_id': 1, 'database_name': 1, 'product_name': 1, 'whatsapp_status': 1, 'respond_status': 1}
-    ).to_list(10000)
+        }},
+        {'$group': {
+            '_id': '$database_id',
+            'database_name': {'$first': '$database_name'},
+            'product_name': {'$first': '$product_name'},
+            **BATCH_STATUS_COUNTERS
+        }}
+    ]).to_list(None)
     
-    if legacy_records_all:
-        legacy_by_db = {}
-        for rec in legacy_records_all:
-            db_id = rec['database_id']
-            if db_id not in legacy_by_db:
-                legacy_by_db[db_id] = {
-                    'database_name': rec.get('database_name', 'Unknown'),
-                    'product_name': rec.get('product_name', 'Unknown'),
-                    'count': 0,
-                    'ada_count': 0,
-                    'ceklis1_count': 0,
-                    'tidak_count': 0,
-                    'respond_ya_count': 0,
-                    'respond_tidak_count': 0
-                }
-            legacy_by_db[db_id]['count'] += 1
-            if rec.get('whatsapp_status') == 'ada':
-                legacy_by_db[db_id]['ada_count'] += 1
-            elif rec.get('whatsapp_status') == 'ceklis1':
-                legacy_by_db[db_id]['ceklis1_count'] += 1
-            elif rec.get('whatsapp_status') == 'tidak':
-                legacy_by_db[db_id]['tidak_count'] += 1
-            if rec.get('respond_status') == 'ya':
-                legacy_by_db[db_id]['respond_ya_count'] += 1
-            elif rec.get('respond_status') == 'tidak':
-                legacy_by_db[db_id]['respond_tidak_count'] += 1
-        
-        for db_id, info in legacy_by_db.items():
-            batch_id = f'legacy_{db_id}'
-            batches.append({
-                'id': batch_id,
-                'database_id': db_id,
-                'database_name': info['database_name'],
-                'product_name': info['product_name'],
-                'custom_title': legacy_titles.get(batch_id),
-                'is_pinned': legacy_pins.get(batch_id, False),
-                'quantity': info['count'],
-                'record_count': info['count'],
-                'ada_count': info['ada_count'],
-                'ceklis1_count': info['ceklis1_count'],
-                'tidak_count': info['tidak_count'],
-                'respond_ya_count': info['respond_ya_count'],
-                'respond_tidak_count': info['respond_tidak_count'],
-                'requested_at': None,
-                'approved_at': None,
-                'is_legacy': True
-            })
+    for info in legacy_rows:
+        db_id = info['_id']
+        batch_id = f'legacy_{db_id}'
+        batches.append({
+            'id': batch_id,
+            'database_id': db_id,
+            'database_name': info.get('database_name') or 'Unknown',
+            'product_name': info.get('product_name') or 'Unknown',
+            'custom_title': legacy_titles.get(batch_id),
+            'is_pinned': legacy_pins.get(batch_id, False),
+            'quantity': info['count'],
+            'record_count': info['count'],
+            'ada_count': info['ada_count'],
+            'ceklis1_count': info['ceklis1_count'],
+            'tidak_count': info['tidak_count'],
+            'respond_ya_count': info['respond_ya_count'],
+            'respond_tidak_count': info['respond_tidak_count'],
+            'requested_at': None,
+            'approved_at': None,
+            'is_legacy': True
+        })
     
     # Sort batches: pinned first, then by approved_at date
     batches.sort(key=lambda x: (not x.get('is_pinned', False), x.get('approved_at') is None, x.get('approved_at', '') or ''), reverse=False)
@@ -1666,14 +1696,9 @@ async def create_reserved_member(member_data: ReservedMemberCreate, user: User =
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Check both customer_id (new field) and customer_name (legacy field) for duplicates
-    existing = await db.reserved_members.find_one({
-        '$or': [
-            {'customer_id': {'$regex': f'^{member_data.customer_id}$', '$options': 'i'}},
-            {'customer_name': {'$regex': f'^{member_data.customer_id}$', '$options': 'i'}}
-        ],
-        'product_id': member_data.product_id,
-        'status': {'$in': ['pending', 'approved']}
-    })
+    existing = await find_reservation(
+        db, member_data.customer_id, status=ACTIVE_STATUSES, product_id=member_data.product_id
+    )
     
     if existing:
         owner = await db.users.find_one({'id': existing['staff_id']})
@@ -1733,15 +1758,12 @@ async def create_reserved_member(member_data: ReservedMemberCreate, user: User =
     if doc.get('approved_at'):
         doc['approved_at'] = doc['approved_at'].isoformat()
     
-    await db.reserved_members.insert_one(doc)
+    await db.reserved_members.insert_one(with_reservation_keys(doc))
+    await bump_reserved_version(db)
     
     # Remove from deleted_reserved_members if exists (member is being re-reserved)
-    await db.deleted_reserved_members.delete_many({
-        '$or': [
-            {'customer_id': member_data.customer_id},
-            {'customer_name': member_data.customer_id}  # Also check customer_name field
-        ]
-    })
+    # Matches both customer_id and the legacy customer_name field
+    await delete_reservations(db, member_data.customer_id)
     
     # CRITICAL: If admin auto-approved, invalidate conflicting records for other staff
     # IMPORTANT: Only invalidate records for the SAME PRODUCT
@@ -1803,14 +1825,9 @@ async def bulk_create_reserved_members(bulk_data: BulkReservedMemberCreate, user
     
     for customer_id in customer_ids:
         # Check for existing reservation (case-insensitive) - check both customer_id and legacy customer_name
-        existing = await db.reserved_members.find_one({
-            '$or': [
-                {'customer_id': {'$regex': f'^{customer_id}$', '$options': 'i'}},
-                {'customer_name': {'$regex': f'^{customer_id}$', '$options': 'i'}}
-            ],
-            'product_id': bulk_data.product_id,
-            'status': {'$in': ['pending', 'approved']}
-        })
+        existing = await find_reservation(
+            db, customer_id, status=ACTIVE_STATUSES, product_id=bulk_data.product_id
+        )
         
         if existing:
             owner = await db.users.find_one({'id': existing['staff_id']})
@@ -1840,15 +1857,10 @@ async def bulk_create_reserved_members(bulk_data: BulkReservedMemberCreate, user
         doc['created_at'] = doc['created_at'].isoformat()
         doc['approved_at'] = doc['approved_at'].isoformat()
         
-        await db.reserved_members.insert_one(doc)
+        await db.reserved_members.insert_one(with_reservation_keys(doc))
         
         # Remove from deleted_reserved_members if exists (member is being re-reserved)
-        await db.deleted_reserved_members.delete_many({
-            '$or': [
-                {'customer_id': customer_id},
-                {'customer_name': customer_id}
-            ]
-        })
+        await delete_reservations(db, customer_id)
         
         # CRITICAL: Invalidate conflicting records for other staff
         # IMPORTANT: Only invalidate records for the SAME PRODUCT
@@ -1863,6 +1875,9 @@ async def bulk_create_reserved_members(bulk_data: BulkReservedMemberCreate, user
         added.append(customer_id)
         total_invalidated += invalidated_count
     
+    if added:
+        await bump_reserved_version(db)
+    
     return {
         'success': True,
         'total_processed': len(customer_ids),
@@ -1878,7 +1893,14 @@ async def bulk_create_reserved_members(bulk_data: BulkReservedMemberCreate, user
 
 
 @router.get("/reserved-members", response_model=List[ReservedMember])
-async def get_reserved_members(status: Optional[str] = None, product_id: Optional[str] = None, user: User = Depends(get_current_user)):
+async def get_reserved_members(
+    response: Response,
+    status: Optional[str] = None,
+    product_id: Optional[str] = None,
+    page: PageParams = Depends(get_page_params),
+    user: User = Depends(get_current_user)
+):
+    """Reserved members, newest first, keyset-paginated (next page cursor in X-Next-Cursor)"""
     db = get_db()
     query = {}
     if status:
@@ -1886,7 +1908,12 @@ async def get_reserved_members(status: Optional[str] = None, product_id: Optiona
     if product_id:
         query['product_id'] = product_id
     
-    members = await db.reserved_members.find(query, {'_id': 0}).sort('created_at', -1).to_list(10000)
+    result = await read_page(
+        db.reserved_members, query, [('created_at', -1), ('id', -1)], page,
+        default_limit=10000, required_fields=required_fields(ReservedMember)
+    )
+    apply_page_headers(response, result)
+    members = result.items
     
     jakarta_now = get_jakarta_now()
     
@@ -1901,36 +1928,31 @@ async def get_reserved_members(status: Optional[str] = None, product_id: Optiona
         # Ensure customer_id is populated (migrate from customer_name if needed)
         if not member.get('customer_id') and member.get('customer_name'):
             member['customer_id'] = member['customer_name']
-        
-        # Calculate last_omset_date from omset_records if not already stored
-        customer_id = member.get('customer_id') or member.get('customer_name', '')
-        staff_id = member.get('staff_id')
-        
-        if customer_id and staff_id:
-            # Find the most recent omset for this customer+staff
-            last_omset = await db.omset_records.find_one(
-                {
-                    'customer_id': {'$regex': f'^{customer_id}$', '$options': 'i'},
-                    'staff_id': staff_id
-                },
-                {'_id': 0, 'record_date': 1},
-                sort=[('record_date', -1)]  # Sort by actual deposit date, not created_at
-            )
-            
-            if last_omset and last_omset.get('record_date'):
-                try:
-                    record_date_str = last_omset['record_date']
-                    # record_date is stored as 'YYYY-MM-DD' string
-                    if isinstance(record_date_str, str):
-                        last_deposit = datetime.strptime(record_date_str, '%Y-%m-%d')
-                        last_deposit = last_deposit.replace(tzinfo=jakarta_now.tzinfo)
-                    else:
-                        last_deposit = record_date_str
-                    
-                    member['last_omset_date'] = last_deposit
-                    member['days_since_last_omset'] = (jakarta_now - last_deposit).days
-                except Exception:
-                    pass
+    
+    # Calculate last_omset_date from omset_records: one batched lookup per staff
+    customers_by_staff = {}
+    for member in members:
+        if member.get('customer_id') and member.get('staff_id'):
+            customers_by_staff.setdefault(member['staff_id'], set()).add(member['customer_id'])
+    deposits_by_staff = {
+        staff_id: await find_deposits(db, customer_ids, staff_id=staff_id)
+        for staff_id, customer_ids in customers_by_staff.items()
+    }
+    
+    for member in members:
+        deposits = deposits_by_staff.get(member.get('staff_id'))
+        # Most recent omset for this customer+staff (by actual deposit date, not created_at)
+        record_date_str = deposits.last_deposit_date(member.get('customer_id')) if deposits else None
+        if record_date_str:
+            try:
+                # record_date is stored as 'YYYY-MM-DD' string
+                last_deposit = datetime.strptime(record_date_str, '%Y-%m-%d')
+                last_deposit = last_deposit.replace(tzinfo=jakarta_now.tzinfo)
+                
+                member['last_omset_date'] = last_deposit
+                member['days_since_last_omset'] = (jakarta_now - last_deposit).days
+            except Exception:
+                pass
     
     return members
 
@@ -1961,6 +1983,7 @@ async def approve_reserved_member(member_id: str, user: User = Depends(get_admin
             'approved_by_name': user.name
         }}
     )
+    await bump_reserved_version(db)
     
     # Notify the staff who reserved
     await create_notification(
@@ -2011,6 +2034,7 @@ async def reject_reserved_member(member_id: str, user: User = Depends(get_admin_
     )
     
     await db.reserved_members.delete_one({'id': member_id})
+    await bump_reserved_version(db)
     
     return {'message': 'Reserved member request rejected'}
 
@@ -2032,14 +2056,7 @@ async def delete_reserved_member(member_id: str, user: User = Depends(get_admin_
         now = get_jakarta_now()
         cid_clean = customer_id.strip()
         if cid_clean:
-            await db.deleted_reserved_members.delete_many({
-                'staff_id': staff_id,
-                'product_id': product_id,
-                '$or': [
-                    {'customer_id': {'$regex': f'^{cid_clean}$', '$options': 'i'}},
-                    {'customer_name': {'$regex': f'^{cid_clean}$', '$options': 'i'}}
-                ]
-            })
+            await delete_reservations(db, cid_clean, product_id=product_id, staff_id=staff_id)
         archived_member = {
             **member_data,
             'deleted_at': now.isoformat(),
@@ -2047,7 +2064,7 @@ async def delete_reserved_member(member_id: str, user: User = Depends(get_admin_
             'deleted_by': user.id,
             'deleted_by_name': user.name,
         }
-        await db.deleted_reserved_members.insert_one(archived_member)
+        await db.deleted_reserved_members.insert_one(with_reservation_keys(archived_member))
     
     # SYNC: Delete related bonus_check_submissions for this customer+staff
     if customer_id and staff_id:
@@ -2065,6 +2082,7 @@ async def delete_reserved_member(member_id: str, user: User = Depends(get_admin_
         )
     
     await db.reserved_members.delete_one({'id': member_id})
+    await bump_reserved_version(db)
     
     # SYNC: Revert matching 'reserved' records to 'available' in MemberWD and Bonanza
     unreserved_count = await sync_reserved_status_on_remove(db, customer_id, member.get('customer_name', ''))
@@ -2101,6 +2119,7 @@ async def move_reserved_member(member_id: str, new_staff_id: str, user: User = D
             'staff_name': new_staff_name
         }}
     )
+    await bump_reserved_version(db)
     
     # SYNC: Move bonus_check_submissions to new staff
     if customer_id and old_staff_id:
@@ -2240,6 +2259,9 @@ async def cleanup_reserved_member_duplicates(user: User = Depends(get_admin_user
                     'product_id': m.get('product_id')
                 })
     
+    if deleted_count:
+        await bump_reserved_version(db)
+    
     return {
         'deleted_count': deleted_count,
         'deleted': deleted_ids
@@ -2308,14 +2330,7 @@ async def restore_deleted_reserved_member(member_id: str, user: User = Depends(g
     product_id = archived_member.get('product_id', '')
     if customer_id:
         cid_clean = customer_id.strip()
-        existing = await db.reserved_members.find_one({
-            '$or': [
-                {'customer_id': {'$regex': f'^{cid_clean}$', '$options': 'i'}},
-                {'customer_name': {'$regex': f'^{cid_clean}$', '$options': 'i'}}
-            ],
-            'product_id': product_id,
-            'status': {'$in': ['pending', 'approved']}
-        })
+        existing = await find_reservation(db, cid_clean, status=ACTIVE_STATUSES, product_id=product_id)
         if existing:
             owner = await db.users.find_one({'id': existing['staff_id']})
             owner_name = owner['name'] if owner else 'Unknown'
@@ -2337,7 +2352,8 @@ async def restore_deleted_reserved_member(member_id: str, user: User = Depends(g
     archived_member['restored_by'] = user.name
     
     # Insert back to active reserved members
-    await db.reserved_members.insert_one(archived_member)
+    await db.reserved_members.insert_one(with_reservation_keys(archived_member))
+    await bump_reserved_version(db)
     
     # Delete from archived
     await db.deleted_reserved_members.delete_one({'id': member_id})
@@ -2351,13 +2367,23 @@ async def restore_deleted_reserved_member(member_id: str, user: User = Depends(g
 # ==================== DOWNLOAD HISTORY ====================
 
 @router.get("/download-history", response_model=List[DownloadHistory])
-async def get_download_history(user: User = Depends(get_current_user)):
+async def get_download_history(
+    response: Response,
+    page: PageParams = Depends(get_page_params),
+    user: User = Depends(get_current_user)
+):
+    """Download history, newest first, keyset-paginated (next page cursor in X-Next-Cursor)"""
     db = get_db()
     query = {}
     if user.role == 'staff':
         query['downloaded_by'] = user.id
     
-    history = await db.download_history.find(query, {'_id': 0}).sort('downloaded_at', -1).to_list(1000)
+    result = await read_page(
+        db.download_history, query, [('downloaded_at', -1), ('id', -1)], page,
+        default_limit=1000, required_fields=required_fields(DownloadHistory)
+    )
+    apply_page_headers(response, result)
+    history = result.items
     
     for item in history:
         if isinstance(item['downloaded_at'], str):
@@ -2,13 +2,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import FileResponse
 from typing import Optional
-import io
-import pandas as pd
 import jwt
 import os
 
 from .deps import get_db, get_admin_user, get_current_user, User
-from utils.helpers import get_jakarta_now, normalize_customer_id
+from utils.helpers import get_jakarta_now
+from utils.executors import run_cpu_bound
+from utils.workbooks import write_sheets_xlsx
 
 router = APIRouter(tags=["Report CRM"])
 
@@ -41,134 +41,51 @@ async def get_report_crm_data(
     
     year_start = f"{year}-01-01"
     year_end = f"{year}-12-31"
-    year_query = {**base_query, 'record_date': {'$gte': year_start, '$lte': year_end}}
-    
-    from utils.db_operations import add_approved_filter
-    all_records = await db.omset_records.find(add_approved_filter(year_query), {'_id': 0}).to_list(100000)
-    
-    # ==================== HELPER FUNCTIONS ====================
-    
-    def get_normalized_cid(record):
-        """Get normalized customer ID from record - handles both stored and computed"""
-        stored = record.get('customer_id_normalized')
-        if stored and str(stored).strip():  # Must be non-empty string
-            return str(stored).strip().lower()
-        return normalize_customer_id(record.get('customer_id', ''))
-    
-    def is_tambahan_record(record):
-        """Check if record has 'tambahan' in keterangan field"""
-        keterangan = record.get('keterangan', '') or ''
-        return 'tambahan' in keterangan.lower()
-    
-    # ==================== BUILD STAFF-SPECIFIC CUSTOMER FIRST DATE LOOKUP ====================
-    # Use MongoDB aggregation for efficiency (instead of loading all records into memory)
-    from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db)
     
-    # ==================== UNIFIED NDP/RDP DETERMINATION ====================
+    # ==================== DAILY ROLLUP ROWS ====================
+    # One pre-aggregated row per (date, staff, product). NDP/RDP are classified with the
+    # staff-specific first-deposit index when the rollup is refreshed:
     # NDP = Customer's FIRST deposit for THIS PRODUCT with THIS STAFF matches record_date (AND not tambahan)
     # RDP = Not first deposit for this staff+product combo OR is tambahan
-    
-    def is_ndp_record(record):
-        """Determine if record counts as NDP"""
-        if is_tambahan_record(record):
-            return False
-        cid_normalized = get_normalized_cid(record)
-        key = (record['staff_id'], cid_normalized, record['product_id'])
-        first_date = staff_customer_first_date.get(key)
-        return first_date == record['record_date']
-    
-    # ==================== PRE-COMPUTE NDP/RDP FOR EACH RECORD ====================
-    # This ensures ALL sections use EXACTLY the same determination
-    # Also compute unique tracking to count each (staff, customer, product, date) only ONCE
-    
-    # Tracking: (staff_id, product_id, date, customer_id_normalized) -> is_ndp (True/False)
-    # NDP/RDP is STAFF-SPECIFIC, so staff_id MUST be part of the key.
-    # This ensures consistent counts with the Omset CRM page.
-    
-    unique_deposits = {}  # key: (sid, pid, date, cid_normalized) -> {'is_ndp': bool, 'records': [record, ...]}
-    
-    for record in all_records:
-        cid_normalized = get_normalized_cid(record)
-        sid = record['staff_id']
-        pid = record['product_id']
-        date = record['record_date']
-        key = (sid, pid, date, cid_normalized)
-        
-        if key not in unique_deposits:
-            unique_deposits[key] = {
-                'is_ndp': is_ndp_record(record),
-                'records': []
-            }
-        unique_deposits[key]['records'].append(record)
+    # Each (staff, customer, product, date) is counted only ONCE: a customer with an NDP
+    # record that day is NDP, every other customer that day is RDP.
+    from utils.omset_rollup import build_rollup_match, fetch_rollups
+    rollups = await fetch_rollups(db, build_rollup_match(
+        staff_id=staff_id, product_id=product_id, start_date=year_start, end_date=year_end
+    ))
+    rollups.sort(key=lambda r: r['date'])
+    
+    def empty_totals():
+        return {'new_id': 0, 'rdp': 0, 'total_form': 0, 'nominal': 0}
+    
+    def add_row(target, row):
+        """Accumulate one rollup row into a new_id/rdp/total_form/nominal dict"""
+        target['new_id'] += row['ndp_count']
+        target['rdp'] += row['customer_count'] - row['ndp_count']
+        target['total_form'] += row['count']
+        target['nominal'] += row['depo_total'] or row['nominal'] or 0
     
     # ==================== BUILD ALL REPORT SECTIONS ====================
-    # ALL sections will use the same unique_deposits lookup for consistency
+    # ALL sections are built from the same rollup rows for consistency
     
     # --- YEARLY DATA ---
-    yearly_data = []
-    for m in range(1, 13):
-        month_str = f"{year}-{str(m).zfill(2)}"
-        
-        new_id = 0
-        rdp = 0
-        total_form = 0
-        nominal = 0
-        
-        for (sid, pid, date, cid), deposit_info in unique_deposits.items():
-            if not date.startswith(month_str):
-                continue
-            
-            if deposit_info['is_ndp']:
-                new_id += 1
-            else:
-                rdp += 1
-            
-            # Sum nominal from all records in this unique deposit
-            for record in deposit_info['records']:
-                total_form += 1
-                nominal += record.get('depo_total', 0) or record.get('nominal', 0) or 0
-        
-        yearly_data.append({
-            'month': m,
-            'new_id': new_id,
-            'rdp': rdp,
-            'total_form': total_form,
-            'nominal': nominal
-        })
+    month_totals_map = {m: empty_totals() for m in range(1, 13)}
+    for row in rollups:
+        add_row(month_totals_map[int(row['date'][5:7])], row)
+    
+    yearly_data = [{'month': m, **month_totals_map[m]} for m in range(1, 13)]
     
     # --- MONTHLY DATA (daily breakdown for all months) ---
-    monthly_data = []
-    for m in range(1, 13):
-        month_str = f"{year}-{str(m).zfill(2)}"
-        
-        # Group by date within this month
-        date_data = {}
-        for (sid, pid, date, cid), deposit_info in unique_deposits.items():
-            if not date.startswith(month_str):
-                continue
-            
-            if date not in date_data:
-                date_data[date] = {'new_id': 0, 'rdp': 0, 'total_form': 0, 'nominal': 0}
-            
-            if deposit_info['is_ndp']:
-                date_data[date]['new_id'] += 1
-            else:
-                date_data[date]['rdp'] += 1
-            
-            for record in deposit_info['records']:
-                date_data[date]['total_form'] += 1
-                date_data[date]['nominal'] += record.get('depo_total', 0) or record.get('nominal', 0) or 0
-        
-        for date, data in sorted(date_data.items()):
-            monthly_data.append({
-                'month': m,
-                'date': date,
-                'new_id': data['new_id'],
-                'rdp': data['rdp'],
-                'total_form': data['total_form'],
-                'nominal': data['nominal']
-            })
+    date_data = {}
+    for row in rollups:
+        if row['date'] not in date_data:
+            date_data[row['date']] = empty_totals()
+        add_row(date_data[row['date']], row)
+    
+    monthly_data = [
+        {'month': int(date[5:7]), 'date': date, **data}
+        for date, data in sorted(date_data.items())
+    ]
     
     # --- MONTHLY BY STAFF ---
     CRM_EFFICIENCY_TARGET = 278000000
@@ -179,31 +96,18 @@ async def get_report_crm_data(
         
         staff_data = {}
         
-        for (sid, pid, date, cid), deposit_info in unique_deposits.items():
-            if not date.startswith(month_str):
+        for row in rollups:
+            if not row['date'].startswith(month_str):
                 continue
             
-            # staff_id is now part of the key, so attribution is always correct
-            sname = deposit_info['records'][0]['staff_name']
-            
+            sid = row['staff_id']
             if sid not in staff_data:
                 staff_data[sid] = {
                     'staff_id': sid,
-                    'staff_name': sname,
-                    'new_id': 0,
-                    'rdp': 0,
-                    'total_form': 0,
-                    'nominal': 0
+                    'staff_name': row.get('staff_name'),
+                    **empty_totals()
                 }
-            
-            if deposit_info['is_ndp']:
-                staff_data[sid]['new_id'] += 1
-            else:
-                staff_data[sid]['rdp'] += 1
-            
-            for record in deposit_info['records']:
-                staff_data[sid]['total_form'] += 1
-                staff_data[sid]['nominal'] += record.get('depo_total', 0) or record.get('nominal', 0) or 0
+            add_row(staff_data[sid], row)
         
         staff_list = []
         for sid, data in staff_data.items():
@@ -235,58 +139,36 @@ async def get_report_crm_data(
     # Build nested structure: staff -> products -> daily
     staff_daily_data = {}
     
-    for (sid, pid, date, cid), deposit_info in unique_deposits.items():
+    for row in rollups:
+        date = row['date']
         if not date.startswith(selected_month_str):
             continue
         
-        # staff_id is part of the key
-        sname = deposit_info['records'][0]['staff_name']
-        pname = deposit_info['records'][0]['product_name']
+        sid = row['staff_id']
+        pid = row['product_id']
         
         if sid not in staff_daily_data:
             staff_daily_data[sid] = {
                 'staff_id': sid,
-                'staff_name': sname,
+                'staff_name': row.get('staff_name'),
                 'products': {},
-                'totals': {'new_id': 0, 'rdp': 0, 'total_form': 0, 'nominal': 0}
+                'totals': empty_totals()
             }
         
         if pid not in staff_daily_data[sid]['products']:
             staff_daily_data[sid]['products'][pid] = {
                 'product_id': pid,
-                'product_name': pname,
+                'product_name': row.get('product_name'),
                 'daily': {},
-                'totals': {'new_id': 0, 'rdp': 0, 'total_form': 0, 'nominal': 0}
+                'totals': empty_totals()
             }
         
         if date not in staff_daily_data[sid]['products'][pid]['daily']:
-            staff_daily_data[sid]['products'][pid]['daily'][date] = {
-                'date': date,
-                'new_id': 0,
-                'rdp': 0,
-                'total_form': 0,
-                'nominal': 0
-            }
-        
-        # Update counts
-        if deposit_info['is_ndp']:
-            staff_daily_data[sid]['totals']['new_id'] += 1
-            staff_daily_data[sid]['products'][pid]['totals']['new_id'] += 1
-            staff_daily_data[sid]['products'][pid]['daily'][date]['new_id'] += 1
-        else:
-            staff_daily_data[sid]['totals']['rdp'] += 1
-            staff_daily_data[sid]['products'][pid]['totals']['rdp'] += 1
-            staff_daily_data[sid]['products'][pid]['daily'][date]['rdp'] += 1
+            staff_daily_data[sid]['products'][pid]['daily'][date] = {'date': date, **empty_totals()}
         
-        # Sum nominal from all records
-        for record in deposit_info['records']:
-            nom = record.get('depo_total', 0) or record.get('nominal', 0) or 0
-            staff_daily_data[sid]['totals']['total_form'] += 1
-            staff_daily_data[sid]['totals']['nominal'] += nom
-            staff_daily_data[sid]['products'][pid]['totals']['total_form'] += 1
-            staff_daily_data[sid]['products'][pid]['totals']['nominal'] += nom
-            staff_daily_data[sid]['products'][pid]['daily'][date]['total_form'] += 1
-            staff_daily_data[sid]['products'][pid]['daily'][date]['nominal'] += nom
+        add_row(staff_daily_data[sid]['totals'], row)
+        add_row(staff_daily_data[sid]['products'][pid]['totals'], row)
+        add_row(staff_daily_data[sid]['products'][pid]['daily'][date], row)
     
     # Convert to list format
     daily_by_staff = []
@@ -312,77 +194,42 @@ async def get_report_crm_data(
     daily_by_staff.sort(key=lambda x: x['totals']['nominal'], reverse=True)
     
     # --- DAILY DATA (simple date list for selected month) ---
-    daily_data = []
-    date_totals = {}
-    
-    for (sid, pid, date, cid), deposit_info in unique_deposits.items():
-        if not date.startswith(selected_month_str):
-            continue
-        
-        if date not in date_totals:
-            date_totals[date] = {'new_id': 0, 'rdp': 0, 'total_form': 0, 'nominal': 0}
-        
-        if deposit_info['is_ndp']:
-            date_totals[date]['new_id'] += 1
-        else:
-            date_totals[date]['rdp'] += 1
-        
-        for record in deposit_info['records']:
-            date_totals[date]['total_form'] += 1
-            date_totals[date]['nominal'] += record.get('depo_total', 0) or record.get('nominal', 0) or 0
-    
-    for date, data in sorted(date_totals.items()):
-        daily_data.append({
-            'date': date,
-            'new_id': data['new_id'],
-            'rdp': data['rdp'],
-            'total_form': data['total_form'],
-            'nominal': data['nominal']
-        })
+    daily_data = [
+        {'date': date, **data}
+        for date, data in sorted(date_data.items())
+        if date.startswith(selected_month_str)
+    ]
     
     # --- STAFF PERFORMANCE (yearly totals per staff) ---
     staff_perf_data = {}
     
-    for (sid, pid, date, cid), deposit_info in unique_deposits.items():
-        sname = deposit_info['records'][0]['staff_name']
-        
+    for row in rollups:
+        sid = row['staff_id']
         if sid not in staff_perf_data:
             staff_perf_data[sid] = {
                 'staff_id': sid,
-                'staff_name': sname,
-                'new_id': 0,
-                'rdp': 0,
-                'total_form': 0,
-                'nominal': 0
+                'staff_name': row.get('staff_name'),
+                **empty_totals()
             }
-        
-        if deposit_info['is_ndp']:
-            staff_perf_data[sid]['new_id'] += 1
-        else:
-            staff_perf_data[sid]['rdp'] += 1
-        
-        for record in deposit_info['records']:
-            staff_perf_data[sid]['total_form'] += 1
-            staff_perf_data[sid]['nominal'] += record.get('depo_total', 0) or record.get('nominal', 0) or 0
+        add_row(staff_perf_data[sid], row)
     
     staff_performance = sorted(staff_perf_data.values(), key=lambda x: x['nominal'], reverse=True)
     
     # --- DEPOSIT TIERS ---
-    customer_deposit_counts = {}
-    for record in all_records:
-        cid = record['customer_id']
-        if cid not in customer_deposit_counts:
-            customer_deposit_counts[cid] = 0
-        customer_deposit_counts[cid] += 1
+    # Counted server-side: number of approved records per customer_id this year
+    from utils.db_operations import add_approved_filter
+    year_query = {**base_query, 'record_date': {'$gte': year_start, '$lte': year_end}}
+    tier_rows = await db.omset_records.aggregate([
+        {'$match': add_approved_filter(year_query)},
+        {'$group': {'_id': '$customer_id', 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gte': 2}}},
+        {'$group': {'_id': {'$min': ['$count', 4]}, 'customers': {'$sum': 1}}}
+    ]).to_list(None)
     
     deposit_tiers = {'2x': 0, '3x': 0, '4x_plus': 0}
-    for cid, count in customer_deposit_counts.items():
-        if count == 2:
-            deposit_tiers['2x'] += 1
-        elif count == 3:
-            deposit_tiers['3x'] += 1
-        elif count >= 4:
-            deposit_tiers['4x_plus'] += 1
+    tier_names = {2: '2x', 3: '3x', 4: '4x_plus'}
+    for tier in tier_rows:
+        deposit_tiers[tier_names[tier['_id']]] = tier['customers']
     
     return {
         'yearly': yearly_data,
@@ -432,43 +279,38 @@ async def export_report_crm(
     
     report_data = await get_report_crm_data(product_id, staff_id, year, 1, user)
     
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        yearly_df = pd.DataFrame(report_data['yearly'])
-        yearly_df['month_name'] = yearly_df['month'].apply(lambda x: ['JAN', 'FEB', 'MAR', 'APR', 'MEI', 'JUN', 'JUL', 'AUG', 'SEPT', 'OCT', 'NOV', 'DEC'][x-1])
-        yearly_df = yearly_df[['month_name', 'new_id', 'rdp', 'total_form', 'nominal']]
-        yearly_df.columns = ['BULAN', 'NEW ID (NDP)', 'ID RDP', 'TOTAL FORM', 'NOMINAL']
-        
-        totals = yearly_df[['NEW ID (NDP)', 'ID RDP', 'TOTAL FORM', 'NOMINAL']].sum()
-        totals_row = pd.DataFrame([['TOTAL', totals['NEW ID (NDP)'], totals['ID RDP'], totals['TOTAL FORM'], totals['NOMINAL']]], 
-                                   columns=yearly_df.columns)
-        yearly_df = pd.concat([yearly_df, totals_row], ignore_index=True)
-        yearly_df.to_excel(writer, sheet_name='YEARLY', index=False)
-        
-        if report_data['monthly']:
-            monthly_df = pd.DataFrame(report_data['monthly'])
-            monthly_df = monthly_df[['date', 'new_id', 'rdp', 'total_form', 'nominal']]
-            monthly_df.columns = ['TANGGAL', 'NEW ID', 'ID RDP', 'TOTAL FORM', 'NOMINAL']
-            monthly_df.to_excel(writer, sheet_name='MONTHLY', index=False)
-        
-        if report_data['staff_performance']:
-            staff_df = pd.DataFrame(report_data['staff_performance'])
-            staff_df = staff_df[['staff_name', 'new_id', 'rdp', 'total_form', 'nominal']]
-            staff_df.columns = ['STAFF', 'NEW ID (NDP)', 'ID RDP', 'TOTAL FORM', 'TOTAL OMSET']
-            staff_df.to_excel(writer, sheet_name='STAFF PERFORMANCE', index=False)
-        
-        tiers_df = pd.DataFrame([
-            {'Tier': '2x Deposit', 'Count': report_data['deposit_tiers']['2x']},
-            {'Tier': '3x Deposit', 'Count': report_data['deposit_tiers']['3x']},
-            {'Tier': '>4x Deposit', 'Count': report_data['deposit_tiers']['4x_plus']}
-        ])
-        tiers_df.to_excel(writer, sheet_name='DEPOSIT TIERS', index=False)
-    
-    output.seek(0)
-    
+    month_names = ['JAN', 'FEB', 'MAR', 'APR', 'MEI', 'JUN', 'JUL', 'AUG', 'SEPT', 'OCT', 'NOV', 'DEC']
+    yearly_rows = [
+        [month_names[y['month'] - 1], y['new_id'], y['rdp'], y['total_form'], y['nominal']]
+        for y in report_data['yearly']
+    ]
+    yearly_rows.append(['TOTAL'] + [sum(row[i] for row in yearly_rows) for i in range(1, 5)])
+    
+    sheets = [('YEARLY', yearly_rows, ['BULAN', 'NEW ID (NDP)', 'ID RDP', 'TOTAL FORM', 'NOMINAL'])]
+    
+    if report_data['monthly']:
+        sheets.append((
+            'MONTHLY',
+            [[m['date'], m['new_id'], m['rdp'], m['total_form'], m['nominal']] for m in report_data['monthly']],
+            ['TANGGAL', 'NEW ID', 'ID RDP', 'TOTAL FORM', 'NOMINAL']
+        ))
+    
+    if report_data['staff_performance']:
+        sheets.append((
+            'STAFF PERFORMANCE',
+            [[s['staff_name'], s['new_id'], s['rdp'], s['total_form'], s['nominal']] for s in report_data['staff_performance']],
+            ['STAFF', 'NEW ID (NDP)', 'ID RDP', 'TOTAL FORM', 'TOTAL OMSET']
+        ))
+    
+    sheets.append(('DEPOSIT TIERS', [
+        {'Tier': '2x Deposit', 'Count': report_data['deposit_tiers']['2x']},
+        {'Tier': '3x Deposit', 'Count': report_data['deposit_tiers']['3x']},
+        {'Tier': '>4x Deposit', 'Count': report_data['deposit_tiers']['4x_plus']}
+    ], None))
+    
+    # Workbook is built on the process pool so other requests keep being served
     temp_path = f"/tmp/report_crm_{year}.xlsx"
-    with open(temp_path, 'wb') as f:
-        f.write(output.getvalue())
+    await run_cpu_bound(write_sheets_xlsx, sheets, temp_path)
     
     return FileResponse(
         path=temp_path,
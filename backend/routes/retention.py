@@ -5,12 +5,82 @@ from datetime import datetime, timedelta
 from collections import defaultdict
 
 from .deps import get_db, get_current_user, get_admin_user, User
-from utils.helpers import get_jakarta_now, normalize_customer_id, JAKARTA_TZ
+from utils.helpers import get_jakarta_now, normalize_customer_id, customer_key_expr, JAKARTA_TZ
+from utils.db_operations import add_approved_filter
+from utils.first_deposit_index import customer_first_deposit_stages
 
 router = APIRouter(tags=["Retention"])
 
 # ==================== RETENTION TRACKING ENDPOINTS ====================
 
+# Sort keys of /retention/customers (ties broken by customer key for a stable order)
+CUSTOMER_SORTS = {
+    'deposits': {'total_deposits': -1},
+    'omset': {'total_omset': -1},
+    'recent': {'last_deposit': -1},
+}
+LOYAL_MIN_DEPOSITS = 3
+
+
+def _customer_retention_stages(query: dict) -> List[dict]:
+    """
+    Aggregation stages grouping the approved OMSET records matching query into one
+    document per (customer, product), details taken from its latest deposit.
+    """
+    return [
+        {'$match': add_approved_filter(query)},
+        {'$project': {
+            '_id': 0,
+            'record_date': 1,
+            'customer_id': 1,
+            'customer_name': {'$ifNull': ['$customer_name', '$customer_id']},
+            'product_id': 1,
+            'product_name': {'$ifNull': ['$product_name', 'Unknown']},
+            'staff_name': {'$ifNull': ['$staff_name', 'Unknown']},
+            '_cid': customer_key_expr(),
+            '_depo': {'$ifNull': ['$depo_total', 0]},
+        }},
+        # Oldest first, so $last picks the latest deposit's display details
+        {'$sort': {'record_date': 1}},
+        {'$group': {
+            '_id': {'c': '$_cid', 'p': '$product_id'},
+            'customer_id': {'$last': '$customer_id'},
+            'customer_name': {'$last': '$customer_name'},
+            'product_name': {'$last': '$product_name'},
+            'staff_name': {'$last': '$staff_name'},
+            'total_deposits': {'$sum': 1},
+            'total_omset': {'$sum': '$_depo'},
+            'first_deposit': {'$min': '$record_date'},
+            'last_deposit': {'$max': '$record_date'},
+            'deposit_dates': {'$addToSet': '$record_date'},
+        }},
+        {'$addFields': {'unique_days': {'$size': '$deposit_dates'}}},
+        {'$project': {'deposit_dates': 0}},
+    ]
+
+
+def _ndp_stages(start_date: str, end_date: str) -> List[dict]:
+    """
+    Stages flagging grouped customers as NDP: their first-ever deposit (first-deposit
+    index, "tambahan" excluded) falls in the range. Customers with only "tambahan"
+    deposits fall back to their first deposit in the range.
+    """
+    return customer_first_deposit_stages('_id.c', '_id.p', '_first_ever') + [
+        {'$addFields': {'_first_ever': {'$ifNull': ['$_first_ever', '$first_deposit']}}},
+        {'$addFields': {'is_ndp': {'$and': [
+            {'$gte': ['$_first_ever', start_date]},
+            {'$lte': ['$_first_ever', end_date]},
+        ]}}},
+        {'$project': {'_first_ever': 0}},
+    ]
+
+
+def _retention_customer(c: dict) -> dict:
+    c.pop('_id', None)
+    c['avg_deposit'] = round(c['total_omset'] / c['total_deposits'], 2) if c['total_deposits'] > 0 else 0
+    return c
+
+
 @router.get("/retention/overview")
 async def get_retention_overview(
     start_date: Optional[str] = None,
@@ -34,11 +104,27 @@ async def get_retention_overview(
     if user.role == 'staff':
         query['staff_id'] = user.id
     
-    # Get all OMSET records in date range (only approved)
-    from utils.db_operations import add_approved_filter
-    records = await db.omset_records.find(add_approved_filter(query), {'_id': 0}).to_list(100000)
+    # Per-customer grouping, NDP classification, totals and the top 10 in one pipeline
+    pipeline = _customer_retention_stages(query) + _ndp_stages(start_date, end_date) + [
+        {'$facet': {
+            'totals': [{'$group': {
+                '_id': None,
+                'total_customers': {'$sum': 1},
+                'ndp_customers': {'$sum': {'$cond': ['$is_ndp', 1, 0]}},
+                'total_deposits': {'$sum': '$total_deposits'},
+                'total_omset': {'$sum': '$total_omset'},
+            }}],
+            # Top loyal customers (by deposit count, then by OMSET)
+            'top': [
+                {'$sort': {'total_deposits': -1, 'total_omset': -1, '_id': 1}},
+                {'$limit': 10},
+                {'$project': {'staff_name': 0}},
+            ],
+        }},
+    ]
+    result = (await db.omset_records.aggregate(pipeline, allowDiskUse=True).to_list(1))[0]
     
-    if not records:
+    if not result['totals']:
         return {
             'date_range': {'start': start_date, 'end': end_date},
             'total_customers': 0,
@@ -52,117 +138,16 @@ async def get_retention_overview(
             'top_loyal_customers': []
         }
     
-    # Helper function to normalize customer ID
-    # Helper function to check if record has "tambahan" in notes
-    def is_tambahan_record(record) -> bool:
-        keterangan = record.get('keterangan', '') or ''
-        return 'tambahan' in keterangan.lower()
-    
-    # Get first deposit dates efficiently using MongoDB aggregation
-    # Retention uses (customer_id, product_id) key — business-level customer acquisition
-    pipeline = [
-        {'$match': {'$and': [
-            {'$or': [
-                {'keterangan': {'$exists': False}},
-                {'keterangan': None},
-                {'keterangan': ''},
-                {'keterangan': {'$not': {'$regex': 'tambahan', '$options': 'i'}}}
-            ]},
-            {'$or': [
-                {'approval_status': 'approved'},
-                {'approval_status': {'$exists': False}}
-            ]}
-        ]}},
-        {'$group': {
-            '_id': {
-                'c': {'$ifNull': ['$customer_id_normalized', '$customer_id']},
-                'p': '$product_id'
-            },
-            'first_date': {'$min': '$record_date'}
-        }}
-    ]
-    agg_results = await db.omset_records.aggregate(pipeline).to_list(None)
-    customer_first_date = {
-        (normalize_customer_id(r['_id']['c']), r['_id']['p']): r['first_date']
-        for r in agg_results if r['_id']['c'] and r['_id']['p']
-    }
-    
-    # Analyze customers in date range - USE NORMALIZED CUSTOMER ID
-    customer_stats = defaultdict(lambda: {
-        'customer_id': '',
-        'customer_id_display': '',  # Original for display
-        'customer_name': '',
-        'product_id': '',
-        'product_name': '',
-        'total_deposits': 0,
-        'total_omset': 0,
-        'first_deposit': None,
-        'last_deposit': None,
-        'is_ndp': False,
-        'deposit_dates': set()
-    })
-    
-    for record in records:
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        key = (cid_normalized, record.get('product_id'))
-        customer = customer_stats[key]
-        
-        customer['customer_id'] = cid_normalized
-        # Store original customer_id for display (use most recent)
-        if customer['last_deposit'] is None or record['record_date'] > customer['last_deposit']:
-            customer['customer_id_display'] = record['customer_id']
-            customer['customer_name'] = record.get('customer_name', record['customer_id'])
-        
-        customer['product_id'] = record.get('product_id')
-        customer['product_name'] = record.get('product_name', 'Unknown')
-        customer['total_deposits'] += 1
-        customer['total_omset'] += record.get('depo_total', 0) or 0
-        customer['deposit_dates'].add(record['record_date'])
-        
-        # Track first/last deposit in range
-        if customer['first_deposit'] is None or record['record_date'] < customer['first_deposit']:
-            customer['first_deposit'] = record['record_date']
-        if customer['last_deposit'] is None or record['record_date'] > customer['last_deposit']:
-            customer['last_deposit'] = record['record_date']
-        
-        # Check if NDP (first deposit is within date range)
-        # If customer has no non-tambahan records, first_ever will be None.
-        # In that case, fall back to their earliest record date (including tambahan).
-        first_ever = customer_first_date.get(key)
-        if first_ever is None:
-            # Customer only has "tambahan" records — use their earliest record date
-            first_ever = customer['first_deposit']
-        if first_ever and start_date <= first_ever <= end_date:
-            customer['is_ndp'] = True
-    
-    # Calculate metrics
-    all_customers = list(customer_stats.values())
-    total_customers = len(all_customers)
-    ndp_customers = sum(1 for c in all_customers if c['is_ndp'])
-    rdp_customers = sum(1 for c in all_customers if not c['is_ndp'])
-    total_deposits = sum(c['total_deposits'] for c in all_customers)
-    total_omset = sum(c['total_omset'] for c in all_customers)
+    totals = result['totals'][0]
+    total_customers = totals['total_customers']
+    ndp_customers = totals['ndp_customers']
+    rdp_customers = total_customers - ndp_customers
+    total_deposits = totals['total_deposits']
+    total_omset = totals['total_omset']
     
     # Retention rate: RDP / Total customers
     retention_rate = round((rdp_customers / total_customers * 100), 1) if total_customers > 0 else 0
     
-    # Top loyal customers (by deposit count, then by OMSET)
-    top_customers = sorted(all_customers, key=lambda x: (x['total_deposits'], x['total_omset']), reverse=True)[:10]
-    top_loyal = []
-    for c in top_customers:
-        top_loyal.append({
-            'customer_id': c.get('customer_id_display', c['customer_id']),  # Use display ID
-            'customer_name': c['customer_name'],
-            'product_name': c['product_name'],
-            'total_deposits': c['total_deposits'],
-            'total_omset': c['total_omset'],
-            'avg_deposit': round(c['total_omset'] / c['total_deposits'], 2) if c['total_deposits'] > 0 else 0,
-            'first_deposit': c['first_deposit'],
-            'last_deposit': c['last_deposit'],
-            'is_ndp': c['is_ndp'],
-            'unique_days': len(c['deposit_dates'])
-        })
-    
     return {
         'date_range': {'start': start_date, 'end': end_date},
         'total_customers': total_customers,
@@ -173,7 +158,7 @@ async def get_retention_overview(
         'total_omset': total_omset,
         'avg_deposits_per_customer': round(total_deposits / total_customers, 1) if total_customers > 0 else 0,
         'avg_omset_per_customer': round(total_omset / total_customers, 2) if total_customers > 0 else 0,
-        'top_loyal_customers': top_loyal
+        'top_loyal_customers': [_retention_customer(c) for c in result['top']]
     }
 
 
@@ -203,115 +188,38 @@ async def get_retention_customers(
     if user.role == 'staff':
         query['staff_id'] = user.id
     
-    # Get records
-    records = await db.omset_records.find(query, {'_id': 0}).to_list(100000)
-    
-    if not records:
-        return {'customers': [], 'total': 0}
-    
-    # Get all records to determine first deposits - USE MONGODB AGGREGATION
-    pipeline = [
-        {'$match': {'$and': [
-            {'$or': [
-                {'keterangan': {'$exists': False}}, {'keterangan': None}, {'keterangan': ''},
-                {'keterangan': {'$not': {'$regex': 'tambahan', '$options': 'i'}}}
-            ]},
-            {'$or': [
-                {'approval_status': 'approved'},
-                {'approval_status': {'$exists': False}}
-            ]}
-        ]}},
-        {'$group': {'_id': {'c': {'$ifNull': ['$customer_id_normalized', '$customer_id']}, 'p': '$product_id'}, 'first_date': {'$min': '$record_date'}}}
+    page = [
+        {'$sort': {**CUSTOMER_SORTS.get(sort_by, {}), '_id': 1}},
+        {'$limit': max(limit, 1)},
     ]
-    agg_results = await db.omset_records.aggregate(pipeline).to_list(None)
-    customer_first_date = {(normalize_customer_id(r['_id']['c']), r['_id']['p']): r['first_date'] for r in agg_results if r['_id']['c'] and r['_id']['p']}
-    
-    # Helper function to check if record has "tambahan" in notes
-    def is_tambahan_record(record) -> bool:
-        keterangan = record.get('keterangan', '') or ''
-        return 'tambahan' in keterangan.lower()
+    stages = _customer_retention_stages(query)
+    if filter_type in ('ndp', 'rdp'):
+        # The filter needs the classification of every customer
+        stages += _ndp_stages(start_date, end_date) + [{'$match': {'is_ndp': filter_type == 'ndp'}}]
+        customers_facet = page
+    else:
+        if filter_type == 'loyal':
+            stages.append({'$match': {'total_deposits': {'$gte': LOYAL_MIN_DEPOSITS}}})
+        # Only the returned page needs the first-deposit lookup
+        customers_facet = page + _ndp_stages(start_date, end_date)
+    
+    pipeline = stages + [
+        {'$facet': {
+            'total': [{'$count': 'count'}],
+            'customers': customers_facet,
+        }},
+    ]
+    result = (await db.omset_records.aggregate(pipeline, allowDiskUse=True).to_list(1))[0]
     
-    # Build customer stats
-    customer_stats = defaultdict(lambda: {
-        'customer_id': '',
-        'customer_name': '',
-        'product_id': '',
-        'product_name': '',
-        'staff_name': '',
-        'total_deposits': 0,
-        'total_omset': 0,
-        'first_deposit': None,
-        'last_deposit': None,
-        'is_ndp': False,
-        'deposit_dates': []
-    })
-    
-    for record in records:
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        key = (cid_normalized, record.get('product_id'))
-        customer = customer_stats[key]
-        
-        customer['customer_id'] = record['customer_id']
-        customer['customer_name'] = record.get('customer_name', record['customer_id'])
-        customer['product_id'] = record.get('product_id')
-        customer['product_name'] = record.get('product_name', 'Unknown')
-        customer['staff_name'] = record.get('staff_name', 'Unknown')
-        customer['total_deposits'] += 1
-        customer['total_omset'] += record.get('depo_total', 0) or 0
-        customer['deposit_dates'].append(record['record_date'])
-        
-        if customer['first_deposit'] is None or record['record_date'] < customer['first_deposit']:
-            customer['first_deposit'] = record['record_date']
-        if customer['last_deposit'] is None or record['record_date'] > customer['last_deposit']:
-            customer['last_deposit'] = record['record_date']
-        
-        # Check if NDP - fall back to earliest record date if only tambahan records
-        first_ever = customer_first_date.get(key)
-        if first_ever is None:
-            first_ever = customer['first_deposit']
-        if first_ever and start_date <= first_ever <= end_date:
-            customer['is_ndp'] = True
-    
-    customers = list(customer_stats.values())
-    
-    # Apply filter
-    if filter_type == 'ndp':
-        customers = [c for c in customers if c['is_ndp']]
-    elif filter_type == 'rdp':
-        customers = [c for c in customers if not c['is_ndp']]
-    elif filter_type == 'loyal':
-        customers = [c for c in customers if c['total_deposits'] >= 3]
-    
-    # Sort
-    if sort_by == 'deposits':
-        customers.sort(key=lambda x: x['total_deposits'], reverse=True)
-    elif sort_by == 'omset':
-        customers.sort(key=lambda x: x['total_omset'], reverse=True)
-    elif sort_by == 'recent':
-        customers.sort(key=lambda x: x['last_deposit'] or '', reverse=True)
-    
-    # Format for response
-    result = []
-    for c in customers[:limit]:
-        unique_days = len(set(c['deposit_dates']))
-        result.append({
-            'customer_id': c['customer_id'],
-            'customer_name': c['customer_name'],
-            'product_name': c['product_name'],
-            'staff_name': c['staff_name'],
-            'total_deposits': c['total_deposits'],
-            'total_omset': c['total_omset'],
-            'avg_deposit': round(c['total_omset'] / c['total_deposits'], 2) if c['total_deposits'] > 0 else 0,
-            'first_deposit': c['first_deposit'],
-            'last_deposit': c['last_deposit'],
-            'is_ndp': c['is_ndp'],
-            'unique_days': unique_days,
-            'loyalty_score': min(100, c['total_deposits'] * 10 + unique_days * 5)  # Simple loyalty score
-        })
+    customers = []
+    for c in (result['customers'] if limit > 0 else []):
+        c = _retention_customer(c)
+        c['loyalty_score'] = min(100, c['total_deposits'] * 10 + c['unique_days'] * 5)  # Simple loyalty score
+        customers.append(c)
     
     return {
-        'customers': result,
-        'total': len(customers)
+        'customers': customers,
+        'total': result['total'][0]['count'] if result['total'] else 0
     }
 
 
@@ -439,9 +347,9 @@ async def get_retention_by_product(
         keterangan = record.get('keterangan', '') or ''
         return 'tambahan' in keterangan.lower()
     
-    # Build STAFF-SPECIFIC customer first deposit map using MongoDB aggregation
+    # Build STAFF-SPECIFIC customer first deposit map from the first-deposit index
     from utils.db_operations import build_staff_first_date_map
-    staff_customer_first_date = await build_staff_first_date_map(db)
+    staff_customer_first_date = await build_staff_first_date_map(db, records=records)
     
     # Group by product — track (staff_id, customer_id) pairs for each product
     products = defaultdict(lambda: {
@@ -649,85 +557,34 @@ async def get_customer_alerts(
     jakarta_now = get_jakarta_now()
     today = jakarta_now.strftime('%Y-%m-%d')
     
-    # Helper function to normalize customer ID
-    # Get all OMSET records
-    query = {}
-    if product_id:
-        query['product_id'] = product_id
-    if user.role == 'staff':
-        query['staff_id'] = user.id
-    
-    records = await db.omset_records.find(query, {'_id': 0}).to_list(500000)
+    # At-risk window: last deposit 3-30 days ago (indexed range scan over deposit profiles)
+    from utils.deposit_profile import find_profiles, days_ago
+    profiles = await find_profiles(
+        db,
+        last_deposit_from=days_ago(today, 30),
+        last_deposit_to=days_ago(today, 3),
+        staff_id=user.id if user.role == 'staff' else None,
+        product_id=product_id
+    )
     
-    if not records:
+    if not profiles:
         return {
             'summary': {'critical': 0, 'high': 0, 'medium': 0, 'total': 0},
             'alerts': []
         }
     
-    # Build customer data with last deposit info - USE NORMALIZED CUSTOMER ID
-    customer_data = defaultdict(lambda: {
-        'customer_id': '',
-        'customer_id_display': '',  # Original display name
-        'customer_name': '',
-        'product_id': '',
-        'product_name': '',
-        'staff_id': '',
-        'staff_name': '',
-        'total_deposits': 0,
-        'total_omset': 0,
-        'last_deposit_date': None,
-        'first_deposit_date': None,
-        'deposit_dates': []
-    })
-    
-    for record in records:
-        # Use normalized customer_id for grouping (same customer with different case = same customer)
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        key = (cid_normalized, record.get('product_id'))
-        customer = customer_data[key]
-        
-        # Store the original customer_id for display (use most recent one)
-        if customer['last_deposit_date'] is None or record['record_date'] > customer['last_deposit_date']:
-            customer['customer_id'] = cid_normalized
-            customer['customer_id_display'] = record['customer_id']  # Original for display
-            customer['customer_name'] = record.get('customer_name', record['customer_id'])
-            customer['staff_id'] = record.get('staff_id')
-            customer['staff_name'] = record.get('staff_name', 'Unknown')
-        
-        customer['product_id'] = record.get('product_id')
-        customer['product_name'] = record.get('product_name', 'Unknown')
-        customer['total_deposits'] += 1
-        customer['total_omset'] += record.get('depo_total', 0) or 0
-        customer['deposit_dates'].append(record['record_date'])
-        
-        if customer['last_deposit_date'] is None or record['record_date'] > customer['last_deposit_date']:
-            customer['last_deposit_date'] = record['record_date']
-        if customer['first_deposit_date'] is None or record['record_date'] < customer['first_deposit_date']:
-            customer['first_deposit_date'] = record['record_date']
-    
     # Calculate days since last deposit and assign risk levels
     alerts = []
     critical_count = 0
     high_count = 0
     medium_count = 0
     
-    for customer in customer_data.values():
-        if not customer['last_deposit_date']:
-            continue
-        
-        last_date = datetime.strptime(customer['last_deposit_date'], '%Y-%m-%d')
-        today_date = datetime.strptime(today, '%Y-%m-%d')
+    today_date = datetime.strptime(today, '%Y-%m-%d')
+    
+    for profile in profiles:
+        last_date = datetime.strptime(profile['last_deposit_date'], '%Y-%m-%d')
         days_since = (today_date - last_date).days
         
-        # Skip if deposited today
-        if days_since == 0:
-            continue
-        
-        # Skip if 31+ days since last deposit (auto-removed from at-risk)
-        if days_since > 30:
-            continue
-        
         # Determine risk level
         risk_level = None
         risk_color = None
@@ -740,7 +597,7 @@ async def get_customer_alerts(
             risk_level = 'high'
             risk_color = '#f97316'  # orange
             high_count += 1
-        elif days_since >= 3 and customer['total_deposits'] >= 2:
+        elif days_since >= 3 and profile['deposit_count'] >= 2:
             # Only flag medium risk for customers who deposited at least twice
             risk_level = 'medium'
             risk_color = '#eab308'  # yellow
@@ -748,21 +605,21 @@ async def get_customer_alerts(
         
         if risk_level:
             # Calculate average deposit frequency
-            unique_days = len(set(customer['deposit_dates']))
-            first_date = datetime.strptime(customer['first_deposit_date'], '%Y-%m-%d')
+            unique_days = profile['deposit_days']
+            first_date = datetime.strptime(profile['first_deposit_date'], '%Y-%m-%d')
             days_active = max(1, (today_date - first_date).days)
             avg_days_between = round(days_active / max(1, unique_days - 1), 1) if unique_days > 1 else 0
             
             alerts.append({
-                'customer_id': customer.get('customer_id_display', customer['customer_id']),  # Use display ID
-                'customer_name': customer['customer_name'],
-                'product_id': customer['product_id'],
-                'product_name': customer['product_name'],
-                'staff_id': customer['staff_id'],
-                'staff_name': customer['staff_name'],
-                'total_deposits': customer['total_deposits'],
-                'total_omset': customer['total_omset'],
-                'last_deposit_date': customer['last_deposit_date'],
+                'customer_id': profile['customer_id'],  # Display ID of the latest deposit
+                'customer_name': profile['customer_name'],
+                'product_id': profile['product_id'],
+                'product_name': profile.get('product_name', 'Unknown'),
+                'staff_id': profile['staff_id'],
+                'staff_name': profile.get('staff_name', 'Unknown'),
+                'total_deposits': profile['deposit_count'],
+                'total_omset': profile['total_depo'],
+                'last_deposit_date': profile['last_deposit_date'],
                 'days_since_deposit': days_since,
                 'risk_level': risk_level,
                 'risk_color': risk_color,
@@ -885,75 +742,34 @@ async def get_lost_customers(
     today = jakarta_now.strftime('%Y-%m-%d')
     today_date = datetime.strptime(today, '%Y-%m-%d')
     
-    query = {}
-    if product_id:
-        query['product_id'] = product_id
-    if user.role == 'staff':
-        query['staff_id'] = user.id
-    
-    records = await db.omset_records.find(query, {'_id': 0}).to_list(500000)
-    
-    if not records:
-        return {'total': 0, 'customers': []}
-    
-    customer_data = defaultdict(lambda: {
-        'customer_id': '',
-        'customer_id_display': '',
-        'customer_name': '',
-        'product_id': '',
-        'product_name': '',
-        'staff_id': '',
-        'staff_name': '',
-        'total_deposits': 0,
-        'total_omset': 0,
-        'last_deposit_date': None,
-        'first_deposit_date': None,
-    })
-    
-    for record in records:
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        key = (cid_normalized, record.get('product_id'))
-        customer = customer_data[key]
-        
-        if customer['last_deposit_date'] is None or record['record_date'] > customer['last_deposit_date']:
-            customer['customer_id'] = cid_normalized
-            customer['customer_id_display'] = record['customer_id']
-            customer['customer_name'] = record.get('customer_name', record['customer_id'])
-            customer['staff_id'] = record.get('staff_id')
-            customer['staff_name'] = record.get('staff_name', 'Unknown')
-        
-        customer['product_id'] = record.get('product_id')
-        customer['product_name'] = record.get('product_name', 'Unknown')
-        customer['total_deposits'] += 1
-        customer['total_omset'] += record.get('depo_total', 0) or 0
-        
-        if customer['last_deposit_date'] is None or record['record_date'] > customer['last_deposit_date']:
-            customer['last_deposit_date'] = record['record_date']
-        if customer['first_deposit_date'] is None or record['record_date'] < customer['first_deposit_date']:
-            customer['first_deposit_date'] = record['record_date']
+    # Lost: last deposit 31+ days ago (indexed range scan over deposit profiles)
+    from utils.deposit_profile import find_profiles, days_ago
+    profiles = await find_profiles(
+        db,
+        last_deposit_to=days_ago(today, 31),
+        staff_id=user.id if user.role == 'staff' else None,
+        product_id=product_id
+    )
     
     lost_customers = []
-    for customer in customer_data.values():
-        if not customer['last_deposit_date']:
-            continue
-        last_date = datetime.strptime(customer['last_deposit_date'], '%Y-%m-%d')
+    for profile in profiles:
+        last_date = datetime.strptime(profile['last_deposit_date'], '%Y-%m-%d')
         days_since = (today_date - last_date).days
         
-        if days_since > 30:
-            lost_customers.append({
-                'customer_id': customer['customer_id'],
-                'customer_id_display': customer['customer_id_display'],
-                'customer_name': customer['customer_name'],
-                'product_id': customer['product_id'],
-                'product_name': customer['product_name'],
-                'staff_id': customer['staff_id'],
-                'staff_name': customer['staff_name'],
-                'total_deposits': customer['total_deposits'],
-                'total_omset': customer['total_omset'],
-                'last_deposit_date': customer['last_deposit_date'],
-                'first_deposit_date': customer['first_deposit_date'],
-                'days_since_deposit': days_since,
-            })
+        lost_customers.append({
+            'customer_id': profile['customer_id_normalized'],
+            'customer_id_display': profile['customer_id'],
+            'customer_name': profile['customer_name'],
+            'product_id': profile['product_id'],
+            'product_name': profile.get('product_name', 'Unknown'),
+            'staff_id': profile['staff_id'],
+            'staff_name': profile.get('staff_name', 'Unknown'),
+            'total_deposits': profile['deposit_count'],
+            'total_omset': profile['total_depo'],
+            'last_deposit_date': profile['last_deposit_date'],
+            'first_deposit_date': profile['first_deposit_date'],
+            'days_since_deposit': days_since,
+        })
     
     lost_customers.sort(key=lambda x: x['days_since_deposit'], reverse=True)
     
@@ -974,75 +790,44 @@ async def get_alerts_by_staff(
     jakarta_now = get_jakarta_now()
     today = jakarta_now.strftime('%Y-%m-%d')
     
-    # Helper function to normalize customer ID
-    records = await db.omset_records.find(
-        {'$or': [{'approval_status': 'approved'}, {'approval_status': {'$exists': False}}]},
-        {'_id': 0, 'staff_id': 1, 'customer_id': 1, 'customer_id_normalized': 1,
-         'product_id': 1, 'product_name': 1, 'record_date': 1, 'keterangan': 1, 
-         'depo_total': 1, 'nominal': 1, 'staff_name': 1}
-    ).to_list(50000)
-    
-    if not records:
-        return {'staff': []}
-    
-    # Build customer data - USE NORMALIZED CUSTOMER ID
-    customer_data = defaultdict(lambda: {
-        'staff_id': '',
-        'staff_name': '',
-        'last_deposit_date': None,
-        'total_deposits': 0
-    })
-    
-    for record in records:
-        # Use normalized customer_id for grouping
-        cid_normalized = record.get('customer_id_normalized') or normalize_customer_id(record['customer_id'])
-        key = (cid_normalized, record.get('product_id'))
-        customer = customer_data[key]
-        
-        # Update staff info based on most recent deposit
-        if customer['last_deposit_date'] is None or record['record_date'] > customer['last_deposit_date']:
-            customer['staff_id'] = record.get('staff_id')
-            customer['staff_name'] = record.get('staff_name', 'Unknown')
-        
-        customer['total_deposits'] += 1
-        
-        if customer['last_deposit_date'] is None or record['record_date'] > customer['last_deposit_date']:
-            customer['last_deposit_date'] = record['record_date']
-    
-    # Group alerts by staff
-    staff_alerts = defaultdict(lambda: {
-        'staff_id': '',
-        'staff_name': '',
-        'critical': 0,
-        'high': 0,
-        'medium': 0,
-        'total_customers': 0
-    })
-    
-    for customer in customer_data.values():
-        if not customer['last_deposit_date'] or not customer['staff_id']:
-            continue
-        
-        staff_id = customer['staff_id']
-        staff = staff_alerts[staff_id]
-        staff['staff_id'] = staff_id
-        staff['staff_name'] = customer['staff_name']
-        staff['total_customers'] += 1
-        
-        last_date = datetime.strptime(customer['last_deposit_date'], '%Y-%m-%d')
-        today_date = datetime.strptime(today, '%Y-%m-%d')
-        days_since = (today_date - last_date).days
-        
-        # Skip if 31+ days since last deposit (auto-removed from at-risk)
-        if days_since > 30:
-            continue
-        
-        if days_since >= 14:
-            staff['critical'] += 1
-        elif days_since >= 7:
-            staff['high'] += 1
-        elif days_since >= 3 and customer['total_deposits'] >= 2:
-            staff['medium'] += 1
+    # Count risk buckets per owning staff server-side over the deposit profiles
+    # (date strings compare lexicographically, so the day thresholds are plain bounds)
+    from utils.deposit_profile import PROFILE_COLLECTION, days_ago
+    d3, d7, d14, d30 = (days_ago(today, n) for n in (3, 7, 14, 30))
+    in_window = {'$gte': ['$last_deposit_date', d30]}
+    rows = await db[PROFILE_COLLECTION].aggregate([
+        {'$match': {'staff_id': {'$nin': [None, '']}}},
+        {'$group': {
+            '_id': '$staff_id',
+            'staff_name': {'$last': '$staff_name'},
+            'total_customers': {'$sum': 1},
+            'critical': {'$sum': {'$cond': [
+                {'$and': [in_window, {'$lte': ['$last_deposit_date', d14]}]}, 1, 0
+            ]}},
+            'high': {'$sum': {'$cond': [
+                {'$and': [{'$gt': ['$last_deposit_date', d14]}, {'$lte': ['$last_deposit_date', d7]}]}, 1, 0
+            ]}},
+            'medium': {'$sum': {'$cond': [
+                {'$and': [
+                    {'$gt': ['$last_deposit_date', d7]},
+                    {'$lte': ['$last_deposit_date', d3]},
+                    {'$gte': ['$deposit_count', 2]}
+                ]}, 1, 0
+            ]}},
+        }}
+    ]).to_list(None)
+    
+    staff_alerts = {
+        row['_id']: {
+            'staff_id': row['_id'],
+            'staff_name': row.get('staff_name') or 'Unknown',
+            'critical': row['critical'],
+            'high': row['high'],
+            'medium': row['medium'],
+            'total_customers': row['total_customers']
+        }
+        for row in rows
+    }
     
     result = list(staff_alerts.values())
     result.sort(key=lambda x: x['critical'] + x['high'], reverse=True)
@@ -1077,6 +862,22 @@ async def dismiss_alert(
     return {'message': 'Alert dismissed for 7 days'}
 
 
+@router.post("/retention/deposit-profiles/rebuild")
+async def rebuild_customer_deposit_profiles(user: User = Depends(get_admin_user)):
+    """Admin-only: rebuild customer_deposit_profile (alerts, lost customers, daily briefing) from omset_records."""
+    db = get_db()
+    from utils.deposit_profile import rebuild_deposit_profiles
+    from utils.rebuild_guard import RebuildInProgressError
+    try:
+        result = await rebuild_deposit_profiles(db)
+    except RebuildInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        'message': f"Deposit profiles rebuilt: {result['profiles']} customer/product profiles",
+        **result
+    }
+
+
 # ==================== DAILY BRIEFING ====================
 
 @router.get("/retention/daily-briefing")
@@ -1107,55 +908,39 @@ async def get_daily_briefing(user: User = Depends(get_current_user)):
     rng = random.Random(seed)
     
     # ---- AT-RISK CUSTOMERS ----
-    query = {'staff_id': user.id}
-    omset_records = await db.omset_records.find(query, {'_id': 0}).to_list(500000)
-    
-    # Build customer last deposit map
-    customer_data = {}
-    for record in omset_records:
-        cid = normalize_customer_id(record.get('customer_id', ''))
-        pid = record.get('product_id', '')
-        key = (cid, pid)
-        if key not in customer_data:
-            customer_data[key] = {
-                'customer_id': record.get('customer_id', ''),
-                'customer_name': record.get('customer_name', ''),
-                'product_id': pid,
-                'product_name': record.get('product_name', 'Unknown'),
-                'total_deposits': 0,
-                'last_deposit_date': None
-            }
-        customer_data[key]['total_deposits'] += 1
-        rd = record.get('record_date', '')
-        if rd and (customer_data[key]['last_deposit_date'] is None or rd > customer_data[key]['last_deposit_date']):
-            customer_data[key]['last_deposit_date'] = rd
-            customer_data[key]['customer_id'] = record.get('customer_id', '')
-            customer_data[key]['customer_name'] = record.get('customer_name', '')
+    # Last deposit 3-30 days ago with this staff (indexed range scan over deposit profiles)
+    from utils.deposit_profile import find_profiles, days_ago
+    profiles = await find_profiles(
+        db,
+        last_deposit_from=days_ago(today, 30),
+        last_deposit_to=days_ago(today, 3),
+        staff_id=user.id
+    )
     
     today_date = datetime.strptime(today, '%Y-%m-%d')
     critical, high, medium = [], [], []
     
-    for data in customer_data.values():
-        if not data['last_deposit_date']:
-            continue
+    for data in profiles:
         last = datetime.strptime(data['last_deposit_date'], '%Y-%m-%d')
         days = (today_date - last).days
-        if days <= 0 or days > 30:
-            continue
         entry = {
             'customer_id': data['customer_id'],
             'customer_name': data['customer_name'],
-            'product_name': data['product_name'],
+            'product_name': data.get('product_name', 'Unknown'),
             'days_since_deposit': days,
-            'total_deposits': data['total_deposits']
+            'total_deposits': data['deposit_count']
         }
         if days >= 14:
             critical.append(entry)
         elif days >= 7:
             high.append(entry)
-        elif days >= 3 and data['total_deposits'] >= 2:
+        elif days >= 3 and data['deposit_count'] >= 2:
             medium.append(entry)
     
+    # Stable order before the seeded shuffle, so the daily pick does not depend on query order
+    for bucket in (critical, high, medium):
+        bucket.sort(key=lambda e: (e['product_name'] or '', e['customer_id'] or ''))
+    
     rng.shuffle(critical)
     rng.shuffle(high)
     rng.shuffle(medium)
@@ -1177,11 +962,16 @@ async def get_daily_briefing(user: User = Depends(get_current_user)):
     }
     followup_records = await db.customer_records.find(followup_query, {'_id': 0}).to_list(10000)
     
-    # Get deposited set to exclude
+    # Get deposited set to exclude (distinct id/name/product combos of this staff's OMSET)
+    deposited = await db.omset_records.aggregate([
+        {'$match': {'staff_id': user.id}},
+        {'$group': {'_id': {'c': '$customer_id', 'n': '$customer_name', 'p': '$product_id'}}}
+    ], allowDiskUse=True).to_list(None)
     omset_set = set()
-    for r in omset_records:
-        omset_set.add((normalize_customer_id(r.get('customer_id', '')), r.get('product_id', '')))
-        omset_set.add((normalize_customer_id(r.get('customer_name', '')), r.get('product_id', '')))
+    for r in deposited:
+        combo = r['_id']
+        omset_set.add((normalize_customer_id(combo.get('c') or ''), combo.get('p') or ''))
+        omset_set.add((normalize_customer_id(combo.get('n') or ''), combo.get('p') or ''))
     
     # Group by product
     product_followups = {}
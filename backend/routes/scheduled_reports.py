@@ -5,15 +5,20 @@ from typing import Optional, List
 from datetime import datetime, timedelta
 import httpx
 import asyncio
+import time
 import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from .deps import get_db, get_admin_user, User
-from .notifications import create_notification
-from .records import restore_invalidated_records_for_reservation
+from .deps import get_db, get_admin_user, User, submit_job
+from .notifications import build_notification, create_notifications
+from .records import restore_invalidated_records_for_reservations
 from utils.helpers import normalize_customer_id
-from utils.reserved_check import sync_reserved_status_on_remove
+from utils.reserved_check import sync_reserved_status_on_remove_many
+from utils.deposit_lookup import find_last_deposit_dates
+from utils.job_queue import JobContext, register_job
+from utils.reserved_lookup import reservation_filter, reservation_key, with_reservation_keys
+from utils.reserved_snapshot import bump_reserved_version
 
 router = APIRouter()
 
@@ -262,7 +267,8 @@ async def generate_atrisk_alert(inactive_days: int = 14) -> str:
     db = get_db()
     
     jakarta_now = datetime.now(JAKARTA_TZ)
-    cutoff_date = (jakarta_now - timedelta(days=inactive_days)).strftime('%Y-%m-%d')
+    # Inclusive bound: last deposit at least inactive_days + 1 days ago (before today - inactive_days)
+    cutoff_date = (jakarta_now - timedelta(days=inactive_days + 1)).strftime('%Y-%m-%d')
     # "Lost" boundary: customers inactive 31+ days are no longer at-risk, they are "lost"
     lost_boundary_date = (jakarta_now - timedelta(days=30)).strftime('%Y-%m-%d')
     
@@ -275,72 +281,47 @@ async def generate_atrisk_alert(inactive_days: int = 14) -> str:
     ).to_list(10000)
     recently_alerted_keys = set((r['customer_id'], r.get('product_id', '')) for r in recently_alerted)
     
-    # Get all OMSET records
-    all_records = await db.omset_records.find({}, {'_id': 0}).to_list(100000)
+    # At-risk window over the deposit profiles (one per customer+product pair):
+    # last deposit before cutoff date AND has deposited at least twice.
+    # EXCLUDE "lost" customers (31+ days inactive) - they belong to the "lost" list, not at-risk
+    from utils.deposit_profile import find_profiles
+    profiles = await find_profiles(
+        db,
+        last_deposit_from=lost_boundary_date,
+        last_deposit_to=cutoff_date,
+        min_deposits=2
+    )
     
-    if not all_records:
+    if not profiles and not await db.omset_records.find_one({}, {'_id': 1}):
         return "⚠️ <b>At-Risk Customer Alert</b>\n\n<i>No customer data found.</i>"
     
     # Get products for grouping
     products = await db.products.find({}, {'_id': 0}).to_list(100)
     product_map = {p['id']: p['name'] for p in products}
     
-    # Track customer last deposit dates - use normalized IDs AND product_id
-    # CRITICAL: Must track (customer_id, product_id) pairs, not just customer_id
-    # because a customer can deposit to different products at different times
-    customer_data = {}  # {(normalized_customer_id, product_id): {last_date, ...}}
-    
-    for record in all_records:
-        # Use .lower() for consistent normalization (matches retention.py)
-        cid_normalized = record.get('customer_id_normalized') or record.get('customer_id', '').strip().lower()
-        product_id = record.get('product_id', '')
-        record_date = record.get('record_date', '')
-        
-        # Key is (customer_id, product_id) to track each customer-product combination
-        key = (cid_normalized, product_id)
-        
-        if key not in customer_data:
-            customer_data[key] = {
-                'last_date': record_date,
-                'total_deposits': 1,
-                'total_nominal': record.get('depo_total', 0) or record.get('nominal', 0) or 0,
-                'product_id': product_id,
-                'staff_id': record.get('staff_id', ''),
-                'customer_name': record.get('customer_id', cid_normalized),
-                'staff_name': record.get('staff_name', 'Unknown')
-            }
-        else:
-            # Update if this record is more recent
-            if record_date > customer_data[key]['last_date']:
-                customer_data[key]['last_date'] = record_date
-                customer_data[key]['staff_id'] = record.get('staff_id', '')
-                customer_data[key]['staff_name'] = record.get('staff_name', 'Unknown')
-            customer_data[key]['total_deposits'] += 1
-            customer_data[key]['total_nominal'] += record.get('depo_total', 0) or record.get('nominal', 0) or 0
-    
-    # Find at-risk customers (last deposit before cutoff date AND has deposited at least twice)
-    # EXCLUDE "lost" customers (31+ days inactive) - they belong to the "lost" list, not at-risk
     # EXCLUDE customers that were alerted in the last 3 days (per customer+product pair)
     at_risk_customers = []
-    for (cid, product_id), data in customer_data.items():
-        if data['last_date'] < cutoff_date and data['last_date'] >= lost_boundary_date and data['total_deposits'] >= 2:
-            # Skip if this customer+product was alerted in the last 3 days
-            if (cid, product_id) in recently_alerted_keys:
-                continue
-                
-            days_since = (jakarta_now - datetime.strptime(data['last_date'], '%Y-%m-%d').replace(tzinfo=JAKARTA_TZ)).days
-            at_risk_customers.append({
-                'customer_id': cid,
-                'customer_name': data['customer_name'],
-                'last_date': data['last_date'],
-                'days_since': days_since,
-                'total_deposits': data['total_deposits'],
-                'total_nominal': data['total_nominal'],
-                'product_id': product_id,
-                'product_name': product_map.get(product_id, product_id),
-                'staff_id': data['staff_id'],
-                'staff_name': data['staff_name']
-            })
+    for data in profiles:
+        cid = data['customer_id_normalized']
+        product_id = data['product_id']
+        
+        # Skip if this customer+product was alerted in the last 3 days
+        if (cid, product_id) in recently_alerted_keys:
+            continue
+        
+        days_since = (jakarta_now - datetime.strptime(data['last_deposit_date'], '%Y-%m-%d').replace(tzinfo=JAKARTA_TZ)).days
+        at_risk_customers.append({
+            'customer_id': cid,
+            'customer_name': data['customer_id'],
+            'last_date': data['last_deposit_date'],
+            'days_since': days_since,
+            'total_deposits': data['deposit_count'],
+            'total_nominal': data['total_depo'],
+            'product_id': product_id,
+            'product_name': product_map.get(product_id, product_id),
+            'staff_id': data['staff_id'],
+            'staff_name': data.get('staff_name', 'Unknown')
+        })
     
     # Sort by days since last deposit (most urgent first)
     at_risk_customers.sort(key=lambda x: x['days_since'], reverse=True)
@@ -521,8 +502,11 @@ async def generate_staff_offline_alert() -> str:
     online_staff = []
     offline_staff = []
     
+    from utils.activity_registry import activity_registry
+    
     for staff in staff_users:
-        last_activity_str = staff.get('last_activity')
+        # Include heartbeats still buffered in the activity registry
+        last_activity_str = activity_registry.last_activity_iso(staff.get('id'), staff.get('last_activity'))
         is_online = staff.get('is_online', False)
         status = 'offline'
         
@@ -670,6 +654,84 @@ async def send_staff_offline_alert():
         )
 
 
+RESERVED_CLEANUP_CHUNK_SIZE = 1000
+
+
+class CleanupPhaseTimer:
+    """Run time and counts of each phase of the reserved member cleanup"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._phase_started_at = self.started_at
+        self.phases = {}
+
+    def done(self, name: str, **counts):
+        now = time.monotonic()
+        self.phases[name] = {'duration_ms': round((now - self._phase_started_at) * 1000, 1), **counts}
+        self._phase_started_at = now
+        print(f"  [{name}] {self.phases[name]}")
+
+    def total_ms(self) -> float:
+        return round((time.monotonic() - self.started_at) * 1000, 1)
+
+
+def _chunks(items: list, size: int = RESERVED_CLEANUP_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _parse_last_omset_date(value):
+    """Stored last_omset_date (ISO string or datetime) as an aware datetime, None if unparseable"""
+    try:
+        if isinstance(value, str):
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        else:
+            parsed = value
+        if parsed.tzinfo is None:
+            parsed = JAKARTA_TZ.localize(parsed)
+        return parsed
+    except Exception as e:
+        print(f"Error parsing last_omset_date {value!r}: {e}")
+        return None
+
+
+async def resolve_last_deposit_dates(db, members: list) -> dict:
+    """
+    Last deposit date of every reserved member: the stored last_omset_date, or else the
+    latest omset record_date of the customer by the reserving staff. All members without a
+    stored date are looked up with one batched aggregation (find_last_deposit_dates).
+    
+    Returns:
+        {member id: aware datetime, or None when the customer never deposited}
+    """
+    resolved = {}
+    missing = []
+    for member in members:
+        last_omset_date = member.get('last_omset_date')
+        parsed = _parse_last_omset_date(last_omset_date) if last_omset_date else None
+        resolved[member.get('id')] = parsed
+        if parsed is None:
+            missing.append(member)
+    
+    if missing:
+        # IMPORTANT: Use 'record_date' field (the actual deposit date), NOT 'created_at'
+        last_dates = await find_last_deposit_dates(
+            db, [m.get('customer_id') or m.get('customer_name') or '' for m in missing]
+        )
+        for member in missing:
+            customer_id = member.get('customer_id') or member.get('customer_name') or ''
+            record_date = last_dates.get((normalize_customer_id(customer_id), member.get('staff_id') or None))
+            if not record_date:
+                continue
+            try:
+                # record_date is stored as 'YYYY-MM-DD' string
+                resolved[member.get('id')] = JAKARTA_TZ.localize(datetime.strptime(record_date, '%Y-%m-%d'))
+            except Exception as e:
+                print(f"Error parsing record_date for {customer_id}: {e}")
+    
+    return resolved
+
+
 async def process_reserved_member_cleanup():
     """
     Task that runs daily at 00:01 AM to:
@@ -684,13 +746,18 @@ async def process_reserved_member_cleanup():
     - Grace period = 21 days
     - Customer's last deposit was 25 days ago
     - Result: Customer should be DELETED (25 > 21)
+    
+    Runs set-based: one batched deposit lookup for all members, expiries and warnings
+    decided in memory, then a few bulk writes. Run time and counts of every phase are
+    returned under 'phases'.
     """
     db = get_db()
     jakarta_now = datetime.now(JAKARTA_TZ)
+    timer = CleanupPhaseTimer()
     
     print(f"[{jakarta_now}] Starting reserved member cleanup job...")
     
-    # Get grace period configuration
+    # ---- Phase: load config and approved reserved members ----
     config = await db.reserved_member_config.find_one({'id': 'reserved_member_config'}, {'_id': 0})
     global_grace_days = 30  # Default
     warning_days = 7  # Default - notify X days before expiry
@@ -703,28 +770,34 @@ async def process_reserved_member_cleanup():
     
     print(f"Config: global_grace_days={global_grace_days}, warning_days={warning_days}")
     
-    # Get all approved reserved members
     reserved_members = await db.reserved_members.find(
         {'status': 'approved'},
         {'_id': 0}
-    ).to_list(10000)
+    ).to_list(None)
     
-    if not reserved_members:
-        print("No approved reserved members to process")
-        return {'warnings_sent': 0, 'members_removed': 0}
+    # Skip permanent reservations - they never expire
+    members = [m for m in reserved_members if not m.get('is_permanent', False)]
+    timer.done('load', approved=len(reserved_members), permanent=len(reserved_members) - len(members))
     
-    print(f"Processing {len(reserved_members)} approved reserved members...")
+    if not members:
+        print("No approved reserved members to process")
+        return {'warnings_sent': 0, 'members_removed': 0, 'duration_ms': timer.total_ms(), 'phases': timer.phases}
+    
+    # ---- Phase: last deposit date of every member ----
+    last_deposits = await resolve_last_deposit_dates(db, members)
+    timer.done(
+        'deposits',
+        with_deposit=sum(1 for d in last_deposits.values() if d is not None),
+        without_deposit=sum(1 for d in last_deposits.values() if d is None)
+    )
     
-    # Track stats
-    notifications_sent = 0
-    members_deleted = 0
+    # ---- Phase: decide expiries and warnings in memory ----
+    today_date = jakarta_now.date()
+    removals = []  # (member, archived fields, notification or None)
+    warnings = []  # (member, notification)
     
-    for member in reserved_members:
+    for member in members:
         member_id = member.get('id')
-        # Skip permanent reservations - they never expire
-        if member.get('is_permanent', False):
-            print(f"  {member.get('customer_id') or member.get('customer_name', '')}: PERMANENT - skipping")
-            continue
         # Support both old field name (customer_name) and new field name (customer_id)
         customer_id = member.get('customer_id') or member.get('customer_name') or ''
         staff_id = member.get('staff_id')
@@ -733,157 +806,32 @@ async def process_reserved_member_cleanup():
         
         # Get grace period for this member (product-specific or global)
         grace_days = product_overrides.get(product_id, global_grace_days)
-        
-        # Get the customer's LAST DEPOSIT DATE from reserved member record
-        # This is stored as 'last_omset_date' field
-        last_omset_date_str = member.get('last_omset_date')
-        has_deposit = False
-        
-        if last_omset_date_str:
-            # Use the stored last_omset_date
-            has_deposit = True
-            try:
-                if isinstance(last_omset_date_str, str):
-                    last_deposit_date = datetime.fromisoformat(last_omset_date_str.replace('Z', '+00:00'))
-                else:
-                    last_deposit_date = last_omset_date_str
-                if last_deposit_date.tzinfo is None:
-                    last_deposit_date = JAKARTA_TZ.localize(last_deposit_date)
-            except Exception as e:
-                print(f"Error parsing last_omset_date for {customer_id}: {e}")
-                has_deposit = False
-        
-        if not has_deposit:
-            # No last_omset_date stored - try to get from omset_records
-            # IMPORTANT: Use 'record_date' field (the actual deposit date), NOT 'created_at'
-            last_omset = await db.omset_records.find_one(
-                {
-                    'customer_id': {'$regex': f'^{customer_id}$', '$options': 'i'},
-                    'staff_id': staff_id
-                },
-                {'_id': 0, 'record_date': 1},
-                sort=[('record_date', -1)]  # Get the most recent by actual deposit date
-            )
-            
-            if last_omset and last_omset.get('record_date'):
-                has_deposit = True
-                try:
-                    record_date_str = last_omset['record_date']
-                    # record_date is stored as 'YYYY-MM-DD' string
-                    if isinstance(record_date_str, str):
-                        # Parse as date and convert to datetime at start of day
-                        last_deposit_date = datetime.strptime(record_date_str, '%Y-%m-%d')
-                        last_deposit_date = JAKARTA_TZ.localize(last_deposit_date)
-                    else:
-                        last_deposit_date = record_date_str
-                        if last_deposit_date.tzinfo is None:
-                            last_deposit_date = JAKARTA_TZ.localize(last_deposit_date)
-                except Exception as e:
-                    print(f"Error parsing record_date for {customer_id}: {e}")
-                    has_deposit = False
+        last_deposit_date = last_deposits.get(member_id)
         
         # If NO DEPOSIT at all - DELETE immediately
-        if not has_deposit:
-            print(f"  {customer_id}: NO DEPOSIT - deleting immediately")
-            
-            # Archive to deleted_reserved_members collection (deduplicate first)
-            member_data = await db.reserved_members.find_one({'id': member_id}, {'_id': 0})
-            
-            if member_data:
-                # Remove existing archive entry for same customer+staff+product to prevent duplicates
-                cid_clean = customer_id.strip()
-                await db.deleted_reserved_members.delete_many({
-                    'staff_id': staff_id,
-                    'product_id': product_id,
-                    '$or': [
-                        {'customer_id': {'$regex': f'^{cid_clean}$', '$options': 'i'}},
-                        {'customer_name': {'$regex': f'^{cid_clean}$', '$options': 'i'}}
-                    ]
-                })
-                archived_member = {
-                    **member_data,
-                    'deleted_at': jakarta_now.isoformat(),
-                    'deleted_reason': 'no_deposit',
-                    'grace_days_used': grace_days,
-                    'days_since_last_deposit': None,
-                    'last_deposit_date': None
-                }
-                await db.deleted_reserved_members.insert_one(archived_member)
-            
-            # Delete from active reserved members
-            await db.reserved_members.delete_one({'id': member_id})
-            members_deleted += 1
-            
-            # SYNC: Delete related bonus_check_submissions for this customer+staff
-            await db.bonus_check_submissions.delete_many({
-                'customer_id_normalized': customer_id.strip().upper(),
-                'staff_id': staff_id
-            })
-            
-            # SYNC: Restore records that were invalidated by this reservation
-            await restore_invalidated_records_for_reservation(db, customer_id, staff_id, product_id)
-            
-            # SYNC: Revert 'reserved' records back to 'available' in MemberWD/Bonanza
-            await sync_reserved_status_on_remove(db, customer_id, member.get('customer_name', ''))
-            
+        if last_deposit_date is None:
+            removals.append((member, {
+                'deleted_reason': 'no_deposit',
+                'grace_days_used': grace_days,
+                'days_since_last_deposit': None,
+                'last_deposit_date': None
+            }, None))
             print(f"  -> DELETED: {customer_id} (no deposit)")
             continue
         
         # Calculate days since LAST DEPOSIT (the key logic!)
         # Compare dates only (ignore time portion) to get accurate day count
-        today_date = jakarta_now.date()
-        last_deposit_date_only = last_deposit_date.date()
-        days_since_last_deposit = (today_date - last_deposit_date_only).days
+        days_since_last_deposit = (today_date - last_deposit_date.date()).days
         days_remaining = grace_days - days_since_last_deposit
         
-        print(f"  {customer_id}: last_deposit={last_deposit_date_only}, days_since={days_since_last_deposit}, grace={grace_days}, remaining={days_remaining}")
-        
-        # Check if grace period has passed
         if days_remaining <= 0:
-            # Grace period passed - DELETE this member
-            # Archive to deleted_reserved_members collection (deduplicate first)
-            member_data = await db.reserved_members.find_one({'id': member_id}, {'_id': 0})
-            
-            if member_data:
-                # Remove existing archive entry for same customer+staff+product to prevent duplicates
-                cid_clean = customer_id.strip()
-                await db.deleted_reserved_members.delete_many({
-                    'staff_id': staff_id,
-                    'product_id': product_id,
-                    '$or': [
-                        {'customer_id': {'$regex': f'^{cid_clean}$', '$options': 'i'}},
-                        {'customer_name': {'$regex': f'^{cid_clean}$', '$options': 'i'}}
-                    ]
-                })
-                archived_member = {
-                    **member_data,
-                    'deleted_at': jakarta_now.isoformat(),
-                    'deleted_reason': 'no_omset_grace_period',
-                    'grace_days_used': grace_days,
-                    'days_since_last_deposit': days_since_last_deposit,
-                    'last_deposit_date': last_deposit_date.isoformat()
-                }
-                await db.deleted_reserved_members.insert_one(archived_member)
-            
-            # Delete from active reserved members
-            await db.reserved_members.delete_one({'id': member_id})
-            members_deleted += 1
-            
-            # SYNC: Delete related bonus_check_submissions for this customer+staff
-            # When a reserved member expires, their bonus check submissions should also be removed
-            await db.bonus_check_submissions.delete_many({
-                'customer_id_normalized': customer_id.strip().upper(),
-                'staff_id': staff_id
-            })
-            
-            # SYNC: Restore records that were invalidated by this reservation
-            await restore_invalidated_records_for_reservation(db, customer_id, staff_id, product_id)
-            
-            # SYNC: Revert 'reserved' records back to 'available' in MemberWD/Bonanza
-            await sync_reserved_status_on_remove(db, customer_id, member.get('customer_name', ''))
-            
-            # Send notification to staff
-            await create_notification(
+            # Grace period passed - DELETE this member and notify the staff
+            removals.append((member, {
+                'deleted_reason': 'no_omset_grace_period',
+                'grace_days_used': grace_days,
+                'days_since_last_deposit': days_since_last_deposit,
+                'last_deposit_date': last_deposit_date.isoformat()
+            }, build_notification(
                 user_id=staff_id,
                 type='reserved_member_expired',
                 title='Reserved Member Removed',
@@ -895,47 +843,139 @@ async def process_reserved_member_cleanup():
                     'days_since_last_deposit': days_since_last_deposit,
                     'reason': 'no_omset_grace_period'
                 }
-            )
+            )))
             print(f"  -> DELETED: {customer_id} (last deposit {days_since_last_deposit} days ago, grace: {grace_days})")
-            
+        
         elif days_remaining <= warning_days:
-            # Within warning period - send notification
-            today_str = jakarta_now.strftime('%Y-%m-%d')
-            existing_notification = await db.notifications.find_one({
-                'user_id': staff_id,
+            # Within warning period - send notification (once per day, checked below)
+            warnings.append((member, build_notification(
+                user_id=staff_id,
+                type='reserved_member_expiring',
+                title='Reserved Member Expiring Soon',
+                message=f'Your reservation for "{customer_id}" ({product_name}) will expire in {days_remaining} day(s). Last deposit was {days_since_last_deposit} days ago.',
+                data={
+                    'member_id': member_id,
+                    'customer_id': customer_id,
+                    'product_name': product_name,
+                    'days_remaining': days_remaining,
+                    'days_since_last_deposit': days_since_last_deposit,
+                    'grace_days': grace_days
+                }
+            )))
+    
+    timer.done('decide', members=len(members), expired=len(removals), expiring=len(warnings))
+    
+    # ---- Phase: archive removed members to deleted_reserved_members ----
+    # One archive entry per customer+staff+product: replace existing entries, keep the last one of this run
+    archived = {}
+    for member, fields, _ in removals:
+        customer_id = (member.get('customer_id') or member.get('customer_name') or '').strip()
+        key = (reservation_key(customer_id), member.get('staff_id'), member.get('product_id', ''))
+        archived[key] = with_reservation_keys({**member, 'deleted_at': jakarta_now.isoformat(), **fields})
+    
+    dedupe_branches = []
+    for customer_key, staff_id, product_id in archived:
+        query = reservation_filter(customer_key, product_id=product_id, staff_id=staff_id)
+        if query:
+            dedupe_branches.extend(query['$or'])
+    archive_replaced = 0
+    for branches in _chunks(dedupe_branches):
+        result = await db.deleted_reserved_members.delete_many({'$or': branches})
+        archive_replaced += result.deleted_count
+    archive_docs = list(archived.values())
+    for docs in _chunks(archive_docs):
+        await db.deleted_reserved_members.insert_many(docs, ordered=False)
+    timer.done('archive', archived=len(archive_docs), replaced=archive_replaced)
+    
+    # ---- Phase: delete from active reserved members ----
+    removed_ids = [member['id'] for member, _, _ in removals if member.get('id')]
+    members_deleted = 0
+    for ids in _chunks(removed_ids):
+        result = await db.reserved_members.delete_many({'id': {'$in': ids}})
+        members_deleted += result.deleted_count
+    if members_deleted:
+        await bump_reserved_version(db)
+    
+    # SYNC: Delete related bonus_check_submissions for each removed customer+staff
+    bonus_customers = {}
+    for member, _, _ in removals:
+        customer_id = member.get('customer_id') or member.get('customer_name') or ''
+        bonus_customers.setdefault(member.get('staff_id'), set()).add(customer_id.strip().upper())
+    bonus_deleted = 0
+    for staff_id, customer_ids in bonus_customers.items():
+        for chunk in _chunks(sorted(customer_ids)):
+            result = await db.bonus_check_submissions.delete_many({
+                'customer_id_normalized': {'$in': chunk},
+                'staff_id': staff_id
+            })
+            bonus_deleted += result.deleted_count
+    timer.done('delete', members_removed=members_deleted, bonus_submissions_deleted=bonus_deleted)
+    
+    # ---- Phase: restore records invalidated by, and reserved for, the removed reservations ----
+    records_restored, records_unreserved = 0, 0
+    if removals:
+        records_restored, records_unreserved = await asyncio.gather(
+            restore_invalidated_records_for_reservations(db, [
+                (m.get('customer_id') or m.get('customer_name') or '', m.get('staff_id'), m.get('product_id', ''))
+                for m, _, _ in removals
+            ]),
+            # Revert 'reserved' records back to 'available' in MemberWD/Bonanza
+            sync_reserved_status_on_remove_many(db, [
+                (m.get('customer_id') or m.get('customer_name') or '', m.get('customer_name', ''))
+                for m, _, _ in removals
+            ])
+        )
+    timer.done('sync', records_restored=records_restored, records_unreserved=records_unreserved)
+    
+    # ---- Phase: notifications ----
+    # Expiring warnings are sent at most once per member per day
+    today_str = jakarta_now.strftime('%Y-%m-%d')
+    already_warned = set()
+    warned_ids = [member.get('id') for member, _ in warnings]
+    for ids in _chunks(warned_ids):
+        existing = await db.notifications.find(
+            {
                 'type': 'reserved_member_expiring',
-                'data.member_id': member_id,
+                'data.member_id': {'$in': ids},
                 'created_at': {'$regex': f'^{today_str}'}
-            })
-            
-            if not existing_notification:
-                await create_notification(
-                    user_id=staff_id,
-                    type='reserved_member_expiring',
-                    title='Reserved Member Expiring Soon',
-                    message=f'Your reservation for "{customer_id}" ({product_name}) will expire in {days_remaining} day(s). Last deposit was {days_since_last_deposit} days ago.',
-                    data={
-                        'member_id': member_id,
-                        'customer_id': customer_id,
-                        'product_name': product_name,
-                        'days_remaining': days_remaining,
-                        'days_since_last_deposit': days_since_last_deposit,
-                        'grace_days': grace_days
-                    }
-                )
-                notifications_sent += 1
-                print(f"  -> WARNING: {customer_id} ({days_remaining} days left)")
-    
-    print(f"Reserved member cleanup completed: {notifications_sent} warnings sent, {members_deleted} members removed")
-    return {'warnings_sent': notifications_sent, 'members_removed': members_deleted}
+            },
+            {'_id': 0, 'user_id': 1, 'data.member_id': 1}
+        ).to_list(None)
+        already_warned.update((n.get('user_id'), n.get('data', {}).get('member_id')) for n in existing)
+    
+    warning_notifications = [
+        notification for member, notification in warnings
+        if (member.get('staff_id'), member.get('id')) not in already_warned
+    ]
+    expired_notifications = [notification for _, _, notification in removals if notification]
+    notifications = expired_notifications + warning_notifications
+    for chunk in _chunks(notifications):
+        await create_notifications(chunk)
+    notifications_sent = len(warning_notifications)
+    timer.done('notify', warnings_sent=notifications_sent, expired_notices=len(expired_notifications),
+               warnings_skipped=len(warnings) - notifications_sent)
+    
+    duration_ms = timer.total_ms()
+    print(f"Reserved member cleanup completed in {duration_ms}ms: {notifications_sent} warnings sent, {members_deleted} members removed")
+    return {
+        'warnings_sent': notifications_sent,
+        'members_removed': members_deleted,
+        'duration_ms': duration_ms,
+        'phases': timer.phases
+    }
 
 
 async def send_reserved_member_cleanup():
-    """Wrapper for the reserved member cleanup job"""
+    """
+    Cron entry for the reserved member cleanup.
+    Queued like the manual run, so it shares its concurrency slot and is skipped
+    (the active job is reused) while a cleanup is already queued or running.
+    """
     try:
-        await process_reserved_member_cleanup()
+        job = await submit_job('reserved_member_cleanup', {}, None, wait=False)
+        print(f"Reserved member cleanup queued as job {job['job_id']}")
     except Exception as e:
-        print(f"Error in reserved member cleanup: {e}")
+        print(f"Error queueing reserved member cleanup: {e}")
 
 
 async def cleanup_omset_trash():
@@ -1540,6 +1580,10 @@ async def preview_reserved_member_cleanup(user: User = Depends(get_admin_user)):
     safe_members = []  # No OMSET but still within grace period (outside warning)
     permanent_members = []  # Permanent reservations (never expire)
     
+    last_deposits = await resolve_last_deposit_dates(
+        db, [m for m in reserved_members if not m.get('is_permanent', False)]
+    )
+    
     for member in reserved_members:
         member_id = member.get('id')
         # Skip permanent reservations
@@ -1554,7 +1598,6 @@ async def preview_reserved_member_cleanup(user: User = Depends(get_admin_user)):
             continue
         # Support both old field name (customer_name) and new field name (customer_id)
         customer_id = member.get('customer_id') or member.get('customer_name') or ''
-        staff_id = member.get('staff_id')
         staff_name = member.get('staff_name', 'Unknown')
         product_id = member.get('product_id', '')
         product_name = member.get('product_name', 'Unknown')
@@ -1562,44 +1605,11 @@ async def preview_reserved_member_cleanup(user: User = Depends(get_admin_user)):
         # Get grace period for this member
         grace_days = product_overrides.get(product_id, global_grace_days)
         
-        # First check if there's a stored last_omset_date
-        last_omset_date_str = member.get('last_omset_date')
-        has_deposit = False
-        
-        if last_omset_date_str:
-            has_deposit = True
-            try:
-                if isinstance(last_omset_date_str, str):
-                    last_deposit_date = datetime.fromisoformat(last_omset_date_str.replace('Z', '+00:00'))
-                else:
-                    last_deposit_date = last_omset_date_str
-                if last_deposit_date.tzinfo is None:
-                    last_deposit_date = JAKARTA_TZ.localize(last_deposit_date)
-            except Exception:
-                has_deposit = False
-        
-        if not has_deposit:
-            # Get the customer's LAST DEPOSIT DATE from omset_records
-            last_omset = await db.omset_records.find_one(
-                {
-                    'customer_id': {'$regex': f'^{customer_id}$', '$options': 'i'},
-                    'staff_id': staff_id
-                },
-                {'_id': 0, 'record_date': 1},
-                sort=[('record_date', -1)]
-            )
-            
-            if last_omset and last_omset.get('record_date'):
-                has_deposit = True
-                try:
-                    record_date_str = last_omset['record_date']
-                    last_deposit_date = datetime.strptime(record_date_str, '%Y-%m-%d')
-                    last_deposit_date = JAKARTA_TZ.localize(last_deposit_date)
-                except Exception:
-                    has_deposit = False
+        # Stored last_omset_date, else the last deposit in omset_records (batched above)
+        last_deposit_date = last_deposits.get(member_id)
         
         # If NO DEPOSIT - mark for immediate deletion
-        if not has_deposit:
+        if last_deposit_date is None:
             member_info = {
                 'id': member_id,
                 'customer_id': customer_id,
@@ -1660,19 +1670,28 @@ async def preview_reserved_member_cleanup(user: User = Depends(get_admin_user)):
     }
 
 
-@router.post("/scheduled-reports/reserved-member-cleanup-run")
-async def run_reserved_member_cleanup(user: User = Depends(get_admin_user)):
-    """Manually trigger the reserved member cleanup job"""
+@register_job('reserved_member_cleanup', concurrency=1, lease_seconds=300)
+async def run_reserved_member_cleanup_job(ctx: JobContext):
+    """Job: run the reserved member cleanup outside the request"""
+    await ctx.progress(0, 'Running reserved member cleanup')
     try:
         result = await process_reserved_member_cleanup()
-        return {
-            'success': True, 
-            'message': 'Reserved member cleanup completed successfully',
-            'warnings_sent': result.get('warnings_sent', 0) if result else 0,
-            'members_removed': result.get('members_removed', 0) if result else 0
-        }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Cleanup failed: {str(e)}")
+        raise RuntimeError(f"Cleanup failed: {str(e)}")
+    return {
+        'success': True, 
+        'message': 'Reserved member cleanup completed successfully',
+        'warnings_sent': result.get('warnings_sent', 0) if result else 0,
+        'members_removed': result.get('members_removed', 0) if result else 0,
+        'duration_ms': result.get('duration_ms') if result else None,
+        'phases': result.get('phases', {}) if result else {}
+    }
+
+
+@router.post("/scheduled-reports/reserved-member-cleanup-run")
+async def run_reserved_member_cleanup(wait: bool = True, user: User = Depends(get_admin_user)):
+    """Manually trigger the reserved member cleanup job (background job, see GET /jobs/{job_id})"""
+    return await submit_job('reserved_member_cleanup', {}, user, wait)
 
 
 # ==================== RESERVED MEMBER GRACE PERIOD CONFIG ====================
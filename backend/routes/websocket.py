@@ -1,15 +1,22 @@
 # WebSocket routes for real-time notifications
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import json
 import asyncio
 from datetime import datetime
 import jwt
-import os
-from .deps import JWT_SECRET  # Import from deps.py for consistency
+from .deps import JWT_SECRET, user_cache  # Import from deps.py for consistency
+from utils.realtime_pubsub import InProcessPubSub, create_pubsub
+from utils.activity_registry import activity_registry
 
 router = APIRouter(tags=["WebSocket"])
 
+# Per-socket send timeout; sockets that miss it are evicted
+SEND_TIMEOUT_SECONDS = 5
+
+# Pub/sub event kind telling every worker to drop a user from its auth cache
+USER_INVALIDATED_EVENT = 'user_invalidated'
+
 # Connection manager to handle multiple WebSocket connections
 class ConnectionManager:
     def __init__(self):
@@ -31,38 +38,81 @@ class ConnectionManager:
                 del self.active_connections[user_id]
         print(f"WebSocket disconnected for user {user_id}")
         
+    async def _send(self, user_id: str, websocket: WebSocket, message: dict) -> bool:
+        """Send to one socket; False if it failed or did not accept the frame in time"""
+        try:
+            await asyncio.wait_for(websocket.send_json(message), timeout=SEND_TIMEOUT_SECONDS)
+            return True
+        except Exception as e:
+            print(f"Error sending message to user {user_id}: {e!r}")
+            return False
+            
+    async def _evict(self, user_id: str, websocket: WebSocket):
+        """Drop a dead or stalled socket so later sends skip it"""
+        self.disconnect(websocket, user_id)
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), timeout=SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+                    
+    async def _fan_out(self, targets: List[Tuple[str, WebSocket]], message: dict):
+        """Send to all targets concurrently; one slow client cannot stall the others"""
+        if not targets:
+            return
+        results = await asyncio.gather(*(self._send(uid, ws, message) for uid, ws in targets))
+        dead = [target for target, ok in zip(targets, results) if not ok]
+        if dead:
+            await asyncio.gather(*(self._evict(uid, ws) for uid, ws in dead))
+        
     async def send_personal_message(self, message: dict, user_id: str):
         """Send message to all connections for a specific user"""
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"Error sending message to user {user_id}: {e}")
+        targets = [(user_id, ws) for ws in list(self.active_connections.get(user_id, []))]
+        await self._fan_out(targets, message)
                     
     async def broadcast_to_admins(self, message: dict):
         """Broadcast message to all admin connections"""
         # We'll need to track admin vs staff connections
         # For now, we send to all connections
-        for user_id, connections in self.active_connections.items():
-            for connection in connections:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"Error broadcasting to user {user_id}: {e}")
+        await self.broadcast(message)
                     
     async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients"""
-        for user_id, connections in self.active_connections.items():
-            for connection in connections:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"Error broadcasting: {e}")
+        """Broadcast message to all connected clients on this worker"""
+        targets = [
+            (user_id, ws)
+            for user_id, connections in list(self.active_connections.items())
+            for ws in list(connections)
+        ]
+        await self._fan_out(targets, message)
+        
+    async def dispatch_event(self, event: dict):
+        """Deliver a pub/sub event to this worker's matching sockets"""
+        if event.get('kind') == USER_INVALIDATED_EVENT:
+            user_cache.invalidate(event['user_id'])
+            return
+        if event.get('user_id'):
+            await self.send_personal_message(event['message'], event['user_id'])
+        else:
+            await self.broadcast(event['message'])
 
 # Global connection manager instance
 manager = ConnectionManager()
 
+# Cross-worker fan-out; in-process until start_realtime_pubsub() runs at startup
+realtime_pubsub = InProcessPubSub(manager.dispatch_event)
+
+
+async def start_realtime_pubsub(db):
+    """Switch to the configured pub/sub backend so notifications reach every worker"""
+    global realtime_pubsub
+    backend = create_pubsub(db, manager.dispatch_event)
+    await backend.start()
+    realtime_pubsub = backend
+    return backend.name
+
+
+async def stop_realtime_pubsub():
+    await realtime_pubsub.stop()
+
 def verify_ws_token(token: str) -> dict:
     """Verify JWT token from WebSocket connection"""
     try:
@@ -109,14 +159,16 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(None)):
                 # Wait for messages from client (heartbeat/ping)
                 data = await asyncio.wait_for(websocket.receive_text(), timeout=60)
                 
-                # Handle ping/pong for keepalive
+                # Handle ping/pong for keepalive (a ping also counts as user activity)
                 if data == "ping":
+                    activity_registry.touch(user_id)
                     await websocket.send_text("pong")
                 else:
                     # Handle other messages if needed
                     try:
                         message = json.loads(data)
                         if message.get("type") == "ping":
+                            activity_registry.touch(user_id)
                             await websocket.send_json({"type": "pong", "timestamp": datetime.now().isoformat()})
                     except json.JSONDecodeError:
                         pass
@@ -124,27 +176,36 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(None)):
             except asyncio.TimeoutError:
                 # Send heartbeat to check if connection is still alive
                 try:
-                    await websocket.send_json({"type": "heartbeat", "timestamp": datetime.now().isoformat()})
+                    await asyncio.wait_for(
+                        websocket.send_json({"type": "heartbeat", "timestamp": datetime.now().isoformat()}),
+                        timeout=SEND_TIMEOUT_SECONDS
+                    )
                 except Exception:
                     break
                     
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
+        pass
     except Exception as e:
         print(f"WebSocket error for user {user_id}: {e}")
+    finally:
+        # Also covers the heartbeat break, which previously left the socket registered
         manager.disconnect(websocket, user_id)
 
 # Helper function to send notification via WebSocket (to be used by other routes)
 async def send_realtime_notification(user_id: str, notification: dict):
     """Send a real-time notification to a specific user"""
-    await manager.send_personal_message({
-        "type": "notification",
-        "data": notification
-    }, user_id)
+    await realtime_pubsub.publish({
+        "user_id": user_id,
+        "message": {"type": "notification", "data": notification}
+    })
+
+async def publish_user_invalidated(user_id: str):
+    """Tell every worker to drop a user from its auth cache (see deps.invalidate_cached_user)"""
+    await realtime_pubsub.publish({"kind": USER_INVALIDATED_EVENT, "user_id": user_id})
 
 async def broadcast_notification(notification: dict):
     """Broadcast a notification to all connected users"""
-    await manager.broadcast({
-        "type": "notification",
-        "data": notification
+    await realtime_pubsub.publish({
+        "user_id": None,
+        "message": {"type": "notification", "data": notification}
     })
@@ -0,0 +1,67 @@
+"""
+Row Identifiers Backfill Script
+Persists the normalized row_identifiers array on memberwd_records,
+bonanza_records and customer_records (and username_normalized on
+customer_records), then resyncs reserved statuses through the new index.
+
+Usage:
+    python backfill_row_identifiers.py            # only records missing row_identifiers
+    python backfill_row_identifiers.py --all      # recompute for every record
+"""
+
+import asyncio
+import os
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.reserved_check import (  # noqa: E402
+    RESERVED_SYNC_COLLECTIONS,
+    ROW_IDENTIFIERS_FIELD,
+    USERNAME_FIELD,
+    backfill_row_identifiers,
+    backfill_usernames,
+    ensure_row_identifiers_indexes,
+    sync_all_reserved_statuses,
+)
+
+
+async def main(recompute_all: bool) -> int:
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('DB_NAME', 'test_database')
+
+    print(f"Connecting to: {mongo_url}")
+    print(f"Database: {db_name}")
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        await ensure_row_identifiers_indexes(db)
+
+        for collection_name in RESERVED_SYNC_COLLECTIONS:
+            if recompute_all:
+                await db[collection_name].update_many({}, {'$unset': {ROW_IDENTIFIERS_FIELD: ''}})
+            updated = await backfill_row_identifiers(db, collection_name)
+            print(f"✅ {collection_name}: {updated} records backfilled")
+
+        if recompute_all:
+            await db.customer_records.update_many({}, {'$unset': {USERNAME_FIELD: '', ROW_IDENTIFIERS_FIELD: ''}})
+        updated = await backfill_usernames(db)
+        print(f"✅ customer_records: {updated} usernames backfilled")
+        updated = await backfill_row_identifiers(db, 'customer_records')
+        print(f"✅ customer_records: {updated} records backfilled")
+
+        result = await sync_all_reserved_statuses(db)
+        print(f"🔧 Reserved resync: {result['marked_reserved']} marked reserved, "
+              f"{result['marked_available']} marked available")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    args = set(sys.argv[1:])
+    sys.exit(asyncio.run(main(recompute_all='--all' in args)))
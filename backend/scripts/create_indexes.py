@@ -1,185 +1,93 @@
 """
-MongoDB Index Creation Script
-Creates indexes for optimal query performance on CRM collections.
-
-Run this script to create indexes:
-    python create_indexes.py
-
-Indexes are designed based on common query patterns:
-- staff_id: Most queries filter by staff
-- status: Filter by record status (available, assigned, invalid)
-- record_date: Date-based filtering for reports
-- product_id: Product filtering
-- database_id: Database association
-- customer_id_normalized: Customer lookup and deduplication
+MongoDB Index Creation / Query-Plan Verification Script
+Applies the index manifest (utils/index_manifest.py) -- the same one the API
+applies at startup -- and checks that the hot route queries use an index.
+
+Usage:
+    python create_indexes.py                       # build missing indexes
+    python create_indexes.py --dry-run             # report the diff only
+    python create_indexes.py --verify              # explain() the query catalog; exit 1 on a COLLSCAN
+    python create_indexes.py --verify --min-docs 50000   # only fail on collections this large
+
+Existing indexes with the same keys (whatever their name) are left alone;
+indexes not in the manifest are listed as unmanaged and never dropped.
 """
 
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.index_manifest import (  # noqa: E402
+    COLLSCAN_THRESHOLD,
+    apply_index_manifest,
+    verify_query_plans,
+)
+
+
+def print_manifest_report(summary: dict, dry_run: bool):
+    for collection_name, report in summary['collections'].items():
+        print(f"{collection_name}:")
+        for name in report['present']:
+            print(f"  ⏭️  {name} (already exists)")
+        for spec in report['missing']:
+            if spec['name'] in report['created']:
+                print(f"  ✅ {spec['name']} created")
+            elif spec['name'] in report['failed']:
+                print(f"  ❌ {spec['name']} failed: {report['failed'][spec['name']]}")
+            else:
+                print(f"  ➕ {spec['name']} missing" + (' (dry run)' if dry_run else ''))
+        for conflict in report['conflicts']:
+            print(f"  ❌ {conflict['name']}: {conflict['reason']}")
+        for name in report['unmanaged']:
+            print(f"  ❔ {name} (not in the manifest)")
+    for collection_name, error in summary['errors'].items():
+        print(f"❌ {collection_name}: {error}")
+
+    print(f"\n=== SUMMARY ===")
+    print(f"Indexes created: {summary['created']}")
+    print(f"Indexes failed: {summary['failed']}")
+    print(f"Indexes missing: {summary['missing'] - summary['created'] - summary['failed']}")
+    print(f"Conflicts: {summary['conflicts']}")
 
 
-async def create_indexes():
+async def main(dry_run: bool, verify: bool, min_docs: int) -> int:
     mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
     db_name = os.environ.get('DB_NAME', 'test_database')
-    
+
     print(f"Connecting to: {mongo_url}")
     print(f"Database: {db_name}")
-    
+
     client = AsyncIOMotorClient(mongo_url)
     db = client[db_name]
-    
-    # Define indexes for each collection
-    indexes_config = {
-        # ==================== OMSET RECORDS ====================
-        'omset_records': [
-            # Most common query: by staff and date
-            {'keys': [('staff_id', 1), ('record_date', -1)], 'name': 'staff_date_idx'},
-            # Product filtering
-            {'keys': [('product_id', 1), ('record_date', -1)], 'name': 'product_date_idx'},
-            # Customer lookup for NDP/RDP calculation
-            {'keys': [('customer_id_normalized', 1), ('staff_id', 1)], 'name': 'customer_staff_idx'},
-            # Date range queries
-            {'keys': [('record_date', -1)], 'name': 'date_idx'},
-        ],
-        
-        # ==================== CUSTOMER RECORDS (Normal DB) ====================
-        'customer_records': [
-            # Staff assignment queries
-            {'keys': [('staff_id', 1), ('status', 1)], 'name': 'staff_status_idx'},
-            # Database filtering
-            {'keys': [('database_id', 1), ('status', 1)], 'name': 'database_status_idx'},
-            # Customer reservation lookup
-            {'keys': [('customer_id_normalized', 1), ('product_id', 1)], 'name': 'customer_product_idx'},
-            # Status filtering
-            {'keys': [('status', 1)], 'name': 'status_idx'},
-        ],
-        
-        # ==================== BONANZA RECORDS ====================
-        'bonanza_records': [
-            # Staff assignment queries
-            {'keys': [('staff_id', 1), ('status', 1)], 'name': 'staff_status_idx'},
-            # Database filtering
-            {'keys': [('database_id', 1), ('status', 1)], 'name': 'database_status_idx'},
-            # Customer reservation lookup
-            {'keys': [('customer_id_normalized', 1), ('product_id', 1)], 'name': 'customer_product_idx'},
-            # Status filtering
-            {'keys': [('status', 1)], 'name': 'status_idx'},
-        ],
-        
-        # ==================== MEMBER WD RECORDS ====================
-        'memberwd_records': [
-            # Staff assignment queries
-            {'keys': [('staff_id', 1), ('status', 1)], 'name': 'staff_status_idx'},
-            # Batch filtering
-            {'keys': [('batch_id', 1), ('status', 1)], 'name': 'batch_status_idx'},
-            # Database filtering
-            {'keys': [('database_id', 1), ('status', 1)], 'name': 'database_status_idx'},
-            # Customer reservation lookup
-            {'keys': [('customer_id_normalized', 1), ('product_id', 1)], 'name': 'customer_product_idx'},
-            # Status filtering
-            {'keys': [('status', 1)], 'name': 'status_idx'},
-        ],
-        
-        # ==================== USERS ====================
-        'users': [
-            # Email lookup for login
-            {'keys': [('email', 1)], 'name': 'email_idx', 'unique': True},
-            # Role filtering
-            {'keys': [('role', 1), ('status', 1)], 'name': 'role_status_idx'},
-        ],
-        
-        # ==================== DATABASES ====================
-        'databases': [
-            # Product filtering
-            {'keys': [('product_id', 1)], 'name': 'product_idx'},
-        ],
-        
-        'bonanza_databases': [
-            # Product filtering
-            {'keys': [('product_id', 1)], 'name': 'product_idx'},
-        ],
-        
-        'memberwd_databases': [
-            # Product filtering
-            {'keys': [('product_id', 1)], 'name': 'product_idx'},
-        ],
-        
-        # ==================== DAILY SUMMARIES ====================
-        'daily_summaries': [
-            # Date lookup
-            {'keys': [('date', -1)], 'name': 'date_idx', 'unique': True},
-        ],
-        
-        # ==================== NOTIFICATIONS ====================
-        'notifications': [
-            # User notifications lookup
-            {'keys': [('user_id', 1), ('read', 1), ('created_at', -1)], 'name': 'user_read_date_idx'},
-        ],
-        
-        # ==================== ATTENDANCE ====================
-        'attendance_records': [
-            # Staff attendance lookup
-            {'keys': [('staff_id', 1), ('date', -1)], 'name': 'staff_date_idx'},
-            # Date range queries
-            {'keys': [('date', -1)], 'name': 'date_idx'},
-        ],
-        
-        # ==================== DOWNLOAD REQUESTS ====================
-        'download_requests': [
-            # Staff requests lookup
-            {'keys': [('staff_id', 1), ('status', 1), ('created_at', -1)], 'name': 'staff_status_date_idx'},
-            # Status filtering
-            {'keys': [('status', 1), ('created_at', -1)], 'name': 'status_date_idx'},
-        ],
-    }
-    
-    print("\n=== CREATING INDEXES ===\n")
-    
-    total_created = 0
-    total_skipped = 0
-    
-    for collection_name, indexes in indexes_config.items():
-        collection = db[collection_name]
-        existing_indexes = await collection.index_information()
-        existing_names = set(existing_indexes.keys())
-        
-        print(f"{collection_name}:")
-        
-        for idx_config in indexes:
-            idx_name = idx_config['name']
-            
-            if idx_name in existing_names:
-                print(f"  ⏭️  {idx_name} (already exists)")
-                total_skipped += 1
-                continue
-            
-            try:
-                # Build index options
-                options = {'name': idx_name}
-                if idx_config.get('unique'):
-                    options['unique'] = True
-                
-                await collection.create_index(idx_config['keys'], **options)
-                print(f"  ✅ {idx_name} created")
-                total_created += 1
-            except Exception as e:
-                print(f"  ❌ {idx_name} failed: {e}")
-    
-    print(f"\n=== SUMMARY ===")
-    print(f"Indexes created: {total_created}")
-    print(f"Indexes skipped (already exist): {total_skipped}")
-    
-    # Verify indexes were created
-    print(f"\n=== VERIFICATION ===")
-    for collection_name in indexes_config.keys():
-        indexes = await db[collection_name].index_information()
-        idx_count = len([k for k in indexes.keys() if k != '_id_'])
-        print(f"  {collection_name}: {idx_count} custom indexes")
-    
-    client.close()
-    print("\n✅ Index creation complete!")
+
+    try:
+        if verify:
+            report = await verify_query_plans(db, threshold=min_docs)
+            print(f"\n=== QUERY PLANS ({report['checked']} queries) ===")
+            for name in report['scans_below_threshold']:
+                print(f"  ⚠️  {name}: COLLSCAN (collection below {min_docs} documents)")
+            for failure in report['failures']:
+                print(f"  ❌ {failure['name']}: COLLSCAN on {failure['collection']} ({failure['documents']} documents)")
+            if report['ok']:
+                print("✅ No collection scans on large collections")
+                return 0
+            return 1
+
+        print("\n=== APPLYING INDEX MANIFEST ===\n")
+        summary = await apply_index_manifest(db, dry_run=dry_run)
+        print_manifest_report(summary, dry_run)
+        return 1 if summary['conflicts'] or summary['failed'] or summary['errors'] else 0
+    finally:
+        client.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(create_indexes())
+    args = sys.argv[1:]
+    min_docs = COLLSCAN_THRESHOLD
+    if '--min-docs' in args:
+        min_docs = int(args[args.index('--min-docs') + 1])
+    sys.exit(asyncio.run(main('--dry-run' in args, '--verify' in args, min_docs)))
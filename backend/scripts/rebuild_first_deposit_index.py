@@ -0,0 +1,70 @@
+"""
+Customer First-Deposit Index Rebuild / Verify Script
+Maintains the customer_first_deposit collection used for NDP/RDP classification.
+
+Usage:
+    python rebuild_first_deposit_index.py            # rebuild from omset_records
+    python rebuild_first_deposit_index.py --verify   # report drift only
+    python rebuild_first_deposit_index.py --verify --repair   # rebuild if drift is found
+"""
+
+import asyncio
+import os
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.first_deposit_index import (  # noqa: E402
+    ensure_first_deposit_indexes,
+    rebuild_first_deposit_index,
+    verify_first_deposit_index,
+)
+from utils.rebuild_guard import RebuildInProgressError  # noqa: E402
+
+
+async def main(verify: bool, repair: bool) -> int:
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('DB_NAME', 'test_database')
+    
+    print(f"Connecting to: {mongo_url}")
+    print(f"Database: {db_name}")
+    
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    
+    try:
+        await ensure_first_deposit_indexes(db)
+        
+        if not verify:
+            result = await rebuild_first_deposit_index(db)
+            print(f"✅ Rebuilt customer_first_deposit with {result['entries']} entries")
+            return 0
+        
+        report = await verify_first_deposit_index(db)
+        print(f"Expected entries: {report['expected_entries']}")
+        print(f"Indexed entries:  {report['indexed_entries']}")
+        print(f"Missing: {report['missing']}  Stale: {report['stale']}  Mismatched: {report['mismatched']}")
+        
+        if report['ok']:
+            print("✅ Index is in sync with omset_records")
+            return 0
+        
+        if repair:
+            result = await rebuild_first_deposit_index(db)
+            print(f"🔧 Drift repaired, rebuilt with {result['entries']} entries")
+            return 0
+        
+        print("❌ Index drift detected (run with --repair to rebuild)")
+        return 1
+    except RebuildInProgressError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    args = set(sys.argv[1:])
+    sys.exit(asyncio.run(main(verify='--verify' in args, repair='--repair' in args)))
@@ -28,9 +28,12 @@ def get_jakarta_date_string():
     return get_jakarta_now().strftime('%Y-%m-%d')
 
 # Database connection with resilience and auto-recovery settings
+# command_listener attributes every MongoDB round trip to the request that issued it (/metrics)
+from utils.request_metrics import command_listener
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(
     mongo_url,
+    event_listeners=[command_listener],
     serverSelectionTimeoutMS=5000,  # 5 second timeout for server selection
     connectTimeoutMS=10000,  # 10 second connection timeout
     socketTimeoutMS=30000,  # 30 second socket timeout
@@ -77,6 +80,8 @@ from routes.fees import router as fees_router
 from routes.bonus_check import router as bonus_check_router
 from routes.memberwd_diagnostics import router as memberwd_diagnostics_router
 from routes.data_sync import router as data_sync_router
+from routes.jobs import router as jobs_router
+from routes.metrics import router as metrics_router
 
 # Initialize database connection for all route modules
 set_database(db)
@@ -109,6 +114,8 @@ api_router.include_router(fees_router)
 api_router.include_router(bonus_check_router)
 api_router.include_router(memberwd_diagnostics_router)
 api_router.include_router(data_sync_router)
+api_router.include_router(jobs_router)
+api_router.include_router(metrics_router)
 # WebSocket routes are added at the app level (not under /api)
 app.include_router(websocket_router)
 
@@ -119,6 +126,13 @@ async def health_check():
     """Health check endpoint for Kubernetes liveness/readiness probes"""
     return {"status": "healthy", "service": "crm-pro-api"}
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-route latency histograms, MongoDB command counts/time and response sizes (Prometheus text format, per worker)"""
+    from fastapi.responses import PlainTextResponse
+    from utils.request_metrics import metrics_registry
+    return PlainTextResponse(metrics_registry.prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @api_router.get("/health")
 async def api_health_check():
     """Health check endpoint accessible via /api/health for ingress routing"""
@@ -136,6 +150,20 @@ async def api_health_check():
         health_status["status"] = "degraded"
         health_status["database"] = f"error: {str(e)[:50]}"
     
+    # Auth user cache counters (per worker)
+    from routes.deps import user_cache
+    health_status["user_cache"] = user_cache.stats()
+    from utils.reserved_snapshot import reserved_snapshot_stats
+    health_status["reserved_snapshot"] = reserved_snapshot_stats()
+    from utils.activity_registry import activity_registry
+    health_status["activity_registry"] = activity_registry.stats()
+    from utils.executors import executor_stats
+    health_status["executors"] = executor_stats()
+    from utils.job_queue import job_worker
+    health_status["job_worker"] = job_worker.stats()
+    from utils.index_manifest import index_build_stats
+    health_status["index_build"] = index_build_stats()
+    
     return health_status
 
 @api_router.get("/server-time")
@@ -157,6 +185,19 @@ limiter = Limiter(key_func=get_remote_address, default_limits=["120/minute"])
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Saturated / timed-out executor jobs (exports, password hashing) are transient: ask the client to retry
+from utils.executors import ExecutorBusyError, ExecutorTimeoutError
+
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request: Request, exc: ExecutorBusyError):
+    logger.warning(f"Executor busy on {request.method} {request.url.path}: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Server is busy, please try again shortly."})
+
+@app.exception_handler(ExecutorTimeoutError)
+async def executor_timeout_handler(request: Request, exc: ExecutorTimeoutError):
+    logger.warning(f"Executor timeout on {request.method} {request.url.path}: {exc}")
+    return JSONResponse(status_code=504, content={"detail": "The operation took too long, please try again."})
+
 # Global exception handler - catches ALL unhandled errors across ALL routes
 # Returns clean JSON instead of crashing with 500 Internal Server Error
 @app.exception_handler(Exception)
@@ -179,14 +220,21 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 app.include_router(api_router)
 
+from utils.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset paging headers (utils/pagination.py) must be readable by the browser
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
 
+# Outermost: per-route latency / DB time / response size metrics and ?__profile=1 for admins
+from utils.request_metrics import RequestMetricsMiddleware
+app.add_middleware(RequestMetricsMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -215,39 +263,28 @@ async def startup_event():
                 import asyncio
                 await asyncio.sleep(2)  # Wait 2 seconds before retry
     
-    # Create indexes for performance-critical queries
+    # Build missing indexes from the manifest (utils/index_manifest.py) without blocking startup
     try:
-        # omset_records indexes
-        await db.omset_records.create_index([("staff_id", 1), ("customer_id_normalized", 1), ("product_id", 1), ("record_date", 1)])
-        await db.omset_records.create_index([("record_date", 1)])
-        await db.omset_records.create_index([("product_id", 1), ("record_date", 1)])
-        await db.omset_records.create_index([("approval_status", 1)])
-        
-        # leave_requests indexes (queried by staff_id, status, date)
-        await db.leave_requests.create_index([("staff_id", 1), ("date", 1)])
-        await db.leave_requests.create_index([("status", 1), ("created_at", -1)])
-        
-        # izin_records indexes (queried by staff_id, status, date)
-        await db.izin_records.create_index([("staff_id", 1), ("status", 1)])
-        await db.izin_records.create_index([("date", 1), ("status", 1)])
-        
-        # memberwd_batches indexes (queried by staff_id, database_id)
-        await db.memberwd_batches.create_index([("staff_id", 1)])
-        await db.memberwd_batches.create_index([("database_id", 1)])
-        
-        # omset_trash indexes (queried by id, staff_id)
-        await db.omset_trash.create_index([("staff_id", 1), ("deleted_at", -1)])
-        
-        # admin_notifications indexes
-        await db.admin_notifications.create_index([("read", 1), ("created_at", -1)])
-        
-        # inventory indexes
-        await db.inventory_items.create_index([("status", 1)])
-        await db.inventory_assignments.create_index([("staff_id", 1), ("status", 1)])
-        
-        logger.info("✅ Database indexes created/verified")
+        from utils.index_manifest import start_index_build
+        start_index_build(db)
+    except Exception as e:
+        logger.error(f"Error starting index build: {e}")
+    
+    # Background job claims and de-duplication rely on unique indexes; build them before the worker starts
+    try:
+        from utils.job_queue import ensure_job_indexes
+        await ensure_job_indexes(db)
+    except Exception as e:
+        logger.error(f"Error ensuring background job indexes: {e}")
+    
+    # One-time builds and backfills (first-deposit index, rollups, deposit profiles, lookup keys)
+    # run as a queued job so they never block startup; every worker enqueues it, one runs it
+    try:
+        from utils.startup_maintenance import enqueue_startup_maintenance
+        job = await enqueue_startup_maintenance(db)
+        logger.info(f"Startup maintenance queued as job {job['id']}")
     except Exception as e:
-        logger.error(f"Error creating indexes: {e}")
+        logger.error(f"Error queueing startup maintenance: {e}")
 
     
     # Ensure master admin user exists
@@ -256,6 +293,30 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Error ensuring master admin exists: {e}")
     
+    # Write-behind flush of heartbeat activity to users.last_activity
+    try:
+        from utils.activity_registry import activity_registry
+        activity_registry.start(db)
+        logger.info(f"Activity registry flushing every {activity_registry.flush_seconds}s")
+    except Exception as e:
+        logger.error(f"Error starting activity registry: {e}")
+    
+    # Worker loop running queued admin jobs (repairs, migrations, summary backfills)
+    try:
+        from utils.job_queue import job_worker
+        job_worker.start(db)
+        logger.info(f"Background job worker polling every {job_worker.poll_seconds}s")
+    except Exception as e:
+        logger.error(f"Error starting background job worker: {e}")
+    
+    # Cross-worker WebSocket fan-out (REALTIME_PUBSUB_BACKEND=mongo for multi-worker deployments)
+    try:
+        from routes.websocket import start_realtime_pubsub
+        backend_name = await start_realtime_pubsub(db)
+        logger.info(f"Realtime pub/sub backend: {backend_name}")
+    except Exception as e:
+        logger.error(f"Error starting realtime pub/sub: {e}")
+    
     try:
         await init_scheduler()
         logger.info("Scheduler initialized")
@@ -332,4 +393,21 @@ async def ensure_master_admin_exists():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    try:
+        from routes.websocket import stop_realtime_pubsub
+        await stop_realtime_pubsub()
+    except Exception as e:
+        logger.error(f"Error stopping realtime pub/sub: {e}")
+    try:
+        from utils.activity_registry import activity_registry
+        await activity_registry.stop()
+    except Exception as e:
+        logger.error(f"Error flushing activity registry: {e}")
+    try:
+        from utils.job_queue import job_worker
+        await job_worker.stop()
+    except Exception as e:
+        logger.error(f"Error stopping background job worker: {e}")
+    from utils.executors import shutdown_executors
+    shutdown_executors()
     client.close()
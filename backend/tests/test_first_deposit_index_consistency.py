@@ -0,0 +1,228 @@
+"""
+Test First-Deposit Index Consistency
+
+customer_first_deposit is maintained incrementally by recalculate_customer_type()
+(called through sync_omset_change()) from the OMSET write paths. After every kind
+of write the persisted index must equal a fresh scan of omset_records, i.e.
+verify_first_deposit_index() reports no missing, stale or mismatched entries.
+
+Legacy records without customer_id_normalized must be classified with the same
+key the Python normalize_customer_id() writes into the index.
+
+A write made while a full rebuild runs must survive the rebuild's swap, and a
+second rebuild must be refused while one holds the lease.
+"""
+import pytest
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+
+import sys
+sys.path.insert(0, '/app/backend')
+from utils.helpers import normalize_customer_id
+import utils.first_deposit_index as first_deposit_index
+from utils.first_deposit_index import (
+    FIRST_DEPOSIT_COLLECTION, ndp_classification_stages, rebuild_first_deposit_index,
+    verify_first_deposit_index
+)
+from utils.omset_rollup import sync_omset_change
+from utils.rebuild_guard import REBUILD_JOURNAL_COLLECTION, RebuildInProgressError
+
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = 'test_first_deposit_index_db'
+
+COLLECTIONS = [
+    'omset_records', FIRST_DEPOSIT_COLLECTION, 'omset_daily_rollup',
+    'customer_deposit_profile', 'system_settings', REBUILD_JOURNAL_COLLECTION
+]
+
+STAFF_ID = 'staff-fdi-1'
+PRODUCT_ID = 'product-fdi-1'
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    """Create event loop for async tests"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+async def test_db():
+    """Setup test database connection"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    for name in COLLECTIONS:
+        await db[name].delete_many({})
+
+    yield db
+
+    for name in COLLECTIONS:
+        await db[name].delete_many({})
+    client.close()
+
+
+def make_record(customer_id, record_date, keterangan=None, approval_status='approved'):
+    return {
+        'id': str(uuid.uuid4()),
+        'product_id': PRODUCT_ID,
+        'product_name': 'Product FDI',
+        'staff_id': STAFF_ID,
+        'staff_name': 'FDI Staff',
+        'record_date': record_date,
+        'customer_name': customer_id,
+        'customer_id': customer_id,
+        'customer_id_normalized': normalize_customer_id(customer_id),
+        'nominal': 100000,
+        'depo_kelipatan': 1.0,
+        'depo_total': 100000,
+        'keterangan': keterangan,
+        'approval_status': approval_status,
+        'created_at': datetime.now().isoformat()
+    }
+
+
+async def sync(db, record):
+    await sync_omset_change(
+        db, record['staff_id'], record['customer_id'], record['product_id'], [record['record_date']]
+    )
+
+
+async def assert_index_consistent(db, step):
+    report = await verify_first_deposit_index(db)
+    assert report['ok'], f"First-deposit index drifted after {step}: {report}"
+
+
+async def first_date(db, customer_id):
+    entry = await db[FIRST_DEPOSIT_COLLECTION].find_one({
+        'staff_id': STAFF_ID,
+        'customer_id_normalized': normalize_customer_id(customer_id),
+        'product_id': PRODUCT_ID
+    })
+    return entry['first_date'] if entry else None
+
+
+class TestFirstDepositIndexConsistency:
+    """The incrementally maintained index matches a fresh scan after every write path"""
+
+    @pytest.mark.asyncio
+    async def test_index_consistent_across_write_paths(self, test_db):
+        db = test_db
+
+        # Create: tambahan records never set the first deposit
+        first = make_record('CUST-1', '2025-02-07')
+        tambahan = make_record('CUST-1', '2025-02-03', keterangan='Tambahan')
+        for record in (first, tambahan):
+            await db.omset_records.insert_one(dict(record))
+            await sync(db, record)
+        await assert_index_consistent(db, 'create')
+        assert await first_date(db, 'CUST-1') == '2025-02-07'
+
+        # Out-of-order create moves the first deposit back
+        earlier = make_record('CUST-1', '2025-02-05')
+        await db.omset_records.insert_one(dict(earlier))
+        await sync(db, earlier)
+        await assert_index_consistent(db, 'out-of-order create')
+        assert await first_date(db, 'CUST-1') == '2025-02-05'
+
+        # Edit customer_id: the old customer keeps its remaining first deposit,
+        # the new customer gets one
+        await db.omset_records.update_one(
+            {'id': first['id']},
+            {'$set': {'customer_id': 'CUST-2', 'customer_id_normalized': normalize_customer_id('CUST-2')}}
+        )
+        await sync(db, first)
+        await sync(db, {**first, 'customer_id': 'CUST-2'})
+        await assert_index_consistent(db, 'customer edit')
+        assert await first_date(db, 'CUST-2') == '2025-02-07'
+
+        # Pending records are ignored until approved
+        pending = make_record('CUST-3', '2025-02-08', approval_status='pending')
+        await db.omset_records.insert_one(dict(pending))
+        await assert_index_consistent(db, 'pending create')
+        assert await first_date(db, 'CUST-3') is None
+        await db.omset_records.update_one({'id': pending['id']}, {'$set': {'approval_status': 'approved'}})
+        await sync(db, pending)
+        await assert_index_consistent(db, 'approve')
+        assert await first_date(db, 'CUST-3') == '2025-02-08'
+
+        # Decline deletes the pending record
+        declined = make_record('CUST-4', '2025-02-08', approval_status='pending')
+        await db.omset_records.insert_one(dict(declined))
+        await db.omset_records.delete_one({'id': declined['id']})
+        await sync(db, declined)
+        await assert_index_consistent(db, 'decline')
+
+        # Delete the first deposit: the entry falls back to nothing, then restore
+        await db.omset_records.delete_one({'id': earlier['id']})
+        await sync(db, earlier)
+        await assert_index_consistent(db, 'delete')
+        assert await first_date(db, 'CUST-1') is None
+
+        await db.omset_records.insert_one(dict(earlier))
+        await sync(db, earlier)
+        await assert_index_consistent(db, 'restore')
+        assert await first_date(db, 'CUST-1') == '2025-02-05'
+
+    @pytest.mark.asyncio
+    async def test_legacy_customer_id_classified_like_python(self, test_db):
+        db = test_db
+
+        # Legacy record: no customer_id_normalized, ID with spaces and punctuation
+        legacy = make_record(' Cust.Legacy #7 ', '2025-03-01')
+        legacy.pop('customer_id_normalized')
+        await db.omset_records.insert_one(dict(legacy))
+        await rebuild_first_deposit_index(db)
+
+        assert normalize_customer_id(legacy['customer_id']) == 'custlegacy7'
+        assert await first_date(db, legacy['customer_id']) == '2025-03-01'
+
+        rows = await db.omset_records.aggregate([
+            {'$match': {'id': legacy['id']}},
+            *ndp_classification_stages(),
+        ]).to_list(1)
+        assert rows[0]['_cid'] == 'custlegacy7'
+        assert rows[0]['_is_ndp'] is True
+
+    @pytest.mark.asyncio
+    async def test_write_during_rebuild_is_replayed(self, test_db, monkeypatch):
+        db = test_db
+        late = make_record('CUST-LATE', '2025-04-01')
+        full_scan = first_deposit_index.compute_first_deposit_map
+
+        async def scan_then_write(db_, **filters):
+            result = await full_scan(db_, **filters)
+            if not filters:
+                # A write path runs after the rebuild scanned omset_records, before its rename
+                await db.omset_records.insert_one(dict(late))
+                await sync(db, late)
+            return result
+
+        monkeypatch.setattr(first_deposit_index, 'compute_first_deposit_map', scan_then_write)
+        result = await rebuild_first_deposit_index(db)
+        monkeypatch.undo()
+
+        assert result['replayed'] >= 1
+        assert await first_date(db, 'CUST-LATE') == '2025-04-01'
+        await assert_index_consistent(db, 'write during rebuild')
+        assert await db[REBUILD_JOURNAL_COLLECTION].count_documents({}) == 0
+
+    @pytest.mark.asyncio
+    async def test_rebuild_refused_while_another_runs(self, test_db):
+        db = test_db
+        lease = {
+            '_id': f'rebuild_lease:{FIRST_DEPOSIT_COLLECTION}',
+            'token': 'other-worker',
+            'expires_at': datetime.now(timezone.utc) + timedelta(minutes=5)
+        }
+        await db.system_settings.insert_one(lease)
+        try:
+            with pytest.raises(RebuildInProgressError):
+                await rebuild_first_deposit_index(db)
+        finally:
+            await db.system_settings.delete_one({'_id': lease['_id']})
@@ -0,0 +1,98 @@
+"""
+Test Keyset Pagination Helpers
+
+Unit tests for utils/pagination.py: cursor encoding round trips, rejection of
+malformed cursors or cursors built for another sort, and the "rows after the
+cursor" filter for ascending, descending and null sort values.
+"""
+import pytest
+from datetime import datetime
+
+import sys
+sys.path.insert(0, '/app/backend')
+from pymongo import ASCENDING, DESCENDING
+from utils.pagination import InvalidCursorError, decode_cursor, encode_cursor, keyset_filter
+
+
+class TestCursorEncoding:
+    """encode_cursor() / decode_cursor() round trips and validation"""
+
+    def test_round_trip_strings_numbers_and_null(self):
+        values = ['2025-02-07', 42, None, 'id-1']
+        assert decode_cursor(encode_cursor(values), 4) == values
+
+    def test_round_trip_datetime(self):
+        values = [datetime(2025, 2, 7, 10, 30), 'id-1']
+        assert decode_cursor(encode_cursor(values), 2) == values
+
+    def test_cursor_is_url_safe(self):
+        cursor = encode_cursor(['a/b+c?d=e', 'id-1'])
+        assert all(ch.isalnum() or ch in '-_' for ch in cursor)
+
+    @pytest.mark.parametrize('cursor', ['not-a-cursor!', '%%%', 'e30', 'bnVsbA'])
+    def test_malformed_cursor(self, cursor):
+        # 'e30' is base64 for {} and 'bnVsbA' for null: valid JSON, not a key list
+        with pytest.raises(InvalidCursorError):
+            decode_cursor(cursor, 2)
+
+    def test_wrong_key_count(self):
+        cursor = encode_cursor(['2025-02-07', 'id-1'])
+        with pytest.raises(InvalidCursorError):
+            decode_cursor(cursor, 3)
+        with pytest.raises(InvalidCursorError):
+            decode_cursor(cursor, 1)
+
+
+class TestKeysetFilter:
+    """keyset_filter() selects exactly the rows after the cursor"""
+
+    def test_ascending_keys(self):
+        sort = [('record_date', ASCENDING), ('id', ASCENDING)]
+        assert keyset_filter(sort, ['2025-02-07', 'id-5']) == {'$or': [
+            {'record_date': {'$gt': '2025-02-07'}},
+            {'$and': [{'record_date': '2025-02-07'}, {'id': {'$gt': 'id-5'}}]},
+        ]}
+
+    def test_descending_keys_include_nulls_after_values(self):
+        # Descending order puts missing/null values last, so they come after any value
+        sort = [('assigned_at', DESCENDING), ('id', DESCENDING)]
+        assert keyset_filter(sort, ['2025-02-07', 'id-5']) == {'$or': [
+            {'$or': [{'assigned_at': {'$lt': '2025-02-07'}}, {'assigned_at': None}]},
+            {'$and': [{'assigned_at': '2025-02-07'}, {'$or': [{'id': {'$lt': 'id-5'}}, {'id': None}]}]},
+        ]}
+
+    def test_null_value_ascending(self):
+        # Ascending order puts nulls first: every non-null value comes after
+        sort = [('assigned_at', ASCENDING), ('id', ASCENDING)]
+        assert keyset_filter(sort, [None, 'id-5']) == {'$or': [
+            {'assigned_at': {'$ne': None}},
+            {'$and': [{'assigned_at': None}, {'id': {'$gt': 'id-5'}}]},
+        ]}
+
+    def test_null_value_descending(self):
+        # Descending order puts nulls last: only the tie-breaker can move forward
+        sort = [('assigned_at', DESCENDING), ('id', DESCENDING)]
+        assert keyset_filter(sort, [None, 'id-5']) == {
+            '$and': [{'assigned_at': None}, {'$or': [{'id': {'$lt': 'id-5'}}, {'id': None}]}]
+        }
+
+    def test_mixed_directions(self):
+        sort = [('record_date', DESCENDING), ('created_at', ASCENDING), ('id', DESCENDING)]
+        result = keyset_filter(sort, ['2025-02-07', '2025-02-07T10:00:00', 'id-5'])
+        assert result == {'$or': [
+            {'$or': [{'record_date': {'$lt': '2025-02-07'}}, {'record_date': None}]},
+            {'$and': [{'record_date': '2025-02-07'}, {'created_at': {'$gt': '2025-02-07T10:00:00'}}]},
+            {'$and': [
+                {'record_date': '2025-02-07'},
+                {'created_at': '2025-02-07T10:00:00'},
+                {'$or': [{'id': {'$lt': 'id-5'}}, {'id': None}]},
+            ]},
+        ]}
+
+    def test_cursor_past_last_row_matches_nothing(self):
+        assert keyset_filter([('assigned_at', DESCENDING)], [None]) == {'_id': {'$exists': False}}
+
+    def test_decoded_cursor_feeds_filter(self):
+        sort = [('requested_at', DESCENDING), ('id', DESCENDING)]
+        values = decode_cursor(encode_cursor(['2025-02-07T10:00:00', 'id-5']), len(sort))
+        assert keyset_filter(sort, values) == keyset_filter(sort, ['2025-02-07T10:00:00', 'id-5'])
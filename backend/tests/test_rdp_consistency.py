@@ -20,6 +20,7 @@ import os
 import sys
 sys.path.insert(0, '/app/backend')
 from routes.daily_summary import generate_daily_summary, normalize_customer_id
+from utils.first_deposit_index import rebuild_first_deposit_index
 
 
 # Test database setup
@@ -46,6 +47,7 @@ async def test_db():
     await db.users.delete_many({})
     await db.products.delete_many({})
     await db.daily_summaries.delete_many({})
+    await db.customer_first_deposit.delete_many({})
     
     yield db
     
@@ -54,6 +56,7 @@ async def test_db():
     await db.users.delete_many({})
     await db.products.delete_many({})
     await db.daily_summaries.delete_many({})
+    await db.customer_first_deposit.delete_many({})
     client.close()
 
 
@@ -152,6 +155,8 @@ async def setup_test_data(test_db):
     }
     
     await db.omset_records.insert_many([record1, record2])
+    # NDP/RDP reads the persisted first-deposit index, so refresh it after direct inserts
+    await rebuild_first_deposit_index(db)
     
     return {
         'staff_id': staff_id,
@@ -297,6 +302,8 @@ class TestRDPConsistency:
             }
         ]
         await db.omset_records.insert_many(records)
+        # NDP/RDP reads the persisted first-deposit index, so refresh it after direct inserts
+        await rebuild_first_deposit_index(db)
         
         # Monkey-patch get_db
         import routes.daily_summary as ds_module
@@ -472,6 +479,8 @@ class TestRDPConsistency:
             }
         ]
         await db.omset_records.insert_many(today_records)
+        # NDP/RDP reads the persisted first-deposit index, so refresh it after direct inserts
+        await rebuild_first_deposit_index(db)
         
         # Generate summary
         import routes.daily_summary as ds_module
@@ -0,0 +1,288 @@
+"""
+Test Daily Rollup Consistency
+
+omset_daily_rollup is maintained incrementally by sync_omset_change() /
+refresh_daily_rollup() from the OMSET write paths. After every kind of write
+(create, out-of-order create, edit, approve, decline, delete, restore) the
+incrementally maintained rows must equal a fresh rebuild_daily_rollups().
+
+The write paths are replayed at the database level, followed by the same
+rollup hook the route calls.
+
+The rollup-backed /omset/summary must also return the same totals as the
+baseline computation over raw records, which counts a customer's depo once per
+(staff, customer, product) and day in each of the NDP / RDP buckets.
+"""
+import pytest
+import asyncio
+import uuid
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+
+import sys
+sys.path.insert(0, '/app/backend')
+from utils.helpers import normalize_customer_id
+from utils.omset_rollup import (
+    ROLLUP_COLLECTION, rebuild_daily_rollups, refresh_daily_rollup, sync_omset_change
+)
+from utils.deposit_profile import refresh_deposit_profile
+from utils.first_deposit_index import compute_first_deposit_map
+from utils.rebuild_guard import REBUILD_JOURNAL_COLLECTION
+from routes import deps
+from routes.deps import User
+from routes.omset import get_omset_summary
+
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = 'test_rollup_consistency_db'
+
+COLLECTIONS = [
+    'omset_records', 'omset_trash', 'customer_first_deposit',
+    ROLLUP_COLLECTION, 'customer_deposit_profile', 'system_settings', REBUILD_JOURNAL_COLLECTION
+]
+
+STAFF_ID = 'staff-rollup-1'
+PRODUCT_A = 'product-rollup-a'
+PRODUCT_B = 'product-rollup-b'
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    """Create event loop for async tests"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+async def test_db():
+    """Setup test database connection"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    for name in COLLECTIONS:
+        await db[name].delete_many({})
+
+    yield db
+
+    for name in COLLECTIONS:
+        await db[name].delete_many({})
+    client.close()
+
+
+def make_record(customer_id, record_date, nominal, product_id=PRODUCT_A, keterangan=None,
+                approval_status='approved', staff_id=STAFF_ID):
+    return {
+        'id': str(uuid.uuid4()),
+        'product_id': product_id,
+        'product_name': 'Product A' if product_id == PRODUCT_A else 'Product B',
+        'staff_id': staff_id,
+        'staff_name': f'Rollup Staff {staff_id}',
+        'record_date': record_date,
+        'customer_name': customer_id,
+        'customer_id': customer_id,
+        'customer_id_normalized': normalize_customer_id(customer_id),
+        'nominal': nominal,
+        'depo_kelipatan': 1.0,
+        'depo_total': nominal,
+        'keterangan': keterangan,
+        'approval_status': approval_status,
+        'created_at': datetime.now().isoformat()
+    }
+
+
+async def sync(db, record):
+    await sync_omset_change(
+        db, record['staff_id'], record['customer_id'], record['product_id'], [record['record_date']]
+    )
+
+
+async def rollup_rows(db):
+    rows = await db[ROLLUP_COLLECTION].find({}, {'_id': 0, 'updated_at': 0}).to_list(None)
+    return {(r['date'], r['staff_id'], r['product_id']): r for r in rows}
+
+
+async def assert_matches_rebuild(db, step):
+    incremental = await rollup_rows(db)
+    await rebuild_daily_rollups(db)
+    rebuilt = await rollup_rows(db)
+    assert incremental == rebuilt, f"Rollups drifted from a fresh rebuild after {step}"
+
+
+async def baseline_summary(db, start_date, end_date):
+    """The raw-record /omset/summary totals computation the rollups replace."""
+    records = await db.omset_records.find({
+        'record_date': {'$gte': start_date, '$lte': end_date},
+        '$or': [{'approval_status': 'approved'}, {'approval_status': {'$exists': False}}]
+    }, {'_id': 0}).sort('_id', 1).to_list(None)
+    first_dates = await compute_first_deposit_map(db)
+
+    total = {'total_nominal': 0, 'total_depo': 0, 'total_records': len(records), 'total_ndp': 0, 'total_rdp': 0}
+    daily, by_staff, by_product, seen = {}, {}, {}, set()
+    for r in records:
+        date, depo, nominal = r['record_date'], r.get('depo_total', 0) or 0, r.get('nominal', 0) or 0
+        cid = r.get('customer_id_normalized') or normalize_customer_id(r['customer_id'])
+        is_tambahan = 'tambahan' in (r.get('keterangan') or '').lower()
+        is_ndp = not is_tambahan and first_dates.get((r['staff_id'], cid, r['product_id'])) == date
+        bucket = 'ndp' if is_ndp else 'rdp'
+        total['total_nominal'] += nominal
+        total['total_depo'] += depo
+
+        day = daily.setdefault(date, {
+            'date': date, 'total_nominal': 0, 'total_depo': 0, 'count': 0,
+            'ndp_count': 0, 'rdp_count': 0, 'ndp_total': 0, 'rdp_total': 0
+        })
+        staff = by_staff.setdefault(r['staff_id'], {
+            'staff_id': r['staff_id'], 'staff_name': r['staff_name'], 'total_nominal': 0,
+            'total_depo': 0, 'count': 0, 'ndp_count': 0, 'rdp_count': 0
+        })
+        product = by_product.setdefault(r['product_id'], {
+            'product_id': r['product_id'], 'product_name': r['product_name'], 'total_nominal': 0,
+            'total_depo': 0, 'count': 0, 'ndp_count': 0, 'rdp_count': 0
+        })
+        for summary in (day, staff, product):
+            summary['total_nominal'] += nominal
+            summary['total_depo'] += depo
+            summary['count'] += 1
+
+        # Counted (and its depo taken) once per (staff, customer, product, date) and bucket
+        tuple_key = (bucket, r['staff_id'], cid, r['product_id'], date)
+        if tuple_key not in seen:
+            seen.add(tuple_key)
+            day[f'{bucket}_count'] += 1
+            day[f'{bucket}_total'] += depo
+            staff[f'{bucket}_count'] += 1
+            product[f'{bucket}_count'] += 1
+            total[f'total_{bucket}'] += 1
+
+    return {'total': total, 'daily': daily, 'by_staff': by_staff, 'by_product': by_product}
+
+
+class TestRollupConsistency:
+    """Incrementally maintained rollups match a fresh rebuild after every write path"""
+
+    @pytest.mark.asyncio
+    async def test_rollups_match_rebuild_across_write_paths(self, test_db):
+        db = test_db
+
+        # Create
+        first = make_record('CUST-1', '2025-02-07', 100000)
+        repeat = make_record('CUST-1', '2025-02-09', 200000)
+        tambahan = make_record('CUST-2', '2025-02-09', 50000, keterangan='tambahan')
+        other_product = make_record('CUST-1', '2025-02-09', 70000, product_id=PRODUCT_B)
+        for record in (first, repeat, tambahan, other_product):
+            await db.omset_records.insert_one(dict(record))
+            await sync(db, record)
+        await assert_matches_rebuild(db, 'create')
+
+        # Out-of-order create moves the first deposit date back
+        earlier = make_record('CUST-1', '2025-02-05', 30000)
+        await db.omset_records.insert_one(dict(earlier))
+        await sync(db, earlier)
+        await assert_matches_rebuild(db, 'out-of-order create')
+
+        # Edit nominal only (rollup + profile refresh, no NDP/RDP resync)
+        await db.omset_records.update_one(
+            {'id': repeat['id']}, {'$set': {'nominal': 250000, 'depo_total': 250000}}
+        )
+        await refresh_daily_rollup(db, repeat['record_date'], STAFF_ID, PRODUCT_A)
+        await refresh_deposit_profile(db, repeat['customer_id'], PRODUCT_A)
+        await assert_matches_rebuild(db, 'nominal edit')
+
+        # Edit customer_id: resync the old and the new customer
+        await db.omset_records.update_one(
+            {'id': tambahan['id']},
+            {'$set': {'customer_id': 'CUST-3', 'customer_id_normalized': normalize_customer_id('CUST-3')}}
+        )
+        await sync(db, tambahan)
+        await sync(db, {**tambahan, 'customer_id': 'CUST-3'})
+        await assert_matches_rebuild(db, 'customer edit')
+
+        # Pending create then approve
+        pending = make_record('CUST-4', '2025-02-09', 40000, approval_status='pending')
+        await db.omset_records.insert_one(dict(pending))
+        await assert_matches_rebuild(db, 'pending create')
+        await db.omset_records.update_one({'id': pending['id']}, {'$set': {'approval_status': 'approved'}})
+        await sync(db, pending)
+        await assert_matches_rebuild(db, 'approve')
+
+        # Pending create then decline (deleted)
+        declined = make_record('CUST-5', '2025-02-07', 60000, approval_status='pending')
+        await db.omset_records.insert_one(dict(declined))
+        await db.omset_records.delete_one({'id': declined['id']})
+        await sync(db, declined)
+        await assert_matches_rebuild(db, 'decline')
+
+        # Delete the first deposit record (moved to trash)
+        await db.omset_trash.insert_one(dict(earlier))
+        await db.omset_records.delete_one({'id': earlier['id']})
+        await sync(db, earlier)
+        await assert_matches_rebuild(db, 'delete')
+
+        # Restore it
+        trash_record = await db.omset_trash.find_one({'id': earlier['id']}, {'_id': 0})
+        await db.omset_records.insert_one(trash_record)
+        await db.omset_trash.delete_one({'id': earlier['id']})
+        await sync(db, earlier)
+        await assert_matches_rebuild(db, 'restore')
+
+    @pytest.mark.asyncio
+    async def test_ranged_rebuild_removes_rows_without_records(self, test_db):
+        db = test_db
+
+        record = make_record('CUST-9', '2025-03-01', 10000)
+        await db.omset_records.insert_one(dict(record))
+        await rebuild_daily_rollups(db, '2025-03-01', '2025-03-01')
+        assert (await rollup_rows(db)).get(('2025-03-01', STAFF_ID, PRODUCT_A)) is not None
+
+        # Record removed without the hook: a ranged rebuild drops the stale row
+        # and leaves rows outside the range alone
+        before_outside = {k: v for k, v in (await rollup_rows(db)).items() if k[0] != '2025-03-01'}
+        await db.omset_records.delete_one({'id': record['id']})
+        await rebuild_daily_rollups(db, '2025-03-01', '2025-03-01')
+        after = await rollup_rows(db)
+        assert ('2025-03-01', STAFF_ID, PRODUCT_A) not in after
+        assert {k: v for k, v in after.items() if k[0] != '2025-03-01'} == before_outside
+
+
+class TestSummaryMatchesBaseline:
+    """The rollup-backed /omset/summary returns the baseline raw-record totals"""
+
+    @pytest.mark.asyncio
+    async def test_summary_matches_raw_record_computation(self, test_db):
+        db = test_db
+        deps.set_database(db)
+        other_staff = 'staff-rollup-2'
+
+        records = [
+            # Two NDP records of one customer on its first day: the depo counts once
+            make_record('CUST-S1', '2025-05-01', 100000),
+            make_record('CUST-S1', '2025-05-01', 40000),
+            # A tambahan on the first day lands in the RDP bucket of the same day
+            make_record('CUST-S1', '2025-05-01', 15000, keterangan='Tambahan'),
+            # Several RDP records of one customer on a later day: the depo counts once
+            make_record('CUST-S1', '2025-05-02', 20000),
+            make_record('CUST-S1', '2025-05-02', 35000),
+            # Same customer with another staff and another product: separate tuples
+            make_record('CUST-S1', '2025-05-02', 50000, staff_id=other_staff),
+            make_record('CUST-S1', '2025-05-02', 60000, product_id=PRODUCT_B),
+            make_record('CUST-S2', '2025-05-02', 70000),
+            make_record('CUST-S3', '2025-05-02', 80000, approval_status='pending'),
+        ]
+        for record in records:
+            await db.omset_records.insert_one(dict(record))
+            await sync(db, record)
+
+        admin = User(email='admin@example.com', name='Admin', role='admin')
+        summary = await get_omset_summary(
+            product_id=None, staff_id=None, start_date='2025-05-01', end_date='2025-05-02', user=admin
+        )
+        expected = await baseline_summary(db, '2025-05-01', '2025-05-02')
+
+        assert summary['total'] == expected['total']
+        assert {d['date']: d for d in summary['daily']} == expected['daily']
+        assert {s['staff_id']: s for s in summary['by_staff']} == expected['by_staff']
+        assert {p['product_id']: p for p in summary['by_product']} == expected['by_product']
+        # The first NDP record's depo, not the sum of both
+        assert expected['daily']['2025-05-01']['ndp_total'] == 100000
@@ -44,6 +44,8 @@ from .db_operations import (
     validate_record,
     get_staff_assigned_records,
     create_notification,
+    bulk_write_chunked,
+    update_many_by_ids,
 )
 
 from .repair_helpers import (
@@ -87,6 +89,8 @@ __all__ = [
     'validate_record',
     'get_staff_assigned_records',
     'create_notification',
+    'bulk_write_chunked',
+    'update_many_by_ids',
     # From repair_helpers
     'check_database_health',
     'repair_database_records',
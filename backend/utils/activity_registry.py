@@ -0,0 +1,139 @@
+"""
+User Activity Registry
+Write-behind tracking of users.last_activity.
+
+Heartbeats (and WebSocket pings) only update an in-memory map; a background
+task flushes the coalesced latest timestamp per user to MongoDB in a single
+bulk_write every ACTIVITY_FLUSH_SECONDS. Readers merge the registry with the
+stored value, so this worker's users are always current and users served by
+other workers are at most one flush interval behind.
+
+Timestamps are Jakarta ISO strings (same format as before); $max keeps the
+newest value when several workers flush the same user.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+
+from utils.db_operations import bulk_write_chunked
+from utils.helpers import JAKARTA_TZ, get_jakarta_now
+
+
+ACTIVITY_FLUSH_SECONDS = 15
+
+
+def parse_activity_time(value) -> Optional[datetime]:
+    """Parse a stored ISO timestamp (naive values are treated as Jakarta time)."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=JAKARTA_TZ)
+    return parsed
+
+
+class ActivityRegistry:
+    """In-memory last-activity map with periodic flush to users.last_activity."""
+
+    def __init__(self, flush_seconds: float = ACTIVITY_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._latest: Dict[str, datetime] = {}
+        self._dirty: Dict[str, datetime] = {}
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self.touches = 0
+        self.flushed_writes = 0
+
+    def touch(self, user_id: str, when: Optional[datetime] = None) -> datetime:
+        """Record activity for user_id; persisted on the next flush."""
+        when = when or get_jakarta_now()
+        previous = self._latest.get(user_id)
+        if previous is None or when > previous:
+            self._latest[user_id] = when
+            self._dirty[user_id] = when
+        self.touches += 1
+        return when
+
+    def last_activity(self, user_id: str, stored=None) -> Optional[datetime]:
+        """Latest known activity: the newer of this registry and the stored value."""
+        seen = self._latest.get(user_id)
+        stored_dt = parse_activity_time(stored)
+        if seen is None:
+            return stored_dt
+        if stored_dt is None or seen > stored_dt:
+            return seen
+        return stored_dt
+
+    def last_activity_iso(self, user_id: str, stored=None) -> Optional[str]:
+        """Like last_activity, but returns the ISO string (stored string kept as-is when newest)."""
+        seen = self._latest.get(user_id)
+        if seen is None:
+            return stored
+        stored_dt = parse_activity_time(stored)
+        if stored_dt is not None and stored_dt >= seen:
+            return stored
+        return seen.isoformat()
+
+    async def flush(self, db=None) -> int:
+        """Write pending activity in one bulk_write; returns the number of users written."""
+        db = db if db is not None else self._db
+        if db is None or not self._dirty:
+            return 0
+
+        pending, self._dirty = self._dirty, {}
+        operations = [
+            UpdateOne({'id': user_id}, {'$max': {'last_activity': when.isoformat()}})
+            for user_id, when in pending.items()
+        ]
+        try:
+            await bulk_write_chunked(db.users, operations)
+        except Exception:
+            # Put the values back so the next flush retries them
+            for user_id, when in pending.items():
+                current = self._dirty.get(user_id)
+                if current is None or when > current:
+                    self._dirty[user_id] = when
+            raise
+        self.flushed_writes += len(operations)
+        return len(operations)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Activity flush failed: {e}")
+
+    def start(self, db):
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'tracked_users': len(self._latest),
+            'pending_users': len(self._dirty),
+            'touches': self.touches,
+            'flushed_writes': self.flushed_writes,
+        }
+
+
+# Process-wide registry used by heartbeat, WebSocket pings and activity readers
+activity_registry = ActivityRegistry()
@@ -3,11 +3,94 @@ Database Operations Helper Functions
 Common CRUD and validation operations for all record modules (Normal DB, Bonanza, MemberWD)
 """
 
+import re
 from datetime import datetime
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, Iterable, List, Tuple
 import uuid
 
+from pymongo import UpdateMany
+
 from utils.helpers import get_jakarta_now, normalize_customer_id
+from utils.first_deposit_index import lookup_first_deposit_dates, set_first_deposit
+
+
+# Max write operations sent per bulk_write round trip
+BULK_WRITE_CHUNK_SIZE = 1000
+# Max ids per {'$in': [...]} filter of a single UpdateMany
+BULK_ID_CHUNK_SIZE = 1000
+
+
+async def bulk_write_chunked(
+    collection,
+    operations: Iterable,
+    chunk_size: int = BULK_WRITE_CHUNK_SIZE,
+    ordered: bool = False
+) -> Dict[str, int]:
+    """
+    Execute write operations (UpdateOne/UpdateMany/...) with bulk_write in chunks.
+    
+    Args:
+        collection: Motor collection
+        operations: Iterable of pymongo write operations
+        chunk_size: Operations per bulk_write call
+        ordered: Stop on first error (default False: unordered, server may parallelize)
+        
+    Returns:
+        Dict with matched, modified and upserted counts and the number of round trips
+    """
+    totals = {'matched': 0, 'modified': 0, 'upserted': 0, 'batches': 0}
+    batch = []
+    
+    async def _flush():
+        result = await collection.bulk_write(batch, ordered=ordered)
+        totals['matched'] += result.matched_count
+        totals['modified'] += result.modified_count
+        totals['upserted'] += result.upserted_count
+        totals['batches'] += 1
+    
+    for op in operations:
+        batch.append(op)
+        if len(batch) >= chunk_size:
+            await _flush()
+            batch = []
+    if batch:
+        await _flush()
+    
+    return totals
+
+
+def build_id_update_ops(
+    ids: Iterable[str],
+    update: dict,
+    id_field: str = 'id',
+    chunk_size: int = BULK_ID_CHUNK_SIZE
+) -> List[UpdateMany]:
+    """Build UpdateMany operations applying the same update to ids, chunked by chunk_size."""
+    ids = list(ids)
+    return [
+        UpdateMany({id_field: {'$in': ids[i:i + chunk_size]}}, update)
+        for i in range(0, len(ids), chunk_size)
+    ]
+
+
+async def update_many_by_ids(
+    collection,
+    ids: Iterable[str],
+    update: dict,
+    id_field: str = 'id',
+    chunk_size: int = BULK_ID_CHUNK_SIZE
+) -> int:
+    """
+    Apply the same update to every record in ids using chunked, unordered bulk writes.
+    
+    Returns:
+        Number of matched records
+    """
+    ops = build_id_update_ops(ids, update, id_field=id_field, chunk_size=chunk_size)
+    if not ops:
+        return 0
+    result = await bulk_write_chunked(collection, ops)
+    return result['matched']
 
 
 # Reusable approval filter: only include approved records (or records without approval_status field)
@@ -30,13 +113,17 @@ def add_approved_filter(query: dict) -> dict:
 
 
 
-async def build_staff_first_date_map(db, product_id: str = None) -> Dict[Tuple[str, str, str], str]:
+async def build_staff_first_date_map(
+    db,
+    product_id: str = None,
+    records: Optional[Iterable[Dict[str, Any]]] = None
+) -> Dict[Tuple[str, str, str], str]:
     """
-    Build a map of (staff_id, customer_id_normalized, product_id) -> first_date
-    using MongoDB aggregation instead of loading all records into memory.
+    Build a map of (staff_id, customer_id_normalized, product_id) -> first_date.
     
     This is the SINGLE SOURCE OF TRUTH for NDP/RDP across all views.
-    Excludes "tambahan" records from first_date calculation.
+    Reads from the persisted customer_first_deposit index (see utils/first_deposit_index.py),
+    which excludes "tambahan" records and only counts approved records.
     
     IMPORTANT: The customer_id normalization must match normalize_customer_id() from helpers.py:
     - lowercase, strip whitespace, remove special chars except alphanumeric/hyphens/underscores
@@ -44,70 +131,22 @@ async def build_staff_first_date_map(db, product_id: str = None) -> Dict[Tuple[s
     Args:
         db: Database connection
         product_id: Optional product filter
+        records: Optional OMSET records the caller is about to classify. When given,
+                 only the keys those records touch are read from the index.
     
     Returns:
         Dict mapping (staff_id, customer_id, product_id) to first record date
     """
-    from utils.helpers import normalize_customer_id
-    
-    match_stage = {
-        '$match': {
-            '$and': [
-                {'$or': [
-                    {'keterangan': {'$exists': False}},
-                    {'keterangan': None},
-                    {'keterangan': ''},
-                    {'keterangan': {'$not': {'$regex': 'tambahan', '$options': 'i'}}}
-                ]},
-                # Only count approved records in NDP/RDP calculations
-                {'$or': [
-                    {'approval_status': 'approved'},
-                    {'approval_status': {'$exists': False}}
-                ]}
-            ]
-        }
-    }
-    
-    if product_id:
-        match_stage['$match']['$and'].append({'product_id': product_id})
-    
-    # Use customer_id_normalized if available, otherwise fall back to customer_id
-    pipeline = [
-        match_stage,
-        {
-            '$group': {
-                '_id': {
-                    's': '$staff_id',
-                    'c': {'$ifNull': ['$customer_id_normalized', '$customer_id']},
-                    'p': '$product_id'
-                },
-                'first_date': {'$min': '$record_date'}
-            }
-        }
-    ]
+    if records is None:
+        return await lookup_first_deposit_dates(db, product_id=product_id)
     
-    results = await db.omset_records.aggregate(pipeline).to_list(None)
-    
-    # Normalize customer IDs using the SAME function used in all endpoints
-    first_date_map = {}
-    for r in results:
-        staff_id = r['_id']['s']
-        raw_cid = r['_id']['c']
-        prod_id = r['_id']['p']
-        
-        if not staff_id or not raw_cid or not prod_id:
-            continue
-        
-        normalized_cid = normalize_customer_id(raw_cid)
-        if not normalized_cid:
-            continue
-        
-        key = (staff_id, normalized_cid, prod_id)
-        # Keep the earliest first_date if there are collisions after normalization
-        if key not in first_date_map or r['first_date'] < first_date_map[key]:
-            first_date_map[key] = r['first_date']
+    keys = set()
+    for r in records:
+        cid = normalize_customer_id(r.get('customer_id_normalized') or r.get('customer_id') or '')
+        if cid:
+            keys.add((r.get('staff_id'), cid, r.get('product_id')))
     
-    return first_date_map
+    return await lookup_first_deposit_dates(db, keys=keys, product_id=product_id)
 
 
 async def recalculate_customer_type(db, staff_id: str, customer_id: str, product_id: str):
@@ -115,8 +154,11 @@ async def recalculate_customer_type(db, staff_id: str, customer_id: str, product
     Recalculate and update the stored customer_type (NDP/RDP) for all records
     matching a specific (staff_id, customer_id, product_id) combo.
     
-    Call this after delete, approve, decline, or restore operations to keep
-    the stored customer_type in sync with the dynamic NDP/RDP calculation.
+    Call this after create, edit, delete, approve, decline, or restore operations to keep
+    the stored customer_type and the customer_first_deposit index in sync.
+    
+    Returns:
+        Tuple of (previous_first_date, new_first_date) for the combo
     """
     from utils.helpers import normalize_customer_id
     
@@ -129,7 +171,7 @@ async def recalculate_customer_type(db, staff_id: str, customer_id: str, product
         '$and': [
             {'$or': [
                 {'customer_id_normalized': normalized_cid},
-                {'customer_id': {'$regex': f'^{customer_id.strip()}$', '$options': 'i'}}
+                {'customer_id': {'$regex': f'^{re.escape(customer_id.strip())}$', '$options': 'i'}}
             ]},
             {'$or': [
                 {'approval_status': 'approved'},
@@ -143,7 +185,8 @@ async def recalculate_customer_type(db, staff_id: str, customer_id: str, product
     ).sort('record_date', 1).to_list(10000)
     
     if not records:
-        return
+        previous_first_date = await set_first_deposit(db, staff_id, normalized_cid, product_id, None)
+        return previous_first_date, None
     
     # Find first_date (earliest non-tambahan record)
     first_date = None
@@ -153,7 +196,11 @@ async def recalculate_customer_type(db, staff_id: str, customer_id: str, product
             first_date = r['record_date']
             break
     
-    # Update each record's customer_type
+    # Keep the persisted first-deposit index in sync with this combo
+    previous_first_date = await set_first_deposit(db, staff_id, normalized_cid, product_id, first_date)
+    
+    # Update each record's customer_type (one UpdateMany per type in a single bulk_write)
+    ids_by_type = {'NDP': [], 'RDP': []}
     for r in records:
         keterangan = r.get('keterangan', '') or ''
         if 'tambahan' in keterangan.lower():
@@ -162,11 +209,14 @@ async def recalculate_customer_type(db, staff_id: str, customer_id: str, product
             new_type = 'NDP'
         else:
             new_type = 'RDP'
-        
-        await db.omset_records.update_one(
-            {'id': r['id']},
-            {'$set': {'customer_type': new_type}}
-        )
+        ids_by_type[new_type].append(r['id'])
+    
+    ops = []
+    for new_type, ids in ids_by_type.items():
+        ops.extend(build_id_update_ops(ids, {'$set': {'customer_type': new_type}}))
+    await bulk_write_chunked(db.omset_records, ops)
+    
+    return previous_first_date, first_date
 
 
 
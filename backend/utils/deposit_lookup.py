@@ -0,0 +1,298 @@
+"""
+Deposit Existence Lookups
+Answer "has this customer deposited (for this product)?" from omset_records
+with indexed queries instead of loading OMSET history into Python.
+
+Customers are matched either by customer_id_normalized (normalize_customer_id)
+or by customer_name_lower (customer_name lowercased and stripped), each backed
+by a (field, product_id) index:
+
+- find_deposit(): one find_one for a single customer
+- find_last_deposit_date(): latest deposit date of a single customer
+- find_last_deposit_dates(): latest deposit date per (customer, staff) for many
+  customers in one aggregation per chunk
+- find_deposits(): one batched $in query for many customers, returning a
+  DepositSet with the latest deposit date per (customer, product)
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.helpers import normalize_customer_id
+from utils.index_manifest import apply_collection_indexes
+
+
+CUSTOMER_NAME_LOWER_FIELD = 'customer_name_lower'
+CUSTOMER_NAME_LOWER_SETTINGS_KEY = 'omset_customer_name_lower'
+LOOKUP_CHUNK_SIZE = 1000
+
+
+def normalize_customer_name(customer_name) -> str:
+    """Lowercased, stripped customer name as stored in customer_name_lower."""
+    return str(customer_name or '').lower().strip()
+
+
+def _identity_filter(customer_ids: Iterable[str], customer_names: Iterable[str]) -> Optional[dict]:
+    clauses = []
+    ids = sorted({c for c in customer_ids if c})
+    names = sorted({n for n in customer_names if n})
+    if ids:
+        clauses.append({'customer_id_normalized': {'$in': ids} if len(ids) > 1 else ids[0]})
+    if names:
+        clauses.append({CUSTOMER_NAME_LOWER_FIELD: {'$in': names} if len(names) > 1 else names[0]})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+async def find_deposit(
+    db,
+    customer_id: Optional[str] = None,
+    customer_name: Optional[str] = None,
+    product_id: Optional[str] = None,
+    staff_id: Optional[str] = None,
+    since: Optional[str] = None
+) -> Optional[dict]:
+    """
+    Find one OMSET record of a customer (matched by ID or by name).
+
+    Args:
+        db: Database connection
+        customer_id: Raw customer ID / username (normalized here)
+        customer_name: Raw customer name (lowercased here)
+        product_id: Only deposits for this product
+        staff_id: Only deposits recorded by this staff
+        since: Only deposits on or after this date (YYYY-MM-DD)
+
+    Returns:
+        record_date / nominal / depo_total of a matching record, or None
+    """
+    identity = _identity_filter(
+        [normalize_customer_id(customer_id)] if customer_id else [],
+        [normalize_customer_name(customer_name)] if customer_name else []
+    )
+    if identity is None:
+        return None
+
+    query = dict(identity)
+    if product_id:
+        query['product_id'] = product_id
+    if staff_id:
+        query['staff_id'] = staff_id
+    if since:
+        query['record_date'] = {'$gte': since}
+
+    return await db.omset_records.find_one(
+        query, {'_id': 0, 'record_date': 1, 'nominal': 1, 'depo_total': 1}
+    )
+
+
+async def find_last_deposit_date(db, customer_id, staff_id: Optional[str] = None) -> Optional[str]:
+    """
+    Latest record_date of a customer's OMSET records (indexed on customer_id_normalized).
+
+    Args:
+        db: Database connection
+        customer_id: Raw customer ID / username (normalized here)
+        staff_id: Only deposits recorded by this staff
+
+    Returns:
+        record_date (YYYY-MM-DD) of the most recent deposit, or None
+    """
+    normalized = normalize_customer_id(customer_id)
+    if not normalized:
+        return None
+    query = {'customer_id_normalized': normalized}
+    if staff_id:
+        query['staff_id'] = staff_id
+    record = await db.omset_records.find_one(query, {'_id': 0, 'record_date': 1}, sort=[('record_date', -1)])
+    return record.get('record_date') if record else None
+
+
+async def find_last_deposit_dates(db, customer_ids: Iterable[str]) -> Dict[Tuple[str, Optional[str]], str]:
+    """
+    Latest record_date per (customer, staff) for many customers ($in on customer_id_normalized,
+    grouped server-side).
+
+    Args:
+        db: Database connection
+        customer_ids: Raw customer IDs / usernames
+
+    Returns:
+        {(customer_id_normalized, staff_id): record_date}; the (customer_id_normalized, None)
+        entry holds the latest deposit recorded by any staff
+    """
+    ids = sorted({normalize_customer_id(c) for c in customer_ids if c} - {''})
+    last_dates: Dict[Tuple[str, Optional[str]], str] = {}
+
+    for i in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+        chunk = ids[i:i + LOOKUP_CHUNK_SIZE]
+        rows = await db.omset_records.aggregate([
+            {'$match': {'customer_id_normalized': {'$in': chunk}}},
+            {'$group': {
+                '_id': {'c': '$customer_id_normalized', 's': '$staff_id'},
+                'last_date': {'$max': '$record_date'}
+            }}
+        ]).to_list(None)
+        for row in rows:
+            last_date = row.get('last_date')
+            if not last_date:
+                continue
+            customer = row['_id'].get('c')
+            for key in ((customer, row['_id'].get('s')), (customer, None)):
+                current = last_dates.get(key)
+                if current is None or last_date > current:
+                    last_dates[key] = last_date
+
+    return last_dates
+
+
+class DepositSet:
+    """Latest deposit date per (customer, product) for a batch of looked-up customers."""
+
+    def __init__(self):
+        self._by_id: Dict[Tuple[str, Optional[str]], str] = {}
+        self._by_name: Dict[Tuple[str, Optional[str]], str] = {}
+
+    @staticmethod
+    def _remember(index: dict, value: str, product_id: Optional[str], record_date: str):
+        # (value, None) holds the latest deposit for any product
+        for key in ((value, product_id), (value, None)):
+            current = index.get(key)
+            if current is None or record_date > current:
+                index[key] = record_date
+
+    def add(self, customer_id_normalized: str, customer_name_lower: str, product_id: str, record_date: str):
+        if customer_id_normalized:
+            self._remember(self._by_id, customer_id_normalized, product_id, record_date)
+        if customer_name_lower:
+            self._remember(self._by_name, customer_name_lower, product_id, record_date)
+
+    def last_deposit_date(
+        self,
+        customer_id: Optional[str] = None,
+        customer_name: Optional[str] = None,
+        product_id: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Latest deposit date of a customer ('' if deposited without a date), None if never.
+        product_id=None matches deposits for any product.
+        """
+        found = None
+        if customer_id:
+            found = self._by_id.get((normalize_customer_id(customer_id), product_id))
+        if customer_name:
+            by_name = self._by_name.get((normalize_customer_name(customer_name), product_id))
+            if by_name is not None and (found is None or by_name > found):
+                found = by_name
+        return found
+
+    def has_deposited(
+        self,
+        customer_id: Optional[str] = None,
+        customer_name: Optional[str] = None,
+        product_id: Optional[str] = None
+    ) -> bool:
+        return self.last_deposit_date(customer_id, customer_name, product_id) is not None
+
+    def customer_count(self) -> int:
+        """Number of distinct customer IDs with at least one deposit."""
+        return sum(1 for _, product_id in self._by_id if product_id is None)
+
+
+async def find_deposits(
+    db,
+    customer_ids: Iterable[str] = (),
+    customer_names: Iterable[str] = (),
+    product_id: Optional[str] = None,
+    staff_id: Optional[str] = None
+) -> DepositSet:
+    """
+    Batched deposit lookup for many customers ($in on the indexed identity fields).
+
+    Args:
+        db: Database connection
+        customer_ids: Raw customer IDs / usernames
+        customer_names: Raw customer names
+        product_id: Only deposits for this product
+        staff_id: Only deposits recorded by this staff
+
+    Returns:
+        DepositSet with the latest deposit date per (customer, product)
+    """
+    ids = sorted({normalize_customer_id(c) for c in customer_ids if c} - {''})
+    names = sorted({normalize_customer_name(n) for n in customer_names if n} - {''})
+    deposits = DepositSet()
+
+    scope = {}
+    if product_id:
+        scope['product_id'] = product_id
+    if staff_id:
+        scope['staff_id'] = staff_id
+
+    batches = [(ids[i:i + LOOKUP_CHUNK_SIZE], []) for i in range(0, len(ids), LOOKUP_CHUNK_SIZE)]
+    batches += [([], names[i:i + LOOKUP_CHUNK_SIZE]) for i in range(0, len(names), LOOKUP_CHUNK_SIZE)]
+
+    for id_chunk, name_chunk in batches:
+        identity = _identity_filter(id_chunk, name_chunk)
+        wanted_ids, wanted_names = set(id_chunk), set(name_chunk)
+        rows = await db.omset_records.aggregate([
+            {'$match': {**identity, **scope}},
+            {'$group': {
+                '_id': {
+                    'c': '$customer_id_normalized',
+                    'n': f'${CUSTOMER_NAME_LOWER_FIELD}',
+                    'p': '$product_id'
+                },
+                'last_date': {'$max': '$record_date'}
+            }}
+        ]).to_list(None)
+        for row in rows:
+            key = row['_id']
+            cid = key.get('c') if key.get('c') in wanted_ids else None
+            name = key.get('n') if key.get('n') in wanted_names else None
+            deposits.add(cid, name, key.get('p'), row.get('last_date') or '')
+
+    return deposits
+
+
+async def ensure_deposit_lookup_indexes(db):
+    """Create the (customer, product) identity indexes used by the lookups."""
+    await apply_collection_indexes(db, 'omset_records', names=('customer_product_idx', 'customer_name_product_idx'))
+
+
+async def ensure_customer_name_lower(db) -> bool:
+    """
+    Backfill customer_name_lower on existing omset_records once (server-side update).
+
+    Returns:
+        True if the backfill ran
+    """
+    await ensure_deposit_lookup_indexes(db)
+    marker = await db.system_settings.find_one({'key': CUSTOMER_NAME_LOWER_SETTINGS_KEY}, {'_id': 0})
+    if marker:
+        return False
+
+    result = await db.omset_records.update_many(
+        {CUSTOMER_NAME_LOWER_FIELD: {'$exists': False}},
+        [{'$set': {CUSTOMER_NAME_LOWER_FIELD: {
+            '$toLower': {'$trim': {'input': {'$ifNull': ['$customer_name', '']}}}
+        }}}]
+    )
+    await db.system_settings.update_one(
+        {'key': CUSTOMER_NAME_LOWER_SETTINGS_KEY},
+        {'$set': {'key': CUSTOMER_NAME_LOWER_SETTINGS_KEY, 'updated': result.modified_count}},
+        upsert=True
+    )
+    return True
+
+
+async def count_deposit_records(db, product_id: Optional[str] = None, staff_id: Optional[str] = None) -> int:
+    """Number of OMSET records in scope (collection metadata count when unscoped)."""
+    query = {}
+    if product_id:
+        query['product_id'] = product_id
+    if staff_id:
+        query['staff_id'] = staff_id
+    if not query:
+        return await db.omset_records.estimated_document_count()
+    return await db.omset_records.count_documents(query)
@@ -0,0 +1,258 @@
+"""
+Customer Deposit Profiles
+Materialized customer_deposit_profile collection: one document per
+(customer_id_normalized, product_id) summarizing that customer's approved
+OMSET history for the product:
+
+- first_deposit_date / last_deposit_date
+- deposit_count (records) and deposit_days (distinct record dates)
+- total_depo (sum of depo_total)
+- customer_id / customer_name / product_name / staff_id / staff_name of the
+  latest deposit (staff_id is the staff currently "owning" the customer)
+
+Retention alerts, lost customers, the daily briefing and the at-risk Telegram
+alert read these profiles with indexed last_deposit_date range scans instead of
+loading the whole omset_records history. Profiles are refreshed from the OMSET
+write paths through sync_omset_change() and can be rebuilt from scratch into a
+staging collection that replaces the live one (under utils.rebuild_guard, which
+replays the profiles refreshed while the rebuild runs).
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from utils.helpers import get_jakarta_now, normalize_customer_id, customer_key_expr
+from utils.db_operations import APPROVED_FILTER
+from utils.index_manifest import apply_collection_indexes
+from utils.rebuild_guard import RebuildInProgressError, guarded_rebuild, journal_write, journal_writes
+
+
+PROFILE_COLLECTION = 'customer_deposit_profile'
+PROFILE_SETTINGS_KEY = 'customer_deposit_profile'
+PROFILE_REFRESH_CHUNK_SIZE = 1000
+
+
+def _profile_pipeline(match: dict) -> List[dict]:
+    """Aggregation turning raw omset_records (filtered by match) into profile documents."""
+    return [
+        {'$match': {'$and': [match, APPROVED_FILTER]}},
+        {'$project': {
+            '_id': 0,
+            'record_date': 1,
+            'product_id': 1,
+            'product_name': 1,
+            'staff_id': 1,
+            'staff_name': 1,
+            'customer_id': 1,
+            'customer_name': {'$ifNull': ['$customer_name', '$customer_id']},
+            '_cid': customer_key_expr(),
+            '_depo': {'$ifNull': ['$depo_total', 0]},
+        }},
+        # Oldest first, so $last picks the latest deposit's customer/staff details
+        {'$sort': {'record_date': 1}},
+        {'$group': {
+            '_id': {'c': '$_cid', 'p': '$product_id'},
+            'first_deposit_date': {'$min': '$record_date'},
+            'last_deposit_date': {'$max': '$record_date'},
+            'deposit_count': {'$sum': 1},
+            'deposit_dates': {'$addToSet': '$record_date'},
+            'total_depo': {'$sum': '$_depo'},
+            'customer_id': {'$last': '$customer_id'},
+            'customer_name': {'$last': '$customer_name'},
+            'product_name': {'$last': '$product_name'},
+            'staff_id': {'$last': '$staff_id'},
+            'staff_name': {'$last': '$staff_name'},
+        }},
+        {'$project': {
+            '_id': 0,
+            'customer_id_normalized': '$_id.c',
+            'product_id': '$_id.p',
+            'customer_id': 1,
+            'customer_name': 1,
+            'product_name': 1,
+            'staff_id': 1,
+            'staff_name': 1,
+            'first_deposit_date': 1,
+            'last_deposit_date': 1,
+            'deposit_count': 1,
+            'deposit_days': {'$size': '$deposit_dates'},
+            'total_depo': 1,
+        }},
+    ]
+
+
+async def refresh_deposit_profile(db, customer_id: str, product_id: str):
+    """
+    Recompute the profile of one (customer, product) from its records (removing it if none remain).
+
+    Args:
+        db: Database connection
+        customer_id: Raw or normalized customer ID
+        product_id: Product ID
+    """
+    normalized_cid = normalize_customer_id(customer_id)
+    if not normalized_cid or not product_id:
+        return
+
+    key_filter = {'customer_id_normalized': normalized_cid, 'product_id': product_id}
+    rows = await db.omset_records.aggregate(_profile_pipeline(key_filter)).to_list(1)
+
+    await journal_write(db, PROFILE_COLLECTION, key_filter)
+    if not rows:
+        await db[PROFILE_COLLECTION].delete_one(key_filter)
+        return
+
+    row = rows[0]
+    row['updated_at'] = get_jakarta_now().isoformat()
+    await db[PROFILE_COLLECTION].replace_one(key_filter, row, upsert=True)
+
+
+async def _merge_profiles(db, record_query: dict, into: str = PROFILE_COLLECTION) -> str:
+    """$merge fresh profiles for record_query into a collection; returns their updated_at."""
+    now = get_jakarta_now().isoformat()
+    pipeline = _profile_pipeline(record_query) + [
+        {'$addFields': {'updated_at': now}},
+        {'$merge': {
+            'into': into,
+            'on': ['customer_id_normalized', 'product_id'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }},
+    ]
+    await db.omset_records.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    return now
+
+
+async def refresh_deposit_profiles_for_customers(db, customer_ids: Iterable[str]) -> int:
+    """
+    Recompute every profile (all products) of the given normalized customer IDs.
+
+    Used after bulk OMSET deletions, e.g. purging a staff member's records.
+
+    Returns:
+        Number of customer IDs refreshed
+    """
+    customer_ids = sorted({c for c in customer_ids if c})
+    for start in range(0, len(customer_ids), PROFILE_REFRESH_CHUNK_SIZE):
+        chunk = customer_ids[start:start + PROFILE_REFRESH_CHUNK_SIZE]
+        await journal_writes(db, PROFILE_COLLECTION, [{'customer_id_normalized': c} for c in chunk])
+        written_at = await _merge_profiles(db, {'customer_id_normalized': {'$in': chunk}})
+        # Profiles not rewritten above have no approved records left
+        await db[PROFILE_COLLECTION].delete_many({
+            'customer_id_normalized': {'$in': chunk}, 'updated_at': {'$lt': written_at}
+        })
+    return len(customer_ids)
+
+
+async def _replay_profile(db, key: dict):
+    """Re-derive one profile (or all of a customer's) refreshed during a rebuild."""
+    if 'product_id' not in key:
+        await refresh_deposit_profiles_for_customers(db, [key['customer_id_normalized']])
+        return
+    await refresh_deposit_profile(db, key['customer_id_normalized'], key['product_id'])
+
+
+async def rebuild_deposit_profiles(db) -> Dict:
+    """
+    Rebuild the whole profile collection from omset_records in one server-side aggregation.
+
+    Profiles are built into a staging collection that is renamed over the live one,
+    so readers never see an empty or half-built collection.
+
+    Returns:
+        Dict with the number of profiles written and of concurrent refreshes replayed
+
+    Raises:
+        RebuildInProgressError: another worker is rebuilding the profiles
+    """
+    await ensure_deposit_profile_indexes(db)
+
+    async def build(staging_name: str) -> Dict:
+        staging = db[staging_name]
+        # The unique key index must exist before $merge can target the staging collection
+        await ensure_deposit_profile_indexes(db, staging_name)
+        await _merge_profiles(db, {}, into=staging_name)
+
+        profiles = await staging.count_documents({})
+        if profiles:
+            await staging.rename(PROFILE_COLLECTION, dropTarget=True)
+        else:
+            await db[PROFILE_COLLECTION].delete_many({})
+            await staging.drop()
+
+        await db.system_settings.update_one(
+            {'key': PROFILE_SETTINGS_KEY},
+            {'$set': {'key': PROFILE_SETTINGS_KEY, 'built_at': get_jakarta_now().isoformat(), 'profiles': profiles}},
+            upsert=True
+        )
+        return {'profiles': profiles}
+
+    return await guarded_rebuild(db, PROFILE_COLLECTION, build, lambda key: _replay_profile(db, key))
+
+
+async def ensure_deposit_profile_indexes(db, collection_name: str = PROFILE_COLLECTION):
+    """Create the unique profile key index and the retention read-path indexes."""
+    await apply_collection_indexes(db, PROFILE_COLLECTION, target=collection_name)
+
+
+async def ensure_deposit_profiles(db) -> bool:
+    """
+    Build the profile collection once if it has never been built.
+
+    Returns:
+        True if a rebuild was performed (False when built already or by another worker)
+    """
+    await ensure_deposit_profile_indexes(db)
+    marker = await db.system_settings.find_one({'key': PROFILE_SETTINGS_KEY}, {'_id': 0})
+    if marker:
+        return False
+    try:
+        await rebuild_deposit_profiles(db)
+    except RebuildInProgressError:
+        return False
+    return True
+
+
+def days_ago(today: str, days: int) -> str:
+    """Date string (YYYY-MM-DD) days before today."""
+    return (datetime.strptime(today, '%Y-%m-%d') - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+async def find_profiles(
+    db,
+    last_deposit_from: Optional[str] = None,
+    last_deposit_to: Optional[str] = None,
+    staff_id: Optional[str] = None,
+    product_id: Optional[str] = None,
+    min_deposits: int = 0
+) -> List[dict]:
+    """
+    Fetch profiles whose last deposit falls in [last_deposit_from, last_deposit_to].
+
+    Args:
+        db: Database connection
+        last_deposit_from: Inclusive lower bound (YYYY-MM-DD)
+        last_deposit_to: Inclusive upper bound (YYYY-MM-DD)
+        staff_id: Only customers whose latest deposit was with this staff
+        product_id: Only this product
+        min_deposits: Minimum deposit_count
+
+    Returns:
+        List of profile documents
+    """
+    query: Dict = {}
+    date_filter = {}
+    if last_deposit_from:
+        date_filter['$gte'] = last_deposit_from
+    if last_deposit_to:
+        date_filter['$lte'] = last_deposit_to
+    if date_filter:
+        query['last_deposit_date'] = date_filter
+    if staff_id:
+        query['staff_id'] = staff_id
+    if product_id:
+        query['product_id'] = product_id
+    if min_deposits:
+        query['deposit_count'] = {'$gte': min_deposits}
+
+    return await db[PROFILE_COLLECTION].find(query, {'_id': 0, 'updated_at': 0}).to_list(None)
@@ -0,0 +1,160 @@
+"""
+Bounded Executors
+Keep blocking and CPU-heavy work off the asyncio event loop.
+
+- run_blocking(): shared thread pool for work that releases the GIL or waits
+  on IO (bcrypt, file spooling, openpyxl saves, chunked upload parsing)
+- run_cpu_bound(): shared process pool for pure-Python/pandas work that would
+  hold the GIL (building export workbooks). Functions and arguments must be
+  picklable, so workers live in plain modules such as utils.workbooks.
+
+Each pool admits at most workers + queue_size jobs; further calls fail fast
+with ExecutorBusyError instead of piling up. Every call has a timeout, and
+executor_stats() reports queue depth, running jobs and outcome counters.
+
+Sizes are configurable with EXECUTOR_THREAD_WORKERS, EXECUTOR_THREAD_QUEUE,
+EXECUTOR_PROCESS_WORKERS and EXECUTOR_PROCESS_QUEUE.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+THREAD_POOL_WORKERS = int(os.environ.get('EXECUTOR_THREAD_WORKERS', 8))
+THREAD_POOL_QUEUE = int(os.environ.get('EXECUTOR_THREAD_QUEUE', 64))
+PROCESS_POOL_WORKERS = int(os.environ.get('EXECUTOR_PROCESS_WORKERS', min(4, os.cpu_count() or 1)))
+PROCESS_POOL_QUEUE = int(os.environ.get('EXECUTOR_PROCESS_QUEUE', 16))
+
+BLOCKING_TIMEOUT_SECONDS = 60
+CPU_BOUND_TIMEOUT_SECONDS = 300
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when a pool already holds its maximum number of running + queued jobs."""
+
+
+class ExecutorTimeoutError(TimeoutError):
+    """Raised when a job does not finish within its timeout."""
+
+
+class BoundedExecutor:
+    """Thread or process pool with an admission limit, per-job timeouts and counters."""
+
+    def __init__(self, name: str, factory: Callable[[], Executor], workers: int, queue_size: int, timeout: float):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.max_duration_ms = 0.0
+
+    def _get_executor(self) -> Executor:
+        # Created lazily so importing this module never starts threads or processes
+        if self._executor is None:
+            self._executor = self._factory()
+        return self._executor
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) in the pool and await its result.
+
+        Args:
+            fn: Callable (module-level and picklable for the process pool)
+            timeout: Seconds to wait (defaults to the pool's timeout)
+
+        Raises:
+            ExecutorBusyError: the pool is full
+            ExecutorTimeoutError: the job did not finish in time
+        """
+        if self.in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise ExecutorBusyError(f"{self.name} executor is busy, try again shortly")
+
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        started_at = time.monotonic()
+        try:
+            future = loop.run_in_executor(self._get_executor(), functools.partial(fn, *args, **kwargs))
+            result = await asyncio.wait_for(future, timeout)
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            # The worker cannot be interrupted; its result is discarded when it finishes
+            self.timeouts += 1
+            raise ExecutorTimeoutError(f"{self.name} job timed out after {timeout}s")
+        except BrokenExecutor:
+            # A worker process died; start a fresh pool on the next call
+            self.failed += 1
+            self.shutdown()
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            duration_ms = round((time.monotonic() - started_at) * 1000, 1)
+            self.max_duration_ms = max(self.max_duration_ms, duration_ms)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        # Pools run jobs FIFO, so everything beyond the worker count is waiting
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'running': min(self.in_flight, self.workers),
+            'queued': max(0, self.in_flight - self.workers),
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'max_duration_ms': self.max_duration_ms,
+        }
+
+
+blocking_executor = BoundedExecutor(
+    'blocking',
+    lambda: ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS, thread_name_prefix='blocking'),
+    THREAD_POOL_WORKERS, THREAD_POOL_QUEUE, BLOCKING_TIMEOUT_SECONDS
+)
+
+# 'spawn' children import only the worker's module, never the running server's state
+cpu_executor = BoundedExecutor(
+    'cpu',
+    lambda: ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS, mp_context=multiprocessing.get_context('spawn')),
+    PROCESS_POOL_WORKERS, PROCESS_POOL_QUEUE, CPU_BOUND_TIMEOUT_SECONDS
+)
+
+
+async def run_blocking(fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """Run a blocking call on the shared thread pool."""
+    return await blocking_executor.run(fn, *args, timeout=timeout, **kwargs)
+
+
+async def run_cpu_bound(fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """Run a CPU-bound, picklable call on the shared process pool."""
+    return await cpu_executor.run(fn, *args, timeout=timeout, **kwargs)
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {'blocking': blocking_executor.stats(), 'cpu': cpu_executor.stats()}
+
+
+def shutdown_executors():
+    blocking_executor.shutdown()
+    cpu_executor.shutdown()
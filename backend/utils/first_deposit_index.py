@@ -0,0 +1,409 @@
+"""
+Customer First-Deposit Index
+Persisted (staff_id, customer_id_normalized, product_id) -> first_date lookup
+backing every NDP/RDP calculation.
+
+The index is maintained incrementally from the OMSET write paths (create,
+approve, decline, edit, delete, restore) via recalculate_customer_type(), and
+can be rebuilt or verified against omset_records at any time. Rebuilds run
+under utils.rebuild_guard, which replays the incremental writes made meanwhile.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.helpers import get_jakarta_now, normalize_customer_id, customer_key_expr
+from utils.index_manifest import apply_collection_indexes
+from utils.rebuild_guard import RebuildInProgressError, guarded_rebuild, journal_write
+
+
+FIRST_DEPOSIT_COLLECTION = 'customer_first_deposit'
+FIRST_DEPOSIT_SETTINGS_KEY = 'customer_first_deposit_index'
+
+# Max values per $in clause when looking up a batch of keys
+LOOKUP_CHUNK_SIZE = 1000
+WRITE_CHUNK_SIZE = 5000
+
+FirstDepositKey = Tuple[str, str, str]
+
+
+async def compute_first_deposit_map(
+    db,
+    product_id: str = None,
+    staff_id: str = None,
+    customer_id: str = None
+) -> Dict[FirstDepositKey, str]:
+    """
+    Compute the first-deposit map directly from omset_records with a full $group.
+
+    This is the expensive source-of-truth scan. Request handlers must NOT call it;
+    it only backs rebuild_first_deposit_index() and verify_first_deposit_index().
+    Excludes "tambahan" records and only counts approved records.
+
+    Args:
+        db: Database connection
+        product_id: Optional product filter
+        staff_id: Optional staff filter
+        customer_id: Optional normalized customer filter (legacy records without
+                     customer_id_normalized are scanned and normalized as well)
+
+    Returns:
+        Dict mapping (staff_id, customer_id, product_id) to first record date
+    """
+    match_stage = {
+        '$match': {
+            '$and': [
+                {'$or': [
+                    {'keterangan': {'$exists': False}},
+                    {'keterangan': None},
+                    {'keterangan': ''},
+                    {'keterangan': {'$not': {'$regex': 'tambahan', '$options': 'i'}}}
+                ]},
+                # Only count approved records in NDP/RDP calculations
+                {'$or': [
+                    {'approval_status': 'approved'},
+                    {'approval_status': {'$exists': False}}
+                ]}
+            ]
+        }
+    }
+
+    if product_id:
+        match_stage['$match']['$and'].append({'product_id': product_id})
+    if staff_id:
+        match_stage['$match']['$and'].append({'staff_id': staff_id})
+    if customer_id:
+        match_stage['$match']['$and'].append({'customer_id_normalized': {'$in': [customer_id, None]}})
+
+    # Use customer_id_normalized if available, otherwise fall back to customer_id
+    pipeline = [
+        match_stage,
+        {
+            '$group': {
+                '_id': {
+                    's': '$staff_id',
+                    'c': {'$ifNull': ['$customer_id_normalized', '$customer_id']},
+                    'p': '$product_id'
+                },
+                'first_date': {'$min': '$record_date'}
+            }
+        }
+    ]
+
+    first_date_map = {}
+    async for r in db.omset_records.aggregate(pipeline, allowDiskUse=True):
+        staff_id = r['_id']['s']
+        raw_cid = r['_id']['c']
+        prod_id = r['_id']['p']
+
+        if not staff_id or not raw_cid or not prod_id:
+            continue
+
+        normalized_cid = normalize_customer_id(raw_cid)
+        if not normalized_cid or (customer_id and normalized_cid != customer_id):
+            continue
+
+        key = (staff_id, normalized_cid, prod_id)
+        # Keep the earliest first_date if there are collisions after normalization
+        if key not in first_date_map or r['first_date'] < first_date_map[key]:
+            first_date_map[key] = r['first_date']
+
+    return first_date_map
+
+
+async def set_first_deposit(
+    db,
+    staff_id: str,
+    customer_id: str,
+    product_id: str,
+    first_date: Optional[str]
+) -> Optional[str]:
+    """
+    Upsert (or remove, when first_date is None) one entry of the first-deposit index.
+
+    Args:
+        db: Database connection
+        staff_id: Staff user ID
+        customer_id: Raw or normalized customer ID (normalized here)
+        product_id: Product ID
+        first_date: Earliest non-tambahan approved record_date, or None if none remain
+
+    Returns:
+        The first_date stored before this call (None if there was no entry)
+    """
+    normalized_cid = normalize_customer_id(customer_id)
+    if not staff_id or not normalized_cid or not product_id:
+        return None
+
+    key_filter = {
+        'staff_id': staff_id,
+        'customer_id_normalized': normalized_cid,
+        'product_id': product_id
+    }
+
+    await journal_write(db, FIRST_DEPOSIT_COLLECTION, key_filter)
+    if first_date is None:
+        previous = await db[FIRST_DEPOSIT_COLLECTION].find_one_and_delete(key_filter)
+    else:
+        previous = await db[FIRST_DEPOSIT_COLLECTION].find_one_and_update(
+            key_filter,
+            {'$set': {'first_date': first_date, 'updated_at': get_jakarta_now().isoformat()}},
+            upsert=True
+        )
+
+    return previous.get('first_date') if previous else None
+
+
+async def delete_first_deposits_for_staff(db, staff_id: str) -> int:
+    """Drop all index entries of a staff member (used when the staff's OMSET is purged)."""
+    await journal_write(db, FIRST_DEPOSIT_COLLECTION, {'staff_id': staff_id})
+    result = await db[FIRST_DEPOSIT_COLLECTION].delete_many({'staff_id': staff_id})
+    return result.deleted_count
+
+
+async def lookup_first_deposit_dates(
+    db,
+    keys: Optional[Iterable[FirstDepositKey]] = None,
+    product_id: str = None
+) -> Dict[FirstDepositKey, str]:
+    """
+    Read first-deposit dates from the persisted index.
+
+    Args:
+        db: Database connection
+        keys: Optional (staff_id, customer_id_normalized, product_id) keys to fetch.
+              When omitted, every entry (optionally of one product) is returned.
+        product_id: Optional product filter
+
+    Returns:
+        Dict mapping (staff_id, customer_id, product_id) to first record date
+    """
+    projection = {'_id': 0, 'staff_id': 1, 'customer_id_normalized': 1, 'product_id': 1, 'first_date': 1}
+    collection = db[FIRST_DEPOSIT_COLLECTION]
+    first_date_map = {}
+
+    if keys is None:
+        query = {'product_id': product_id} if product_id else {}
+        async for doc in collection.find(query, projection):
+            first_date_map[(doc['staff_id'], doc['customer_id_normalized'], doc['product_id'])] = doc['first_date']
+        return first_date_map
+
+    wanted = {k for k in keys if k[0] and k[1] and k[2] and (not product_id or k[2] == product_id)}
+    if not wanted:
+        return first_date_map
+
+    staff_ids = sorted({k[0] for k in wanted})
+    product_ids = sorted({k[2] for k in wanted})
+    customer_ids = sorted({k[1] for k in wanted})
+
+    for i in range(0, len(customer_ids), LOOKUP_CHUNK_SIZE):
+        query = {
+            'customer_id_normalized': {'$in': customer_ids[i:i + LOOKUP_CHUNK_SIZE]},
+            'staff_id': {'$in': staff_ids},
+            'product_id': {'$in': product_ids}
+        }
+        async for doc in collection.find(query, projection):
+            key = (doc['staff_id'], doc['customer_id_normalized'], doc['product_id'])
+            if key in wanted:
+                first_date_map[key] = doc['first_date']
+
+    return first_date_map
+
+
+def ndp_classification_stages() -> List[dict]:
+    """
+    Aggregation stages classifying omset_records documents as NDP/RDP server-side.
+
+    Adds to each document:
+        _cid: normalized customer id
+        _tambahan: True when keterangan contains "tambahan"
+        _depo: depo_total (0 when missing)
+        _first_date: first deposit date of its (staff, customer, product) from the index
+        _is_ndp: not tambahan and record_date == _first_date
+
+    The $lookup is keyed on the unique (staff_id, customer_id_normalized, product_id)
+    index, so only the keys present in the matched documents are read.
+    """
+    return [
+        {'$addFields': {
+            '_cid': customer_key_expr(),
+            '_tambahan': {'$regexMatch': {
+                'input': {'$ifNull': ['$keterangan', '']}, 'regex': 'tambahan', 'options': 'i'
+            }},
+            '_depo': {'$ifNull': ['$depo_total', 0]},
+        }},
+        {'$lookup': {
+            'from': FIRST_DEPOSIT_COLLECTION,
+            'let': {'s': '$staff_id', 'c': '$_cid', 'p': '$product_id'},
+            'pipeline': [
+                {'$match': {'$expr': {'$and': [
+                    {'$eq': ['$staff_id', '$$s']},
+                    {'$eq': ['$customer_id_normalized', '$$c']},
+                    {'$eq': ['$product_id', '$$p']},
+                ]}}},
+                {'$project': {'_id': 0, 'first_date': 1}},
+            ],
+            'as': '_first'
+        }},
+        {'$addFields': {'_first_date': {'$arrayElemAt': ['$_first.first_date', 0]}}},
+        {'$addFields': {'_is_ndp': {'$and': [
+            {'$not': ['$_tambahan']},
+            {'$eq': ['$_first_date', '$record_date']},
+        ]}}},
+        {'$project': {'_first': 0}},
+    ]
+
+
+def customer_first_deposit_stages(customer_field: str, product_field: str, as_field: str) -> List[dict]:
+    """
+    Aggregation stages adding as_field: the first deposit date of a (customer, product)
+    across all staff (the earliest first_date of its index entries), or null.
+
+    For documents already grouped per customer, e.g. retention, which counts
+    acquisition per (customer, product) rather than per staff. The $lookup is keyed
+    on the (customer_id_normalized, product_id) index.
+
+    Args:
+        customer_field: Field path (without '$') of the normalized customer id
+        product_field: Field path (without '$') of the product id
+        as_field: Output field
+    """
+    return [
+        {'$lookup': {
+            'from': FIRST_DEPOSIT_COLLECTION,
+            'let': {'c': f'${customer_field}', 'p': f'${product_field}'},
+            'pipeline': [
+                {'$match': {'$expr': {'$and': [
+                    {'$eq': ['$customer_id_normalized', '$$c']},
+                    {'$eq': ['$product_id', '$$p']},
+                ]}}},
+                {'$group': {'_id': None, 'first_date': {'$min': '$first_date'}}},
+            ],
+            'as': as_field
+        }},
+        {'$addFields': {as_field: {'$arrayElemAt': [f'${as_field}.first_date', 0]}}},
+    ]
+
+
+async def _replay_first_deposit(db, key: dict):
+    """Re-derive one index entry (or a purged staff's entries) journaled during a rebuild."""
+    if 'customer_id_normalized' not in key:
+        await delete_first_deposits_for_staff(db, key['staff_id'])
+        return
+    staff_id, cid, product_id = key['staff_id'], key['customer_id_normalized'], key['product_id']
+    first_dates = await compute_first_deposit_map(db, product_id=product_id, staff_id=staff_id, customer_id=cid)
+    await set_first_deposit(db, staff_id, cid, product_id, first_dates.get((staff_id, cid, product_id)))
+
+
+async def rebuild_first_deposit_index(db) -> Dict[str, int]:
+    """
+    Rebuild the whole first-deposit index from omset_records.
+
+    Builds into a staging collection and swaps it in with a single rename,
+    so readers never observe a half-built index.
+
+    Returns:
+        Dict with the number of entries written and of concurrent writes replayed
+
+    Raises:
+        RebuildInProgressError: another worker is rebuilding the index
+    """
+    async def build(staging_name: str) -> Dict[str, int]:
+        first_date_map = await compute_first_deposit_map(db)
+        now = get_jakarta_now().isoformat()
+        staging = db[staging_name]
+
+        batch = []
+        for (staff_id, cid, pid), first_date in first_date_map.items():
+            batch.append({
+                'staff_id': staff_id,
+                'customer_id_normalized': cid,
+                'product_id': pid,
+                'first_date': first_date,
+                'updated_at': now
+            })
+            if len(batch) >= WRITE_CHUNK_SIZE:
+                await staging.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            await staging.insert_many(batch, ordered=False)
+
+        await ensure_first_deposit_indexes(db, staging_name)
+
+        if first_date_map:
+            await staging.rename(FIRST_DEPOSIT_COLLECTION, dropTarget=True)
+        else:
+            await db[FIRST_DEPOSIT_COLLECTION].delete_many({})
+            await staging.drop()
+
+        await db.system_settings.update_one(
+            {'key': FIRST_DEPOSIT_SETTINGS_KEY},
+            {'$set': {'key': FIRST_DEPOSIT_SETTINGS_KEY, 'built_at': now, 'entries': len(first_date_map)}},
+            upsert=True
+        )
+        return {'entries': len(first_date_map)}
+
+    return await guarded_rebuild(
+        db, FIRST_DEPOSIT_COLLECTION, build, lambda key: _replay_first_deposit(db, key)
+    )
+
+
+async def verify_first_deposit_index(db, sample_size: int = 20) -> Dict:
+    """
+    Compare the persisted index against a fresh scan of omset_records.
+
+    Returns:
+        Dict with counts of missing, stale and mismatched entries plus a few samples
+    """
+    expected = await compute_first_deposit_map(db)
+    indexed = await lookup_first_deposit_dates(db)
+
+    missing = [k for k in expected if k not in indexed]
+    stale = [k for k in indexed if k not in expected]
+    mismatched = [k for k in expected if k in indexed and indexed[k] != expected[k]]
+
+    def _sample(keys, with_dates=False):
+        out = []
+        for k in keys[:sample_size]:
+            item = {'staff_id': k[0], 'customer_id_normalized': k[1], 'product_id': k[2]}
+            if with_dates:
+                item['expected'] = expected.get(k)
+                item['indexed'] = indexed.get(k)
+            out.append(item)
+        return out
+
+    return {
+        'ok': not missing and not stale and not mismatched,
+        'expected_entries': len(expected),
+        'indexed_entries': len(indexed),
+        'missing': len(missing),
+        'stale': len(stale),
+        'mismatched': len(mismatched),
+        'samples': {
+            'missing': _sample(missing),
+            'stale': _sample(stale),
+            'mismatched': _sample(mismatched, with_dates=True)
+        }
+    }
+
+
+async def ensure_first_deposit_indexes(db, collection_name: str = FIRST_DEPOSIT_COLLECTION):
+    """Create the unique key index (and lookup helpers) on the first-deposit collection."""
+    await apply_collection_indexes(db, FIRST_DEPOSIT_COLLECTION, target=collection_name)
+
+
+async def ensure_first_deposit_index(db) -> bool:
+    """
+    Build the index once if it has never been built (first deploy / fresh database).
+
+    Returns:
+        True if a rebuild was performed (False when built already or by another worker)
+    """
+    await ensure_first_deposit_indexes(db)
+    marker = await db.system_settings.find_one({'key': FIRST_DEPOSIT_SETTINGS_KEY}, {'_id': 0})
+    if marker:
+        return False
+    try:
+        await rebuild_first_deposit_index(db)
+    except RebuildInProgressError:
+        return False
+    return True
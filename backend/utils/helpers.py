@@ -48,6 +48,33 @@ def normalize_customer_id(customer_id: str) -> str:
     return normalized
 
 
+def normalized_customer_id_expr(field: str = 'customer_id') -> dict:
+    """
+    Aggregation equivalent of normalize_customer_id() applied to a document field.
+    
+    Used where a pipeline must key records the same way the Python-built indexes do
+    (e.g. legacy records without customer_id_normalized). Aggregation has no regex
+    replace, so the allowed characters are kept with $regexFindAll and re-joined.
+    
+    Args:
+        field: Field name (without '$') holding the raw customer ID
+        
+    Returns:
+        Expression evaluating to the normalized ID ('' when missing)
+    """
+    lowered = {'$toLower': {'$trim': {'input': {'$toString': {'$ifNull': [f'${field}', '']}}}}}
+    return {'$reduce': {
+        'input': {'$regexFindAll': {'input': lowered, 'regex': '[a-z0-9_-]+'}},
+        'initialValue': '',
+        'in': {'$concat': ['$$value', '$$this.match']}
+    }}
+
+
+def customer_key_expr() -> dict:
+    """Stored customer_id_normalized, falling back to normalizing customer_id for legacy records."""
+    return {'$ifNull': ['$customer_id_normalized', normalized_customer_id_expr('customer_id')]}
+
+
 def normalize_name(name: str) -> Optional[str]:
     """
     Normalize a name for consistent comparison.
@@ -0,0 +1,512 @@
+"""
+Index Manifest
+The one declaration of every MongoDB index the app relies on, applied idempotently
+at startup and by scripts/create_indexes.py.
+
+- INDEX_MANIFEST: collection -> index specs ({'keys', 'name'} plus options)
+- diff_collection_indexes(): compare a collection's existing indexes with its specs
+- apply_collection_indexes() / apply_index_manifest(): build the missing indexes
+- start_index_build(): run apply_index_manifest() in the background at startup
+- QUERY_CATALOG / verify_query_plans(): explain() representative route queries and
+  flag collection scans on large collections
+
+An existing index with the same keys and options satisfies a spec whatever its
+name (older deployments carry auto-generated names), so applying never builds
+duplicates. Name or option clashes are reported as conflicts and never dropped
+automatically.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+
+logger = logging.getLogger(__name__)
+
+# Collections smaller than this may be scanned (the planner prefers a COLLSCAN on tiny collections)
+COLLSCAN_THRESHOLD = 10000
+INDEX_OPTIONS = ('unique', 'partialFilterExpression')
+
+
+def _idx(keys: list, name: str, **options) -> dict:
+    return {'keys': keys, 'name': name, **options}
+
+
+def _record_indexes() -> List[dict]:
+    """Indexes shared by the three record collections."""
+    return [
+        _idx([('id', 1)], 'id_idx'),
+        _idx([('staff_id', 1), ('status', 1)], 'staff_status_idx'),
+        _idx([('database_id', 1), ('status', 1)], 'database_status_idx'),
+        _idx([('customer_id_normalized', 1), ('product_id', 1)], 'customer_product_idx'),
+        _idx([('status', 1)], 'status_idx'),
+    ]
+
+
+def _claimable_record_indexes() -> List[dict]:
+    """Bonanza / Member WD: reserved-member syncs, staff listings and validation alerts."""
+    return _record_indexes() + [
+        # Reserved-member sync (multikey on normalized row_data values)
+        _idx([('row_identifiers', 1), ('status', 1)], 'row_identifiers_status_idx'),
+        _idx([('database_id', 1), ('status', 1), ('row_identifiers', 1)], 'database_status_identifiers_idx'),
+        # Keyset pagination of the staff record listing
+        _idx([('assigned_to', 1), ('status', 1), ('assigned_at', -1), ('id', -1)], 'assigned_page_idx'),
+        # Staff invalid-record alerts and the admin invalid-record views
+        _idx([('assigned_to', 1), ('status', 1), ('validation_status', 1)], 'assigned_status_validation_idx'),
+        _idx([('validation_status', 1), ('status', 1)], 'validation_status_idx'),
+    ]
+
+
+INDEX_MANIFEST: Dict[str, List[dict]] = {
+    # ==================== OMSET ====================
+    'omset_records': [
+        # NDP/RDP classification and per-staff date ranges
+        _idx([('staff_id', 1), ('customer_id_normalized', 1), ('product_id', 1), ('record_date', 1)],
+             'staff_customer_product_date_idx'),
+        _idx([('record_date', 1)], 'record_date_idx'),
+        _idx([('product_id', 1), ('record_date', 1)], 'product_record_date_idx'),
+        _idx([('approval_status', 1)], 'approval_status_idx'),
+        # Deposit-existence lookups (followups / funnel / cleanup) by ID or lowercased name
+        _idx([('customer_id_normalized', 1), ('product_id', 1)], 'customer_product_idx'),
+        _idx([('customer_name_lower', 1), ('product_id', 1)], 'customer_name_product_idx'),
+        # Keyset pagination of /omset (sort: record_date, created_at, id)
+        _idx([('staff_id', 1), ('record_date', -1), ('created_at', -1), ('id', -1)], 'staff_date_page_idx'),
+        _idx([('record_date', -1), ('created_at', -1), ('id', -1)], 'date_page_idx'),
+    ],
+    'omset_trash': [
+        _idx([('staff_id', 1), ('deleted_at', -1)], 'staff_deleted_idx'),
+    ],
+    # NDP/RDP first-deposit index (utils.first_deposit_index)
+    'customer_first_deposit': [
+        _idx([('staff_id', 1), ('customer_id_normalized', 1), ('product_id', 1)],
+             'staff_customer_product_uniq', unique=True),
+        _idx([('customer_id_normalized', 1), ('product_id', 1)], 'customer_product_idx'),
+        _idx([('product_id', 1)], 'product_idx'),
+    ],
+    # Daily OMSET rollups (utils.omset_rollup)
+    'omset_daily_rollup': [
+        _idx([('date', 1), ('staff_id', 1), ('product_id', 1)], 'date_staff_product_uniq', unique=True),
+        _idx([('staff_id', 1), ('date', 1)], 'staff_date_idx'),
+        _idx([('product_id', 1), ('date', 1)], 'product_date_idx'),
+    ],
+    # Retention profiles (utils.deposit_profile)
+    'customer_deposit_profile': [
+        _idx([('customer_id_normalized', 1), ('product_id', 1)], 'customer_product_uniq', unique=True),
+        _idx([('last_deposit_date', 1)], 'last_deposit_idx'),
+        _idx([('staff_id', 1), ('last_deposit_date', 1)], 'staff_last_deposit_idx'),
+        _idx([('product_id', 1), ('last_deposit_date', 1)], 'product_last_deposit_idx'),
+    ],
+    # Writes made during a full rebuild of the three collections above (utils.rebuild_guard)
+    'rebuild_journal': [
+        _idx([('collection', 1), ('token', 1)], 'collection_token_idx'),
+    ],
+
+    # ==================== RECORDS ====================
+    'customer_records': _record_indexes() + [
+        # Random assignment: reserved-username exclusion, claims and request lookups
+        _idx([('database_id', 1), ('status', 1), ('username_normalized', 1)], 'database_status_username_idx'),
+        # Reserved-excluded counts of /databases/with-stats (multikey on normalized row_data values)
+        _idx([('database_id', 1), ('status', 1), ('row_identifiers', 1)], 'database_status_identifiers_idx'),
+        _idx([('request_id', 1), ('status', 1)], 'request_status_idx'),
+        _idx([('assigned_to', 1), ('status', 1), ('request_id', 1)], 'assigned_status_request_idx'),
+        # Staff "my assigned records" (sorted by assignment time)
+        _idx([('assigned_to', 1), ('status', 1), ('assigned_at', -1)], 'assigned_status_date_idx'),
+        # Keyset pagination of /databases/{id}/records
+        _idx([('database_id', 1), ('row_number', 1), ('id', 1)], 'database_row_page_idx'),
+    ],
+    'bonanza_records': _claimable_record_indexes(),
+    'memberwd_records': _claimable_record_indexes() + [
+        _idx([('batch_id', 1), ('status', 1)], 'batch_status_idx'),
+    ],
+    'memberwd_batches': [
+        _idx([('staff_id', 1)], 'staff_idx'),
+        _idx([('database_id', 1)], 'database_idx'),
+    ],
+    'databases': [_idx([('product_id', 1)], 'product_idx')],
+    'bonanza_databases': [_idx([('product_id', 1)], 'product_idx')],
+    'memberwd_databases': [_idx([('product_id', 1)], 'product_idx')],
+
+    # ==================== RESERVATIONS ====================
+    'reserved_members': [
+        # Indexed reservation lookups (utils.reserved_lookup)
+        _idx([('status', 1), ('customer_id_upper', 1), ('product_id', 1)], 'status_customer_id_upper_idx'),
+        _idx([('status', 1), ('customer_name_upper', 1), ('product_id', 1)], 'status_customer_name_upper_idx'),
+        # Per-product reserved lists and counts
+        _idx([('status', 1), ('product_id', 1)], 'status_product_idx'),
+        _idx([('created_at', -1), ('id', -1)], 'created_page_idx'),
+    ],
+    'deleted_reserved_members': [
+        _idx([('customer_id_upper', 1), ('product_id', 1)], 'customer_id_upper_idx'),
+        _idx([('customer_name_upper', 1), ('product_id', 1)], 'customer_name_upper_idx'),
+    ],
+
+    # ==================== DOWNLOADS ====================
+    'download_requests': [
+        _idx([('staff_id', 1), ('status', 1), ('created_at', -1)], 'staff_status_date_idx'),
+        _idx([('status', 1), ('created_at', -1)], 'status_date_idx'),
+        # Keyset pagination of /download-requests
+        _idx([('requested_by', 1), ('requested_at', -1), ('id', -1)], 'requester_page_idx'),
+        _idx([('requested_at', -1), ('id', -1)], 'requested_page_idx'),
+    ],
+    'download_history': [
+        _idx([('downloaded_by', 1), ('downloaded_at', -1), ('id', -1)], 'downloader_page_idx'),
+    ],
+
+    # ==================== USERS / NOTIFICATIONS ====================
+    'users': [
+        _idx([('email', 1)], 'email_idx', unique=True),
+        _idx([('role', 1), ('status', 1)], 'role_status_idx'),
+    ],
+    'notifications': [
+        # Unread badge count and the unread-only list
+        _idx([('user_id', 1), ('read', 1), ('created_at', -1)], 'user_read_date_idx'),
+        # Full notification list, newest first
+        _idx([('user_id', 1), ('created_at', -1)], 'user_date_idx'),
+    ],
+    'admin_notifications': [
+        _idx([('read', 1), ('created_at', -1)], 'read_date_idx'),
+    ],
+
+    # ==================== ATTENDANCE / LEAVE ====================
+    'attendance_records': [
+        _idx([('staff_id', 1), ('date', -1)], 'staff_date_idx'),
+        _idx([('date', -1)], 'date_idx'),
+    ],
+    'leave_requests': [
+        _idx([('staff_id', 1), ('date', 1)], 'staff_date_idx'),
+        _idx([('status', 1), ('created_at', -1)], 'status_date_idx'),
+    ],
+    'izin_records': [
+        _idx([('staff_id', 1), ('status', 1)], 'staff_status_idx'),
+        _idx([('date', 1), ('status', 1)], 'date_status_idx'),
+    ],
+
+    # ==================== MISC ====================
+    'daily_summaries': [
+        _idx([('date', -1)], 'date_idx', unique=True),
+    ],
+    'bonus_check_submissions': [
+        _idx([('month', 1), ('submitted_at', -1), ('id', -1)], 'month_page_idx'),
+    ],
+    'inventory_items': [
+        _idx([('status', 1)], 'status_idx'),
+    ],
+    'inventory_assignments': [
+        _idx([('staff_id', 1), ('status', 1)], 'staff_status_idx'),
+    ],
+    # Chunked upload progress (utils.ingestion)
+    'ingestion_jobs': [
+        _idx([('id', 1)], 'id_uniq', unique=True),
+    ],
+    # Admin job queue claims and de-duplication (utils.job_queue)
+    'background_jobs': [
+        _idx([('id', 1)], 'id_uniq', unique=True),
+        _idx([('active_key', 1)], 'active_key_uniq', unique=True,
+             partialFilterExpression={'active_key': {'$type': 'string'}}),
+        _idx([('type', 1), ('status', 1), ('created_at', 1)], 'type_status_created_idx'),
+        _idx([('created_at', -1), ('id', -1)], 'created_page_idx'),
+    ],
+}
+
+
+def _key_signature(keys) -> tuple:
+    # Servers may report directions as floats (1.0)
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in keys)
+
+
+def _options(spec: dict) -> dict:
+    return {option: spec[option] for option in INDEX_OPTIONS if spec.get(option)}
+
+
+def _specs(collection_name: str, names: Optional[Iterable[str]] = None) -> List[dict]:
+    specs = INDEX_MANIFEST.get(collection_name, [])
+    if names is None:
+        return specs
+    names = set(names)
+    return [spec for spec in specs if spec['name'] in names]
+
+
+async def diff_collection_indexes(db, collection_name: str, target: Optional[str] = None,
+                                  names: Optional[Iterable[str]] = None) -> dict:
+    """
+    Compare the existing indexes of target (default: collection_name) with the manifest
+    specs (only the named ones when names is given).
+
+    Returns:
+        {'missing': [spec], 'present': [name], 'conflicts': [{'name', 'reason'}], 'unmanaged': [name]}
+    """
+    existing = await db[target or collection_name].index_information()
+    by_keys = {_key_signature(info['key']): (name, info) for name, info in existing.items()}
+    report = {'missing': [], 'present': [], 'conflicts': [], 'unmanaged': []}
+    claimed = {'_id_'}
+
+    for spec in _specs(collection_name, names):
+        signature = _key_signature(spec['keys'])
+        match = by_keys.get(signature)
+        if match:
+            name, info = match
+            claimed.add(name)
+            if _options(info) != _options(spec):
+                report['conflicts'].append({
+                    'name': spec['name'],
+                    'reason': f"index {name} on the same keys has options {_options(info)}, want {_options(spec)}"
+                })
+            else:
+                report['present'].append(spec['name'])
+        elif spec['name'] in existing:
+            claimed.add(spec['name'])
+            report['conflicts'].append({
+                'name': spec['name'],
+                'reason': f"name is taken by an index on {list(_key_signature(existing[spec['name']]['key']))}"
+            })
+        else:
+            report['missing'].append(spec)
+
+    if names is None:
+        report['unmanaged'] = sorted(set(existing) - claimed)
+    return report
+
+
+async def apply_collection_indexes(db, collection_name: str, target: Optional[str] = None,
+                                   names: Optional[Iterable[str]] = None, dry_run: bool = False) -> dict:
+    """
+    Build the missing manifest indexes of one collection (into target when given,
+    e.g. a rebuild collection) in a single createIndexes command. Modules that need
+    a few indexes before a backfill pass their names; the rest is left to the
+    background build.
+
+    Returns:
+        The diff report plus 'created' (index names) and 'failed' ({name: error})
+    """
+    report = await diff_collection_indexes(db, collection_name, target, names)
+    report['created'], report['failed'] = [], {}
+    collection = db[target or collection_name]
+    if report['missing'] and not dry_run:
+        models = [
+            IndexModel(spec['keys'], name=spec['name'], background=True, **_options(spec))
+            for spec in report['missing']
+        ]
+        try:
+            report['created'] = await collection.create_indexes(models)
+        except OperationFailure:
+            # One failing build (e.g. a unique index over duplicate data) aborts the whole
+            # command; retry one by one so the others still get built
+            for model in models:
+                name = model.document['name']
+                try:
+                    report['created'] += await collection.create_indexes([model])
+                except OperationFailure as e:
+                    report['failed'][name] = str(e)
+                    logger.error(f"Error building index {collection.name}.{name}: {e}")
+    for conflict in report['conflicts']:
+        logger.warning(f"Index conflict on {target or collection_name}.{conflict['name']}: {conflict['reason']}")
+    return report
+
+
+# Result of the last apply_index_manifest() of this worker (reported by /api/health)
+_last_apply: dict = {}
+
+
+async def apply_index_manifest(db, collections: Optional[Iterable[str]] = None, dry_run: bool = False) -> dict:
+    """
+    Diff and build every collection of the manifest (or the given subset).
+
+    Returns:
+        {'collections': {name: report}, 'created': n, 'missing': n, 'conflicts': n, 'failed': n,
+         'errors': {name: msg}}
+    """
+    summary = {'collections': {}, 'created': 0, 'missing': 0, 'conflicts': 0, 'failed': 0, 'errors': {}}
+    for collection_name in collections or INDEX_MANIFEST:
+        try:
+            report = await apply_collection_indexes(db, collection_name, dry_run=dry_run)
+        except Exception as e:
+            summary['errors'][collection_name] = str(e)
+            logger.error(f"Error applying indexes to {collection_name}: {e}")
+            continue
+        summary['collections'][collection_name] = report
+        summary['created'] += len(report['created'])
+        summary['missing'] += len(report['missing'])
+        summary['conflicts'] += len(report['conflicts'])
+        summary['failed'] += len(report['failed'])
+
+    if not dry_run:
+        _last_apply.clear()
+        _last_apply.update({
+            'applied_at': datetime.now(timezone.utc).isoformat(),
+            'created': summary['created'],
+            'conflicts': summary['conflicts'],
+            'failed': summary['failed'],
+            'errors': len(summary['errors']),
+        })
+    return summary
+
+
+_build_task: Optional[asyncio.Task] = None
+
+
+def start_index_build(db) -> asyncio.Task:
+    """Apply the manifest without holding up startup (index builds on large collections take a while)."""
+    global _build_task
+
+    async def build():
+        summary = await apply_index_manifest(db)
+        logger.info(
+            f"✅ Index manifest applied: {summary['created']} created, "
+            f"{summary['conflicts']} conflicts, {summary['failed']} failed builds, {len(summary['errors'])} errors"
+        )
+
+    _build_task = asyncio.create_task(build())
+    return _build_task
+
+
+def index_build_stats() -> dict:
+    running = _build_task is not None and not _build_task.done()
+    return {'running': running, **_last_apply}
+
+
+# ==================== QUERY-PLAN VERIFICATION ====================
+
+# Representative filters / sorts of the hot route queries (values are placeholders;
+# the planner picks an index from the query shape)
+QUERY_CATALOG: List[dict] = [
+    # routes/omset.py
+    {'name': 'omset.staff_range', 'collection': 'omset_records',
+     'filter': {'staff_id': 's', 'record_date': {'$gte': '2024-01-01', '$lte': '2024-01-31'}}},
+    {'name': 'omset.date_range', 'collection': 'omset_records',
+     'filter': {'record_date': {'$gte': '2024-01-01', '$lte': '2024-01-31'}}},
+    {'name': 'omset.product_range', 'collection': 'omset_records',
+     'filter': {'product_id': 'p', 'record_date': {'$gte': '2024-01-01'}}},
+    {'name': 'omset.pending_approvals', 'collection': 'omset_records', 'filter': {'approval_status': 'pending'}},
+    {'name': 'omset.list_page', 'collection': 'omset_records', 'filter': {'staff_id': 's'},
+     'sort': [('record_date', -1), ('created_at', -1), ('id', -1)], 'limit': 101},
+    {'name': 'deposit_lookup.by_customer', 'collection': 'omset_records',
+     'filter': {'customer_id_normalized': {'$in': ['c']}, 'product_id': 'p'}},
+    {'name': 'deposit_lookup.by_name', 'collection': 'omset_records',
+     'filter': {'customer_name_lower': {'$in': ['c']}, 'product_id': 'p'}},
+    {'name': 'leaderboard.rollup', 'collection': 'omset_daily_rollup',
+     'filter': {'staff_id': 's', 'date': {'$gte': '2024-01-01'}}},
+    {'name': 'retention.at_risk', 'collection': 'customer_deposit_profile',
+     'filter': {'last_deposit_date': {'$lt': '2024-01-01'}}},
+    # routes/records.py
+    {'name': 'records.my_assigned', 'collection': 'customer_records',
+     'filter': {'assigned_to': 's', 'status': 'assigned'}, 'sort': [('assigned_at', -1)]},
+    {'name': 'records.database_available', 'collection': 'customer_records',
+     'filter': {'database_id': 'd', 'status': 'available'}},
+    {'name': 'records.random_assignment', 'collection': 'customer_records',
+     'filter': {'database_id': 'd', 'status': 'available', 'username_normalized': {'$nin': ['u']}}},
+    {'name': 'records.excluded_counts', 'collection': 'customer_records',
+     'filter': {'$or': [{'database_id': {'$in': ['d']}, 'status': 'available', 'row_identifiers': {'$in': ['U']}},
+                        {'database_id': {'$in': ['d']}, 'status': 'available', 'is_reserved_member': True}]}},
+    {'name': 'records.request_batch', 'collection': 'customer_records',
+     'filter': {'request_id': 'r', 'status': 'assigned'}},
+    {'name': 'records.by_id', 'collection': 'customer_records', 'filter': {'id': {'$in': ['i']}}},
+    {'name': 'records.database_page', 'collection': 'customer_records',
+     'filter': {'database_id': 'd'}, 'sort': [('row_number', 1), ('id', 1)], 'limit': 101},
+    {'name': 'reserved.approved', 'collection': 'reserved_members', 'filter': {'status': 'approved'}},
+    {'name': 'reserved.by_product', 'collection': 'reserved_members',
+     'filter': {'status': 'approved', 'product_id': 'p'}},
+    {'name': 'reserved.lookup', 'collection': 'reserved_members',
+     'filter': {'status': {'$in': ['pending', 'approved']}, 'customer_id_upper': 'C', 'product_id': 'p'}},
+    # routes/bonanza.py, routes/memberwd.py
+    *[check for collection in ('bonanza_records', 'memberwd_records') for check in (
+        {'name': f'{collection}.staff_page', 'collection': collection,
+         'filter': {'assigned_to': 's', 'status': 'assigned'},
+         'sort': [('assigned_at', -1), ('id', -1)], 'limit': 101},
+        {'name': f'{collection}.staff_invalid', 'collection': collection,
+         'filter': {'assigned_to': 's', 'status': 'assigned', 'validation_status': 'invalid'}},
+        {'name': f'{collection}.invalid_alerts', 'collection': collection,
+         'filter': {'validation_status': 'invalid', 'status': 'assigned'}},
+        {'name': f'{collection}.database_available', 'collection': collection,
+         'filter': {'database_id': 'd', 'status': 'available'}},
+        {'name': f'{collection}.reserved_sync', 'collection': collection,
+         'filter': {'row_identifiers': {'$in': ['u']}, 'status': 'available'}},
+    )],
+    # routes/notifications.py
+    {'name': 'notifications.list', 'collection': 'notifications',
+     'filter': {'user_id': 'u'}, 'sort': [('created_at', -1)], 'limit': 50},
+    {'name': 'notifications.unread', 'collection': 'notifications', 'filter': {'user_id': 'u', 'read': False}},
+    # routes/records.py download requests
+    {'name': 'download_requests.page', 'collection': 'download_requests',
+     'filter': {'requested_by': 's'}, 'sort': [('requested_at', -1), ('id', -1)], 'limit': 101},
+    {'name': 'download_requests.my_batches', 'collection': 'download_requests',
+     'filter': {'requested_by': 's', 'status': 'approved'}},
+    {'name': 'download_requests.approved', 'collection': 'download_requests', 'filter': {'status': 'approved'}},
+    # routes/attendance.py, routes/leave.py
+    {'name': 'attendance.staff_range', 'collection': 'attendance_records',
+     'filter': {'staff_id': 's', 'date': {'$gte': '2024-01-01'}}},
+    {'name': 'leave.staff_range', 'collection': 'leave_requests',
+     'filter': {'staff_id': 's', 'date': {'$gte': '2024-01-01'}}},
+    # utils/job_queue.py
+    {'name': 'jobs.claim', 'collection': 'background_jobs',
+     'filter': {'type': 't', '$or': [{'status': 'queued'}, {'status': 'running', 'lease_expires_at': {'$lte': 0}}]},
+     'sort': [('created_at', 1)], 'limit': 1},
+]
+
+
+def _has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get('stage') == 'COLLSCAN':
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+
+def _winning_plans(explain) -> list:
+    """Every winningPlan in an explain document (rejected plans are ignored)."""
+    plans = []
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == 'winningPlan':
+                plans.append(value)
+            elif key != 'rejectedPlans':
+                plans.extend(_winning_plans(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            plans.extend(_winning_plans(value))
+    return plans
+
+
+async def explain_query(db, check: dict) -> dict:
+    """Run explain (queryPlanner verbosity: plans only, nothing executes) for one catalog entry."""
+    command = {'find': check['collection'], 'filter': check['filter']}
+    if check.get('sort'):
+        command['sort'] = dict(check['sort'])
+    if check.get('limit'):
+        command['limit'] = check['limit']
+    return await db.command('explain', command, verbosity='queryPlanner')
+
+
+async def verify_query_plans(db, threshold: int = COLLSCAN_THRESHOLD,
+                             catalog: Optional[List[dict]] = None) -> dict:
+    """
+    Explain every catalog query and flag collection scans on collections above threshold documents.
+
+    Returns:
+        {'ok': bool, 'checked': n, 'failures': [{'name', 'collection', 'documents'}], 'scans_below_threshold': [name]}
+    """
+    failures, small_scans = [], []
+    sizes: Dict[str, int] = {}
+    catalog = catalog if catalog is not None else QUERY_CATALOG
+
+    for check in catalog:
+        explain = await explain_query(db, check)
+        if not any(_has_collscan(plan) for plan in _winning_plans(explain)):
+            continue
+        collection_name = check['collection']
+        if collection_name not in sizes:
+            sizes[collection_name] = await db[collection_name].estimated_document_count()
+        if sizes[collection_name] >= threshold:
+            failures.append({'name': check['name'], 'collection': collection_name,
+                             'documents': sizes[collection_name]})
+        else:
+            small_scans.append(check['name'])
+
+    return {'ok': not failures, 'checked': len(catalog), 'failures': failures,
+            'scans_below_threshold': small_scans}
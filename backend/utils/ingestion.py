@@ -0,0 +1,360 @@
+"""
+Chunked Upload Ingestion
+Streaming import of uploaded CSV/Excel databases (Normal DB, DB Bonanza,
+Member WD) without holding the whole file or all its rows in memory.
+
+- spool_upload(): copy the UploadFile to disk in fixed-size blocks
+- ChunkReader: parse the spooled file in fixed-size row chunks inside a worker
+  thread of the shared blocking pool (pandas chunksize for CSV, openpyxl read-only streaming for .xlsx)
+  and sanitize each chunk column-wise instead of per cell with iterrows()
+- ingest_chunks(): build the documents of every chunk (on the same pool) and insert
+  them with an unordered insert_many, reporting progress on an IngestionJob
+- import_upload(): run a whole import; a failed import removes its partial records
+  and its database document so no half-imported database stays visible
+
+Progress lives in the ingestion_jobs collection so any worker can answer
+"how far is job X?" while another one is still importing.
+"""
+
+import asyncio
+import os
+import tempfile
+import uuid
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from utils.helpers import get_jakarta_now
+from utils.executors import run_blocking
+from utils.index_manifest import apply_collection_indexes
+
+
+INGEST_CHUNK_ROWS = 5000
+SPOOL_BLOCK_BYTES = 1024 * 1024
+PREVIEW_ROWS = 5
+INGESTION_JOBS_COLLECTION = 'ingestion_jobs'
+
+# Cell sanitization modes
+# - NULLABLE_TEXT: missing -> None, everything else str() (Normal DB upload)
+# - BLANK_TEXT: missing -> '', integral numbers without '.0' (Bonanza / Member WD uploads)
+NULLABLE_TEXT = 'nullable'
+BLANK_TEXT = 'blank'
+
+# Background imports started from this worker (kept referenced until done)
+_background_tasks = set()
+
+
+class UploadParseError(ValueError):
+    """Raised when a chunk of an uploaded file cannot be parsed."""
+
+
+def new_spool_path(prefix: str, file_type: str) -> str:
+    """Temporary file path for an upload that is not kept after the import."""
+    return os.path.join(tempfile.gettempdir(), f'{prefix}_{uuid.uuid4()}.{file_type}')
+
+
+async def spool_upload(upload, destination) -> int:
+    """
+    Copy an UploadFile to destination block by block.
+
+    Returns:
+        Number of bytes written
+    """
+    size = 0
+    with open(destination, 'wb') as out:
+        while True:
+            block = await upload.read(SPOOL_BLOCK_BYTES)
+            if not block:
+                break
+            out.write(block)
+            size += len(block)
+    return size
+
+
+def _column_names(header) -> List[str]:
+    """String column names with pandas' conventions for blank and duplicate headers."""
+    names = []
+    seen: Dict[str, int] = {}
+    for position, value in enumerate(header):
+        name = f'Unnamed: {position}' if value is None or str(value).strip() == '' else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _iter_xlsx_frames(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _column_names(header)
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            values = list(row[:len(columns)]) + [None] * (len(columns) - len(row))
+            batch.append(values)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_frames(path: str, file_type: str, chunk_rows: int = INGEST_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Yield the rows of an uploaded file as DataFrames of at most chunk_rows rows.
+
+    Args:
+        path: Spooled file path
+        file_type: 'csv', 'xlsx' or 'xls'
+        chunk_rows: Rows per chunk
+    """
+    if file_type == 'csv':
+        with pd.read_csv(path, chunksize=chunk_rows) as reader:
+            for frame in reader:
+                yield frame
+    elif file_type == 'xlsx':
+        yield from _iter_xlsx_frames(path, chunk_rows)
+    else:
+        # Legacy .xls has no streaming reader; slice the parsed sheet instead
+        frame = pd.read_excel(path)
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+
+
+def _blank_text_cell(value) -> str:
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    if isinstance(value, (int, float)):
+        return str(int(value)) if float(value).is_integer() else str(value)
+    try:
+        return str(value)
+    except Exception:
+        return ''
+
+
+def _sanitize_column(series: pd.Series, mode: str) -> pd.Series:
+    missing = series.isna()
+    if mode == NULLABLE_TEXT:
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # astype(str) drops midnight times; str(Timestamp) keeps them, as before
+            return series.map(str).astype(object).where(~missing, None)
+        return series.astype(str).astype(object).where(~missing, None)
+
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        text = series.astype('int64').astype(str) if pd.api.types.is_bool_dtype(series) else series.astype(str)
+    elif pd.api.types.is_float_dtype(series):
+        text = series.astype(str)
+        integral = ~missing & (series % 1 == 0)
+        text[integral] = series[integral].astype('int64').astype(str)
+    else:
+        # Mixed object columns (e.g. numbers and text from Excel) need the per-value rule
+        return series.map(_blank_text_cell).astype(object)
+    return text.astype(object).where(~missing, '')
+
+
+def sanitize_frame(frame: pd.DataFrame, mode: str) -> List[dict]:
+    """
+    Convert one chunk into row_data dicts (string column names, sanitized string values).
+
+    Args:
+        frame: Parsed chunk
+        mode: NULLABLE_TEXT or BLANK_TEXT
+    """
+    frame = frame.copy()
+    frame.columns = [str(col) for col in frame.columns]
+    cleaned = {col: _sanitize_column(frame[col], mode) for col in frame.columns}
+    return pd.DataFrame(cleaned, columns=frame.columns).to_dict('records')
+
+
+class ChunkReader:
+    """Parse and sanitize a spooled upload chunk by chunk in a worker thread."""
+
+    def __init__(self, path: str, file_type: str, mode: str, chunk_rows: int = INGEST_CHUNK_ROWS):
+        self.path = path
+        self.file_type = file_type
+        self.mode = mode
+        self.chunk_rows = chunk_rows
+        self.columns: List[str] = []
+        self.preview_rows: List[list] = []
+        self.rows_read = 0
+        self._frames: Optional[Iterator[pd.DataFrame]] = None
+
+    def _read_next(self) -> Optional[List[dict]]:
+        try:
+            if self._frames is None:
+                self._frames = iter_frames(self.path, self.file_type, self.chunk_rows)
+            frame = next(self._frames, None)
+            if frame is None:
+                return None
+            rows = sanitize_frame(frame, self.mode)
+        except Exception as e:
+            raise UploadParseError(str(e)) from e
+        if not self.columns:
+            self.columns = [str(col) for col in frame.columns]
+        if len(self.preview_rows) < PREVIEW_ROWS:
+            needed = PREVIEW_ROWS - len(self.preview_rows)
+            self.preview_rows.extend([list(row.values()) for row in rows[:needed]])
+        self.rows_read += len(rows)
+        return rows
+
+    async def next_chunk(self) -> Optional[List[dict]]:
+        """
+        Sanitized rows of the next chunk, or None at end of file.
+
+        Raises:
+            UploadParseError: the chunk could not be parsed
+        """
+        return await run_blocking(self._read_next)
+
+
+class IngestionJob:
+    """Progress document of one upload in the ingestion_jobs collection."""
+
+    def __init__(self, db, job_id: str):
+        self.db = db
+        self.id = job_id
+
+    @classmethod
+    async def create(cls, db, kind: str, filename: str, user) -> 'IngestionJob':
+        job_id = str(uuid.uuid4())
+        now = get_jakarta_now().isoformat()
+        await db[INGESTION_JOBS_COLLECTION].insert_one({
+            'id': job_id,
+            'kind': kind,
+            'filename': filename,
+            'status': 'running',
+            'processed_rows': 0,
+            'chunks': 0,
+            'database_id': None,
+            'result': None,
+            'error': None,
+            'created_by': user.id,
+            'created_by_name': user.name,
+            'created_at': now,
+            'updated_at': now
+        })
+        return cls(db, job_id)
+
+    async def update(self, **fields):
+        fields['updated_at'] = get_jakarta_now().isoformat()
+        await self.db[INGESTION_JOBS_COLLECTION].update_one({'id': self.id}, {'$set': fields})
+
+    async def progress(self, processed_rows: int, chunks: int):
+        await self.update(processed_rows=processed_rows, chunks=chunks)
+
+    async def complete(self, result: dict):
+        await self.update(status='completed', result=result)
+
+    async def fail(self, error: str):
+        await self.update(status='failed', error=error)
+
+
+async def get_ingestion_job(db, job_id: str) -> Optional[dict]:
+    return await db[INGESTION_JOBS_COLLECTION].find_one({'id': job_id}, {'_id': 0})
+
+
+async def ingest_chunks(
+    reader: ChunkReader,
+    first_chunk: Optional[List[dict]],
+    collection,
+    build_docs: Callable[[List[dict], int], List[dict]],
+    job: IngestionJob
+) -> int:
+    """
+    Insert every chunk of reader (starting with the already-read first_chunk).
+
+    Args:
+        reader: ChunkReader positioned after first_chunk
+        first_chunk: Rows returned by the reader's first next_chunk() call
+        collection: Target records collection
+        build_docs: (rows, first_row_number) -> documents; runs in a worker thread
+        job: Progress document to update after every chunk
+
+    Returns:
+        Number of records inserted
+    """
+    inserted = 0
+    chunks = 0
+    rows = first_chunk
+    while rows:
+        docs = await run_blocking(build_docs, rows, inserted + 1)
+        if docs:
+            await collection.insert_many(docs, ordered=False)
+        inserted += len(rows)
+        chunks += 1
+        await job.progress(inserted, chunks)
+        rows = await reader.next_chunk()
+    return inserted
+
+
+async def import_upload(
+    job: IngestionJob,
+    reader: ChunkReader,
+    first_chunk: Optional[List[dict]],
+    collection,
+    build_docs: Callable[[List[dict], int], List[dict]],
+    finalize: Callable[[int], Awaitable[dict]],
+    databases,
+    database_id: str
+) -> dict:
+    """
+    Run a whole import: insert every chunk, finalize the database document and close the job.
+
+    On failure the records already inserted (database_id in collection) and the
+    database document (id in databases) are deleted before the job is marked failed.
+
+    Args:
+        collection: Target records collection
+        finalize: Coroutine function (inserted_count) -> result dict stored on the job
+        databases: Collection holding the database document of this upload
+        database_id: ID of that database document
+
+    Returns:
+        The finalize() result
+
+    Raises:
+        UploadParseError: the file could not be parsed past the first chunk
+    """
+    try:
+        inserted = await ingest_chunks(reader, first_chunk, collection, build_docs, job)
+        result = await finalize(inserted)
+    except Exception as e:
+        try:
+            await collection.delete_many({'database_id': database_id})
+            await databases.delete_one({'id': database_id})
+        finally:
+            await job.fail(str(e))
+        raise
+    await job.complete(result)
+    return result
+
+
+async def _run_guarded(coro):
+    try:
+        await coro
+    except Exception as e:
+        print(f"Background upload import failed: {e}")
+
+
+def run_in_background(coro):
+    """Run an import after the response is sent, keeping a reference until it finishes."""
+    task = asyncio.create_task(_run_guarded(coro))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def ensure_ingestion_indexes(db):
+    await apply_collection_indexes(db, INGESTION_JOBS_COLLECTION)
@@ -0,0 +1,461 @@
+"""
+Background Job Queue
+MongoDB-backed queue for long-running admin operations (repairs, migrations,
+summary backfills) so they no longer run inside the HTTP request.
+
+- register_job(): declare a handler for a job type with its concurrency limit
+- enqueue_job(): insert a job document; an identical active job is reused, so
+  double-clicking a button never starts the same operation twice
+- JobWorker: polls the background_jobs collection, claims jobs with a lease
+  (find_one_and_update on status/lease_expires_at, so only one worker runs a
+  job), renews the lease while the handler runs and records the result
+- Per-type concurrency is enforced with slot documents in background_job_slots
+  (one per allowed concurrent job): a worker must take a free slot with
+  find_one_and_update before claiming a job of that type. Slots carry the same
+  lease as their job and are released when it finishes, or reused once the
+  lease expires
+- JobContext.progress(): progress percentage, message and a resumable
+  checkpoint; a job whose worker died is re-claimed once its lease expires
+  and its handler resumes from the last checkpoint
+
+Job documents carry Jakarta ISO timestamps like the rest of the app; lease
+expiry uses BSON datetimes so it compares correctly across workers.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.helpers import get_jakarta_now
+from utils.index_manifest import apply_collection_indexes
+from utils.realtime_pubsub import WORKER_ID
+
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = 'background_jobs'
+JOB_SLOTS_COLLECTION = 'background_job_slots'
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+JOB_POLL_SECONDS = 2.0
+DEFAULT_LEASE_SECONDS = 120
+# A job whose worker died this many times is marked failed instead of re-claimed
+MAX_JOB_ATTEMPTS = 3
+# Jobs one worker process runs at the same time (across all types)
+MAX_WORKER_JOBS = 4
+# Endpoints wait this long for a quick job before answering with its id (below the 30s client timeout)
+JOB_INLINE_WAIT_SECONDS = 20
+JOB_WAIT_POLL_SECONDS = 0.5
+
+
+class JobLeaseLostError(RuntimeError):
+    """Raised inside a handler when another worker has taken over its job."""
+
+
+class JobType:
+    """Handler and limits of one registered job type."""
+
+    def __init__(self, name: str, handler: Callable[['JobContext'], Awaitable[dict]], concurrency: int, lease_seconds: int):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+
+
+_JOB_TYPES: Dict[str, JobType] = {}
+
+
+def register_job(name: str, concurrency: int = 1, lease_seconds: int = DEFAULT_LEASE_SECONDS):
+    """
+    Decorator registering an async handler(ctx) -> result dict for a job type.
+
+    Args:
+        name: Job type stored on the job documents
+        concurrency: Maximum jobs of this type running at once (across workers)
+        lease_seconds: Lease length; renewed while the handler runs
+    """
+    def decorator(handler):
+        _JOB_TYPES[name] = JobType(name, handler, concurrency, lease_seconds)
+        return handler
+    return decorator
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _active_key(job_type: str, params: dict) -> str:
+    return f"{job_type}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+class JobContext:
+    """What a handler sees of its job: params, checkpoint and progress reporting."""
+
+    def __init__(self, db, job: dict, job_type: JobType):
+        self.db = db
+        self.job_id = job['id']
+        self.params = job.get('params') or {}
+        self.checkpoint = job.get('checkpoint') or {}
+        self.attempt = job.get('attempts', 1)
+        self.user_id = job.get('created_by')
+        self.user_name = job.get('created_by_name') or 'System'
+        self.lease_seconds = job_type.lease_seconds
+
+    async def progress(self, percent: float, message: Optional[str] = None, checkpoint: Optional[dict] = None):
+        """
+        Report progress (0-100) and optionally save a checkpoint; also renews the lease.
+
+        Raises:
+            JobLeaseLostError: this worker no longer owns the job
+        """
+        fields = {
+            'progress': max(0, min(100, int(percent))),
+            'lease_expires_at': _utc_now() + timedelta(seconds=self.lease_seconds),
+            'updated_at': get_jakarta_now().isoformat()
+        }
+        if message is not None:
+            fields['progress_message'] = message
+        if checkpoint is not None:
+            fields['checkpoint'] = checkpoint
+            self.checkpoint = checkpoint
+        result = await self.db[JOBS_COLLECTION].update_one(
+            {'id': self.job_id, 'status': JOB_RUNNING, 'lease_owner': WORKER_ID},
+            {'$set': fields}
+        )
+        if result.matched_count == 0:
+            raise JobLeaseLostError(f"Lost the lease on job {self.job_id}")
+
+
+async def enqueue_job(db, job_type: str, params: Optional[dict] = None, user=None) -> dict:
+    """
+    Queue a job, or return the queued/running job with the same type and params.
+
+    Args:
+        db: Database connection
+        job_type: A type registered with register_job()
+        params: JSON-serializable handler parameters
+        user: Requesting user (stored as created_by)
+
+    Returns:
+        The job document (without _id)
+    """
+    if job_type not in _JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    params = params or {}
+    now = get_jakarta_now().isoformat()
+    job = {
+        'id': str(uuid.uuid4()),
+        'type': job_type,
+        'params': params,
+        'status': JOB_QUEUED,
+        'progress': 0,
+        'progress_message': 'Queued',
+        'checkpoint': None,
+        'result': None,
+        'error': None,
+        'attempts': 0,
+        'lease_owner': None,
+        'lease_expires_at': None,
+        # Unique while the job is active; removed when it finishes
+        'active_key': _active_key(job_type, params),
+        'created_by': user.id if user else None,
+        'created_by_name': user.name if user else None,
+        'created_at': now,
+        'updated_at': now,
+        'started_at': None,
+        'finished_at': None
+    }
+    try:
+        await db[JOBS_COLLECTION].insert_one(job)
+    except DuplicateKeyError:
+        existing = await db[JOBS_COLLECTION].find_one({'active_key': job['active_key']}, {'_id': 0})
+        if existing:
+            return existing
+        # The other job finished between the insert and the lookup; queue a fresh one
+        job['id'] = str(uuid.uuid4())
+        job.pop('_id', None)
+        await db[JOBS_COLLECTION].insert_one(job)
+    job.pop('_id', None)
+    job_worker.wake()
+    return job
+
+
+async def get_job(db, job_id: str) -> Optional[dict]:
+    return await db[JOBS_COLLECTION].find_one({'id': job_id}, {'_id': 0, 'active_key': 0})
+
+
+async def wait_for_job(db, job_id: str, timeout: float = JOB_INLINE_WAIT_SECONDS) -> Optional[dict]:
+    """Poll a job until it finishes or timeout seconds pass; returns its latest document."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        job = await get_job(db, job_id)
+        if job is None or job['status'] in JOB_FINISHED_STATUSES or loop.time() >= deadline:
+            return job
+        await asyncio.sleep(JOB_WAIT_POLL_SECONDS)
+
+
+class JobWorker:
+    """Claims queued jobs (or jobs whose lease expired) and runs their handlers."""
+
+    def __init__(self, poll_seconds: float = JOB_POLL_SECONDS, max_jobs: int = MAX_WORKER_JOBS):
+        self.poll_seconds = poll_seconds
+        self.max_jobs = max_jobs
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._running: Dict[str, asyncio.Task] = {}
+        # Job type -> concurrency its slot documents were created for
+        self._slots_ready: Dict[str, int] = {}
+        self.claimed = 0
+        self.completed = 0
+        self.failed = 0
+        self.lost = 0
+
+    def wake(self):
+        """Look for work now instead of at the next poll."""
+        self._wake.set()
+
+    async def _fail_exhausted(self):
+        # Jobs abandoned MAX_JOB_ATTEMPTS times would otherwise be re-claimed forever
+        now = _utc_now()
+        await self._db[JOBS_COLLECTION].update_many(
+            {'status': JOB_RUNNING, 'lease_expires_at': {'$lte': now}, 'attempts': {'$gte': MAX_JOB_ATTEMPTS}},
+            {
+                '$set': {
+                    'status': JOB_FAILED,
+                    'error': f'Worker lost {MAX_JOB_ATTEMPTS} times',
+                    'finished_at': get_jakarta_now().isoformat(),
+                    'lease_owner': None
+                },
+                '$unset': {'active_key': ''}
+            }
+        )
+
+    async def _ensure_slots(self, job_type: JobType):
+        if self._slots_ready.get(job_type.name) == job_type.concurrency:
+            return
+        for slot in range(job_type.concurrency):
+            try:
+                await self._db[JOB_SLOTS_COLLECTION].update_one(
+                    {'_id': f'{job_type.name}:{slot}'},
+                    {'$setOnInsert': {
+                        'type': job_type.name,
+                        'slot': slot,
+                        'claim_id': None,
+                        'lease_owner': None,
+                        'lease_expires_at': None
+                    }},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # Another worker created it at the same time
+                pass
+        self._slots_ready[job_type.name] = job_type.concurrency
+
+    async def _acquire_slot(self, job_type: JobType, claim_id: str, now: datetime) -> Optional[str]:
+        # Free slots, or slots whose holder's lease expired (its worker died)
+        slot = await self._db[JOB_SLOTS_COLLECTION].find_one_and_update(
+            {
+                'type': job_type.name,
+                'slot': {'$lt': job_type.concurrency},
+                '$or': [{'claim_id': None}, {'lease_expires_at': {'$lte': now}}]
+            },
+            {'$set': {
+                'claim_id': claim_id,
+                'lease_owner': WORKER_ID,
+                'lease_expires_at': now + timedelta(seconds=job_type.lease_seconds)
+            }},
+            projection={'_id': 1}
+        )
+        return slot['_id'] if slot else None
+
+    async def _release_slot(self, slot_id: Optional[str], claim_id: Optional[str]):
+        if not slot_id or not claim_id:
+            return
+        await self._db[JOB_SLOTS_COLLECTION].update_one(
+            {'_id': slot_id, 'claim_id': claim_id},
+            {'$set': {'claim_id': None, 'lease_owner': None, 'lease_expires_at': None}}
+        )
+
+    async def _claim(self, job_type: JobType) -> Optional[dict]:
+        await self._ensure_slots(job_type)
+        now = _utc_now()
+        claim_id = str(uuid.uuid4())
+        slot_id = await self._acquire_slot(job_type, claim_id, now)
+        if slot_id is None:
+            return None
+
+        job = await self._db[JOBS_COLLECTION].find_one_and_update(
+            {
+                'type': job_type.name,
+                '$or': [
+                    {'status': JOB_QUEUED},
+                    {'status': JOB_RUNNING, 'lease_expires_at': {'$lte': now}, 'attempts': {'$lt': MAX_JOB_ATTEMPTS}}
+                ]
+            },
+            {
+                '$set': {
+                    'status': JOB_RUNNING,
+                    'lease_owner': WORKER_ID,
+                    'lease_expires_at': now + timedelta(seconds=job_type.lease_seconds),
+                    'slot_id': slot_id,
+                    'slot_claim_id': claim_id,
+                    'started_at': get_jakarta_now().isoformat(),
+                    'updated_at': get_jakarta_now().isoformat()
+                },
+                '$inc': {'attempts': 1}
+            },
+            projection={'_id': 0},
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            await self._release_slot(slot_id, claim_id)
+        return job
+
+    async def poll(self) -> int:
+        """Claim and start as many jobs as the limits allow; returns the number started."""
+        await self._fail_exhausted()
+        started = 0
+        for job_type in list(_JOB_TYPES.values()):
+            while len(self._running) < self.max_jobs:
+                job = await self._claim(job_type)
+                if job is None:
+                    break
+                self.claimed += 1
+                started += 1
+                task = asyncio.create_task(self._run(job, job_type))
+                self._running[job['id']] = task
+                task.add_done_callback(lambda _, job_id=job['id']: self._running.pop(job_id, None))
+        return started
+
+    async def _heartbeat(self, job: dict, job_type: JobType, handler_task: asyncio.Task):
+        # Keeps the job and slot leases alive for handlers that do long steps between progress() calls
+        while True:
+            await asyncio.sleep(job_type.lease_seconds / 3)
+            lease_expires_at = _utc_now() + timedelta(seconds=job_type.lease_seconds)
+            result = await self._db[JOBS_COLLECTION].update_one(
+                {'id': job['id'], 'status': JOB_RUNNING, 'lease_owner': WORKER_ID},
+                {'$set': {'lease_expires_at': lease_expires_at}}
+            )
+            slot = await self._db[JOB_SLOTS_COLLECTION].update_one(
+                {'_id': job.get('slot_id'), 'claim_id': job.get('slot_claim_id')},
+                {'$set': {'lease_expires_at': lease_expires_at}}
+            )
+            if result.matched_count == 0 or slot.matched_count == 0:
+                handler_task.cancel()
+                return
+
+    async def _finish(self, job_id: str, fields: dict) -> bool:
+        fields['finished_at'] = get_jakarta_now().isoformat()
+        fields['updated_at'] = fields['finished_at']
+        fields['lease_owner'] = None
+        fields['lease_expires_at'] = None
+        result = await self._db[JOBS_COLLECTION].update_one(
+            {'id': job_id, 'status': JOB_RUNNING, 'lease_owner': WORKER_ID},
+            {'$set': fields, '$unset': {'active_key': ''}}
+        )
+        return result.matched_count > 0
+
+    async def _run(self, job: dict, job_type: JobType):
+        ctx = JobContext(self._db, job, job_type)
+        handler_task = asyncio.create_task(job_type.handler(ctx))
+        heartbeat = asyncio.create_task(self._heartbeat(job, job_type, handler_task))
+        try:
+            try:
+                result = await handler_task
+            except (JobLeaseLostError, asyncio.CancelledError):
+                # Another worker owns the job now (or this one is shutting down)
+                self.lost += 1
+                return
+            except Exception as e:
+                logger.exception(f"Job {job['id']} ({job_type.name}) failed")
+                if await self._finish(job['id'], {'status': JOB_FAILED, 'error': str(e)}):
+                    self.failed += 1
+                return
+            finally:
+                heartbeat.cancel()
+
+            if await self._finish(job['id'], {
+                'status': JOB_COMPLETED,
+                'progress': 100,
+                'progress_message': 'Completed',
+                'result': result
+            }):
+                self.completed += 1
+        finally:
+            # Only frees the slot if this claim still holds it
+            await self._release_slot(job.get('slot_id'), job.get('slot_claim_id'))
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Job worker poll failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self, db):
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._running.values()):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        if self._db is not None:
+            # Hand unfinished jobs back right away; they resume from their checkpoint elsewhere
+            await self._db[JOBS_COLLECTION].update_many(
+                {'status': JOB_RUNNING, 'lease_owner': WORKER_ID},
+                {'$set': {'status': JOB_QUEUED, 'lease_owner': None, 'lease_expires_at': None},
+                 '$inc': {'attempts': -1}}
+            )
+            await self._db[JOB_SLOTS_COLLECTION].update_many(
+                {'lease_owner': WORKER_ID},
+                {'$set': {'claim_id': None, 'lease_owner': None, 'lease_expires_at': None}}
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': len(self._running),
+            'claimed': self.claimed,
+            'completed': self.completed,
+            'failed': self.failed,
+            'lost': self.lost,
+            'job_types': sorted(_JOB_TYPES),
+        }
+
+
+# Process-wide worker started/stopped with the app
+job_worker = JobWorker()
+
+
+async def ensure_job_indexes(db):
+    """Create the indexes used by job lookups, claims and de-duplication."""
+    await apply_collection_indexes(db, JOBS_COLLECTION)
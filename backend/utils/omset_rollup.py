@@ -0,0 +1,348 @@
+"""
+Daily OMSET Rollup
+Materialized omset_daily_rollup collection: one row per (date, staff_id, product_id)
+holding nominal/depo totals, record count and NDP/RDP counts.
+
+Dashboard, summary, leaderboard and Report CRM read these rows instead of
+scanning raw omset_records. Rows are refreshed from the OMSET write paths
+through sync_omset_change() and can be rebuilt per date range (a full rebuild
+swaps in a staging collection, like the first-deposit index).
+
+NDP/RDP semantics per row (same as the per-record logic used everywhere else):
+- a record is NDP when it is not "tambahan" and its record_date equals the
+  (staff, customer, product) first deposit date from customer_first_deposit
+- ndp_count / rdp_count count DISTINCT customers with at least one NDP / RDP record
+- customer_count counts distinct customers; customers with an NDP record are
+  counted as NDP by Report CRM, so its RDP is customer_count - ndp_count
+- ndp_total / rdp_total count each customer's depo once per row and bucket, like
+  the /omset/summary daily totals always have: the depo_total of the customer's
+  first NDP (resp. RDP) record of the day in insertion order, not the sum of all
+  of them (depo_total holds every record's depo)
+
+Full rebuilds run under utils.rebuild_guard, which replays the rows refreshed
+while they run.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.helpers import get_jakarta_now
+from utils.db_operations import APPROVED_FILTER, recalculate_customer_type
+from utils.first_deposit_index import ndp_classification_stages
+from utils.deposit_profile import refresh_deposit_profile
+from utils.index_manifest import apply_collection_indexes
+from utils.rebuild_guard import RebuildInProgressError, guarded_rebuild, journal_write
+from utils.ttl_cache import TTLCache
+
+
+ROLLUP_COLLECTION = 'omset_daily_rollup'
+ROLLUP_SETTINGS_KEY = 'omset_daily_rollup'
+
+# /omset/dashboard-stats responses, keyed by date. Dashboards poll every 30s, so the TTL
+# spans a poll; every rollup write clears the cache on this worker and the TTL bounds
+# staleness on other workers.
+DASHBOARD_STATS_CACHE_SECONDS = 60
+dashboard_stats_cache = TTLCache(maxsize=4, ttl_seconds=DASHBOARD_STATS_CACHE_SECONDS)
+
+ROLLUP_FIELDS = (
+    'nominal', 'depo_total', 'count', 'ndp_count', 'rdp_count',
+    'ndp_total', 'rdp_total', 'customer_count'
+)
+
+def _rollup_pipeline(match: dict) -> List[dict]:
+    """Aggregation turning raw omset_records (filtered by match) into rollup rows."""
+    return [
+        {'$match': {'$and': [match, APPROVED_FILTER]}},
+        # Insertion order, so the depo "first" counted per customer is deterministic
+        {'$sort': {'_id': 1}},
+        *ndp_classification_stages(),
+        # One row per (date, staff, product, customer)
+        {'$group': {
+            '_id': {'d': '$record_date', 's': '$staff_id', 'p': '$product_id', 'c': '$_cid'},
+            'staff_name': {'$last': '$staff_name'},
+            'product_name': {'$last': '$product_name'},
+            'nominal': {'$sum': {'$ifNull': ['$nominal', 0]}},
+            'depo_total': {'$sum': '$_depo'},
+            'count': {'$sum': 1},
+            'has_ndp': {'$max': '$_is_ndp'},
+            'has_rdp': {'$max': {'$not': ['$_is_ndp']}},
+            'ndp_depos': {'$push': {'$cond': ['$_is_ndp', '$_depo', '$$REMOVE']}},
+            'rdp_depos': {'$push': {'$cond': ['$_is_ndp', '$$REMOVE', '$_depo']}},
+        }},
+        # One row per (date, staff, product)
+        {'$group': {
+            '_id': {'d': '$_id.d', 's': '$_id.s', 'p': '$_id.p'},
+            'staff_name': {'$last': '$staff_name'},
+            'product_name': {'$last': '$product_name'},
+            'nominal': {'$sum': '$nominal'},
+            'depo_total': {'$sum': '$depo_total'},
+            'count': {'$sum': '$count'},
+            'ndp_count': {'$sum': {'$cond': ['$has_ndp', 1, 0]}},
+            'rdp_count': {'$sum': {'$cond': ['$has_rdp', 1, 0]}},
+            # The customer's depo counts once per bucket (its first record's)
+            'ndp_total': {'$sum': {'$ifNull': [{'$arrayElemAt': ['$ndp_depos', 0]}, 0]}},
+            'rdp_total': {'$sum': {'$ifNull': [{'$arrayElemAt': ['$rdp_depos', 0]}, 0]}},
+            'customer_count': {'$sum': 1},
+        }},
+        {'$project': {
+            '_id': 0,
+            'date': '$_id.d',
+            'staff_id': '$_id.s',
+            'product_id': '$_id.p',
+            'staff_name': 1,
+            'product_name': 1,
+            **{f: 1 for f in ROLLUP_FIELDS},
+        }},
+    ]
+
+
+async def refresh_daily_rollup(db, record_date: str, staff_id: str, product_id: str):
+    """
+    Recompute a single rollup row from its raw records (removing it if none remain).
+
+    Args:
+        db: Database connection
+        record_date: Date of the row (YYYY-MM-DD)
+        staff_id: Staff user ID
+        product_id: Product ID
+    """
+    if not record_date or not staff_id or not product_id:
+        return
+
+    dashboard_stats_cache.clear()
+    key_filter = {'date': record_date, 'staff_id': staff_id, 'product_id': product_id}
+    rows = await db.omset_records.aggregate(_rollup_pipeline({
+        'record_date': record_date, 'staff_id': staff_id, 'product_id': product_id
+    })).to_list(1)
+
+    await journal_write(db, ROLLUP_COLLECTION, key_filter)
+    if not rows:
+        await db[ROLLUP_COLLECTION].delete_one(key_filter)
+        return
+
+    row = rows[0]
+    row['updated_at'] = get_jakarta_now().isoformat()
+    await db[ROLLUP_COLLECTION].replace_one(key_filter, row, upsert=True)
+
+
+async def sync_omset_change(
+    db,
+    staff_id: str,
+    customer_id: str,
+    product_id: str,
+    record_dates: Iterable[Optional[str]] = ()
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Single write-path hook after an OMSET record is created, approved, declined,
+    edited, deleted or restored.
+
+    Recalculates customer_type and the first-deposit index for the combo, then
+    refreshes every rollup row whose totals or NDP/RDP split may have moved:
+    the written record's date(s) plus the previous and new first deposit dates.
+    The customer's deposit profile for the product is refreshed as well.
+
+    Returns:
+        Tuple of (previous_first_date, new_first_date)
+    """
+    previous_first, new_first = await recalculate_customer_type(db, staff_id, customer_id, product_id)
+
+    dates = {d for d in record_dates if d}
+    if previous_first != new_first:
+        dates.update(d for d in (previous_first, new_first) if d)
+
+    for record_date in sorted(dates):
+        await refresh_daily_rollup(db, record_date, staff_id, product_id)
+
+    await refresh_deposit_profile(db, customer_id, product_id)
+
+    return previous_first, new_first
+
+
+async def rebuild_daily_rollups(db, start_date: str = None, end_date: str = None) -> Dict:
+    """
+    Rebuild rollup rows for a date range (whole history when no bounds are given).
+
+    A full rebuild aggregates into a staging collection that is swapped in with a
+    single rename; a ranged rebuild $merges the fresh rows and then removes the rows
+    of the range it did not write. Readers never see a missing or zeroed range.
+
+    Returns:
+        Dict with the range and number of rows written (plus, for a full rebuild,
+        the number of concurrent row refreshes replayed)
+
+    Raises:
+        RebuildInProgressError: another worker is running a full rebuild
+    """
+    date_filter = {}
+    if start_date:
+        date_filter['$gte'] = start_date
+    if end_date:
+        date_filter['$lte'] = end_date
+
+    rollup_query = {'date': date_filter} if date_filter else {}
+    record_query = {'record_date': date_filter} if date_filter else {}
+
+    await ensure_rollup_indexes(db)
+    dashboard_stats_cache.clear()
+    now = get_jakarta_now().isoformat()
+    pipeline = _rollup_pipeline(record_query) + [{'$addFields': {'updated_at': now}}]
+
+    if not date_filter:
+        async def build(staging_name: str) -> Dict:
+            staging = db[staging_name]
+            await db.omset_records.aggregate(
+                pipeline + [{'$out': staging_name}], allowDiskUse=True
+            ).to_list(None)
+            rows = await staging.count_documents({})
+            if rows:
+                await ensure_rollup_indexes(db, staging_name)
+                await staging.rename(ROLLUP_COLLECTION, dropTarget=True)
+            else:
+                await db[ROLLUP_COLLECTION].delete_many({})
+                await staging.drop()
+            dashboard_stats_cache.clear()
+
+            await db.system_settings.update_one(
+                {'key': ROLLUP_SETTINGS_KEY},
+                {'$set': {'key': ROLLUP_SETTINGS_KEY, 'built_at': now, 'rows': rows}},
+                upsert=True
+            )
+            return {'start_date': start_date, 'end_date': end_date, 'rows': rows}
+
+        return await guarded_rebuild(db, ROLLUP_COLLECTION, build, lambda key: _replay_rollup(db, key))
+
+    await db.omset_records.aggregate(pipeline + [
+        {'$merge': {
+            'into': ROLLUP_COLLECTION,
+            'on': ['date', 'staff_id', 'product_id'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }},
+    ], allowDiskUse=True).to_list(None)
+    # Rows of the range older than this run were not rewritten: no records remain
+    await db[ROLLUP_COLLECTION].delete_many({**rollup_query, 'updated_at': {'$lt': now}})
+
+    rows = await db[ROLLUP_COLLECTION].count_documents(rollup_query)
+    return {'start_date': start_date, 'end_date': end_date, 'rows': rows}
+
+
+async def _replay_rollup(db, key: dict):
+    """Re-derive one rollup row (or a purged staff's rows) refreshed during a full rebuild."""
+    if 'date' not in key:
+        await delete_rollups_for_staff(db, key['staff_id'])
+        return
+    await refresh_daily_rollup(db, key['date'], key['staff_id'], key['product_id'])
+
+
+async def delete_rollups_for_staff(db, staff_id: str) -> int:
+    """Drop all rollup rows of a staff member (used when the staff's OMSET is purged)."""
+    await journal_write(db, ROLLUP_COLLECTION, {'staff_id': staff_id})
+    result = await db[ROLLUP_COLLECTION].delete_many({'staff_id': staff_id})
+    dashboard_stats_cache.clear()
+    return result.deleted_count
+
+
+async def ensure_rollup_indexes(db, collection_name: str = ROLLUP_COLLECTION):
+    """Create the unique row key index and the common read-path indexes."""
+    await apply_collection_indexes(db, ROLLUP_COLLECTION, target=collection_name)
+
+
+async def ensure_daily_rollups(db) -> bool:
+    """
+    Build the rollup collection once if it has never been built.
+
+    Returns:
+        True if a rebuild was performed (False when built already or by another worker)
+    """
+    await ensure_rollup_indexes(db)
+    marker = await db.system_settings.find_one({'key': ROLLUP_SETTINGS_KEY}, {'_id': 0})
+    if marker:
+        return False
+    try:
+        await rebuild_daily_rollups(db)
+    except RebuildInProgressError:
+        return False
+    return True
+
+
+def build_rollup_match(
+    staff_id: str = None,
+    product_id: str = None,
+    start_date: str = None,
+    end_date: str = None,
+    date: str = None
+) -> dict:
+    """Build a rollup query from the usual endpoint filters."""
+    query = {}
+    if staff_id:
+        query['staff_id'] = staff_id
+    if product_id:
+        query['product_id'] = product_id
+    if date:
+        query['date'] = date
+    elif start_date or end_date:
+        query['date'] = {}
+        if start_date:
+            query['date']['$gte'] = start_date
+        if end_date:
+            query['date']['$lte'] = end_date
+    return query
+
+
+async def fetch_rollups(db, query: dict) -> List[dict]:
+    """Fetch rollup rows matching query."""
+    return await db[ROLLUP_COLLECTION].find(query, {'_id': 0, 'updated_at': 0}).to_list(None)
+
+
+async def sum_rollups(db, query: dict) -> Dict[str, float]:
+    """Sum every rollup counter over the rows matching query."""
+    rows = await db[ROLLUP_COLLECTION].aggregate([
+        {'$match': query},
+        {'$group': {'_id': None, **{f: {'$sum': f'${f}'} for f in ROLLUP_FIELDS}}}
+    ]).to_list(1)
+    if not rows:
+        return {f: 0 for f in ROLLUP_FIELDS}
+    rows[0].pop('_id', None)
+    return rows[0]
+
+
+async def facet_sum_rollups(
+    db,
+    windows: Dict[str, dict],
+    extra_facets: Optional[Dict[str, List[dict]]] = None
+) -> Dict[str, object]:
+    """
+    Sum rollup counters for several windows in a single $facet aggregation.
+
+    Args:
+        db: Database connection
+        windows: Name -> rollup query (e.g. {'today': {'date': '2025-01-31'}})
+        extra_facets: Name -> raw sub-pipeline run over the same rows
+
+    Returns:
+        Dict keyed by window name (summed counters, zeros when empty) plus the
+        extra facet names (list of result documents)
+    """
+    extra_facets = extra_facets or {}
+    facets = {
+        name: [
+            {'$match': query},
+            {'$group': {'_id': None, **{f: {'$sum': f'${f}'} for f in ROLLUP_FIELDS}}},
+            {'$project': {'_id': 0}},
+        ]
+        for name, query in windows.items()
+    }
+    facets.update(extra_facets)
+
+    rows = await db[ROLLUP_COLLECTION].aggregate([
+        {'$match': {'$or': list(windows.values())}},
+        {'$facet': facets},
+    ]).to_list(1)
+    result = rows[0] if rows else {}
+
+    sums: Dict[str, object] = {}
+    for name in windows:
+        found = result.get(name) or []
+        sums[name] = found[0] if found else {f: 0 for f in ROLLUP_FIELDS}
+    for name in extra_facets:
+        sums[name] = result.get(name) or []
+    return sums
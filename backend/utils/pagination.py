@@ -0,0 +1,202 @@
+"""
+Keyset Pagination
+Cursor-based paging for list endpoints, replacing fixed to_list() caps.
+
+A page is read with find(query + "after cursor").sort(sort).limit(limit + 1)
+over an indexed sort key that ends with the unique 'id' field, so every page
+costs the same regardless of how deep into the collection it is. The cursor
+is an opaque, URL-safe token holding the sort-key values of the last row.
+
+- fetch_page(): read one page (optionally with the opt-in total count)
+- build_projection(): turn a comma-separated ?fields= list into a projection
+- apply_page_headers(): expose next cursor / total on list-shaped responses
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+TOTAL_COUNT_HEADER = 'X-Total-Count'
+
+SortSpec = List[Tuple[str, int]]
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor token cannot be decoded for the requested sort."""
+
+
+class Page:
+    """One page of results plus the cursor of the following page."""
+
+    def __init__(self, items: List[dict], next_cursor: Optional[str], total: Optional[int] = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+
+def _encode_value(value):
+    # Dates stored as BSON datetimes must come back as datetimes to compare correctly
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and '$date' in value:
+        return datetime.fromisoformat(value['$date'])
+    return value
+
+
+def encode_cursor(values: Iterable[Any]) -> str:
+    """Opaque cursor token for the sort-key values of the last row of a page."""
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, key_count: int) -> List[Any]:
+    """
+    Decode a cursor token produced by encode_cursor().
+
+    Raises:
+        InvalidCursorError: malformed token or wrong number of sort keys
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or len(values) != key_count:
+        raise InvalidCursorError("Invalid cursor: does not match this listing")
+    return values
+
+
+def _after_clause(field: str, direction: int, value) -> Optional[dict]:
+    """Rows strictly after value on one sort key (missing/null sorts lowest, as in MongoDB)."""
+    if direction == ASCENDING:
+        return {field: {'$ne': None}} if value is None else {field: {'$gt': value}}
+    if value is None:
+        return None
+    return {'$or': [{field: {'$lt': value}}, {field: None}]}
+
+
+def keyset_filter(sort: SortSpec, values: List[Any]) -> dict:
+    """
+    Filter selecting the rows that come after values in the given sort order.
+
+    For sort keys (a, b, id) this is: a after | a equal and b after | a, b equal and id after.
+    """
+    branches = []
+    for position, (field, direction) in enumerate(sort):
+        after = _after_clause(field, direction, values[position])
+        if after is None:
+            continue
+        equal = [{sort[i][0]: values[i]} for i in range(position)]
+        branches.append({'$and': equal + [after]} if equal else after)
+    if not branches:
+        # Cursor already points past the last possible row
+        return {'_id': {'$exists': False}}
+    return branches[0] if len(branches) == 1 else {'$or': branches}
+
+
+def build_projection(fields: Optional[str], required: Iterable[str] = ()) -> dict:
+    """
+    Projection for a comma-separated ?fields= parameter.
+
+    Args:
+        fields: e.g. "id,customer_id,record_date" (None/empty returns every field)
+        required: Fields always included (e.g. the response model's required fields)
+
+    Returns:
+        MongoDB projection (always excluding _id)
+    """
+    names = [f.strip() for f in (fields or '').split(',') if f.strip()]
+    if not names:
+        return {'_id': 0}
+    projection = {'_id': 0}
+    for name in list(required) + names:
+        projection[name] = 1
+    return projection
+
+
+def required_fields(model) -> List[str]:
+    """Names of the required fields of a pydantic response model."""
+    return [name for name, field in model.model_fields.items() if field.is_required()]
+
+
+async def fetch_page(
+    collection,
+    query: dict,
+    sort: SortSpec,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    projection: Optional[dict] = None,
+    include_total: bool = False
+) -> Page:
+    """
+    Read one page of a keyset-paginated listing.
+
+    Args:
+        collection: Motor collection
+        query: Listing filter
+        sort: Sort keys; the last one must be unique (normally ('id', ...))
+        limit: Page size (clamped to 1..MAX_PAGE_SIZE)
+        cursor: Token from the previous page's next_cursor (None for the first page)
+        projection: Projection from build_projection() (None returns every field)
+        include_total: Also count every row matching query (extra count query)
+
+    Returns:
+        Page with items, next_cursor (None on the last page) and total (if requested)
+
+    Raises:
+        InvalidCursorError: the cursor does not belong to this sort
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    projection = dict(projection or {'_id': 0})
+
+    # Sort keys are needed to build the next cursor; drop the ones the caller did not ask for
+    added_keys = []
+    if len(projection) > 1:
+        for field, _ in sort:
+            if field not in projection:
+                projection[field] = 1
+                added_keys.append(field)
+
+    page_query = query
+    if cursor:
+        after = keyset_filter(sort, decode_cursor(cursor, len(sort)))
+        page_query = {'$and': [query, after]} if query else after
+
+    items = await collection.find(page_query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].get(field) for field, _ in sort)
+
+    for item in items:
+        for field in added_keys:
+            item.pop(field, None)
+
+    total = await collection.count_documents(query) if include_total else None
+    return Page(items, next_cursor, total)
+
+
+def apply_page_headers(response, page: Page):
+    """Expose the next cursor and the opt-in total as headers (for list-shaped responses)."""
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    if page.total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(page.total)
@@ -0,0 +1,132 @@
+"""
+Request Sampling Profiler
+Opt-in profile of a single request: an admin adds ?__profile=1 to any API call and
+gets back a flame-graph-ready stack dump instead of the normal response body.
+
+A daemon thread samples the event-loop thread's Python stack every
+PROFILE_INTERVAL_SECONDS while the request runs. The result is the "collapsed
+stacks" text format (one `frame;frame;frame count` line per distinct stack) read by
+flamegraph.pl, speedscope and inferno.
+
+Caveats: the event loop is shared, so samples include other requests served at
+the same time; time spent awaiting MongoDB shows up as the loop waiting in its
+selector (the X-Profile-DB-* headers report the request's own DB time).
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+import jwt
+
+from utils.request_metrics import RequestStats, server_timing, track_request, untrack_request
+
+
+PROFILE_INTERVAL_SECONDS = 0.001
+PROFILE_MAX_DEPTH = 128
+PROFILE_ROLES = ('admin', 'master_admin')
+
+
+class SamplingProfiler:
+    """Samples one thread's stack from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+def _short_path(filename: str) -> str:
+    for marker in ('site-packages/', 'backend/'):
+        index = filename.rfind(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return filename
+
+
+def _bearer_token(scope) -> str:
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            return token if scheme.lower() == 'bearer' else ''
+    return ''
+
+
+async def is_profiling_allowed(scope) -> bool:
+    """True when the request asks for ?__profile=1 and carries an admin token."""
+    if parse_qs(scope.get('query_string', b'').decode('latin-1')).get('__profile') != ['1']:
+        return False
+    token = _bearer_token(scope)
+    if not token:
+        return False
+    from routes.deps import JWT_SECRET, JWT_ALGORITHM, load_user
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        user = await load_user(payload.get('user_id'))
+    except Exception:
+        return False
+    return user.role in PROFILE_ROLES
+
+
+async def profile_request(app, scope, receive, send):
+    """Run the request under the sampler and answer with its collapsed stacks."""
+    stats = RequestStats()
+    token = track_request(stats)
+    status = 500
+    profiler = SamplingProfiler(threading.get_ident())
+
+    async def discard_response(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        await app(scope, receive, discard_response)
+    finally:
+        profiler.stop()
+        untrack_request(token)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    body = profiler.collapsed().encode()
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/plain; charset=utf-8'),
+            (b'content-length', str(len(body)).encode()),
+            (b'x-profile-status', str(status).encode()),
+            (b'x-profile-samples', str(sum(profiler.samples.values())).encode()),
+            (b'x-profile-interval-ms', str(PROFILE_INTERVAL_SECONDS * 1000).encode()),
+            (b'x-profile-db-commands', str(stats.db_commands).encode()),
+            (b'x-profile-db-ms', f'{stats.db_seconds * 1000:.1f}'.encode()),
+            (b'server-timing', server_timing(elapsed_ms, stats).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,156 @@
+"""
+Realtime Pub/Sub Backends
+Fan realtime (WebSocket) events out to every API worker, not just the one
+that produced them.
+
+- InProcessPubSub: delivers straight to the local handler (single worker).
+- MongoCappedPubSub: every worker appends events to a capped collection and
+  tails it with a tailable/await cursor; each worker delivers its own events
+  locally right away and skips them when they come back through the tail.
+
+The backend is picked with REALTIME_PUBSUB_BACKEND ('memory' or 'mongo').
+Events are plain dicts; the handler decides which local sockets get them.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+PUBSUB_BACKEND_ENV = 'REALTIME_PUBSUB_BACKEND'
+PUBSUB_COLLECTION = 'realtime_events'
+# Capped collection size; old events are overwritten, so this only bounds replay for lagging workers
+PUBSUB_CAPPED_SIZE_BYTES = 16 * 1024 * 1024
+PUBSUB_CAPPED_MAX_DOCS = 50000
+# Pause before re-opening the tail after the cursor died or an error occurred
+PUBSUB_RETRY_SECONDS = 1.0
+
+# Identifies this process so it does not deliver its own events twice
+WORKER_ID = str(uuid.uuid4())
+
+
+class InProcessPubSub:
+    """Deliver events to the local handler only (one worker, or tests)."""
+
+    name = 'memory'
+
+    def __init__(self, handler: EventHandler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: dict):
+        await self.handler(event)
+
+
+class MongoCappedPubSub:
+    """Share events between workers through a tailed capped collection."""
+
+    name = 'mongo'
+
+    def __init__(self, db, handler: EventHandler, collection_name: str = PUBSUB_COLLECTION):
+        self.db = db
+        self.handler = handler
+        self.collection = db[collection_name]
+        self.collection_name = collection_name
+        self._task: Optional[asyncio.Task] = None
+        self._last_id = None
+
+    async def _ensure_collection(self):
+        try:
+            await self.db.create_collection(
+                self.collection_name,
+                capped=True,
+                size=PUBSUB_CAPPED_SIZE_BYTES,
+                max=PUBSUB_CAPPED_MAX_DOCS
+            )
+        except CollectionInvalid:
+            pass  # Already exists
+
+        # A tailable cursor on an empty capped collection dies immediately
+        latest = await self.collection.find_one({}, sort=[('$natural', -1)])
+        if latest is None:
+            result = await self.collection.insert_one({
+                'origin': WORKER_ID,
+                'event': None,
+                'created_at': datetime.now(timezone.utc).isoformat()
+            })
+            self._last_id = result.inserted_id
+        else:
+            self._last_id = latest['_id']
+
+    async def start(self):
+        await self._ensure_collection()
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, event: dict):
+        # Local sockets first: they should not wait on a database round trip
+        await self.handler(event)
+        try:
+            await self.collection.insert_one({
+                'origin': WORKER_ID,
+                'event': event,
+                'created_at': datetime.now(timezone.utc).isoformat()
+            })
+        except Exception as e:
+            print(f"Realtime pub/sub publish failed: {e}")
+
+    async def _listen(self):
+        while True:
+            try:
+                cursor = self.collection.find(
+                    {'_id': {'$gt': self._last_id}},
+                    cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                while cursor.alive:
+                    async for doc in cursor:
+                        self._last_id = doc['_id']
+                        if doc.get('origin') == WORKER_ID or not doc.get('event'):
+                            continue
+                        try:
+                            await self.handler(doc['event'])
+                        except Exception as e:
+                            print(f"Realtime pub/sub handler error: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Realtime pub/sub tail error: {e}")
+            await asyncio.sleep(PUBSUB_RETRY_SECONDS)
+
+
+def create_pubsub(db, handler: EventHandler, backend: Optional[str] = None):
+    """
+    Build the pub/sub backend configured for this deployment.
+
+    Args:
+        db: Motor database (used by the 'mongo' backend)
+        handler: Coroutine delivering an event to this worker's sockets
+        backend: 'memory' or 'mongo' (defaults to REALTIME_PUBSUB_BACKEND, then 'memory')
+
+    Returns:
+        An unstarted pub/sub backend
+    """
+    backend = (backend or os.environ.get(PUBSUB_BACKEND_ENV, 'memory')).lower()
+    if backend == 'mongo':
+        return MongoCappedPubSub(db, handler)
+    return InProcessPubSub(handler)
@@ -0,0 +1,156 @@
+"""
+Rebuild Guard
+Serializes the full rebuilds of the materialized OMSET collections (first-deposit
+index, daily rollups, deposit profiles) across workers and keeps the incremental
+writes that race with them.
+
+- A rebuild holds a lease document in system_settings (one per collection),
+  renewed while it runs; a second rebuild of the same collection fails with
+  RebuildInProgressError instead of building next to it
+- Each rebuild builds into its own staging collection (named after its lease
+  token) and swaps it in with a rename; staging collections left behind by a
+  crashed rebuild are dropped by the next one
+- While the lease is held, incremental writers record the keys they touch in
+  rebuild_journal (journal_write()) before writing to the live collection.
+  After the swap the rebuild replays those keys against the new live collection,
+  so a write that landed in the replaced collection is not lost
+
+Writers call journal_write() after computing their new value from omset_records
+and before writing it: a write that found no lease either happened before the
+rebuild's source scan started or lands in the swapped-in collection.
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+from pymongo.errors import DuplicateKeyError
+
+
+logger = logging.getLogger(__name__)
+
+REBUILD_JOURNAL_COLLECTION = 'rebuild_journal'
+REBUILD_LEASE_SECONDS = 300
+
+
+class RebuildInProgressError(RuntimeError):
+    """Raised when another worker is already rebuilding the same collection."""
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _lease_id(name: str) -> str:
+    return f'rebuild_lease:{name}'
+
+
+async def _acquire_lease(db, name: str, token: str):
+    now = _utc_now()
+    try:
+        # Only a missing or expired lease (its worker died) can be taken over
+        await db.system_settings.update_one(
+            {'_id': _lease_id(name), 'expires_at': {'$lte': now}},
+            {'$set': {
+                'key': _lease_id(name),
+                'token': token,
+                'started_at': now,
+                'expires_at': now + timedelta(seconds=REBUILD_LEASE_SECONDS)
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        raise RebuildInProgressError(f"A rebuild of {name} is already running")
+
+
+async def _renew_lease(db, name: str, token: str):
+    while True:
+        await asyncio.sleep(REBUILD_LEASE_SECONDS / 3)
+        await db.system_settings.update_one(
+            {'_id': _lease_id(name), 'token': token},
+            {'$set': {'expires_at': _utc_now() + timedelta(seconds=REBUILD_LEASE_SECONDS)}}
+        )
+
+
+async def journal_write(db, name: str, key: Dict[str, Any]):
+    """
+    Record an incremental write to the named collection if a rebuild of it is running.
+
+    Args:
+        db: Database connection
+        name: Guarded collection (e.g. 'customer_first_deposit')
+        key: Key of the written entry, as understood by that rebuild's replay
+    """
+    await journal_writes(db, name, [key])
+
+
+async def journal_writes(db, name: str, keys: List[Dict[str, Any]]):
+    """journal_write() for a batch of keys (one lease lookup)."""
+    if not keys:
+        return
+    lease = await db.system_settings.find_one(
+        {'_id': _lease_id(name), 'expires_at': {'$gt': _utc_now()}},
+        {'_id': 0, 'token': 1}
+    )
+    if lease:
+        written_at = _utc_now()
+        await db[REBUILD_JOURNAL_COLLECTION].insert_many([
+            {'collection': name, 'token': lease['token'], 'key': key, 'written_at': written_at}
+            for key in keys
+        ])
+
+
+async def guarded_rebuild(
+    db,
+    name: str,
+    build: Callable[[str], Awaitable[Dict]],
+    replay: Callable[[Dict[str, Any]], Awaitable[Any]]
+) -> Dict:
+    """
+    Run a full rebuild of a collection under its lease and replay the writes made meanwhile.
+
+    Args:
+        db: Database connection
+        name: Live collection being rebuilt
+        build: async build(staging_name) -> result; fills the staging collection and
+               swaps it in (or leaves the live collection untouched on failure)
+        replay: async replay(key) re-deriving one journaled entry in the live collection
+
+    Returns:
+        build()'s result plus 'replayed', the number of journaled writes replayed
+
+    Raises:
+        RebuildInProgressError: another rebuild of the collection holds the lease
+    """
+    token = uuid.uuid4().hex[:12]
+    await _acquire_lease(db, name, token)
+    renewal = asyncio.create_task(_renew_lease(db, name, token))
+    try:
+        # Staging collections of rebuilds that died before their rename
+        for leftover in await db.list_collection_names(filter={'name': {'$regex': f'^{name}_rebuild'}}):
+            await db[leftover].drop()
+        # Keys journaled for earlier rebuilds are covered by this rebuild's scan
+        await db[REBUILD_JOURNAL_COLLECTION].delete_many({'collection': name, 'token': {'$ne': token}})
+        result = await build(f'{name}_rebuild_{token}')
+    except BaseException:
+        await db[REBUILD_JOURNAL_COLLECTION].delete_many({'collection': name, 'token': token})
+        raise
+    finally:
+        renewal.cancel()
+        await db.system_settings.delete_one({'_id': _lease_id(name), 'token': token})
+
+    # Writers that saw the lease journaled before writing, so every write that may have
+    # landed in the replaced collection is in the journal by now
+    replayed = 0
+    while True:
+        entry = await db[REBUILD_JOURNAL_COLLECTION].find_one_and_delete({'collection': name, 'token': token})
+        if entry is None:
+            break
+        await replay(entry['key'])
+        replayed += 1
+    if replayed:
+        logger.info(f"Replayed {replayed} writes made to {name} during its rebuild")
+
+    return {**result, 'replayed': replayed}
@@ -0,0 +1,115 @@
+"""
+Random Record Assignment Engine
+Server-side random draw + atomic claim of available records for
+download requests (customer_records) and random assignment
+(bonanza_records / memberwd_records).
+
+- Eligibility (status, database, reserved exclusion) is a single indexed
+  query; records are never loaded into the API process.
+- N ids are drawn with $sample. After a $match, $sample cannot use its
+  optimized random cursor and instead sorts every eligible document by a random
+  key, so the documents are projected to their id first: the draw carries one
+  small id per eligible record rather than whole record documents.
+- Claims are conditional updates on the eligibility query, so a record that
+  another request claimed first is simply not matched. Each claim carries a
+  one-off token that is read back to learn exactly which records were won;
+  lost races are topped up with a fresh draw.
+"""
+
+import uuid
+from typing import Dict, List
+
+from utils.db_operations import update_many_by_ids
+from utils.index_manifest import apply_collection_indexes
+
+
+CLAIM_TOKEN_FIELD = '_assignment_claim'
+# Fresh $sample draws attempted when concurrent requests take some of the sampled records
+MAX_CLAIM_ROUNDS = 5
+
+
+async def count_assignable(collection, base_query: dict, eligible_query: dict) -> Dict[str, int]:
+    """
+    Count available and eligible (non-reserved) records.
+
+    Args:
+        collection: Motor collection
+        base_query: Available-records filter (e.g. database_id + status)
+        eligible_query: Extra predicate excluding reserved records
+
+    Returns:
+        Dict with 'available', 'eligible' and 'reserved' counts
+    """
+    available = await collection.count_documents(base_query)
+    eligible = await collection.count_documents({**base_query, **eligible_query}) if available else 0
+    return {'available': available, 'eligible': eligible, 'reserved': available - eligible}
+
+
+async def sample_record_ids(collection, query: dict, size: int) -> List[str]:
+    """Draw up to size random record ids matching query server-side ($sample over ids only)."""
+    if size <= 0:
+        return []
+    cursor = collection.aggregate([
+        {'$match': query},
+        # Only the id reaches the random sort behind a non-leading $sample
+        {'$project': {'_id': 0, 'id': 1}},
+        {'$sample': {'size': size}},
+    ], allowDiskUse=True)
+    return [doc['id'] async for doc in cursor]
+
+
+async def claim_random_records(collection, query: dict, count: int, update: dict) -> List[str]:
+    """
+    Randomly pick up to count records matching query and apply update to them atomically.
+
+    update must move the records out of query (e.g. set status away from 'available'),
+    otherwise the same record could be claimed twice.
+
+    Args:
+        collection: Motor collection
+        query: Eligibility filter (status, database, reserved exclusion)
+        count: Number of records wanted
+        update: Update document with a '$set' applied to claimed records
+
+    Returns:
+        Ids of the claimed records (fewer than count if the pool ran out)
+    """
+    token = str(uuid.uuid4())
+    claim_update = {**update, '$set': {**update.get('$set', {}), CLAIM_TOKEN_FIELD: token}}
+    claimed: List[str] = []
+
+    for _ in range(MAX_CLAIM_ROUNDS):
+        remaining = count - len(claimed)
+        if remaining <= 0:
+            break
+
+        sampled = await sample_record_ids(collection, query, remaining)
+        if not sampled:
+            break
+
+        await collection.update_many({**query, 'id': {'$in': sampled}}, claim_update)
+
+        won = await collection.find(
+            {'id': {'$in': sampled}, CLAIM_TOKEN_FIELD: token},
+            {'_id': 0, 'id': 1}
+        ).to_list(None)
+        claimed.extend(doc['id'] for doc in won)
+
+    if claimed:
+        await update_many_by_ids(collection, claimed, {'$unset': {CLAIM_TOKEN_FIELD: ''}})
+
+    return claimed
+
+
+async def release_records(collection, record_ids: List[str], update: dict) -> int:
+    """Undo a claim (e.g. when fewer records than requested could be claimed)."""
+    return await update_many_by_ids(collection, record_ids, update)
+
+
+async def ensure_assignment_indexes(db):
+    """Create the id / request lookup indexes used when claiming, releasing and listing records."""
+    for collection_name in ['bonanza_records', 'memberwd_records']:
+        await apply_collection_indexes(db, collection_name, names=('id_idx',))
+    await apply_collection_indexes(
+        db, 'customer_records', names=('id_idx', 'request_status_idx', 'assigned_status_request_idx')
+    )
@@ -3,10 +3,11 @@ Data Repair and Health Check Helper Functions
 Common validation and repair operations for all record modules
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from utils.helpers import get_jakarta_now
 from utils.db_operations import get_collection_names, count_records_by_status
-from utils.reserved_check import build_reserved_map as _centralized_build_reserved_map, is_record_reserved, find_reservation_owner
+from utils.reserved_check import is_record_reserved, find_reservation_owner
+from utils.reserved_snapshot import get_reserved_snapshot
 
 # Common username fields used across all modules for customer ID lookup
 USERNAME_FIELDS = [
@@ -242,7 +243,9 @@ async def run_full_health_check(
 
 async def run_full_repair(
     db,
-    module: str = 'records'
+    module: str = 'records',
+    checkpoint: Optional[Dict[str, Any]] = None,
+    on_progress: Optional[Callable[[float, str, Dict[str, Any]], Awaitable[Any]]] = None
 ) -> Dict[str, Any]:
     """
     Run full repair on all databases in a module.
@@ -250,14 +253,18 @@ async def run_full_repair(
     Args:
         db: Database connection
         module: Module type
+        checkpoint: State passed to on_progress by an interrupted run; the
+            databases it already repaired are skipped
+        on_progress: Coroutine (percent, message, checkpoint) awaited after each database
         
     Returns:
         Full repair report
     """
     collections = get_collection_names(module)
     now = get_jakarta_now()
+    checkpoint = checkpoint or {}
     
-    repair_log = {
+    repair_log = checkpoint.get('repair_log') or {
         'timestamp': now.isoformat(),
         'fixed_missing_db_info': 0,
         'fixed_invalid_status_restored': 0,
@@ -266,10 +273,13 @@ async def run_full_repair(
         'databases_checked': [],
         'errors': []
     }
+    done_ids = list(checkpoint.get('done_database_ids') or [])
     
     databases = await db[collections['databases']].find({}, {'_id': 0}).to_list(1000)
     
-    for database in databases:
+    for position, database in enumerate(databases, start=1):
+        if database['id'] in done_ids:
+            continue
         try:
             repairs = await repair_database_records(
                 db,
@@ -301,6 +311,14 @@ async def run_full_repair(
             
         except Exception as e:
             repair_log['errors'].append(f"{database['name']}: {str(e)}")
+        
+        done_ids.append(database['id'])
+        if on_progress:
+            await on_progress(
+                100 * position / len(databases),
+                f"Repaired {database['name']}",
+                {'repair_log': repair_log, 'done_database_ids': done_ids}
+            )
     
     total_fixed = (
         repair_log['fixed_missing_db_info'] + 
@@ -647,15 +665,10 @@ async def repair_product_mismatch(db, module: str = 'records') -> Dict[str, Any]
 
 
 async def _build_reserved_map(db) -> Dict[str, Dict]:
-    """Build a map of normalized customer IDs to their reservation info.
-    Uses centralized utility that adds BOTH customer_id AND customer_name.
+    """Map of normalized customer IDs to their reservation info (from the shared reserved snapshot).
+    The snapshot is built by the centralized utility that adds BOTH customer_id AND customer_name.
     """
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'},
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'staff_id': 1, 'staff_name': 1}
-    ).to_list(100000)
-    
-    return _centralized_build_reserved_map(reserved_members)
+    return (await get_reserved_snapshot(db)).reserved_map
 
 
 def _find_customer_id_in_row(row_data: Dict) -> Optional[str]:
@@ -0,0 +1,313 @@
+"""
+Request Metrics
+Per-route latency histograms, MongoDB round trips / time and response sizes.
+
+- RequestMetricsMiddleware: ASGI middleware timing every HTTP request under its
+  route template (e.g. /api/omset/{record_id}), adding a Server-Timing header
+  (app and db time) and serving ?__profile=1 for admins (see utils.profiler)
+- MongoCommandListener: pymongo CommandListener passed to the Motor client;
+  attributes each command's duration to the request that issued it (commands
+  issued outside a request, e.g. scheduler jobs, count as 'background')
+- metrics_registry: the per-worker store behind /metrics (Prometheus text
+  format) and the admin JSON view
+
+Counters live in one worker's memory; each worker exposes its own /metrics.
+"""
+
+import contextvars
+import threading
+import time
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+
+# Request latency buckets in seconds (Prometheus 'le' bounds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROFILE_QUERY_PARAM = b'__profile=1'
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class RequestStats:
+    """DB round trips of the request currently being served (shared with Motor's executor threads)."""
+
+    __slots__ = ('db_commands', 'db_seconds', '_lock')
+
+    def __init__(self):
+        self.db_commands = 0
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_command(self, seconds: float):
+        with self._lock:
+            self.db_commands += 1
+            self.db_seconds += seconds
+
+
+# Motor runs commands on executor threads with a copy of the caller's context,
+# so the listener sees the RequestStats of the request that issued the command
+_current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    'current_request_stats', default=None
+)
+
+
+def track_request(stats: RequestStats) -> contextvars.Token:
+    """Attribute MongoDB commands issued from this context to stats (until untrack_request)."""
+    return _current_request.set(stats)
+
+
+def untrack_request(token: contextvars.Token):
+    _current_request.reset(token)
+
+
+class _RouteMetrics:
+    __slots__ = ('count', 'seconds', 'buckets', 'statuses', 'db_commands', 'db_seconds', 'response_bytes')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.statuses: Dict[int, int] = {}
+        self.db_commands = 0
+        self.db_seconds = 0.0
+        self.response_bytes = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Latency quantile in seconds, linearly interpolated inside its histogram bucket."""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative, lower = 0, 0.0
+        for upper, in_bucket in zip(LATENCY_BUCKETS, self.buckets):
+            if in_bucket and cumulative + in_bucket >= target:
+                return lower + (upper - lower) * (target - cumulative) / in_bucket
+            cumulative += in_bucket
+            lower = upper
+        return LATENCY_BUCKETS[-1]  # in the +Inf bucket
+
+
+class MetricsRegistry:
+    """Per-route request metrics and per-command MongoDB metrics of this worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.routes: Dict[tuple, _RouteMetrics] = {}
+        self.commands: Dict[str, list] = {}  # command name -> [count, seconds, failures]
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float,
+                        stats: RequestStats, response_bytes: int):
+        with self._lock:
+            metrics = self.routes.get((method, route))
+            if metrics is None:
+                metrics = self.routes[(method, route)] = _RouteMetrics()
+            metrics.count += 1
+            metrics.seconds += seconds
+            for i, upper in enumerate(LATENCY_BUCKETS):
+                if seconds <= upper:
+                    metrics.buckets[i] += 1
+                    break
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.db_commands += stats.db_commands
+            metrics.db_seconds += stats.db_seconds
+            metrics.response_bytes += response_bytes
+
+    def observe_command(self, name: str, seconds: float, failed: bool):
+        with self._lock:
+            entry = self.commands.get(name)
+            if entry is None:
+                entry = self.commands[name] = [0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += int(failed)
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.commands = {}
+            self.started_at = time.time()
+
+    def summary(self, sort: str = 'total_time', limit: Optional[int] = None) -> dict:
+        """JSON view: one entry per route (ms figures), busiest first."""
+        with self._lock:
+            routes = []
+            for (method, route), m in self.routes.items():
+                routes.append({
+                    'method': method,
+                    'route': route,
+                    'count': m.count,
+                    'total_ms': round(m.seconds * 1000, 1),
+                    'avg_ms': round(m.seconds / m.count * 1000, 2),
+                    'p50_ms': _ms(m.quantile(0.5)),
+                    'p95_ms': _ms(m.quantile(0.95)),
+                    'p99_ms': _ms(m.quantile(0.99)),
+                    'avg_db_commands': round(m.db_commands / m.count, 2),
+                    'avg_db_ms': round(m.db_seconds / m.count * 1000, 2),
+                    'db_time_share': round(m.db_seconds / m.seconds, 3) if m.seconds else 0.0,
+                    'avg_response_bytes': m.response_bytes // m.count,
+                    'statuses': {str(s): c for s, c in sorted(m.statuses.items())},
+                })
+            commands = [
+                {'command': name, 'count': c, 'total_ms': round(s * 1000, 1), 'failures': f}
+                for name, (c, s, f) in self.commands.items()
+            ]
+            started_at = self.started_at
+
+        sort_key = {
+            'total_time': lambda r: r['total_ms'],
+            'p95': lambda r: r['p95_ms'] or 0,
+            'count': lambda r: r['count'],
+            'db_commands': lambda r: r['avg_db_commands'],
+        }.get(sort, lambda r: r['total_ms'])
+        routes.sort(key=sort_key, reverse=True)
+        commands.sort(key=lambda c: c['total_ms'], reverse=True)
+        return {
+            'since': started_at,
+            'uptime_seconds': round(time.time() - started_at, 1),
+            'routes': routes[:limit] if limit else routes,
+            'mongodb_commands': commands,
+        }
+
+    def prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route template.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            routes = sorted(self.routes.items())
+            commands = sorted(self.commands.items())
+            for (method, route), m in routes:
+                labels = f'method="{_escape(method)}",route="{_escape(route)}"'
+                cumulative = 0
+                for upper, in_bucket in zip(LATENCY_BUCKETS, m.buckets):
+                    cumulative += in_bucket
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{upper}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m.count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {m.seconds:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {m.count}')
+
+            lines += ['# HELP http_requests_total Requests by route template and status code.',
+                      '# TYPE http_requests_total counter']
+            for (method, route), m in routes:
+                for status, count in sorted(m.statuses.items()):
+                    lines.append(
+                        f'http_requests_total{{method="{_escape(method)}",route="{_escape(route)}",status="{status}"}} {count}'
+                    )
+
+            for name, help_text, value in (
+                ('http_request_db_commands_total', 'MongoDB commands issued while serving the route.',
+                 lambda m: str(m.db_commands)),
+                ('http_request_db_seconds_total', 'Time spent in MongoDB commands while serving the route.',
+                 lambda m: f'{m.db_seconds:.6f}'),
+                ('http_response_size_bytes_total', 'Response body bytes sent by the route.',
+                 lambda m: str(m.response_bytes)),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (method, route), m in routes:
+                    lines.append(f'{name}{{method="{_escape(method)}",route="{_escape(route)}"}} {value(m)}')
+
+            for name, help_text, index in (
+                ('mongodb_commands_total', 'MongoDB commands by command name.', 0),
+                ('mongodb_command_seconds_total', 'Time spent in MongoDB commands by command name.', 1),
+                ('mongodb_command_failures_total', 'Failed MongoDB commands by command name.', 2),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for command, entry in commands:
+                    value = f'{entry[index]:.6f}' if index == 1 else str(entry[index])
+                    lines.append(f'{name}{{command="{_escape(command)}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+metrics_registry = MetricsRegistry()
+_background_stats = RequestStats()
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Attributes MongoDB command durations to the current request (or to 'background')."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event, failed=False)
+
+    def failed(self, event):
+        self._observe(event, failed=True)
+
+    def _observe(self, event, failed: bool):
+        seconds = event.duration_micros / 1_000_000
+        metrics_registry.observe_command(event.command_name, seconds, failed)
+        (_current_request.get() or _background_stats).add_command(seconds)
+
+
+command_listener = MongoCommandListener()
+
+
+def _route_template(scope) -> str:
+    route = scope.get('route')
+    return getattr(route, 'path', None) or UNMATCHED_ROUTE
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware (response bodies are counted as they stream, never buffered)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        if PROFILE_QUERY_PARAM in scope.get('query_string', b''):
+            from utils.profiler import is_profiling_allowed, profile_request
+            if await is_profiling_allowed(scope):
+                await profile_request(self.app, scope, receive, send)
+                return
+
+        stats = RequestStats()
+        token = track_request(stats)
+        started = time.perf_counter()
+        status = 500
+        response_bytes = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, response_bytes
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', server_timing(elapsed_ms, stats).encode()))
+                message = {**message, 'headers': headers}
+            elif message['type'] == 'http.response.body':
+                response_bytes += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            untrack_request(token)
+            metrics_registry.observe_request(
+                scope.get('method', 'GET'), _route_template(scope), status,
+                time.perf_counter() - started, stats, response_bytes
+            )
+
+
+def server_timing(app_ms: float, stats: RequestStats) -> str:
+    """Server-Timing header value (shown per request in browser dev tools)."""
+    return (f'app;dur={app_ms:.1f}, '
+            f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_commands} commands"')
+
+
+def background_stats() -> dict:
+    return {'db_commands': _background_stats.db_commands, 'db_ms': round(_background_stats.db_seconds * 1000, 1)}
@@ -14,8 +14,187 @@ CRITICAL DESIGN DECISIONS:
    column name (Username, NAMA, user, etc.), so we cannot rely on specific field names.
 
 3. We normalize to UPPERCASE and strip whitespace for consistent comparison.
+
+4. memberwd_records / bonanza_records persist those normalized row_data values in a
+   `row_identifiers` array (multikey-indexed), so reservation syncs are single indexed
+   update_many calls instead of loading and uppercasing every record in Python.
+   customer_records persist it too, for the excluded counts of /databases/with-stats.
+
+5. The approved reservations behind the reserved set/map come from the versioned
+   snapshot in utils/reserved_snapshot (get_reserved_snapshot). Every write to
+   reserved_members must call bump_reserved_version() afterwards.
 """
 
+from pymongo import UpdateOne
+
+from utils.helpers import get_jakarta_now
+from utils.db_operations import bulk_write_chunked
+from utils.index_manifest import apply_collection_indexes
+
+
+ROW_IDENTIFIERS_FIELD = 'row_identifiers'
+ROW_IDENTIFIERS_SETTINGS_KEY = 'row_identifiers_backfill'
+CUSTOMER_ROW_IDENTIFIERS_SETTINGS_KEY = 'customer_row_identifiers_backfill'
+RESERVED_SYNC_COLLECTIONS = ['memberwd_records', 'bonanza_records']
+BACKFILL_BATCH_SIZE = 1000
+
+# customer_records (Normal DB) are matched against reservations by their username column only
+USERNAME_FIELD = 'username_normalized'
+USERNAME_SETTINGS_KEY = 'username_normalized_backfill'
+# IMPORTANT: 'name' is NOT a username key - it's the customer's actual name, not the Customer ID
+USERNAME_KEYS = ['username', 'user_name', 'user', 'id', 'userid', 'user_id', 'customer_id', 'member', 'account']
+
+
+def normalize_identifier(value) -> str:
+    """Normalize a customer identifier / row_data value for reserved matching."""
+    if value is None:
+        return ''
+    return str(value).strip().upper()
+
+
+def build_row_identifiers(row_data: dict) -> list:
+    """
+    Build the persisted row_identifiers array for a record.
+    
+    Args:
+        row_data: The record's raw row_data dict
+        
+    Returns:
+        Sorted list of unique normalized (uppercase, stripped) non-empty values
+    """
+    identifiers = set()
+    for value in (row_data or {}).values():
+        normalized = normalize_identifier(value)
+        if normalized:
+            identifiers.add(normalized)
+    return sorted(identifiers)
+
+
+def extract_username(row_data: dict) -> str:
+    """
+    Normalized username (= Customer ID of a reservation) of a Normal DB record.
+    
+    Uses the first row_data column whose lowercased name is a USERNAME_KEYS entry.
+    
+    Returns:
+        Uppercased, stripped username, or '' when the record has none
+    """
+    for key in (row_data or {}):
+        if key.lower() in USERNAME_KEYS:
+            return normalize_identifier(row_data[key])
+    return ''
+
+
+def build_unreserved_filter(reserved_set: set) -> dict:
+    """
+    Server-side predicate matching memberwd/bonanza records that are NOT reserved
+    (equivalent of `not is_record_reserved(record, reserved_set)`).
+
+    The $nin over the whole reserved set is not selective, so it filters the
+    documents selected by the query's other (indexed) conditions rather than
+    driving an index scan itself. Records without row_identifiers are never
+    matched, so an un-backfilled record can't slip past the reserved check.
+    """
+    return {
+        'is_reserved_member': {'$ne': True},
+        ROW_IDENTIFIERS_FIELD: {'$exists': True, '$nin': sorted(reserved_set)},
+    }
+
+
+async def get_download_reserved_ids(db, product_id: str) -> set:
+    """
+    Reserved Customer IDs excluded from Normal DB download requests of a product.
+    
+    Both 'pending' and 'approved' reservations are excluded; deleted reservations
+    are available again. Supports customer_id and the old customer_name field.
+    
+    Returns:
+        Set of normalized (uppercase, stripped) Customer IDs
+    """
+    reserved_members = await db.reserved_members.find(
+        {'product_id': product_id, 'status': {'$in': ['pending', 'approved']}},
+        {'_id': 0, 'customer_id': 1, 'customer_name': 1}
+    ).to_list(None)
+
+    reserved_ids = set()
+    for member in reserved_members:
+        cid = normalize_identifier(member.get('customer_id') or member.get('customer_name'))
+        if cid:
+            reserved_ids.add(cid)
+    return reserved_ids
+
+
+def build_unreserved_username_filter(reserved_ids: set) -> dict:
+    """Indexed predicate matching customer_records whose username is not reserved."""
+    return {USERNAME_FIELD: {'$exists': True, '$nin': sorted(reserved_ids)}}
+
+
+async def count_excluded_available(db, databases: list, reserved_by_product: dict) -> dict:
+    """
+    Count the available customer_records of each database that are excluded as reserved:
+    flagged is_reserved_member, or any row_data value matching an approved reservation
+    of the database's product.
+    
+    One aggregation for all databases: one pair of indexed $or branches
+    (database_id, status, row_identifiers) per product that has reservations.
+    
+    Args:
+        databases: Database documents ('id', 'product_id')
+        reserved_by_product: product_id -> normalized reserved identifiers (ReservedSnapshot)
+        
+    Returns:
+        {database_id: excluded count} (databases without excluded records are absent)
+    """
+    database_ids_by_product = {}
+    for database in databases:
+        product_id = database.get('product_id')
+        if product_id and reserved_by_product.get(product_id):
+            database_ids_by_product.setdefault(product_id, []).append(database['id'])
+    if not database_ids_by_product:
+        return {}
+
+    branches = []
+    for product_id, database_ids in database_ids_by_product.items():
+        scope = {'database_id': {'$in': database_ids}, 'status': 'available'}
+        branches.append({**scope, ROW_IDENTIFIERS_FIELD: {'$in': sorted(reserved_by_product[product_id])}})
+        branches.append({**scope, 'is_reserved_member': True})
+
+    rows = await db.customer_records.aggregate([
+        {'$match': {'$or': branches}},
+        {'$group': {'_id': '$database_id', 'count': {'$sum': 1}}}
+    ]).to_list(None)
+    return {row['_id']: row['count'] for row in rows}
+
+
+def _member_identifiers(customer_id, customer_name) -> set:
+    """Normalized identifiers of a single reservation (customer_id AND customer_name)."""
+    return {n for n in (normalize_identifier(customer_id), normalize_identifier(customer_name)) if n}
+
+
+def _group_identifiers_by_staff(reserved_map: dict) -> dict:
+    """Invert build_reserved_map(): (staff_id, staff_name) -> [identifiers]."""
+    groups = {}
+    for identifier, info in reserved_map.items():
+        groups.setdefault((info['staff_id'], info['staff_name']), []).append(identifier)
+    return groups
+
+
+async def _reserve_matching(db, collection_name: str, base_query: dict, reserved_map: dict) -> int:
+    """Mark available records whose row_identifiers hit a reservation as reserved (one update per staff)."""
+    total = 0
+    for (staff_id, staff_name), identifiers in _group_identifiers_by_staff(reserved_map).items():
+        result = await db[collection_name].update_many(
+            {**base_query, 'status': 'available', ROW_IDENTIFIERS_FIELD: {'$in': identifiers}},
+            {'$set': {
+                'status': 'reserved',
+                'is_reserved_member': True,
+                'reserved_by': staff_id,
+                'reserved_by_name': staff_name,
+            }}
+        )
+        total += result.modified_count
+    return total
+
 
 def build_reserved_set(reserved_members: list) -> set:
     """
@@ -127,40 +306,22 @@ async def sync_reserved_status_on_add(db, customer_id: str, customer_name: str,
     When a reservation is APPROVED, mark matching available records as 'reserved'
     in both memberwd_records and bonanza_records.
     """
-    identifiers = set()
-    if customer_id and str(customer_id).strip():
-        identifiers.add(str(customer_id).strip().upper())
-    if customer_name and str(customer_name).strip():
-        identifiers.add(str(customer_name).strip().upper())
+    identifiers = _member_identifiers(customer_id, customer_name)
     if not identifiers:
         return 0
 
     total_updated = 0
-    for collection_name in ['memberwd_records', 'bonanza_records']:
-        records = await db[collection_name].find(
-            {'status': 'available'},
-            {'_id': 0, 'id': 1, 'row_data': 1}
-        ).to_list(None)
-
-        ids_to_reserve = []
-        for record in records:
-            row_data = record.get('row_data', {})
-            for value in row_data.values():
-                if value and str(value).strip().upper() in identifiers:
-                    ids_to_reserve.append(record['id'])
-                    break
-
-        if ids_to_reserve:
-            await db[collection_name].update_many(
-                {'id': {'$in': ids_to_reserve}},
-                {'$set': {
-                    'status': 'reserved',
-                    'is_reserved_member': True,
-                    'reserved_by': staff_id,
-                    'reserved_by_name': staff_name,
-                }}
-            )
-            total_updated += len(ids_to_reserve)
+    for collection_name in RESERVED_SYNC_COLLECTIONS:
+        result = await db[collection_name].update_many(
+            {'status': 'available', ROW_IDENTIFIERS_FIELD: {'$in': sorted(identifiers)}},
+            {'$set': {
+                'status': 'reserved',
+                'is_reserved_member': True,
+                'reserved_by': staff_id,
+                'reserved_by_name': staff_name,
+            }}
+        )
+        total_updated += result.modified_count
 
     return total_updated
 
@@ -170,126 +331,85 @@ async def sync_reserved_status_on_remove(db, customer_id: str, customer_name: st
     When a reservation is DELETED/EXPIRED, check if ANY other active reservation
     still covers this customer. If not, revert matching 'reserved' records back to 'available'.
     """
-    identifiers = set()
-    if customer_id and str(customer_id).strip():
-        identifiers.add(str(customer_id).strip().upper())
-    if customer_name and str(customer_name).strip():
-        identifiers.add(str(customer_name).strip().upper())
-    if not identifiers:
+    return await sync_reserved_status_on_remove_many(db, [(customer_id, customer_name)])
+
+
+async def sync_reserved_status_on_remove_many(db, customers: list):
+    """
+    Batched sync_reserved_status_on_remove() for many removed reservations:
+    the active reservations are loaded once and each collection gets one update_many.
+
+    Args:
+        customers: (customer_id, customer_name) of every removed reservation
+    """
+    member_identifiers = [_member_identifiers(cid, name) for cid, name in customers]
+    member_identifiers = [ids for ids in member_identifiers if ids]
+    if not member_identifiers:
         return 0
 
     # Check if any OTHER active reservation still covers this customer
-    all_reserved = await db.reserved_members.find(
-        {'status': 'approved'},
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1}
-    ).to_list(None)
+    from utils.reserved_snapshot import get_reserved_snapshot
+    still_reserved = (await get_reserved_snapshot(db)).reserved_set
 
-    still_reserved = build_reserved_set(all_reserved)
-
-    # If any of this customer's identifiers are still in the active set, don't unreserve
-    if identifiers & still_reserved:
+    # If any of a customer's identifiers are still in the active set, don't unreserve it
+    identifiers = set()
+    for ids in member_identifiers:
+        if not ids & still_reserved:
+            identifiers |= ids
+    if not identifiers:
         return 0
 
     total_updated = 0
-    for collection_name in ['memberwd_records', 'bonanza_records']:
-        records = await db[collection_name].find(
-            {'status': 'reserved'},
-            {'_id': 0, 'id': 1, 'row_data': 1}
-        ).to_list(None)
-
-        ids_to_unreserve = []
-        for record in records:
-            row_data = record.get('row_data', {})
-            for value in row_data.values():
-                if value and str(value).strip().upper() in identifiers:
-                    ids_to_unreserve.append(record['id'])
-                    break
-
-        if ids_to_unreserve:
-            await db[collection_name].update_many(
-                {'id': {'$in': ids_to_unreserve}},
-                {'$set': {
-                    'status': 'available',
-                    'is_reserved_member': False,
-                    'reserved_by': None,
-                    'reserved_by_name': None,
-                }}
-            )
-            total_updated += len(ids_to_unreserve)
+    for collection_name in RESERVED_SYNC_COLLECTIONS:
+        result = await db[collection_name].update_many(
+            {'status': 'reserved', ROW_IDENTIFIERS_FIELD: {'$in': sorted(identifiers)}},
+            {'$set': {
+                'status': 'available',
+                'is_reserved_member': False,
+                'reserved_by': None,
+                'reserved_by_name': None,
+            }}
+        )
+        total_updated += result.modified_count
 
     return total_updated
 
 
 async def sync_all_reserved_statuses(db):
     """
-    Full resync: scan ALL available+reserved records and correct their status
-    based on the current set of active reservations. Used for migration/repair.
+    Full resync: correct the status of ALL available+reserved records based on the
+    current set of active reservations. Used for migration/repair.
     """
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'},
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'staff_id': 1, 'staff_name': 1}
-    ).to_list(None)
+    await ensure_row_identifiers(db)
 
-    reserved_set = build_reserved_set(reserved_members)
-    reserved_map = build_reserved_map(reserved_members)
+    from utils.reserved_snapshot import get_reserved_snapshot
+    snapshot = await get_reserved_snapshot(db)
+    reserved_set = snapshot.reserved_set
+    reserved_map = snapshot.reserved_map
 
     total_marked_reserved = 0
     total_marked_available = 0
 
-    for collection_name in ['memberwd_records', 'bonanza_records']:
+    for collection_name in RESERVED_SYNC_COLLECTIONS:
         # Mark available -> reserved
-        avail_records = await db[collection_name].find(
-            {'status': 'available'},
-            {'_id': 0, 'id': 1, 'row_data': 1}
-        ).to_list(None)
-
-        to_reserve = []
-        reserve_info = {}
-        for record in avail_records:
-            row_data = record.get('row_data', {})
-            for value in row_data.values():
-                if value and str(value).strip():
-                    normalized = str(value).strip().upper()
-                    if normalized in reserved_map:
-                        to_reserve.append(record['id'])
-                        reserve_info[record['id']] = reserved_map[normalized]
-                        break
-
-        for rid in to_reserve:
-            info = reserve_info[rid]
-            await db[collection_name].update_one(
-                {'id': rid},
-                {'$set': {
-                    'status': 'reserved',
-                    'is_reserved_member': True,
-                    'reserved_by': info['staff_id'],
-                    'reserved_by_name': info['staff_name'],
-                }}
-            )
-        total_marked_reserved += len(to_reserve)
-
-        # Mark reserved -> available (if no longer reserved)
-        res_records = await db[collection_name].find(
-            {'status': 'reserved'},
-            {'_id': 0, 'id': 1, 'row_data': 1}
-        ).to_list(None)
-
-        to_unreserve = []
-        for record in res_records:
-            if not is_record_reserved(record, reserved_set):
-                to_unreserve.append(record['id'])
-
-        if to_unreserve:
-            await db[collection_name].update_many(
-                {'id': {'$in': to_unreserve}},
-                {'$set': {
-                    'status': 'available',
-                    'is_reserved_member': False,
-                    'reserved_by': None,
-                    'reserved_by_name': None,
-                }}
-            )
-        total_marked_available += len(to_unreserve)
+        total_marked_reserved += await _reserve_matching(db, collection_name, {}, reserved_map)
+
+        # Mark reserved -> available (if no longer reserved). Records carrying the
+        # is_reserved_member flag are kept, same as is_record_reserved().
+        result = await db[collection_name].update_many(
+            {
+                'status': 'reserved',
+                'is_reserved_member': {'$ne': True},
+                ROW_IDENTIFIERS_FIELD: {'$exists': True, '$nin': sorted(reserved_set)},
+            },
+            {'$set': {
+                'status': 'available',
+                'is_reserved_member': False,
+                'reserved_by': None,
+                'reserved_by_name': None,
+            }}
+        )
+        total_marked_available += result.modified_count
 
     return {
         'marked_reserved': total_marked_reserved,
@@ -300,85 +420,158 @@ async def sync_all_reserved_statuses(db):
 async def ensure_reserved_status_for_database(db, database_id: str, collection_name: str):
     """
     Lazy sync: ensure all records in a specific database have correct reserved status.
-    Called when listing databases or fetching records. Fast because it only processes one database.
+    Called when listing databases or fetching records. Fast because it only touches one
+    database through the row_identifiers index.
     
     Returns (reserved_count, ids_changed) for the caller to use.
     """
-    reserved_members = await db.reserved_members.find(
-        {'status': 'approved'},
-        {'_id': 0, 'customer_id': 1, 'customer_name': 1, 'staff_id': 1, 'staff_name': 1}
-    ).to_list(None)
+    from utils.reserved_snapshot import get_reserved_snapshot
+    snapshot = await get_reserved_snapshot(db)
+    reserved_set = snapshot.reserved_set
+    reserved_map = snapshot.reserved_map
+
+    # 1. Available records → should they be reserved?
+    marked_reserved = await _reserve_matching(db, collection_name, {'database_id': database_id}, reserved_map)
+
+    # 2. Reserved records → should they be unreserved? (checked against CURRENT reserved set, not stale flag)
+    result = await db[collection_name].update_many(
+        {
+            'database_id': database_id,
+            'status': 'reserved',
+            ROW_IDENTIFIERS_FIELD: {'$exists': True, '$nin': sorted(reserved_set)},
+        },
+        {'$set': {
+            'status': 'available',
+            'is_reserved_member': False,
+            'reserved_by': None,
+            'reserved_by_name': None,
+        }}
+    )
 
-    reserved_set = build_reserved_set(reserved_members)
-    reserved_map = build_reserved_map(reserved_members)
+    changed = marked_reserved > 0 or result.modified_count > 0
 
-    changed = False
+    reserved_count = await db[collection_name].count_documents(
+        {'database_id': database_id, 'status': 'reserved'}
+    )
 
-    # 1. Check available records → should they be reserved?
-    avail_records = await db[collection_name].find(
-        {'database_id': database_id, 'status': 'available'},
-        {'_id': 0, 'id': 1, 'row_data': 1}
-    ).to_list(None)
+    return reserved_count, changed
 
-    to_reserve = []
-    reserve_info = {}
-    for record in avail_records:
-        row_data = record.get('row_data', {})
-        for value in row_data.values():
-            if value and str(value).strip():
-                normalized = str(value).strip().upper()
-                if normalized in reserved_map:
-                    to_reserve.append(record['id'])
-                    reserve_info[record['id']] = reserved_map[normalized]
-                    break
-
-    if to_reserve:
-        for rid in to_reserve:
-            info = reserve_info[rid]
-            await db[collection_name].update_one(
-                {'id': rid},
-                {'$set': {
-                    'status': 'reserved',
-                    'is_reserved_member': True,
-                    'reserved_by': info['staff_id'],
-                    'reserved_by_name': info['staff_name'],
-                }}
-            )
-        changed = True
-
-    # 2. Check reserved records → should they be unreserved?
-    res_records = await db[collection_name].find(
-        {'database_id': database_id, 'status': 'reserved'},
-        {'_id': 0, 'id': 1, 'row_data': 1, 'is_reserved_member': 1}
-    ).to_list(None)
 
-    to_unreserve = []
-    for record in res_records:
-        # Check against CURRENT reserved set (not stale flag)
-        row_data = record.get('row_data', {})
-        still_reserved = False
-        for value in row_data.values():
-            if value and str(value).strip():
-                if str(value).strip().upper() in reserved_set:
-                    still_reserved = True
-                    break
-        if not still_reserved:
-            to_unreserve.append(record['id'])
-
-    if to_unreserve:
-        await db[collection_name].update_many(
-            {'id': {'$in': to_unreserve}},
-            {'$set': {
-                'status': 'available',
-                'is_reserved_member': False,
-                'reserved_by': None,
-                'reserved_by_name': None,
-            }}
+async def backfill_row_identifiers(db, collection_name: str, query: dict = None) -> int:
+    """
+    Persist row_identifiers on records of a collection that do not have it yet.
+    
+    Args:
+        db: Database connection
+        collection_name: memberwd_records, bonanza_records or customer_records
+        query: Optional extra filter (e.g. {'database_id': ...})
+        
+    Returns:
+        Number of records updated
+    """
+    match = {**(query or {}), ROW_IDENTIFIERS_FIELD: {'$exists': False}}
+    cursor = db[collection_name].find(match, {'_id': 1, 'row_data': 1}).batch_size(BACKFILL_BATCH_SIZE)
+
+    updated = 0
+    ops = []
+    async for record in cursor:
+        ops.append(UpdateOne(
+            {'_id': record['_id']},
+            {'$set': {ROW_IDENTIFIERS_FIELD: build_row_identifiers(record.get('row_data'))}}
+        ))
+        if len(ops) >= BACKFILL_BATCH_SIZE:
+            updated += (await bulk_write_chunked(db[collection_name], ops))['matched']
+            ops = []
+    if ops:
+        updated += (await bulk_write_chunked(db[collection_name], ops))['matched']
+
+    return updated
+
+
+async def backfill_usernames(db, query: dict = None) -> int:
+    """
+    Persist username_normalized on customer_records that do not have it yet.
+    
+    Returns:
+        Number of records updated
+    """
+    match = {**(query or {}), USERNAME_FIELD: {'$exists': False}}
+    cursor = db.customer_records.find(match, {'_id': 1, 'row_data': 1}).batch_size(BACKFILL_BATCH_SIZE)
+
+    updated = 0
+    ops = []
+    async for record in cursor:
+        ops.append(UpdateOne(
+            {'_id': record['_id']},
+            {'$set': {USERNAME_FIELD: extract_username(record.get('row_data'))}}
+        ))
+        if len(ops) >= BACKFILL_BATCH_SIZE:
+            updated += (await bulk_write_chunked(db.customer_records, ops))['matched']
+            ops = []
+    if ops:
+        updated += (await bulk_write_chunked(db.customer_records, ops))['matched']
+
+    return updated
+
+
+async def ensure_row_identifiers_indexes(db):
+    """Create the multikey row_identifiers indexes used by the reservation syncs (and the username index)."""
+    for collection_name in RESERVED_SYNC_COLLECTIONS:
+        await apply_collection_indexes(
+            db, collection_name, names=('row_identifiers_status_idx', 'database_status_identifiers_idx')
         )
-        changed = True
-
-    reserved_count = await db[collection_name].count_documents(
-        {'database_id': database_id, 'status': 'reserved'}
+    await apply_collection_indexes(
+        db, 'customer_records', names=('database_status_username_idx', 'database_status_identifiers_idx')
     )
 
-    return reserved_count, changed
+
+async def ensure_row_identifiers(db) -> bool:
+    """
+    Backfill row_identifiers on every memberwd/bonanza record and username_normalized
+    and row_identifiers on every customer_records record once (migration).
+    
+    Returns:
+        True if a backfill was performed
+    """
+    performed = False
+
+    if not await db.system_settings.find_one({'key': USERNAME_SETTINGS_KEY}, {'_id': 0}):
+        updated = await backfill_usernames(db)
+        await db.system_settings.update_one(
+            {'key': USERNAME_SETTINGS_KEY},
+            {'$set': {'key': USERNAME_SETTINGS_KEY, 'built_at': get_jakarta_now().isoformat(), 'updated': updated}},
+            upsert=True
+        )
+        performed = True
+
+    if not await db.system_settings.find_one({'key': CUSTOMER_ROW_IDENTIFIERS_SETTINGS_KEY}, {'_id': 0}):
+        updated = await backfill_row_identifiers(db, 'customer_records')
+        await db.system_settings.update_one(
+            {'key': CUSTOMER_ROW_IDENTIFIERS_SETTINGS_KEY},
+            {'$set': {
+                'key': CUSTOMER_ROW_IDENTIFIERS_SETTINGS_KEY,
+                'built_at': get_jakarta_now().isoformat(),
+                'updated': updated
+            }},
+            upsert=True
+        )
+        performed = True
+
+    marker = await db.system_settings.find_one({'key': ROW_IDENTIFIERS_SETTINGS_KEY}, {'_id': 0})
+    if marker:
+        return performed
+
+    counts = {}
+    for collection_name in RESERVED_SYNC_COLLECTIONS:
+        counts[collection_name] = await backfill_row_identifiers(db, collection_name)
+
+    await db.system_settings.update_one(
+        {'key': ROW_IDENTIFIERS_SETTINGS_KEY},
+        {'$set': {
+            'key': ROW_IDENTIFIERS_SETTINGS_KEY,
+            'built_at': get_jakarta_now().isoformat(),
+            'updated': counts
+        }},
+        upsert=True
+    )
+    return True
@@ -0,0 +1,212 @@
+"""
+Reservation Lookups
+Indexed resolver for "is this customer reserved (by whom, for which product)?"
+against reserved_members and the deleted_reserved_members archive.
+
+Every reservation stores customer_id_upper / customer_name_upper (stripped,
+uppercased, like normalize_identifier) next to the raw fields. Lookups are
+equality matches on those keys, one $or branch per key, each backed by a
+(status, key, product_id) index, instead of anchored case-insensitive
+regexes that scan the whole collection (and break on regex characters in
+customer ids).
+
+- reservation_keys() / with_reservation_keys(): the stored keys for a write
+- reservation_filter(): query for a customer (matched by customer_id OR the
+  legacy customer_name field) plus scope (status, product, staff)
+- find_reservation() / update_reservations() / delete_reservations(): the
+  resolver used by every route that looks reservations up by customer
+- ensure_reservation_keys(): indexes + one-time backfill of existing documents
+"""
+
+from typing import Iterable, Optional, Union
+
+from pymongo import UpdateOne
+
+from utils.reserved_check import BACKFILL_BATCH_SIZE, normalize_identifier
+from utils.db_operations import bulk_write_chunked
+from utils.index_manifest import apply_collection_indexes
+
+
+RESERVED_COLLECTION = 'reserved_members'
+ARCHIVE_COLLECTION = 'deleted_reserved_members'
+CUSTOMER_ID_UPPER_FIELD = 'customer_id_upper'
+CUSTOMER_NAME_UPPER_FIELD = 'customer_name_upper'
+# _v2: keys are computed in Python (the first backfill uppercased server-side, ASCII only)
+RESERVATION_KEYS_SETTINGS_KEY = 'reservation_upper_keys_backfill_v2'
+ACTIVE_STATUSES = ['pending', 'approved']
+
+
+def reservation_key(value) -> Optional[str]:
+    """Stored/lookup key of a customer id or name (None when empty, so it never matches)."""
+    return normalize_identifier(value) or None
+
+
+def reservation_keys(customer_id, customer_name=None) -> dict:
+    """customer_id_upper / customer_name_upper fields for a reservation write."""
+    return {
+        CUSTOMER_ID_UPPER_FIELD: reservation_key(customer_id),
+        CUSTOMER_NAME_UPPER_FIELD: reservation_key(customer_name),
+    }
+
+
+def with_reservation_keys(doc: dict) -> dict:
+    """Set the lookup keys on a reservation document from its customer_id/customer_name (in place)."""
+    doc.update(reservation_keys(doc.get('customer_id'), doc.get('customer_name')))
+    return doc
+
+
+def reservation_filter(
+    customer,
+    status: Union[str, Iterable[str], None] = None,
+    product_id: Optional[str] = None,
+    staff_id: Optional[str] = None,
+    exclude_staff_id: Optional[str] = None
+) -> Optional[dict]:
+    """
+    Query matching reservations of a customer (by customer_id or legacy customer_name).
+
+    Args:
+        customer: Raw customer id (case and surrounding whitespace are ignored)
+        status: One status or a list of statuses
+        product_id: Only this product
+        staff_id: Only this staff's reservations
+        exclude_staff_id: Only other staff's reservations
+
+    Returns:
+        MongoDB filter, or None when the customer id is empty
+    """
+    key = reservation_key(customer)
+    if key is None:
+        return None
+
+    scope = {}
+    if status is not None:
+        scope['status'] = status if isinstance(status, str) else {'$in': list(status)}
+    if product_id is not None:
+        scope['product_id'] = product_id
+    if staff_id is not None:
+        scope['staff_id'] = staff_id
+    elif exclude_staff_id is not None:
+        scope['staff_id'] = {'$ne': exclude_staff_id}
+
+    # Scope is repeated in each branch so both use their (status, key, product_id) index
+    return {'$or': [
+        {**scope, CUSTOMER_ID_UPPER_FIELD: key},
+        {**scope, CUSTOMER_NAME_UPPER_FIELD: key},
+    ]}
+
+
+async def find_reservation(
+    db,
+    customer,
+    status: Union[str, Iterable[str], None] = None,
+    product_id: Optional[str] = None,
+    staff_id: Optional[str] = None,
+    exclude_staff_id: Optional[str] = None,
+    projection: Optional[dict] = None,
+    archived: bool = False
+) -> Optional[dict]:
+    """
+    Find one reservation of a customer.
+
+    Args:
+        archived: Search deleted_reserved_members instead of reserved_members
+
+    Returns:
+        The reservation document (without _id unless projection says otherwise), or None
+    """
+    query = reservation_filter(customer, status, product_id, staff_id, exclude_staff_id)
+    if query is None:
+        return None
+    collection = db[ARCHIVE_COLLECTION if archived else RESERVED_COLLECTION]
+    return await collection.find_one(query, projection or {'_id': 0})
+
+
+async def update_reservations(
+    db,
+    customer,
+    update: dict,
+    status: Union[str, Iterable[str], None] = None,
+    product_id: Optional[str] = None,
+    staff_id: Optional[str] = None
+) -> int:
+    """Apply update to every matching active-collection reservation; returns the modified count."""
+    query = reservation_filter(customer, status, product_id, staff_id)
+    if query is None:
+        return 0
+    result = await db[RESERVED_COLLECTION].update_many(query, update)
+    return result.modified_count
+
+
+async def delete_reservations(
+    db,
+    customer,
+    product_id: Optional[str] = None,
+    staff_id: Optional[str] = None,
+    archived: bool = True
+) -> int:
+    """Delete matching reservations (archived ones by default); returns the deleted count."""
+    query = reservation_filter(customer, product_id=product_id, staff_id=staff_id)
+    if query is None:
+        return 0
+    collection = db[ARCHIVE_COLLECTION if archived else RESERVED_COLLECTION]
+    result = await collection.delete_many(query)
+    return result.deleted_count
+
+
+async def _backfill_reservation_keys(collection) -> int:
+    """
+    Set the lookup keys on every document of a reservation collection; returns the modified count.
+
+    Keys are computed with reservation_key() itself: $toUpper only folds ASCII and $trim
+    strips a different whitespace set, so a server-side pipeline would store keys that
+    Python lookups of non-ASCII customer ids never match.
+    """
+    cursor = collection.find({}, {'_id': 1, 'customer_id': 1, 'customer_name': 1}).batch_size(BACKFILL_BATCH_SIZE)
+
+    updated = 0
+    ops = []
+    async for doc in cursor:
+        ops.append(UpdateOne(
+            {'_id': doc['_id']},
+            {'$set': reservation_keys(doc.get('customer_id'), doc.get('customer_name'))}
+        ))
+        if len(ops) >= BACKFILL_BATCH_SIZE:
+            updated += (await bulk_write_chunked(collection, ops))['modified']
+            ops = []
+    if ops:
+        updated += (await bulk_write_chunked(collection, ops))['modified']
+
+    return updated
+
+
+async def ensure_reservation_indexes(db):
+    """Create the (status, key, product_id) lookup indexes on both reservation collections."""
+    await apply_collection_indexes(
+        db, RESERVED_COLLECTION, names=('status_customer_id_upper_idx', 'status_customer_name_upper_idx')
+    )
+    await apply_collection_indexes(db, ARCHIVE_COLLECTION)
+
+
+async def ensure_reservation_keys(db) -> bool:
+    """
+    Create the lookup indexes and backfill the upper keys on existing reservations once
+    (both collections, keys computed by reservation_key()).
+
+    Returns:
+        True if the backfill ran
+    """
+    await ensure_reservation_indexes(db)
+    marker = await db.system_settings.find_one({'key': RESERVATION_KEYS_SETTINGS_KEY}, {'_id': 0})
+    if marker:
+        return False
+
+    updated = 0
+    for collection_name in (RESERVED_COLLECTION, ARCHIVE_COLLECTION):
+        updated += await _backfill_reservation_keys(db[collection_name])
+    await db.system_settings.update_one(
+        {'key': RESERVATION_KEYS_SETTINGS_KEY},
+        {'$set': {'key': RESERVATION_KEYS_SETTINGS_KEY, 'updated': updated}},
+        upsert=True
+    )
+    return True
@@ -0,0 +1,130 @@
+"""
+Reserved Member Snapshot
+Process-wide, versioned cache of the approved reservations that every reserved
+check is built from (build_reserved_set / build_reserved_map).
+
+A version counter in system_settings is bumped after every write that changes
+the approved set (add, approve, reject, delete, move, expire). get_reserved_snapshot()
+reads that counter (one find_one on a single small document) and returns the cached
+snapshot while it is unchanged, so the approved reservations are only reloaded
+after something actually changed - on any worker.
+
+- get_reserved_snapshot(): the current ReservedSnapshot (reloaded on version change)
+- bump_reserved_version(): call after writing reserved_members
+- reserved_snapshot_stats(): hit/reload counters for /api/health
+"""
+
+import asyncio
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from utils.reserved_check import build_reserved_map, build_reserved_set, normalize_identifier
+
+
+RESERVED_VERSION_SETTINGS_KEY = 'reserved_members_version'
+SNAPSHOT_PROJECTION = {
+    '_id': 0, 'customer_id': 1, 'customer_name': 1, 'staff_id': 1, 'staff_name': 1, 'product_id': 1
+}
+
+
+class ReservedSnapshot:
+    """Approved reservations at one version, with the lookup structures derived from them.
+
+    Shared between requests: treat every attribute as read-only.
+    """
+
+    def __init__(self, version: int, members: list):
+        self.version = version
+        self.members: Tuple[dict, ...] = tuple(members)
+        self.reserved_set: FrozenSet[str] = frozenset(build_reserved_set(members))
+        self.reserved_map: Dict[str, dict] = build_reserved_map(members)
+
+        by_product = {}
+        for m in members:
+            identifiers = by_product.setdefault(m.get('product_id', ''), set())
+            for value in (m.get('customer_id'), m.get('customer_name')):
+                normalized = normalize_identifier(value)
+                if normalized:
+                    identifiers.add(normalized)
+        # product_id -> normalized customer_id / customer_name of its reservations
+        self.reserved_by_product: Dict[str, FrozenSet[str]] = {
+            product_id: frozenset(identifiers) for product_id, identifiers in by_product.items()
+        }
+
+
+class _SnapshotCache:
+    def __init__(self):
+        self.snapshot: Optional[ReservedSnapshot] = None
+        self.lock = asyncio.Lock()
+        self.hits = 0
+        self.reloads = 0
+        self.bumps = 0
+
+
+_cache = _SnapshotCache()
+
+
+async def _current_version(db) -> int:
+    marker = await db.system_settings.find_one(
+        {'key': RESERVED_VERSION_SETTINGS_KEY}, {'_id': 0, 'version': 1}
+    )
+    return (marker or {}).get('version', 0)
+
+
+async def get_reserved_snapshot(db) -> ReservedSnapshot:
+    """
+    Approved reservations as a shared snapshot.
+
+    Returns the cached snapshot when the stored version is unchanged; otherwise
+    reloads reserved_members once (concurrent callers wait for the same reload).
+    """
+    version = await _current_version(db)
+    snapshot = _cache.snapshot
+    if snapshot is not None and snapshot.version == version:
+        _cache.hits += 1
+        return snapshot
+
+    async with _cache.lock:
+        snapshot = _cache.snapshot
+        if snapshot is not None and snapshot.version >= version:
+            _cache.hits += 1
+            return snapshot
+
+        # Re-read the version before loading: a bump racing the load leaves the snapshot
+        # tagged with an older version, so the next call reloads it
+        version = await _current_version(db)
+        members = await db.reserved_members.find(
+            {'status': 'approved'}, SNAPSHOT_PROJECTION
+        ).to_list(None)
+        snapshot = ReservedSnapshot(version, members)
+        _cache.snapshot = snapshot
+        _cache.reloads += 1
+        return snapshot
+
+
+async def bump_reserved_version(db) -> int:
+    """Invalidate the snapshot on every worker; call after any reserved_members write."""
+    marker = await db.system_settings.find_one_and_update(
+        {'key': RESERVED_VERSION_SETTINGS_KEY},
+        {'$inc': {'version': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        projection={'_id': 0, 'version': 1}
+    )
+    _cache.snapshot = None
+    _cache.bumps += 1
+    return (marker or {}).get('version', 0)
+
+
+def reserved_snapshot_stats() -> dict:
+    snapshot = _cache.snapshot
+    lookups = _cache.hits + _cache.reloads
+    return {
+        'version': snapshot.version if snapshot else None,
+        'members': len(snapshot.members) if snapshot else 0,
+        'hits': _cache.hits,
+        'reloads': _cache.reloads,
+        'hit_rate': round(_cache.hits / lookups, 4) if lookups else 0.0,
+        'bumps': _cache.bumps,
+    }
@@ -0,0 +1,73 @@
+"""
+Startup Maintenance
+One-time builds and backfills a deployment needs after an upgrade (first-deposit
+index, daily rollups, deposit profiles, lookup keys) run as the queued
+'startup_maintenance' background job instead of inside the startup event.
+
+- Every worker enqueues the job at startup; enqueue_job() returns the active
+  job instead of queueing a second one and concurrency=1 keeps one running, so
+  the steps never run in several workers at once and startup never waits
+- Each step is a no-op once its system_settings marker exists, so the job of a
+  later restart finishes immediately
+- Steps run in order (the rollups classify NDP/RDP against the first-deposit
+  index) and finished steps are checkpointed, so a job resumed after its worker
+  died skips them. A failing step is logged and retried by the next startup
+"""
+
+import logging
+from typing import Awaitable, Callable, List, Tuple
+
+from utils.deposit_lookup import ensure_customer_name_lower
+from utils.deposit_profile import ensure_deposit_profiles
+from utils.first_deposit_index import ensure_first_deposit_index
+from utils.job_queue import JobContext, enqueue_job, register_job
+from utils.omset_rollup import ensure_daily_rollups
+from utils.reserved_check import ensure_row_identifiers
+from utils.reserved_lookup import ensure_reservation_keys
+
+
+logger = logging.getLogger(__name__)
+
+STARTUP_MAINTENANCE_JOB = 'startup_maintenance'
+
+# (step name, log message when the step did work, step returning True if it did)
+STARTUP_MAINTENANCE_STEPS: List[Tuple[str, str, Callable[..., Awaitable[bool]]]] = [
+    ('first_deposit_index', 'customer_first_deposit index built from omset_records', ensure_first_deposit_index),
+    ('daily_rollups', 'omset_daily_rollup built from omset_records', ensure_daily_rollups),
+    ('deposit_profiles', 'customer_deposit_profile built from omset_records', ensure_deposit_profiles),
+    ('customer_name_lower', 'customer_name_lower backfilled on omset_records', ensure_customer_name_lower),
+    ('reservation_keys', 'Reservation lookup keys backfilled on reserved_members', ensure_reservation_keys),
+    ('row_identifiers', 'row_identifiers / username_normalized backfilled on record collections', ensure_row_identifiers),
+]
+
+
+@register_job(STARTUP_MAINTENANCE_JOB, concurrency=1, lease_seconds=300)
+async def run_startup_maintenance(ctx: JobContext):
+    """Job: run the one-time startup builds and backfills that have not run yet."""
+    done = list(ctx.checkpoint.get('done_steps', []))
+    performed = []
+    failed = []
+
+    for position, (name, message, step) in enumerate(STARTUP_MAINTENANCE_STEPS, start=1):
+        if name in done:
+            continue
+        try:
+            if await step(ctx.db):
+                performed.append(name)
+                logger.info(f"✅ {message}")
+            done.append(name)
+        except Exception:
+            logger.exception(f"Startup maintenance step {name} failed")
+            failed.append(name)
+        await ctx.progress(
+            100 * position / len(STARTUP_MAINTENANCE_STEPS),
+            f"Checked {name}",
+            checkpoint={'done_steps': done}
+        )
+
+    return {'performed': performed, 'failed': failed}
+
+
+async def enqueue_startup_maintenance(db) -> dict:
+    """Queue the startup maintenance job (or return the one already queued or running)."""
+    return await enqueue_job(db, STARTUP_MAINTENANCE_JOB)
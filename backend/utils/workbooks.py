@@ -0,0 +1,94 @@
+"""
+Export Workbook Writers
+CPU-bound pandas/openpyxl file builders executed on the process pool through
+run_cpu_bound(). They take plain, picklable data (lists of dicts) and either
+write the file to a path or return its bytes; they never touch the database.
+"""
+
+import io
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+
+SheetSpec = Tuple[str, list, Optional[List[str]]]
+
+
+def write_table_file(rows: List[dict], path: str, format: str = 'xlsx') -> str:
+    """
+    Write rows (one dict per row, keys = column headers) to a CSV or XLSX file.
+
+    Returns:
+        The written path
+    """
+    df = pd.DataFrame(rows)
+    if format == 'csv':
+        df.to_csv(path, index=False, encoding='utf-8')
+    else:
+        df.to_excel(path, index=False, engine='openpyxl')
+    return path
+
+
+def write_sheets_xlsx(sheets: Sequence[SheetSpec], path: str) -> str:
+    """
+    Write several sheets into one XLSX file.
+
+    Args:
+        sheets: (sheet_name, rows, column_names) tuples; rows are dicts (column_names=None)
+                or value lists in column_names order
+        path: Output file path
+
+    Returns:
+        The written path
+    """
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for sheet_name, rows, column_names in sheets:
+            df = pd.DataFrame(rows, columns=column_names)
+            df.to_excel(writer, sheet_name=sheet_name[:31], index=False)
+    return path
+
+
+def styled_table_xlsx_bytes(
+    title: str,
+    header: List[str],
+    rows: List[list],
+    header_color: str = '4F46E5',
+    column_widths: Optional[Dict[str, float]] = None
+) -> bytes:
+    """
+    Build a single-sheet XLSX with a bold colored header row.
+
+    Args:
+        title: Worksheet title
+        header: Column headers
+        rows: Row values (same order as header)
+        header_color: Header fill color (hex RGB)
+        column_widths: Column letter -> width
+
+    Returns:
+        The XLSX file contents
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = title[:31]
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color=header_color, end_color=header_color, fill_type="solid")
+    for col, name in enumerate(header, 1):
+        cell = ws.cell(row=1, column=col, value=name)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal='center')
+
+    for row in rows:
+        ws.append(list(row))
+
+    for letter, width in (column_widths or {}).items():
+        ws.column_dimensions[letter].width = width
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
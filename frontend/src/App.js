@@ -57,6 +57,26 @@ api.interceptors.response.use(
   }
 );
 
+// Long admin operations run as background jobs: the POST returns the result when the job
+// finishes quickly, otherwise a job_id that is polled here until the job is done
+export const runJob = async (url, pollMs = 2000) => {
+  const response = await api.post(url);
+  const jobId = response.data?.job_id;
+  if (!jobId || response.data.job_status === 'completed') return response;
+  for (;;) {
+    await new Promise(r => setTimeout(r, pollMs));
+    const { data: job } = await api.get(`/jobs/${jobId}`);
+    if (job.status === 'completed') {
+      return { ...response, data: { ...job.result, job_id: jobId, job_status: job.status } };
+    }
+    if (job.status === 'failed') {
+      const error = new Error(job.error || 'Job failed');
+      error.response = { status: 500, data: { detail: job.error } };
+      throw error;
+    }
+  }
+};
+
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('token');
   if (token) {
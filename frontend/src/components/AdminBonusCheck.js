@@ -2,6 +2,7 @@ import { useState, useEffect } from 'react';
 import { Gift, Download, Calendar, Users, Package, RefreshCw, FileSpreadsheet, FileText, Search, Filter } from 'lucide-react';
 import { toast } from 'sonner';
 import { api } from '../App';
+import { ALL_PAGES_PAGE_SIZE } from '../lib/pagination';
 
 export default function AdminBonusCheck() {
   const [submissions, setSubmissions] = useState([]);
@@ -50,15 +51,33 @@ export default function AdminBonusCheck() {
   const loadSubmissions = async () => {
     setLoading(true);
     try {
-      const params = { month: selectedMonth };
+      const params = { month: selectedMonth, limit: ALL_PAGES_PAGE_SIZE };
       if (selectedStaff) params.staff_id = selectedStaff;
       if (selectedProduct) params.product_id = selectedProduct;
       
-      const response = await api.get('/bonus-check/admin/all', { params });
-      setSubmissions(response.data.submissions || []);
+      // The listing is keyset-paginated (next_cursor in the body); read every page
+      // and merge the per-page staff counts
+      const allSubmissions = [];
+      const byStaff = {};
+      let cursor = null;
+      do {
+        const response = await api.get('/bonus-check/admin/all', {
+          params: { ...params, ...(cursor && { cursor }) }
+        });
+        allSubmissions.push(...(response.data.submissions || []));
+        (response.data.by_staff || []).forEach(staff => {
+          byStaff[staff.staff_id] = {
+            ...staff,
+            count: (byStaff[staff.staff_id]?.count || 0) + staff.count
+          };
+        });
+        cursor = response.data.next_cursor;
+      } while (cursor);
+
+      setSubmissions(allSubmissions);
       setSummary({
-        total: response.data.total || 0,
-        by_staff: response.data.by_staff || []
+        total: allSubmissions.length,
+        by_staff: Object.values(byStaff)
       });
     } catch (error) {
       console.error('Failed to load submissions:', error);
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { api } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { Upload, Database, Users, Trash2, ChevronDown, ChevronUp, Check, X, Search, Shuffle, Package, Edit2, AlertTriangle, RefreshCw, Archive, Undo2, Settings } from 'lucide-react';
 import ErrorBoundary from './ErrorBoundary';
@@ -87,8 +88,8 @@ export default function AdminDBBonanza() {
 
   const loadReservedNames = async () => {
     try {
-      const response = await api.get('/reserved-members');
-      const names = response.data.map(m => m.customer_name?.toLowerCase().trim()).filter(Boolean);
+      const members = await getAllPages('/reserved-members');
+      const names = members.map(m => m.customer_name?.toLowerCase().trim()).filter(Boolean);
       setReservedNames(names);
     } catch (error) {
       console.error('Failed to load reserved names');
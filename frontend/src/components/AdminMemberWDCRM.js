@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
-import { api } from '../App';
+import { api, runJob } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { Upload, Database, Users, Trash2, ChevronDown, ChevronUp, Check, X, Search, Shuffle, Package, Edit2, AlertTriangle, RefreshCw, Archive, Undo2, Settings, Play, RotateCcw } from 'lucide-react';
 import ReplaceModal from './shared/ReplaceModal';
@@ -92,8 +93,8 @@ export default function AdminMemberWDCRM() {
 
   const loadReservedNames = async () => {
     try {
-      const response = await api.get('/reserved-members');
-      const names = response.data.map(m => {
+      const members = await getAllPages('/reserved-members');
+      const names = members.map(m => {
         const name = m.customer_name;
         return name ? String(name).toLowerCase().trim() : null;
       }).filter(Boolean);
@@ -174,7 +175,7 @@ export default function AdminMemberWDCRM() {
     
     setRunningMigration(true);
     try {
-      const response = await api.post('/memberwd/admin/migrate-batches');
+      const response = await runJob('/memberwd/admin/migrate-batches');
       toast.success(response.data.message);
       loadMigrationStatus();
     } catch (error) {
@@ -211,7 +212,7 @@ export default function AdminMemberWDCRM() {
       toast.info(`Reset: ${resetResponse.data.batches_deleted} batches deleted, ${resetResponse.data.records_reset} records reset`);
       
       // Step 2: Migrate
-      const migrateResponse = await api.post('/memberwd/admin/migrate-batches');
+      const migrateResponse = await runJob('/memberwd/admin/migrate-batches');
       toast.success(`Migration complete: ${migrateResponse.data.batches_created} new batches created`);
       
       loadMigrationStatus();
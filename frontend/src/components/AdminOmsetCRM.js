@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useCallback } from 'react';
-import { api } from '../App';
+import { api, runJob } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { Calendar, Package, DollarSign, TrendingUp, Users, ChevronDown, ChevronUp, UserPlus, RefreshCw, Download, Trash2, Clock, RotateCcw, AlertTriangle } from 'lucide-react';
 import OmsetFilterPanel from './shared/OmsetFilterPanel';
@@ -44,7 +45,7 @@ export default function AdminOmsetCRM() {
     if (!window.confirm('This will recalculate NDP/RDP status for ALL omset records. Continue?')) return;
     setRecalculating(true);
     try {
-      const res = await api.post('/omset/migrate-normalize');
+      const res = await runJob('/omset/migrate-normalize');
       toast.success(`Recalculated ${res.data.updated_count} records`);
       loadData();
     } catch (err) {
@@ -156,11 +157,11 @@ export default function AdminOmsetCRM() {
       };
 
       const [recordsRes, summaryRes] = await Promise.all([
-        api.get('/omset', { params }),
+        getAllPages('/omset', { params }),
         api.get('/omset/summary', { params })
       ]);
 
-      setRecords(recordsRes.data);
+      setRecords(recordsRes);
       setSummary(summaryRes.data);
     } catch (error) {
       toast.error('Failed to load data');
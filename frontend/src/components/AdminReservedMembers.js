@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
-import { api } from '../App';
+import { api, runJob } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { UserPlus, Check, X, Trash2, ArrowRight, Search, Users, Clock, CheckCircle, Package, Upload, FileText, Phone, Copy, RotateCcw, Archive, Shield, ShieldOff } from 'lucide-react';
 
@@ -36,12 +37,12 @@ export default function AdminReservedMembers({ onUpdate }) {
   const loadData = async () => {
     try {
       const [membersRes, staffRes, productsRes, deletedRes] = await Promise.all([
-        api.get('/reserved-members'),
+        getAllPages('/reserved-members'),
         api.get('/staff-users'),
         api.get('/products'),
         api.get('/reserved-members/deleted').catch(() => ({ data: [] }))
       ]);
-      setMembers(membersRes.data);
+      setMembers(membersRes);
       setStaffList(staffRes.data);
       setProducts(productsRes.data);
       setDeletedMembers(deletedRes.data || []);
@@ -320,7 +321,7 @@ export default function AdminReservedMembers({ onUpdate }) {
     
     setRunningCleanup(true);
     try {
-      const response = await api.post('/scheduled-reports/reserved-member-cleanup-run');
+      const response = await runJob('/scheduled-reports/reserved-member-cleanup-run');
       const data = response.data;
       
       // Build detailed message
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { api } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { Search, User, Package, FileSpreadsheet } from 'lucide-react';
 
@@ -50,8 +51,7 @@ export default function AllAssignments() {
     
     setLoading(true);
     try {
-      const response = await api.get(`/databases/${selectedDatabase}/records`);
-      setRecords(response.data);
+      setRecords(await getAllPages(`/databases/${selectedDatabase}/records`));
     } catch (error) {
       toast.error('Failed to load records');
     } finally {
@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from 'react';
-import { api } from '../App';
+import { api, runJob } from '../App';
 import { toast } from 'sonner';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from './ui/card';
 import { Button } from './ui/button';
@@ -55,7 +55,7 @@ export default function DataSyncDashboard() {
   const handleRepair = async (repairType) => {
     setRepairing(true);
     try {
-      const res = await api.post(`/data-sync/repair?repair_type=${repairType}`);
+      const res = await runJob(`/data-sync/repair?repair_type=${repairType}`);
       toast.success(`Repair completed: ${repairType}`);
       // Reload data after repair
       await loadData();
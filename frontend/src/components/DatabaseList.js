@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { api } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { Search, Eye, Trash2, FileSpreadsheet, Users, AlertTriangle, X, Wrench, CheckCircle, RefreshCw, Zap, Settings } from 'lucide-react';
 import DatabasePreview from './DatabasePreview';
@@ -87,8 +88,8 @@ export default function DatabaseList({ onUpdate, isStaff = false }) {
 
   const handleRequestDownload = async (database) => {
     try {
-      const response = await api.get(`/databases/${database.id}/records`);
-      setSelectedDb({...database, records: response.data});
+      const records = await getAllPages(`/databases/${database.id}/records`);
+      setSelectedDb({...database, records});
       setShowRecords(true);
     } catch (error) {
       toast.error('Failed to load records');
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { api } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { User } from 'lucide-react';
 
@@ -16,8 +17,7 @@ export default function DatabaseRecords({ database, isStaff, onRequestSuccess })
 
   const loadRecords = async () => {
     try {
-      const response = await api.get(`/databases/${database.id}/records`);
-      setRecords(response.data);
+      setRecords(await getAllPages(`/databases/${database.id}/records`));
     } catch (error) {
       toast.error('Failed to load customer records');
     } finally {
@@ -1,25 +1,19 @@
-import { useState, useEffect } from 'react';
-import { api } from '../App';
+import { useEffect } from 'react';
 import { toast } from 'sonner';
 import { Download } from 'lucide-react';
+import { useCursorPages } from '../hooks/useCursorPages';
 
 export default function DownloadHistory() {
-  const [history, setHistory] = useState([]);
-  const [loading, setLoading] = useState(true);
+  const {
+    items: history, loading, loadingMore, hasMore, reload, loadMore
+  } = useCursorPages('/download-history', { pageSize: 50 });
 
   useEffect(() => {
-    loadHistory();
-  }, []);
+    reload().catch(() => toast.error('Failed to load download history'));
+  }, [reload]);
 
-  const loadHistory = async () => {
-    try {
-      const response = await api.get('/download-history');
-      setHistory(response.data);
-    } catch (error) {
-      toast.error('Failed to load download history');
-    } finally {
-      setLoading(false);
-    }
+  const handleLoadMore = () => {
+    loadMore().catch(() => toast.error('Failed to load download history'));
   };
 
   const formatDate = (dateString) => {
@@ -64,6 +58,16 @@ export default function DownloadHistory() {
               </div>
             </div>
           ))}
+          {hasMore && (
+            <button
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+              className="w-full py-3 text-sm font-medium text-slate-700 bg-white border border-slate-200 rounded-xl hover:bg-slate-50 disabled:opacity-50"
+              data-testid="download-history-load-more"
+            >
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -2,10 +2,9 @@ import { useState, useEffect } from 'react';
 import { api } from '../App';
 import { toast } from 'sonner';
 import { CheckCircle, XCircle, Clock, CheckSquare, Square, Filter, Calendar, Users, Package, TrendingUp, RefreshCw } from 'lucide-react';
+import { useCursorPages } from '../hooks/useCursorPages';
 
 export default function DownloadRequests({ onUpdate }) {
-  const [requests, setRequests] = useState([]);
-  const [loading, setLoading] = useState(true);
   const [selectedRequests, setSelectedRequests] = useState([]);
   const [bulkProcessing, setBulkProcessing] = useState(false);
   
@@ -22,6 +21,20 @@ export default function DownloadRequests({ onUpdate }) {
   // Stats
   const [stats, setStats] = useState(null);
 
+  const {
+    items: requests, total: totalRequests, loading, loadingMore, hasMore, reload, loadMore
+  } = useCursorPages('/download-requests', {
+    pageSize: 200,
+    includeTotal: true,
+    params: {
+      ...(filterStaff && { staff_id: filterStaff }),
+      ...(filterProduct && { product_id: filterProduct }),
+      ...(filterDateFrom && { date_from: filterDateFrom }),
+      ...(filterDateTo && { date_to: filterDateTo }),
+      ...(filterStatus && { status: filterStatus })
+    }
+  });
+
   useEffect(() => {
     loadStaffAndProducts();
   }, []);
@@ -30,7 +43,7 @@ export default function DownloadRequests({ onUpdate }) {
     loadRequests();
     loadStats();
   // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [filterStaff, filterProduct, filterDateFrom, filterDateTo, filterStatus]);
+  }, [reload]);
 
   const loadStaffAndProducts = async () => {
     try {
@@ -47,23 +60,17 @@ export default function DownloadRequests({ onUpdate }) {
 
   const loadRequests = async () => {
     try {
-      const params = new URLSearchParams();
-      if (filterStaff) params.append('staff_id', filterStaff);
-      if (filterProduct) params.append('product_id', filterProduct);
-      if (filterDateFrom) params.append('date_from', filterDateFrom);
-      if (filterDateTo) params.append('date_to', filterDateTo);
-      if (filterStatus) params.append('status', filterStatus);
-      
-      const response = await api.get(`/download-requests?${params}`);
-      setRequests(response.data);
+      await reload();
       setSelectedRequests([]);
     } catch (error) {
       toast.error('Failed to load requests');
-    } finally {
-      setLoading(false);
     }
   };
 
+  const handleLoadMore = () => {
+    loadMore().catch(() => toast.error('Failed to load requests'));
+  };
+
   const loadStats = async () => {
     try {
       const params = new URLSearchParams();
@@ -351,7 +358,7 @@ export default function DownloadRequests({ onUpdate }) {
       {/* Results summary */}
       {hasActiveFilters && (
         <div className="mb-4 text-sm text-slate-600 dark:text-slate-400">
-          Showing {requests.length} request{requests.length !== 1 ? 's' : ''} with current filters
+          Showing {requests.length}{totalRequests !== null && totalRequests > requests.length ? ` of ${totalRequests}` : ''} request{requests.length !== 1 ? 's' : ''} with current filters
         </div>
       )}
 
@@ -497,6 +504,17 @@ export default function DownloadRequests({ onUpdate }) {
             </div>
           )}
 
+          {hasMore && (
+            <button
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+              className="w-full py-3 text-sm font-medium text-slate-700 bg-white border border-slate-200 rounded-xl hover:bg-slate-50 disabled:opacity-50"
+              data-testid="download-requests-load-more"
+            >
+              {loadingMore ? 'Loading...' : `Load more${totalRequests !== null ? ` (${requests.length} of ${totalRequests})` : ''}`}
+            </button>
+          )}
+
           {requests.length === 0 && (
             <div className="text-center py-12">
               <Clock className="mx-auto text-slate-300 mb-4" size={64} />
@@ -1,25 +1,19 @@
-import { useState, useEffect } from 'react';
-import { api } from '../App';
+import { useEffect } from 'react';
 import { toast } from 'sonner';
 import { Clock, CheckCircle, XCircle, Download } from 'lucide-react';
+import { useCursorPages } from '../hooks/useCursorPages';
 
 export default function MyRequests({ onUpdate }) {
-  const [requests, setRequests] = useState([]);
-  const [loading, setLoading] = useState(true);
+  const {
+    items: requests, loading, loadingMore, hasMore, reload, loadMore
+  } = useCursorPages('/download-requests', { pageSize: 50 });
 
   useEffect(() => {
-    loadRequests();
-  }, []);
+    reload().catch(() => toast.error('Failed to load requests'));
+  }, [reload]);
 
-  const loadRequests = async () => {
-    try {
-      const response = await api.get('/download-requests');
-      setRequests(response.data);
-    } catch (error) {
-      toast.error('Failed to load requests');
-    } finally {
-      setLoading(false);
-    }
+  const handleLoadMore = () => {
+    loadMore().catch(() => toast.error('Failed to load requests'));
   };
 
   const handleDownload = async (request) => {
@@ -110,6 +104,16 @@ export default function MyRequests({ onUpdate }) {
               </div>
             </div>
           ))}
+          {hasMore && (
+            <button
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+              className="w-full py-3 text-sm font-medium text-slate-700 bg-white border border-slate-200 rounded-xl hover:bg-slate-50 disabled:opacity-50"
+              data-testid="my-requests-load-more"
+            >
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { api } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { UserPlus, Users, CheckCircle, XCircle, Trash2, Search } from 'lucide-react';
 
@@ -19,12 +20,12 @@ export default function ReservedMemberCRM({ isStaff = false }) {
   const loadData = async () => {
     try {
       const [membersRes, usersRes] = await Promise.all([
-        api.get('/reserved-members'),
+        getAllPages('/reserved-members'),
         api.get('/auth/me').then(() => api.get('/auth/me')).catch(() => ({ data: null }))
       ]);
 
-      const approved = membersRes.data.filter(m => m.status === 'approved');
-      const pending = membersRes.data.filter(m => m.status === 'pending');
+      const approved = membersRes.filter(m => m.status === 'approved');
+      const pending = membersRes.filter(m => m.status === 'pending');
       
       setMembers(approved);
       setPendingRequests(pending);
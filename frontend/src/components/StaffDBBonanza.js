@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { api } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { Gift, FileSpreadsheet, Calendar, Package, CheckCircle, XCircle, AlertTriangle } from 'lucide-react';
 import { useLanguage } from '../contexts/LanguageContext';
@@ -40,9 +41,8 @@ export default function StaffDBBonanza() {
 
   const loadRecords = async () => {
     try {
-      const params = filterProduct ? `?product_id=${filterProduct}` : '';
-      const response = await api.get(`/bonanza/staff/records${params}`);
-      setRecords(response.data);
+      const params = filterProduct ? { product_id: filterProduct } : {};
+      setRecords(await getAllPages('/bonanza/staff/records', { params }));
     } catch (error) {
       toast.error(t('messages.loadFailed'));
     } finally {
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { api } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { Users, TrendingUp, CheckCircle, XCircle, Clock, Package, MessageCircle, Target, Trophy, AlertTriangle, AlertOctagon, Flame, ChevronDown, ChevronUp } from 'lucide-react';
 import { useLanguage } from '../contexts/LanguageContext';
@@ -42,10 +43,10 @@ export default function StaffProgress() {
 
       // Load all records from all databases
       const allRecordsPromises = dbResponse.data.map(db => 
-        api.get(`/databases/${db.id}/records`)
+        getAllPages(`/databases/${db.id}/records`)
       );
       const recordsResponses = await Promise.all(allRecordsPromises);
-      const combinedRecords = recordsResponses.flatMap(res => res.data);
+      const combinedRecords = recordsResponses.flat();
       setAllRecords(combinedRecords);
     } catch (error) {
       toast.error(t('messages.loadFailed'));
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { api } from '../App';
+import { getAllPages } from '../lib/pagination';
 import { toast } from 'sonner';
 import { UserPlus, Search, Clock, CheckCircle, Users, Package, Phone, Copy } from 'lucide-react';
 import { useLanguage } from '../contexts/LanguageContext';
@@ -24,10 +25,10 @@ export default function StaffReservedMembers() {
   const loadData = async () => {
     try {
       const [membersRes, productsRes] = await Promise.all([
-        api.get('/reserved-members'),
+        getAllPages('/reserved-members'),
         api.get('/products')
       ]);
-      setMembers(membersRes.data);
+      setMembers(membersRes);
       setProducts(productsRes.data);
     } catch (error) {
       toast.error('Failed to load data');
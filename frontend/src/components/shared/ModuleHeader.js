@@ -1,5 +1,6 @@
 import { Check, RefreshCw } from 'lucide-react';
 import { toast } from 'sonner';
+import { runJob } from '../../App';
 
 /**
  * Module Header Component
@@ -45,7 +46,7 @@ export default function ModuleHeader({
   const handleRepairData = async () => {
     if (!window.confirm('Run data repair? This will fix orphaned records and missing data.')) return;
     try {
-      const response = await api.post(`/${moduleType}/admin/repair-data`);
+      const response = await runJob(`/${moduleType}/admin/repair-data`);
       toast.success(response.data.message);
       if (onDataRefresh) onDataRefresh();
       console.log('Repair Log:', response.data.repair_log);
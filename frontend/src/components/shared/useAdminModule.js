@@ -1,5 +1,6 @@
 import { useState, useEffect, useCallback } from 'react';
 import { api } from '../../App';
+import { getAllPages } from '../../lib/pagination';
 import { toast } from 'sonner';
 
 /**
@@ -95,8 +96,8 @@ export function useAdminModule(moduleType, options = {}) {
 
   const loadReservedNames = useCallback(async () => {
     try {
-      const response = await api.get('/reserved-members');
-      setReservedNames(response.data.map(r => r.name ? r.name.toLowerCase().trim() : null).filter(Boolean));
+      const members = await getAllPages('/reserved-members');
+      setReservedNames(members.map(r => r.name ? r.name.toLowerCase().trim() : null).filter(Boolean));
     } catch (error) {
       console.error('Failed to load reserved names');
     }
@@ -164,8 +165,7 @@ export function useAdminModule(moduleType, options = {}) {
       setLoadingRecords(true);
       setExpandedDb(databaseId);
       const endpoint = apiPrefix ? `${apiPrefix}/databases/${databaseId}/records` : `/databases/${databaseId}/records`;
-      const response = await api.get(endpoint);
-      setRecords(response.data);
+      setRecords(await getAllPages(endpoint));
     } catch (error) {
       toast.error('Failed to load records');
     } finally {
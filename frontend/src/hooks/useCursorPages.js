@@ -0,0 +1,59 @@
+import { useState, useCallback, useRef } from 'react';
+import { getPage } from '../lib/pagination';
+
+/**
+ * Hook for "load more" tables over a keyset-paginated list endpoint.
+ * reload() reads the first page (call it when filters change), loadMore() appends
+ * the next one while hasMore. Both reject on request errors so callers can toast.
+ *
+ * Usage:
+ *   const { items, hasMore, loading, loadingMore, reload, loadMore } =
+ *     useCursorPages('/download-history', { pageSize: 50 });
+ *   useEffect(() => { reload().catch(() => toast.error('Failed')); }, [reload]);
+ *   {hasMore && <button disabled={loadingMore} onClick={loadMore}>Load more</button>}
+ */
+export function useCursorPages(url, { params, pageSize = 100, includeTotal = false } = {}) {
+  const [items, setItems] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [total, setTotal] = useState(null);
+  const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // Ignore responses of a listing that was reloaded (e.g. filters changed) meanwhile
+  const generation = useRef(0);
+  const paramsKey = JSON.stringify(params || {});
+
+  const reload = useCallback(async () => {
+    const current = ++generation.current;
+    setLoading(true);
+    try {
+      const page = await getPage(url, {
+        params: { ...JSON.parse(paramsKey), limit: pageSize },
+        includeTotal
+      });
+      if (current !== generation.current) return;
+      setItems(page.items);
+      setNextCursor(page.nextCursor);
+      setTotal(page.total);
+    } finally {
+      if (current === generation.current) setLoading(false);
+    }
+  }, [url, paramsKey, pageSize, includeTotal]);
+
+  const loadMore = useCallback(async () => {
+    if (!nextCursor || loadingMore) return;
+    const current = generation.current;
+    setLoadingMore(true);
+    try {
+      const page = await getPage(url, {
+        params: { ...JSON.parse(paramsKey), limit: pageSize, cursor: nextCursor }
+      });
+      if (current !== generation.current) return;
+      setItems(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [url, paramsKey, pageSize, nextCursor, loadingMore]);
+
+  return { items, setItems, total, loading, loadingMore, hasMore: !!nextCursor, reload, loadMore };
+}
@@ -0,0 +1,56 @@
+import { api } from '../App';
+
+// Keyset paging headers set by the backend (axios lower-cases header names)
+export const NEXT_CURSOR_HEADER = 'x-next-cursor';
+export const TOTAL_COUNT_HEADER = 'x-total-count';
+
+// Page size used when a view needs every row of a listing
+export const ALL_PAGES_PAGE_SIZE = 2000;
+
+/**
+ * Read one page of a keyset-paginated list endpoint.
+ * Returns { items, nextCursor, total } — nextCursor is null on the last page,
+ * total is null unless requested with includeTotal.
+ *
+ * Usage:
+ *   const page = await getPage('/download-history', { params: { limit: 50 } });
+ *   const next = await getPage('/download-history', { params: { limit: 50, cursor: page.nextCursor } });
+ */
+export async function getPage(url, { params = {}, includeTotal = false, ...config } = {}) {
+  const response = await api.get(url, {
+    ...config,
+    params: { ...params, ...(includeTotal && { include_total: true }) }
+  });
+  const total = response.headers[TOTAL_COUNT_HEADER];
+  return {
+    items: response.data,
+    nextCursor: response.headers[NEXT_CURSOR_HEADER] || null,
+    total: total !== undefined ? Number(total) : null
+  };
+}
+
+/**
+ * Read every page of a list endpoint by following X-Next-Cursor.
+ * For views that must see the whole listing (client-side matching, totals per row).
+ */
+export async function getAllPages(url, { params = {}, pageSize = ALL_PAGES_PAGE_SIZE, ...config } = {}) {
+  const items = [];
+  let cursor = null;
+  do {
+    const page = await getPage(url, {
+      ...config,
+      params: { ...params, limit: pageSize, ...(cursor && { cursor }) }
+    });
+    items.push(...page.items);
+    cursor = page.nextCursor;
+  } while (cursor);
+  return items;
+}
+
+/**
+ * Count the rows of a listing without reading them (X-Total-Count of a one-row page).
+ */
+export async function getTotalCount(url, { params = {}, ...config } = {}) {
+  const page = await getPage(url, { ...config, params: { ...params, limit: 1 }, includeTotal: true });
+  return page.total ?? page.items.length;
+}
@@ -1,5 +1,6 @@
 import { useState, useEffect, useCallback, useMemo, useRef, lazy, Suspense } from 'react';
 import { api } from '../App';
+import { getTotalCount } from '../lib/pagination';
 import { toast } from 'sonner';
 import DashboardLayout from '../components/DashboardLayout';
 import DatabaseOverview from '../components/DatabaseOverview';
@@ -57,17 +58,17 @@ export default function AdminDashboard({ user, onLogout }) {
 
   const loadStats = useCallback(async () => {
     try {
-      const [requests, reservations, omsetStats, pendingOmset, leaveRequests] = await Promise.all([
-        api.get('/download-requests'),
-        api.get('/reserved-members'),
+      const [pendingRequests, pendingReservations, omsetStats, pendingOmset, leaveRequests] = await Promise.all([
+        getTotalCount('/download-requests', { params: { status: 'pending' } }),
+        getTotalCount('/reserved-members', { params: { status: 'pending' } }),
         api.get('/omset/dashboard-stats'),
         api.get('/omset/pending').catch(() => ({ data: [] })),
         api.get('/leave/all-requests?status=pending').catch(() => ({ data: { pending_count: 0 } }))
       ]);
 
       setStats({
-        pendingRequests: requests.data.filter(r => r.status === 'pending').length,
-        pendingReservations: reservations.data.filter(r => r.status === 'pending').length,
+        pendingRequests,
+        pendingReservations,
         pendingOmset: Array.isArray(pendingOmset.data) ? pendingOmset.data.length : 0,
         pendingLeave: leaveRequests.data?.pending_count || 0,
         totalOmsetYear: omsetStats.data.total_omset_year || 0,
@@ -1,5 +1,6 @@
 import { useState, useEffect, useMemo, useCallback, useRef, lazy, Suspense } from 'react';
 import { api } from '../App';
+import { getTotalCount } from '../lib/pagination';
 import { toast } from 'sonner';
 import DashboardLayout from '../components/DashboardLayout';
 import StaffTargetBanner from '../components/StaffTargetBanner';
@@ -139,16 +140,16 @@ export default function StaffDashboard({ user, onLogout }) {
 
   const loadStats = useCallback(async () => {
     try {
-      const [databases, requests, history] = await Promise.all([
+      const [databases, myRequests, myDownloads] = await Promise.all([
         api.get('/databases'),
-        api.get('/download-requests'),
-        api.get('/download-history')
+        getTotalCount('/download-requests'),
+        getTotalCount('/download-history')
       ]);
 
       setStats({
         totalDatabases: databases.data.length,
-        myRequests: requests.data.length,
-        myDownloads: history.data.length
+        myRequests,
+        myDownloads
       });
     } catch (error) {
       console.error('Error loading stats:', error);